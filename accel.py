@@ -0,0 +1,45 @@
+"""
+Opt-in native/viper acceleration switch for the Sump Alarm hot paths
+Set ACCEL = True in config.py to compile the accelerated variants of the
+siren ISR, the debounce filters, the GPIO bank read and the base64 loops
+with @micropython.native / @micropython.viper. Each module keeps its pure
+Python version, which is what runs under CPython and when ACCEL is off.
+
+The decorators are recognised by the MicroPython compiler, so the
+accelerated definitions sit in "if accel.ENABLED:" blocks next to their
+pure twins instead of being applied through a wrapper here. Only helpers
+with no pure twin (direct register access) live in this module.
+"""
+
+import sys
+
+# ESP32-C3 GPIO registers used by the viper code paths
+GPIO_OUT_W1TS_REG = 0x60004008  # Write 1 to set output bits
+GPIO_OUT_W1TC_REG = 0x6000400C  # Write 1 to clear output bits
+
+def _enabled():
+    if sys.implementation.name != "micropython":
+        return False
+    try:
+        import config
+    except ImportError:
+        return False
+    return bool(getattr(config, "ACCEL", False))
+
+ENABLED = _enabled()
+
+if ENABLED:
+    import micropython
+
+    @micropython.viper
+    def h_bridge_step(phase: int, mask_a: int, mask_b: int) -> int:
+        """Drive the H-bridge one half-cycle with direct GPIO register writes"""
+        set_reg = ptr32(0x60004008)  # GPIO_OUT_W1TS_REG
+        clr_reg = ptr32(0x6000400C)  # GPIO_OUT_W1TC_REG
+        if phase:
+            set_reg[0] = mask_a
+            clr_reg[0] = mask_b
+        else:
+            set_reg[0] = mask_b
+            clr_reg[0] = mask_a
+        return phase ^ 1
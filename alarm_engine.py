@@ -0,0 +1,105 @@
+"""
+Tick-driven sump alarm state machine
+Pure logic with no hardware or network access: feed it the debounced sensor
+state and a millisecond timestamp, and act on the action it returns. The
+same engine runs on the ESP32 and in the host replay/sweep tools.
+"""
+
+from compat import ticks_diff, ticks_add
+
+# Actions returned by AlarmEngine.update()
+ACT_NONE = 0     # Nothing to do
+ACT_ALARM = 1    # Water confirmed: start siren and send notifications
+ACT_RETRY = 2    # Alarm still active and notifications failed: retry them
+ACT_RESTORE = 3  # Water level back to normal: stop siren
+
+class AlarmEngine:
+    def __init__(self, debounce_s=15, retry_s=600):
+        """Configure the debounce time and notification retry interval"""
+        self.debounce_ms = debounce_s * 1000
+        self.retry_ms = retry_s * 1000
+        self.last_flood_s = 0
+        self.last_alarm = False
+        self.on_transition = None  # Called after every state change (checkpointing)
+        self.reset()
+
+    def reset(self):
+        """Return to the dry, idle state"""
+        self.flood_start_ms = None
+        self.seconds_flooded = 0
+        self.alarm_triggered = False
+        self.notification_sent = False
+        self.last_attempt_ms = None
+
+    @property
+    def flooded(self):
+        return self.flood_start_ms is not None
+
+    def update(self, wet, now_ms):
+        """Advance the state machine by one sensor reading"""
+        if not wet:
+            if self.flood_start_ms is None:
+                return ACT_NONE
+            # Keep a summary of the episode for the caller's restore message
+            self.last_flood_s = self.seconds_flooded
+            self.last_alarm = self.alarm_triggered
+            self.reset()
+            self._changed()
+            return ACT_RESTORE
+
+        if self.flood_start_ms is None:
+            self.flood_start_ms = now_ms
+            self._changed()
+        flooded_ms = ticks_diff(now_ms, self.flood_start_ms)
+        self.seconds_flooded = flooded_ms // 1000
+
+        if not self.alarm_triggered:
+            if flooded_ms >= self.debounce_ms:
+                self.alarm_triggered = True
+                self.last_attempt_ms = now_ms
+                self._changed()
+                return ACT_ALARM
+            return ACT_NONE
+
+        if (not self.notification_sent and
+                ticks_diff(now_ms, self.last_attempt_ms) >= self.retry_ms):
+            self.last_attempt_ms = now_ms
+            self._changed()
+            return ACT_RETRY
+        return ACT_NONE
+
+    def notified(self, success):
+        """Record the outcome of a notification attempt"""
+        self.notification_sent = bool(success)
+        self._changed()
+
+    def _changed(self):
+        if self.on_transition is not None:
+            self.on_transition()
+
+    # --- Checkpoints --------------------------------------------------------
+
+    def snapshot(self, now_ms):
+        """State as (flags, last_flood_s, flood age ms, attempt age ms), ages -1 if unset
+
+        Ages rather than timestamps, because ticks_ms restarts after a reset.
+        """
+        flags = ((1 if self.flooded else 0) | (2 if self.alarm_triggered else 0) |
+                 (4 if self.notification_sent else 0) | (8 if self.last_alarm else 0))
+        flood = -1 if self.flood_start_ms is None else ticks_diff(now_ms, self.flood_start_ms)
+        attempt = -1 if self.last_attempt_ms is None else ticks_diff(now_ms, self.last_attempt_ms)
+        return flags, self.last_flood_s, flood, attempt
+
+    def resume(self, snapshot, now_ms):
+        """Continue from a snapshot() taken before a reset (without calling on_transition)"""
+        flags, last_flood_s, flood, attempt = snapshot
+        self.reset()
+        self.last_flood_s = last_flood_s
+        self.last_alarm = bool(flags & 8)
+        if flags & 1 and flood >= 0:
+            self.flood_start_ms = ticks_add(now_ms, -flood)
+            self.seconds_flooded = flood // 1000
+            self.alarm_triggered = bool(flags & 2)
+            self.notification_sent = bool(flags & 4)
+            if attempt >= 0:
+                self.last_attempt_ms = ticks_add(now_ms, -attempt)
@@ -0,0 +1,91 @@
+"""
+Microbenchmark for the accelerated hot paths (runs on the ESP32 or a host)
+Reports microseconds per call for each pure Python function and, when
+ACCEL = True in config.py on MicroPython, for its native/viper twin.
+
+On the ESP32: import bench_accel  (the siren pins click briefly)
+On a host:    python bench_accel.py  (pure Python numbers only)
+"""
+
+import accel
+import debounce
+import mybase64
+from compat import ticks_us, ticks_diff
+
+def per_call_us(fn, arg, calls):
+    """Average microseconds per call of fn(arg), loop overhead included"""
+    start = ticks_us()
+    for _ in range(calls):
+        fn(arg)
+    return ticks_diff(ticks_us(), start) / calls
+
+def report(name, pure_us, fast_us):
+    if fast_us is None:
+        print(f"{name:<24}{pure_us:>10.2f}{'n/a':>10}")
+    else:
+        print(f"{name:<24}{pure_us:>10.2f}{fast_us:>10.2f}{pure_us / fast_us:>8.1f}x")
+
+def bench_debounce(calls):
+    pairs = (
+        ("integrator", debounce.Integrator(10), "integrator", {"samples": 10}),
+        ("hysteresis", debounce.HysteresisCounter(10, 20), "hysteresis",
+         {"rise_samples": 10, "fall_samples": 20}),
+        ("majority", debounce.MajorityVote(15), "majority", {"window": 15}),
+    )
+    for name, pure, algo, params in pairs:
+        fast = debounce.make_debouncer(algo, **params)
+        fast_us = per_call_us(fast.update, 1, calls) if type(fast) is not type(pure) else None
+        report(f"debounce {name}", per_call_us(pure.update, 1, calls), fast_us)
+    pure = debounce.BankDebouncer(10, 10)
+    fast = debounce.BANK_DEBOUNCER(10, 10)
+    fast_us = per_call_us(fast.update, 0x30, calls) if fast.__class__ is not pure.__class__ else None
+    report("debounce bank", per_call_us(pure.update, 0x30, calls), fast_us)
+
+def bench_base64(calls):
+    data = bytes(range(256)) * 2  # 512 bytes
+    out = bytearray(mybase64.encoded_length(len(data)))
+    n = len(data)
+    pure = per_call_us(lambda d: mybase64._encode_into_py(d, 0, n, out, 0), data, calls)
+    fast = None
+    if mybase64._encode_into is not mybase64._encode_into_py:
+        fast = per_call_us(lambda d: mybase64._encode_into(d, 0, n, out, 0), data, calls)
+    report("base64 encode 512 B", pure, fast)
+
+def bench_hardware(calls):
+    """GPIO bank read and siren half-cycle; device only"""
+    try:
+        from machine import Pin, mem32
+    except ImportError:
+        return
+    import sensors
+    reg = sensors.GPIO_IN_REG_ESP32C3
+    pure = per_call_us(lambda r: mem32[r] & 0x3FFFFF, reg, calls)
+    fast = None
+    if accel.ENABLED:
+        fast = per_call_us(lambda r: sensors._read_reg_masked(r, 0x3FFFFF), reg, calls)
+    report("GPIO bank read", pure, fast)
+
+    in_a = Pin(6, Pin.OUT)
+    in_b = Pin(7, Pin.OUT)
+
+    def pin_toggle(_):
+        a = 0 if in_a.value() else 1
+        in_a.value(a)
+        in_b.value(0 if a else 1)
+
+    pure = per_call_us(pin_toggle, None, calls)
+    fast = None
+    if accel.ENABLED:
+        fast = per_call_us(lambda p: accel.h_bridge_step(p, 1 << 6, 1 << 7), 1, calls)
+    in_a.value(0)
+    in_b.value(0)
+    report("siren half-cycle", pure, fast)
+
+def run(calls=2000):
+    print(f"Accelerated build: {'enabled' if accel.ENABLED else 'disabled'}")
+    print(f"{'function':<24}{'pure us':>10}{'fast us':>10}{'speedup':>9}")
+    bench_debounce(calls)
+    bench_base64(max(1, calls // 20))
+    bench_hardware(calls)
+
+run()
@@ -0,0 +1,70 @@
+"""
+Boot-to-armed benchmark for the Sump Alarm (run on the host)
+Summarises the "armed" events the device writes to events.log on every
+boot, grouped by build mode (py, mpy, frozen), and optionally appends the
+summary to a history file so boot time can be tracked between releases.
+
+Usage:
+    python bench_boot.py --pull /dev/ttyUSB0        # copy events.log first
+    python bench_boot.py events.log --history boot_history.csv
+"""
+
+import argparse
+import os
+import subprocess
+import time
+
+from eventlog import read_events
+
+def pull(port, dest):
+    """Copy the event logs off the device with mpremote"""
+    paths = []
+    for name in ("events.1.log", "events.log"):
+        target = os.path.join(dest, name)
+        result = subprocess.run(["mpremote", "connect", port, "cp", ":" + name, target])
+        if result.returncode == 0:
+            paths.append(target)
+    return paths
+
+def boot_times(paths):
+    """Return {build: [boot-to-armed ms, ...]} from the event logs"""
+    times = {}
+    for _, event, detail in read_events(paths):
+        if event != "armed":
+            continue
+        fields = dict(item.split("=", 1) for item in detail.split() if "=" in item)
+        times.setdefault(fields.get("build", "py"), []).append(int(fields["ms"]))
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise boot-to-armed times")
+    parser.add_argument("logs", nargs="*", default=["events.1.log", "events.log"])
+    parser.add_argument("--pull", metavar="PORT", help="Copy the logs from the device first")
+    parser.add_argument("--history", help="Append the summary to this CSV file")
+    args = parser.parse_args()
+
+    paths = pull(args.pull, ".") if args.pull else args.logs
+    times = boot_times(paths)
+    if not times:
+        raise SystemExit("No armed events found")
+
+    print(f"{'build':<8}{'boots':>6}{'min ms':>8}{'median ms':>11}{'max ms':>8}")
+    rows = []
+    for build, values in sorted(times.items()):
+        values.sort()
+        median = values[len(values) // 2]
+        print(f"{build:<8}{len(values):>6}{values[0]:>8}{median:>11}{values[-1]:>8}")
+        rows.append((build, len(values), values[0], median, values[-1]))
+
+    if args.history:
+        new = not os.path.exists(args.history)
+        with open(args.history, "a") as f:
+            if new:
+                f.write("date,build,boots,min_ms,median_ms,max_ms\n")
+            stamp = time.strftime("%Y-%m-%d")
+            for row in rows:
+                f.write(stamp + "," + ",".join(str(v) for v in row) + "\n")
+        print(f"Appended to {args.history}")
+
+if __name__ == "__main__":
+    main()
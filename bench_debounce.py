@@ -0,0 +1,144 @@
+"""
+Host benchmark for the debounce filters (run with CPython, not on the ESP32)
+Replays synthetic noisy float-switch traces through each algorithm and
+reports alarm latency, false alarms and per-sample cost.
+
+Usage: python bench_debounce.py [--traces 200] [--seed 1]
+"""
+
+import argparse
+import random
+import time
+
+from debounce import make_debouncer
+
+SAMPLE_MS = 100          # Fast sampling rate used while confirming water
+DEBOUNCE_SECONDS = 15    # Continuous wet time required before the alarm
+
+CANDIDATES = [
+    ("integrator n=10", "integrator", {"samples": 10}),
+    ("integrator n=20", "integrator", {"samples": 20}),
+    ("hysteresis 10/20", "hysteresis", {"rise_samples": 10, "fall_samples": 20}),
+    ("majority w=15", "majority", {"window": 15}),
+    ("majority w=29", "majority", {"window": 29}),
+]
+
+class LegacyBurst:
+    """The original read_sensor_debounced() loop, for comparison
+
+    One 10-sample burst per loop iteration, preceded by an unsampled 1 s
+    sleep; any inconsistent burst reads as dry.
+    """
+
+    def __init__(self, samples=10):
+        self.samples = samples
+        self.state = 0
+        self._pos = 0
+        self._last = None
+        self._consistent = 0
+
+    def update(self, sample):
+        pos = self._pos
+        self._pos = (pos + 1) % (2 * self.samples)
+        if pos < self.samples:
+            return self.state  # time.sleep(1) - samples are not looked at
+        if pos == self.samples:
+            self._last = sample
+            self._consistent = 0
+            return self.state
+        if sample == self._last:
+            self._consistent += 1
+        else:
+            self._consistent = 0
+            self._last = sample
+        if pos == 2 * self.samples - 1:
+            self.state = self._last if self._consistent >= self.samples - 1 else 0
+        return self.state
+
+def dry_trace(rng, seconds, spike_rate):
+    """Dry pit with occasional short wet spikes (waves, vibration)"""
+    n = seconds * 1000 // SAMPLE_MS
+    trace = [0] * n
+    i = 0
+    while i < n:
+        if rng.random() < spike_rate:
+            for j in range(i, min(n, i + rng.randint(1, 8))):
+                trace[j] = 1
+            i += 8
+        i += 1
+    return trace
+
+def flood_trace(rng, seconds, onset_s, chatter):
+    """Dry until onset, then wet with random dropouts from a bobbing float"""
+    n = seconds * 1000 // SAMPLE_MS
+    onset = onset_s * 1000 // SAMPLE_MS
+    trace = [0] * onset
+    for _ in range(onset, n):
+        trace.append(0 if rng.random() < chatter else 1)
+    return trace, onset
+
+def replay(filt, trace):
+    """Return (first index the filter reads wet, first index an alarm fires)"""
+    alarm_samples = DEBOUNCE_SECONDS * 1000 // SAMPLE_MS
+    first_wet = None
+    run = 0
+    for i, sample in enumerate(trace):
+        state = filt.update(sample)
+        if state:
+            if first_wet is None:
+                first_wet = i
+            run += 1
+            if run >= alarm_samples:
+                return first_wet, i
+        else:
+            run = 0
+    return first_wet, None
+
+def build(kind, params):
+    if kind == "legacy":
+        return LegacyBurst()
+    return make_debouncer(kind, **params)
+
+def run(traces, seed):
+    rng = random.Random(seed)
+    dry = [dry_trace(rng, 600, 0.01) for _ in range(traces)]
+    floods = [flood_trace(rng, 300, 30, rng.choice((0.0, 0.1, 0.3, 0.45)))
+              for _ in range(traces)]
+
+    print(f"{'algorithm':<18}{'alarm p50 s':>12}{'alarm max s':>12}"
+          f"{'missed':>8}{'false alarms':>14}{'false wet':>11}{'us/sample':>11}")
+    for label, kind, params in [("legacy burst", "legacy", {})] + CANDIDATES:
+        latencies = []
+        missed = 0
+        for trace, onset in floods:
+            _, alarm = replay(build(kind, params), trace)
+            if alarm is None:
+                missed += 1
+            else:
+                latencies.append((alarm - onset) * SAMPLE_MS / 1000)
+        false_alarms = 0
+        false_wet = 0
+        for trace in dry:
+            first_wet, alarm = replay(build(kind, params), trace)
+            false_wet += first_wet is not None
+            false_alarms += alarm is not None
+
+        filt = build(kind, params)
+        sample_trace = floods[0][0]
+        start = time.perf_counter()
+        for sample in sample_trace:
+            filt.update(sample)
+        us = (time.perf_counter() - start) * 1e6 / len(sample_trace)
+
+        latencies.sort()
+        p50 = f"{latencies[len(latencies) // 2]:.1f}" if latencies else "-"
+        worst = f"{latencies[-1]:.1f}" if latencies else "-"
+        print(f"{label:<18}{p50:>12}{worst:>12}{missed:>8}"
+              f"{false_alarms:>14}{false_wet:>11}{us:>11.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--traces", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    run(args.traces, args.seed)
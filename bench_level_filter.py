@@ -0,0 +1,99 @@
+"""
+Host benchmark for the analog level filters (run with CPython + NumPy)
+Checks MovingAverage, MovingMedian and SlopeEstimator against NumPy
+reference outputs on a noisy rising-level signal and reports the cost
+per sample.
+
+Usage: python bench_level_filter.py [--samples 20000] [--n 16] [--seed 1]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from level_sensor import MovingAverage, MovingMedian, SlopeEstimator, LevelSensor
+
+def noisy_level(rng, count):
+    """Slow fill with a faster rise at the end, ADC noise and spikes"""
+    t = np.arange(count)
+    level = 12000 + 20000 * t / count + np.where(t > 0.8 * count, 40 * (t - 0.8 * count), 0)
+    level = level + rng.normal(0, 300, count)
+    spikes = rng.random(count) < 0.01
+    level[spikes] += rng.choice([-8000, 8000], spikes.sum())
+    return np.clip(level, 0, 65535).astype(np.int64)
+
+def reference_window(signal, n, fn):
+    """NumPy reference: fn over the trailing window (shorter at the start)"""
+    out = np.empty(len(signal), dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(signal, n)
+    out[n - 1:] = fn(windows)
+    for i in range(n - 1):
+        out[i] = fn(signal[None, :i + 1])[0]
+    return out
+
+def reference_slope(values, k):
+    """NumPy least-squares slope over trailing windows, x1000"""
+    out = np.zeros(len(values), dtype=np.int64)
+    for i in range(1, len(values)):
+        window = values[max(0, i - k + 1):i + 1]
+        x = np.arange(len(window))
+        out[i] = np.floor(np.polyfit(x, window, 1)[0] * 1000)
+    return out
+
+def timed(filt, signal):
+    start = time.perf_counter()
+    out = [filt.update(int(x)) for x in signal]
+    return np.asarray(out), (time.perf_counter() - start) * 1e6 / len(signal)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--n", type=int, default=16, help="Filter window")
+    parser.add_argument("--k", type=int, default=12, help="Slope window")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    signal = noisy_level(rng, args.samples)
+    ok = True
+
+    avg_ref = reference_window(signal, args.n,
+                               lambda w: np.floor_divide(w.sum(axis=1), w.shape[1]))
+    avg, avg_us = timed(MovingAverage(args.n), signal)
+    med_ref = reference_window(signal, args.n,
+                               lambda w: np.floor(np.median(w, axis=1)).astype(np.int64))
+    med, med_us = timed(MovingMedian(args.n), signal)
+
+    # Decimate one output per burst, then estimate the slope of those
+    decimated = med[args.n - 1::args.n]
+    slope_ref = reference_slope(decimated, args.k)
+    slope, slope_us = timed(SlopeEstimator(args.k), decimated)
+
+    print(f"{'filter':<16}{'max |err|':>10}{'us/sample':>11}")
+    for name, out, ref, us in (("moving average", avg, avg_ref, avg_us),
+                               ("moving median", med, med_ref, med_us),
+                               ("slope (k=%d)" % args.k, slope, slope_ref, slope_us)):
+        err = int(np.max(np.abs(out - ref)))
+        # Integer floor division may differ from the float reference by one
+        ok &= err <= 1
+        print(f"{name:<16}{err:>10}{us:>11.2f}")
+
+    # Whole burst read path, as on the device
+    samples = iter(signal.tolist())
+    sensor = LevelSensor("bench", None, burst=args.n, filter_n=args.n,
+                         slope_points=args.k, reader=lambda: next(samples))
+    start = time.perf_counter()
+    bursts = args.samples // args.n
+    for _ in range(bursts):
+        sensor.read()
+    us = (time.perf_counter() - start) * 1e6 / (bursts * args.n)
+    print(f"{'LevelSensor.read':<16}{'-':>10}{us:>11.2f}")
+    print(f"Final level {sensor.level / 10:.1f}%, rising {sensor.rate / 10:.1f}%/min")
+
+    print("PASS" if ok else "FAIL")
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
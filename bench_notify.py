@@ -0,0 +1,238 @@
+"""
+Host benchmark for notification connections (run with CPython, not on the ESP32)
+Sends alerts through transport.request() (Telegram/ntfy style HTTPS) and
+GmailSender (SMTP with STARTTLS) to a local TLS stand-in server, with TLS
+session resumption off and on, and with and without public key pinning,
+and reports the handshake count, the resumed share, the time per
+notification and the cost of each pin check. The stand-in uses an RSA
+certificate made with the openssl command line tool.
+
+Usage: python bench_notify.py [--sends 20] [--openssl openssl]
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+import transport
+from email_sender import GmailSender
+
+def make_cert(directory, openssl="openssl", host="localhost"):
+    """Self-signed (cert, key) files for host, or None without openssl"""
+    exe = shutil.which(openssl)
+    if exe is None:
+        return None
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run([exe, "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key,
+                    "-out", cert, "-days", "2", "-subj", f"/CN={host}"],
+                   check=True, capture_output=True)
+    return cert, key
+
+class StandIn:
+    """HTTPS and SMTP (STARTTLS) on local ports, one connection at a time
+
+    One server context for every connection, so it resumes the sessions
+    it issued, as api.telegram.org, ntfy.sh and smtp.gmail.com do.
+    """
+
+    def __init__(self, cert, key):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        with open(cert) as f:
+            self.pin = transport.spki_pin(ssl.PEM_cert_to_DER_cert(f.read()))
+        self.requests = 0
+        self.emails = 0
+        self.resumed = 0
+        self.handshakes = 0
+        self.split_replies = False  # Send multi-line replies a line at a time
+        self._servers = []
+        self.https_port = self._serve(self._https)
+        self.smtp_port = self._serve(self._smtp)
+
+    def _serve(self, handler):
+        server = socket.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("127.0.0.1", 0))
+        server.listen(8)
+        self._servers.append(server)
+
+        def loop():
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return  # Closed
+                try:
+                    conn.settimeout(5)
+                    handler(conn)
+                except (OSError, ssl.SSLError):
+                    pass
+                finally:
+                    conn.close()
+
+        threading.Thread(target=loop, daemon=True).start()
+        return server.getsockname()[1]
+
+    def _tls(self, conn):
+        tls = self.context.wrap_socket(conn, server_side=True)
+        self.handshakes += 1
+        if tls.session_reused:
+            self.resumed += 1
+        return tls
+
+    def _https(self, conn):
+        tls = self._tls(conn)
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = tls.recv(1024)
+            if not chunk:
+                return
+            data += chunk
+        head, _, body = data.partition(b"\r\n\r\n")
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                while len(body) < int(line.split(b":")[1]):
+                    body += tls.recv(1024)
+        self.requests += 1
+        tls.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 11\r\n\r\n{"ok":true}')
+        tls.close()
+
+    def _smtp(self, conn):
+        sock = conn
+        sock.sendall(b"220 stand-in ESMTP ready\r\n")
+        buf = b""
+        in_data = False
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            buf += chunk
+            while True:
+                if in_data:
+                    end = buf.find(b"\r\n.\r\n")
+                    if end < 0:
+                        break
+                    buf = buf[end + 5:]
+                    in_data = False
+                    self.emails += 1
+                    sock.sendall(b"250 OK queued\r\n")
+                    continue
+                line, sep, rest = buf.partition(b"\r\n")
+                if not sep:
+                    break
+                buf = rest
+                verb = line.split(b" ")[0].upper()
+                if verb == b"EHLO":
+                    reply = (b"250-stand-in\r\n", b"250-STARTTLS\r\n", b"250 AUTH LOGIN\r\n")
+                    if self.split_replies:
+                        for part in reply:
+                            sock.sendall(part)
+                            time.sleep(0.02)
+                    else:
+                        sock.sendall(b"".join(reply))
+                elif verb == b"STARTTLS":
+                    sock.sendall(b"220 Go ahead\r\n")
+                    sock = self._tls(conn)
+                elif verb == b"AUTH":
+                    sock.sendall(b"334 VXNlcm5hbWU6\r\n")
+                elif line.startswith(b"dXNl") or line.startswith(b"YWxh"):
+                    sock.sendall(b"334 UGFzc3dvcmQ6\r\n")
+                elif verb in (b"MAIL", b"RCPT"):
+                    sock.sendall(b"250 OK\r\n")
+                elif verb == b"DATA":
+                    in_data = True
+                    sock.sendall(b"354 Go ahead\r\n")
+                elif verb == b"QUIT":
+                    sock.sendall(b"221 Bye\r\n")
+                    return
+                else:
+                    sock.sendall(b"235 Accepted\r\n")
+
+    def close(self):
+        for server in self._servers:
+            server.close()
+
+def send_once(stand_in):
+    """One HTTPS alert and one email; returns (seconds, both accepted)"""
+    start = time.perf_counter()
+    status = transport.request("POST", f"https://localhost:{stand_in.https_port}/sump-test",
+                               headers={"Title": "SUMP ALARM!"}, data="Water level is high!")
+    gmail = GmailSender("alarm@example.com", "app password", ports=(stand_in.smtp_port,))
+    gmail.smtp_server = "localhost"
+    sent = gmail.send_email(["test@example.com"], "SUMP ALARM TEST", "Water level is high!")
+    return time.perf_counter() - start, status == 200 and sent
+
+def run(stand_in, mode, sends, pinned=False):
+    """Per-notification times and TLS counters with sessions kept in mode
+
+    pinned: check the stand-in's key against its pin (and a backup pin).
+    """
+    pins = {"localhost": [stand_in.pin, "A" * 43 + "="]} if pinned else {}
+    transport.configure(mode, pins, "enforce")
+    transport.forget_sessions()
+    before = dict(transport.stats)
+    times = []
+    ok = True
+    for _ in range(sends):
+        elapsed, accepted = send_once(stand_in)
+        times.append(elapsed)
+        ok = ok and accepted
+    counts = {k: transport.stats[k] - before[k]
+              for k in ("tls_full", "tls_resumed", "tls_saved_ms", "pin_checks", "pin_failures", "pin_us")}
+    return times, counts, ok
+
+def _quiet(fn, *args):
+    """Run fn without the notifiers' progress prints"""
+    import builtins
+    real = builtins.print
+    builtins.print = lambda *a, **k: None
+    try:
+        return fn(*args)
+    finally:
+        builtins.print = real
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sends", type=int, default=20, help="Notifications per mode (2 TLS sessions each)")
+    parser.add_argument("--openssl", default="openssl", help="openssl command for the test certificate")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        files = make_cert(directory, args.openssl)
+        if files is None:
+            raise SystemExit(f"{args.openssl} not found: pass --openssl /path/to/openssl")
+        stand_in = StandIn(*files)
+    try:
+        print(f"{'sessions':<12}{'full':>6}{'resumed':>9}{'ms/alert':>10}{'saved ms':>10}"
+              f"{'pins':>6}{'us/pin':>8}  ok")
+        results = {}
+        pin_us = {}
+        for label, mode, pinned in (("off", "off", False), ("ram", "ram", False),
+                                    ("off+pins", "off", True), ("ram+pins", "ram", True)):
+            times, counts, ok = _quiet(run, stand_in, mode, args.sends, pinned)
+            mean = sum(times) / len(times) * 1000
+            results[label] = mean
+            pin_us[label] = counts["pin_us"] / args.sends
+            checks = counts["pin_checks"]
+            per_pin = f"{counts['pin_us'] / checks:.0f}" if checks else "-"
+            ok = ok and counts["pin_failures"] == 0
+            print(f"{label:<12}{counts['tls_full']:>6}{counts['tls_resumed']:>9}{mean:>10.2f}"
+                  f"{counts['tls_saved_ms']:>10}{checks:>6}{per_pin:>8}  {ok}")
+        print(f"\nServer saw {stand_in.handshakes} handshakes, {stand_in.resumed} resumed; "
+              f"{stand_in.requests} HTTPS requests, {stand_in.emails} emails")
+        print(f"Resuming saves {results['off'] - results['ram']:.2f} ms per alert here "
+              f"(host CPU; the C3 spends seconds on a full handshake)")
+        for label in ("off+pins", "ram+pins"):
+            print(f"Pin checks with sessions {label[:-5]}: {pin_us[label]:.0f} us per alert, "
+                  f"{pin_us[label] / 10 / results[label]:.2f}% of its time (one SHA-256 per handshake)")
+    finally:
+        stand_in.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# Runs before main.py. After an over-the-air update, finish an interrupted
+# swap and count trial boots, rolling back a version that keeps failing.
+# During a trial the hardware watchdog is armed here, so a new main.py that
+# crashes or hangs before confirming itself resets the board into the next
+# trial boot (and finally the rollback) instead of sitting at the REPL.
+import os
+
+try:
+    os.stat("ota_state.json")
+    updated = True
+except OSError:
+    updated = False  # No update has ever been installed
+
+if updated:
+    try:
+        import ota
+        if ota.boot_check():
+            import settings
+            from machine import WDT
+            WDT(timeout=settings.load().OTA_TRIAL_WDT_MS)
+        del ota
+    except Exception as e:
+        print(f"OTA boot check failed: {e}")
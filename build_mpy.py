@@ -0,0 +1,163 @@
+"""
+Fast-boot build for the Sump Alarm (run on the host, not on the ESP32)
+Cross-compiles the device modules to .mpy with mpy-cross so the ESP32 does
+not compile source on every power restore, or writes a manifest to freeze
+them into a custom firmware image.
+
+Usage:
+    python build_mpy.py                      # build/ with .mpy files
+    python build_mpy.py --deploy /dev/ttyUSB0
+    python build_mpy.py --manifest build/manifest.py
+
+main.py cannot run as .mpy, so it is compiled to sump_main.mpy and a
+one-line main.py stub that imports it is written next to it. Remember to
+remove the old .py copies from the device: MicroPython prefers .py files
+over .mpy files of the same name. config.py is uploaded as it is:
+settings.py reads it as source (and compiles it to config.bin), it is
+never imported.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+# Modules that run on the ESP32, in the order they are imported at boot
+DEVICE_MODULES = [
+    "compat.py",
+    "accel.py",
+    "metrics.py",
+    "timeservice.py",
+    "eventlog.py",
+    "watchdog.py",
+    "sampler.py",
+    "debounce.py",
+    "alarm_engine.py",
+    "sensors.py",
+    "level_sensor.py",
+    "settings.py",
+    "rtcstore.py",
+    "checkpoint.py",
+    "governor.py",
+    "lazy.py",
+    "notify.py",
+    "gateway.py",
+    "heartbeat.py",
+    "ota.py",
+    "transport.py",
+    "telegram_bot.py",
+    "mybase64.py",
+    "email_sender.py",
+    "report.py",
+    "canary.py",
+]
+CONFIG_SOURCE = "config.py"  # Credentials - read as source by settings.py, never compiled
+STALE_FILES = ["config.mpy"]  # Left on the device by older builds
+MAIN_MODULE = "sump_main"
+BOOT_MODULE = "boot.py"  # Runs as source before main.py
+MAIN_STUB = f"import {MAIN_MODULE}  # Compiled main program, see build_mpy.py\n"
+
+def find_mpy_cross():
+    """Return the command used to run mpy-cross"""
+    exe = shutil.which("mpy-cross")
+    if exe:
+        return [exe]
+    try:
+        import mpy_cross  # noqa: F401 - pip install mpy-cross
+        return [sys.executable, "-m", "mpy_cross"]
+    except ImportError:
+        raise SystemExit("mpy-cross not found: pip install mpy-cross, or build it from "
+                         "the MicroPython source tree")
+
+def compile_module(cmd, src, dst, march):
+    args = cmd + ["-o", dst, src]
+    if march:
+        args.insert(len(cmd), f"-march={march}")
+    subprocess.run(args, check=True)
+
+def build(out_dir, march):
+    """Compile every device module into out_dir; return the files to upload"""
+    cmd = find_mpy_cross()
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = []
+    for src in DEVICE_MODULES:
+        dst = os.path.join(out_dir, src[:-3] + ".mpy")
+        compile_module(cmd, src, dst, march)
+        outputs.append(dst)
+        print(f"{src:<20} {os.path.getsize(src):>7} -> {os.path.getsize(dst):>6} bytes")
+
+    dst = os.path.join(out_dir, MAIN_MODULE + ".mpy")
+    compile_module(cmd, "main.py", dst, march)
+    outputs.append(dst)
+    print(f"{'main.py':<20} {os.path.getsize('main.py'):>7} -> {os.path.getsize(dst):>6} bytes")
+
+    stub = os.path.join(out_dir, "main.py")
+    with open(stub, "w") as f:
+        f.write(MAIN_STUB)
+    outputs.append(stub)
+
+    # boot.py only runs as source; copied so an OTA bundle of the build has it
+    shutil.copyfile(BOOT_MODULE, os.path.join(out_dir, BOOT_MODULE))
+    outputs.append(os.path.join(out_dir, BOOT_MODULE))
+    return outputs
+
+def write_manifest(path):
+    """Write a MicroPython freeze manifest for a custom firmware build"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    out_dir = os.path.dirname(os.path.abspath(path))
+    os.makedirs(out_dir, exist_ok=True)
+    # The real main program is frozen as sump_main; main.py becomes the stub
+    shutil.copyfile(os.path.join(here, "main.py"), os.path.join(out_dir, MAIN_MODULE + ".py"))
+    with open(path, "w") as f:
+        f.write("# Freeze manifest for the Sump Alarm - generated by build_mpy.py\n")
+        f.write('include("$(PORT_DIR)/boards/manifest.py")\n')
+        f.write(f"freeze({here!r}, {tuple(DEVICE_MODULES)!r})\n")
+        f.write(f"freeze({out_dir!r}, ({MAIN_MODULE + '.py'!r},))\n")
+    print(f"Wrote {path}; build with: make BOARD=ESP32_GENERIC_C3 FROZEN_MANIFEST={os.path.abspath(path)}")
+    print(f"Then upload config.py and a main.py containing: {MAIN_STUB.strip()}")
+
+def device_has(port, name):
+    """True if the file exists on the device"""
+    result = subprocess.run(["mpremote", "connect", port, "exec", f"import os; os.stat({name!r})"],
+                            capture_output=True)
+    return result.returncode == 0
+
+def check_config(port):
+    """Refuse to deploy a unit that would boot without a config.py"""
+    if os.path.exists(CONFIG_SOURCE) or device_has(port, CONFIG_SOURCE):
+        return
+    raise SystemExit(f"No {CONFIG_SOURCE} here or on the device: copy config_template.py to "
+                     f"{CONFIG_SOURCE} and fill it in, or the alarm cannot load its settings")
+
+def deploy(port, files):
+    """Upload the build and config.py with mpremote and remove stale .py sources"""
+    check_config(port)
+    if os.path.exists(CONFIG_SOURCE):
+        files = files + [CONFIG_SOURCE]
+    for path in files:
+        subprocess.run(["mpremote", "connect", port, "cp", path, ":"], check=True)
+    for name in DEVICE_MODULES + STALE_FILES:
+        # Ignore errors: the file may already be gone
+        subprocess.run(["mpremote", "connect", port, "rm", ":" + name])
+    print("Deployed; reset the board to boot from the compiled modules")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build .mpy files or a freeze manifest")
+    parser.add_argument("--out", default="build", help="Output directory")
+    parser.add_argument("--march", default="rv32imc",
+                        help="Native code architecture (rv32imc for the ESP32-C3)")
+    parser.add_argument("--deploy", metavar="PORT", help="Upload with mpremote to this port")
+    parser.add_argument("--manifest", metavar="PATH", help="Write a freeze manifest instead")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if args.manifest:
+        write_manifest(args.manifest)
+        return
+    files = build(args.out, args.march)
+    if args.deploy:
+        deploy(args.deploy, files)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Synthetic end-to-end canary alerts for the Sump Alarm
+Every CANARY_S seconds, while the pit is dry, a test alert marked [CANARY]
+goes through each channel that has a test-only destination in config
+(CANARY_TELEGRAM_CHAT_ID, CANARY_EMAIL, CANARY_NTFY_TOPIC), so an expired
+app password, revoked bot token or renamed topic shows up before a flood
+needs it. Each run is timed phase by phase (WiFi, DNS, connect, TLS, the
+exchange with the service) against CANARY_SLO_MS and kept in a short
+rolling history per channel. A channel whose recent runs keep failing or
+missing the SLO is reported degraded, once, on the other channels.
+"""
+
+from compat import ticks_ms, ticks_diff
+
+MARK = "[CANARY]"
+PHASES = ("wifi", "resolve", "connect", "tls", "exchange", "total")
+HISTORY = 8     # Runs kept per channel
+WINDOW = 4      # Recent runs looked at for the degraded state
+BAD_RUNS = 2    # Failed or slow runs in WINDOW that make a channel degraded
+
+def destinations(config):
+    """{channel: test-only destination} for the channels that have one"""
+    found = {}
+    if config.CANARY_TELEGRAM_CHAT_ID:
+        found["telegram"] = config.CANARY_TELEGRAM_CHAT_ID
+    if config.CANARY_EMAIL:
+        found["gmail"] = config.CANARY_EMAIL
+    if config.CANARY_NTFY_TOPIC:
+        found["ntfy"] = config.CANARY_NTFY_TOPIC
+    return found
+
+def probe(notify, channel, destination, wifi, run=0):
+    """Send one marked test alert; returns (ok, {phase: ms})
+
+    wifi() brings the station up and returns True if connected. The DNS,
+    connect and TLS phases come from transport.timings; the exchange is the
+    rest of the send (HTTP request or SMTP dialogue, and any retry).
+    """
+    import sys
+    start = ticks_ms()
+    ok = wifi()
+    phases = {"wifi": ticks_diff(ticks_ms(), start)}
+    if ok:
+        transport = sys.modules.get("transport")
+        if transport:
+            transport.timings.clear()
+        sent = ticks_ms()
+        text = f"Sump alarm canary {run}, not an alarm. All is well if this arrives."
+        if channel == "telegram":
+            ok = notify.send_telegram_alert(message=f"{MARK} {text}", chat_id=destination)
+        elif channel == "gmail":
+            ok = notify.send_gmail_alert(destination, subject=f"{MARK} Sump alarm canary", message=text)
+        else:
+            ok = notify.send_ntfy_alert(topic=destination, title=f"{MARK} Sump alarm canary", message=text)
+        send_ms = ticks_diff(ticks_ms(), sent)
+        transport = sys.modules.get("transport")
+        timings = dict(transport.timings) if transport else {}
+        phases.update(timings)
+        phases["exchange"] = max(0, send_ms - sum(timings.values()))
+    phases["total"] = ticks_diff(ticks_ms(), start)
+    return bool(ok), phases
+
+class Canary:
+    def __init__(self, slo_ms=None, history=HISTORY, window=WINDOW, bad_runs=BAD_RUNS):
+        """slo_ms: {phase: ms}; phases without an entry are not checked"""
+        self.slo_ms = dict(slo_ms or {})
+        self.history_len = history
+        self.window = window
+        self.bad_runs = bad_runs
+        self.history = {}   # channel -> [(ok, {phase: ms}, [phases over the SLO])]
+        self.degraded = []
+        self.runs = 0
+
+    def record(self, channel, ok, phases):
+        """Add one run; returns "degraded" or "recovered" when the state changes"""
+        breaches = [p for p in PHASES if p in phases and p in self.slo_ms and phases[p] > self.slo_ms[p]]
+        runs = self.history.setdefault(channel, [])
+        runs.append((ok, phases, breaches))
+        del runs[:-self.history_len]
+        self.runs += 1
+        bad = sum(1 for good, _, slow in runs[-self.window:] if not good or slow)
+        if channel not in self.degraded and bad >= self.bad_runs:
+            self.degraded.append(channel)
+            return "degraded"
+        if channel in self.degraded and all(good and not slow for good, _, slow in runs[-self.bad_runs:]):
+            self.degraded.remove(channel)
+            return "recovered"
+        return None
+
+    def summary(self, channel):
+        """One line on a channel's recent runs"""
+        runs = self.history.get(channel)
+        if not runs:
+            return f"{channel}: no canary yet"
+        ok = sum(1 for good, _, _ in runs if good)
+        totals = sorted(phases["total"] for good, phases, _ in runs if good)
+        line = f"{channel}: {ok}/{len(runs)} ok"
+        if totals:
+            line += f", median {totals[len(totals) // 2]} ms"
+        good, phases, slow = runs[-1]
+        if not good:
+            line += ", last run FAILED"
+        elif slow:
+            line += ", last run slow: " + ", ".join(f"{p} {phases[p]} ms > {self.slo_ms[p]}" for p in slow)
+        if channel in self.degraded:
+            line += " (DEGRADED)"
+        return line
+
+    def metrics(self):
+        last = {}
+        for channel, runs in self.history.items():
+            good, phases, slow = runs[-1]
+            last[channel] = {"ok": good, "ms": phases, "slow": slow}
+        return {"runs": self.runs, "degraded": self.degraded, "last": last}
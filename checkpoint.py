@@ -0,0 +1,110 @@
+"""
+Alarm state checkpoints for the Sump Alarm
+Every alarm engine transition (water found, alarm, retry, notification
+result, restore) writes all engines to RTC memory, which survives watchdog,
+brown-out and soft resets. At boot the engines resume from the record, so a
+reset in the middle of a flood neither restarts the debounce window nor
+sends the alarm again; the siren is back on at once and an alarm whose
+notification had not gone out is retried straight away.
+
+Times are stored as ages. RTC seconds (which keep counting through a
+reset, unlike ticks_ms) at the time of the write add the time spent
+rebooting, when they are plausible.
+"""
+
+import struct
+import time
+
+import rtcstore
+from compat import ticks_ms, ticks_add
+
+try:
+    from binascii import crc32
+except ImportError:
+    from ubinascii import crc32
+
+MAX_SLOTS = 8
+MAX_GAP_S = 3600         # Longer gaps across a reset mean the RTC was set or lost
+CRASH_LOOP_RESUMES = 2   # Boots in a row resuming the same unsent alarm
+
+_HEAD = "<IIB3x"  # CRC of the sensor names, RTC seconds, resumes with a pending alarm
+_SLOT = "<BxHii"  # flags, last flood s, flood age ms, last attempt age ms
+
+def _seconds():
+    return int(time.time())
+
+class EngineCheckpoint:
+    def __init__(self, sensors):
+        """sensors: objects with .name and .engine, in a fixed order"""
+        if len(sensors) > MAX_SLOTS:
+            raise ValueError(f"At most {MAX_SLOTS} sensors, got {len(sensors)}")
+        self.sensors = list(sensors)
+        self.names_crc = crc32(",".join(s.name for s in self.sensors).encode()) & 0xFFFFFFFF
+        self.resumes = 0
+        self.writes = 0
+        self.resumed = []
+        self.resume_ms = None
+        self.gap_s = None
+
+    def attach(self):
+        """Checkpoint on every transition of every engine from now on"""
+        for s in self.sensors:
+            s.engine.on_transition = self.save
+
+    def _pending(self):
+        for s in self.sensors:
+            if s.engine.alarm_triggered and not s.engine.notification_sent:
+                return True
+        return False
+
+    def save(self, now=None):
+        now = ticks_ms() if now is None else now
+        if not self._pending():
+            self.resumes = 0
+        parts = [struct.pack(_HEAD, self.names_crc, _seconds() & 0xFFFFFFFF, min(self.resumes, 255))]
+        for s in self.sensors:
+            flags, last_flood_s, flood, attempt = s.engine.snapshot(now)
+            parts.append(struct.pack(_SLOT, flags, min(last_flood_s, 0xFFFF), flood, attempt))
+        rtcstore.write("engine", b"".join(parts))
+        self.writes += 1
+
+    def restore(self, now=None):
+        """Resume the engines from the record; returns the sensors left flooded"""
+        now = ticks_ms() if now is None else now
+        data = rtcstore.read("engine")
+        head = struct.calcsize(_HEAD)
+        slot = struct.calcsize(_SLOT)
+        if data is None or len(data) != head + len(self.sensors) * slot:
+            return []
+        names_crc, saved_s, resumes = struct.unpack_from(_HEAD, data)
+        if names_crc != self.names_crc:
+            return []  # Sensors were reconfigured
+        gap_s = (_seconds() - saved_s) & 0xFFFFFFFF
+        self.gap_s = gap_s if gap_s <= MAX_GAP_S else None
+        # Without a usable RTC gap, at least the time since this reset counts
+        gap_ms = self.gap_s * 1000 if self.gap_s is not None else now
+        for i, s in enumerate(self.sensors):
+            flags, last_flood_s, flood, attempt = struct.unpack_from(_SLOT, data, head + i * slot)
+            s.engine.resume((flags, last_flood_s, flood + gap_ms if flood >= 0 else -1,
+                             attempt + gap_ms if attempt >= 0 else -1), now)
+        self.resumed = [s for s in self.sensors if s.engine.flooded]
+        if self._pending():
+            self.resumes = resumes + 1
+            if self.resumes < CRASH_LOOP_RESUMES:
+                # The reset may have cut the send short: try again now
+                for s in self.sensors:
+                    engine = s.engine
+                    if engine.alarm_triggered and not engine.notification_sent:
+                        engine.last_attempt_ms = ticks_add(now, -engine.retry_ms)
+        self.resume_ms = ticks_ms()
+        self.save(now)
+        return self.resumed
+
+    def metrics(self):
+        return {
+            "writes": self.writes,
+            "resumed": [s.name for s in self.resumed],
+            "resume_ms": self.resume_ms,
+            "gap_s": self.gap_s,
+            "resumes": self.resumes,
+        }
@@ -0,0 +1,47 @@
+"""
+MicroPython/CPython compatibility helpers
+Lets the pure-logic modules run unchanged on the ESP32 and on a Linux host
+"""
+
+import time
+import gc
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms
+except ImportError:
+    # CPython host: emulate the MicroPython ticks API with a monotonic clock.
+    # Host ticks never wrap, so plain arithmetic is enough.
+    def ticks_ms():
+        return time.monotonic_ns() // 1000000
+
+    def ticks_us():
+        return time.monotonic_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def ticks_add(a, b):
+        return a + b
+
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
+try:
+    from micropython import const
+except ImportError:
+    def const(x):
+        return x
+
+IS_MICROPYTHON = hasattr(gc, "mem_free")
+
+def mem_free():
+    """Return free heap in bytes (0 on hosts that do not report it)"""
+    if IS_MICROPYTHON:
+        return gc.mem_free()
+    return 0
+
+def mem_alloc():
+    """Return allocated heap in bytes (0 on hosts that do not report it)"""
+    if IS_MICROPYTHON:
+        return gc.mem_alloc()
+    return 0
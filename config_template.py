@@ -1,6 +1,11 @@
 # Configuration Template for Sump Alarm System
 # Copy this file to config.py and fill in your actual credentials
 # DO NOT commit config.py to GitHub - it contains sensitive information
+#
+# Every setting is checked at boot (settings.py lists them with their
+# ranges) and compiled to config.bin, which later boots load directly.
+# Upload a changed config.py and it is applied within a few seconds without
+# a reset; settings that can only change at boot say so when applied.
 
 # WiFi Configuration
 WIFI_SSID = "YOUR_WIFI_SSID"
@@ -26,4 +31,204 @@ EMAIL_RECIPIENTS = [
     "another_email@example.com",
     # SMS gateways (example for T-Mobile):
     # "1234567890@tmomail.net"
-]
\ No newline at end of file
+]
+
+# Alarm timing: the float must read wet this long before the alarm, and
+# failed notifications are retried this often while it lasts
+DEBOUNCE_SECONDS = 15
+NOTIFY_RETRY_SECONDS = 600
+
+# Adaptive sampling (float switch polling schedule)
+# Fast rate is used on the first wet reading and while an alarm is active
+SAMPLER_FAST_MS = 100        # Sample spacing while confirming water
+SAMPLER_NORMAL_MS = 1000     # Poll interval after recent activity
+SAMPLER_IDLE_MS = 2000       # Poll interval once the pit has been dry a while
+SAMPLER_IDLE_AFTER_S = 600   # Dry this long before dropping to the idle rate
+SAMPLER_FAST_HOLD_S = 30     # Stay at the fast rate this long after water clears
+
+# Debounce filter for the float switches:
+# "auto", "integrator", "hysteresis", "majority" or "bank"
+# auto:       "bank" with two or more SENSORS, else "integrator"; the bank
+#             uses {"samples": N} as N rise and fall samples
+# integrator: {"samples": N}  - up/down counter, flips after N net samples
+# hysteresis: {"rise_samples": N, "fall_samples": M} - consecutive samples
+# majority:   {"window": W}    - majority of the last W samples (W <= 30)
+# bank:       {"rise_samples": N, "fall_samples": M} - hysteresis for all
+#             sensors at once; cost per sample does not grow with sensors
+# The other three keep a filter per sensor, so each sample costs one
+# filter update per switch.
+DEBOUNCE_ALGORITHM = "auto"
+DEBOUNCE_PARAMS = {"samples": 10}
+
+# Float switches. Leave as None for the single switch on GPIO4 (GND on GPIO3).
+# Every switch is read with one GPIO input-register read and has its own
+# debounce and alarm state. Optional keys: label, gnd_pin, active_high,
+# debounce_s, channels ("telegram", "gmail", "ntfy"), email_recipients,
+# ntfy_topic.
+SENSORS = None
+# SENSORS = [
+#     {"name": "sump", "label": "Main sump", "pin": 4, "gnd_pin": 3},
+#     {"name": "sump_hh", "label": "Main sump high-high", "pin": 5, "gnd_pin": 10,
+#      "debounce_s": 5},
+#     {"name": "pit2", "label": "Garage pit", "pin": 2, "gnd_pin": 1,
+#      "channels": ("telegram", "ntfy"), "ntfy_topic": "your_garage_topic"},
+# ]
+GPIO_IN_REG = 0x6000403C  # ESP32-C3 GPIO_IN_REG; None to read pins one by one
+
+# Optional analog level sensor on an ADC pin (pressure transducer or
+# resistive strip). Levels are permille of the calibrated empty..full range;
+# the alarm fires at the high mark, or earlier on a fast rise.
+LEVEL_SENSOR = None
+# LEVEL_SENSOR = {
+#     "name": "level", "label": "Sump level", "adc_pin": 0,
+#     "burst": 16, "filter": "median", "filter_n": 16,  # or "average"
+#     "slope_points": 12, "period_ms": 5000,
+#     "empty_raw": 9000, "full_raw": 52000,  # Calibrate with a tape measure
+#     "high_permille": 700, "rise_permille_per_min": 50, "rise_floor_permille": 300,
+#     "debounce_s": 10,
+# }
+
+# Notifier modules are imported when an alarm fires. Afterwards they are
+# evicted from memory: "pressure" (when free heap < LAZY_MIN_FREE_BYTES),
+# "always", or "never".
+LAZY_EVICT_POLICY = "pressure"
+LAZY_MIN_FREE_BYTES = 80000
+
+# Alert governor. Each channel has a token bucket of (burst, seconds per
+# token); alerts beyond it wait for the alarm retry or the next digest.
+# A float that alarms FLAP_ALARMS times within FLAP_WINDOW_S is flapping:
+# further alarms go into one digest every FLAP_DIGEST_S until it has been
+# quiet for FLAP_WINDOW_S. "Water back to normal" messages: "each",
+# "batch" (one message for every restore within RESTORE_BATCH_S) or "off".
+# The governor state is kept in RTC memory, so it survives soft resets.
+ALERT_RATE_LIMITS = {
+    "telegram": (5, 120),
+    "gmail": (3, 600),  # SMS gateways throttle hardest
+    "ntfy": (5, 120),
+}
+FLAP_WINDOW_S = 1800
+FLAP_ALARMS = 3
+FLAP_DIGEST_S = 1800
+RESTORE_NOTIFY = "batch"
+RESTORE_BATCH_S = 300
+
+# Gateway mode (optional). With GATEWAY_HOST set, alarms go to
+# gateway_server.py on the LAN as one HMAC-signed UDP datagram and the
+# gateway sends Telegram, Gmail and Ntfy for the unit. It acknowledges once
+# one channel has delivered the alert; without an ack within
+# GATEWAY_DEADLINE_MS the unit sends directly as usual.
+GATEWAY_HOST = None  # e.g. "192.168.1.10"
+GATEWAY_PORT = 5050
+GATEWAY_KEY = "change this shared secret"  # Must match "keys" in gateway.json
+GATEWAY_UNIT = "sump-alarm"  # Unique per unit
+GATEWAY_SITE = ""  # Units watching the same pit share a site to avoid double alerts
+GATEWAY_DEADLINE_MS = 10000
+
+# Over-the-air updates (optional). With OTA_URL set, the unit checks the
+# manifest made by make_ota.py once a day while the pit is dry, downloads
+# the bundle (resuming if interrupted), swaps it in and resets. The new
+# version must pass the alarm self-test and run OTA_CONFIRM_S seconds or it
+# is rolled back; boot.py arms the watchdog (OTA_TRIAL_WDT_MS) meanwhile.
+OTA_URL = None  # e.g. "http://192.168.1.10:8000/manifest.json"
+OTA_KEY = None  # Same as make_ota.py --key; required with OTA_URL (unsigned manifests are refused)
+OTA_CHECK_S = 86400
+OTA_FIRST_CHECK_S = 300  # First check after boot
+OTA_CONFIRM_S = 120
+OTA_TRIAL_WDT_MS = 300000
+
+# Telegram commands (optional). The unit polls the bot every TELEGRAM_POLL_S
+# seconds without blocking the sensing loop and answers /status,
+# /silence 30m (siren only, alerts still go out; /silence off), /test and
+# /metrics, only from TELEGRAM_CHAT_ID, plus /get NAME, /set NAME VALUE
+# and /reload for the settings in this file. Passwords, keys, TLS_PINS,
+# TLS_PIN_MODE and OTA_URL cannot be /set from the chat. Keeps WiFi connected.
+TELEGRAM_COMMANDS = False
+TELEGRAM_POLL_S = 10
+
+# Compile the hot paths (siren ISR, debounce filters, GPIO bank read, base64)
+# with the MicroPython native/viper emitters. Needs firmware with native code
+# support for the ESP32-C3 (MicroPython 1.23+). Run bench_accel.py to compare.
+ACCEL = False
+
+# Hardware watchdog. A supervisor timer feeds machine.WDT only while every
+# task checks in within its deadline, so a hung socket call resets the board
+# instead of leaving it frozen. The WDT cannot be stopped once started, so
+# turn this on only once the unit is deployed, not while working at the
+# REPL. The reason for the last watchdog reset and the longest blocking
+# call per task are kept in watchdog.json.
+WDT_ENABLED = False
+WDT_TIMEOUT_MS = 60000  # Hardware timeout if the supervisor itself stops running
+WDT_TIMER_ID = 1        # Timer 0 drives the siren
+WDT_DEADLINES_MS = {
+    "sensor": 20000,    # Main loop between samples
+    "siren": 10000,     # Buzzer timer while an alarm sounds
+    "notifier": 45000,  # Any single network step (longer than the 30 s HTTP timeout)
+    "wifi": 15000,      # Between polls of the WiFi association
+}
+
+# Print sampler/CPU metrics to the console this often
+METRICS_PRINT_S = 3600
+
+# Wall clock. Synced with NTP_HOST every NTP_RESYNC_S seconds without
+# blocking the loop; the crystal's drift is measured between syncs. Used for
+# the time in emails and alerts and to stamp events.log. None (the default)
+# leaves it off.
+NTP_HOST = None  # e.g. "pool.ntp.org"
+NTP_RESYNC_S = 3600
+
+# Email report every REPORT_S seconds (0, the default, turns it off): pump
+# cycles, alarms and resets over the last REPORT_DAYS days, with every event
+# attached as a compressed CSV. Goes to EMAIL_RECIPIENTS unless
+# REPORT_RECIPIENTS is set; set it if EMAIL_RECIPIENTS has SMS gateway
+# addresses. /report from Telegram sends one now.
+REPORT_S = 0  # e.g. 7 * 86400 for weekly
+REPORT_DAYS = 7
+REPORT_RECIPIENTS = None  # e.g. ["you@example.com"]
+
+# Heartbeat (optional dead man's switch). Every HEARTBEAT_S seconds the unit
+# tells a monitor it is alive, so a power cut, lost WiFi or a hang raises an
+# alert instead of looking like a dry pit. "udp://host:5051" sends one signed
+# datagram to heartbeat_monitor.py (run with --key HEARTBEAT_KEY);
+# "http://host/ping/uuid" pings a healthchecks-style service instead. With
+# HEARTBEAT_RADIO_OFF the radio is only up around beats and alerts (not with
+# TELEGRAM_COMMANDS, which keeps WiFi connected).
+HEARTBEAT_URL = None  # e.g. "udp://192.168.1.10:5051"
+HEARTBEAT_S = 300
+HEARTBEAT_KEY = "change this shared secret"
+HEARTBEAT_RADIO_OFF = False
+
+# Gmail SMTP ports, raced in staggered parallel with the first preferred:
+# 465 is TLS from the start, any other (587) upgrades with STARTTLS. Every
+# notifier tries all resolved addresses the same way and starts with the
+# one that won last time.
+SMTP_PORTS = [465, 587]
+
+# TLS sessions are kept per server and resumed on the next alert or retry,
+# which skips most of the handshake: "ram" while the notifier code is
+# loaded, "rtc" also in RTC memory through resets (the session keys then
+# sit in RTC memory), "off" for a full handshake every time.
+TLS_SESSIONS = "ram"
+
+# Certificate pinning. Servers are not checked against CA certificates
+# (too slow and big for the C3); instead the public key a host presents
+# can be checked against its pins, base64 SHA-256 hashes made with
+# make_pins.py on a PC, plus at least one backup pin per host. "enforce"
+# refuses a server whose key is not pinned, "report" only logs it (alerts
+# still go out), "off" skips the check. Services renew their keys now and
+# then: a mismatch in the log or a failing canary means run make_pins.py
+# again before switching to "enforce".
+TLS_PINS = {}  # e.g. {"ntfy.sh": ["<pin from make_pins.py>", "<backup pin>"]}
+TLS_PIN_MODE = "report"
+
+# Canary: every CANARY_S seconds (0 to turn off), while the pit is dry, a
+# test alert marked [CANARY] goes to each channel's test-only destination
+# below (channels left at None are not tested), to catch an expired app
+# password or revoked token before a flood. Phases slower than
+# CANARY_SLO_MS, or failures, in 2 of the last 4 runs mark the channel
+# degraded, and a warning goes out on the other channels. /canary from
+# Telegram runs one now; test_all.py sends one by hand.
+CANARY_S = 86400
+CANARY_TELEGRAM_CHAT_ID = None  # e.g. a test group: "-1001234567890"
+CANARY_EMAIL = None  # e.g. ["sump-canary@example.com"], not the household
+CANARY_NTFY_TOPIC = None  # e.g. "my-sump-canary-x7q2"
+CANARY_SLO_MS = {"wifi": 10000, "connect": 3000, "tls": 10000, "total": 30000}
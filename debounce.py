@@ -0,0 +1,213 @@
+"""
+Streaming debounce filters for the float switch
+Each filter does constant work per sample, keeps a fixed amount of state and
+never allocates in update(), so it can be fed from a timer ISR as well as
+from the main loop.
+"""
+
+from compat import const
+import accel
+
+_MAX_WINDOW = const(30)  # Majority history must fit in a small int
+
+class Integrator:
+    """Up/down counter clamped to [0, limit]; output flips only at the rails"""
+
+    def __init__(self, samples=10, state=0):
+        self.limit = samples
+        self.reset(state)
+
+    def reset(self, state=0):
+        self.state = 1 if state else 0
+        self.count = self.limit if self.state else 0
+
+    def update(self, sample):
+        if sample:
+            if self.count < self.limit:
+                self.count += 1
+                if self.count == self.limit:
+                    self.state = 1
+        elif self.count > 0:
+            self.count -= 1
+            if self.count == 0:
+                self.state = 0
+        return self.state
+
+class HysteresisCounter:
+    """Consecutive-sample counter with separate rise and fall thresholds"""
+
+    def __init__(self, rise_samples=10, fall_samples=20, state=0):
+        self.rise = rise_samples
+        self.fall = fall_samples
+        self.reset(state)
+
+    def reset(self, state=0):
+        self.state = 1 if state else 0
+        self.count = 0
+
+    def update(self, sample):
+        if (1 if sample else 0) == self.state:
+            self.count = 0
+        else:
+            self.count += 1
+            if self.count >= (self.fall if self.state else self.rise):
+                self.state ^= 1
+                self.count = 0
+        return self.state
+
+class MajorityVote:
+    """Sliding-window vote with a bitmask history and a running count"""
+
+    def __init__(self, window=15, rise=None, fall=None, state=0):
+        if not 1 <= window <= _MAX_WINDOW:
+            raise ValueError("window must be 1..30")
+        self.window = window
+        self.rise = rise if rise is not None else window // 2 + 1
+        self.fall = fall if fall is not None else window // 2
+        self._top = window - 1
+        self._mask = (1 << window) - 1
+        self.reset(state)
+
+    def reset(self, state=0):
+        self.state = 1 if state else 0
+        self.history = self._mask if self.state else 0
+        self.ones = self.window if self.state else 0
+
+    def update(self, sample):
+        self.ones -= (self.history >> self._top) & 1
+        self.history = ((self.history << 1) & self._mask) | (1 if sample else 0)
+        if sample:
+            self.ones += 1
+        if self.state:
+            if self.ones <= self.fall:
+                self.state = 0
+        elif self.ones >= self.rise:
+            self.state = 1
+        return self.state
+
+ALGORITHMS = {
+    "integrator": Integrator,
+    "hysteresis": HysteresisCounter,
+    "majority": MajorityVote,
+}
+
+def make_debouncer(name="integrator", **params):
+    """Create a debounce filter by algorithm name"""
+    try:
+        cls = ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"Unknown debounce algorithm: {name}")
+    return cls(**params)
+
+class BankDebouncer:
+    """Bit-sliced consecutive-sample debouncer for a whole bank of inputs
+
+    Every bit of the input word is an independent channel with its own
+    counter, held as vertical counters (one int per counter bit), so the
+    work per sample is the same for one sensor or thirty.
+    """
+
+    def __init__(self, rise_samples=10, fall_samples=10, state=0):
+        if not 1 <= rise_samples < 256 or not 1 <= fall_samples < 256:
+            raise ValueError("thresholds must be 1..255")
+        self.rise = rise_samples
+        self.fall = fall_samples
+        self._bits = max(rise_samples, fall_samples).bit_length()
+        self.reset(state)
+
+    def reset(self, state=0):
+        self.state = state
+        self.planes = [0] * self._bits
+
+    def _equals(self, value):
+        """Bit mask of channels whose counter equals value"""
+        match = -1
+        for i, plane in enumerate(self.planes):
+            match &= plane if (value >> i) & 1 else ~plane
+        return match
+
+    def update(self, word):
+        delta = word ^ self.state
+        # Ripple-carry increment of the counters that see a difference
+        planes = self.planes
+        carry = delta
+        for i in range(self._bits):
+            plane = planes[i]
+            planes[i] = (plane ^ carry) & delta  # Counters without a difference reset
+            carry &= plane
+        reached = delta & ((~self.state & self._equals(self.rise)) |
+                           (self.state & self._equals(self.fall)))
+        if reached:
+            self.state ^= reached
+            for i in range(self._bits):
+                planes[i] &= ~reached
+        return self.state
+
+if accel.ENABLED:
+    import micropython
+
+    # Native-emitter twins of the filters above; same logic, same state
+    class _NativeIntegrator(Integrator):
+        @micropython.native
+        def update(self, sample):
+            if sample:
+                if self.count < self.limit:
+                    self.count += 1
+                    if self.count == self.limit:
+                        self.state = 1
+            elif self.count > 0:
+                self.count -= 1
+                if self.count == 0:
+                    self.state = 0
+            return self.state
+
+    class _NativeHysteresisCounter(HysteresisCounter):
+        @micropython.native
+        def update(self, sample):
+            if (1 if sample else 0) == self.state:
+                self.count = 0
+            else:
+                self.count += 1
+                if self.count >= (self.fall if self.state else self.rise):
+                    self.state ^= 1
+                    self.count = 0
+            return self.state
+
+    class _NativeMajorityVote(MajorityVote):
+        @micropython.native
+        def update(self, sample):
+            self.ones -= (self.history >> self._top) & 1
+            self.history = ((self.history << 1) & self._mask) | (1 if sample else 0)
+            if sample:
+                self.ones += 1
+            if self.state:
+                if self.ones <= self.fall:
+                    self.state = 0
+            elif self.ones >= self.rise:
+                self.state = 1
+            return self.state
+
+    class _NativeBankDebouncer(BankDebouncer):
+        @micropython.native
+        def update(self, word):
+            delta = word ^ self.state
+            planes = self.planes
+            carry = delta
+            for i in range(self._bits):
+                plane = planes[i]
+                planes[i] = (plane ^ carry) & delta
+                carry &= plane
+            reached = delta & ((~self.state & self._equals(self.rise)) |
+                               (self.state & self._equals(self.fall)))
+            if reached:
+                self.state ^= reached
+                for i in range(self._bits):
+                    planes[i] &= ~reached
+            return self.state
+
+    ALGORITHMS["integrator"] = _NativeIntegrator
+    ALGORITHMS["hysteresis"] = _NativeHysteresisCounter
+    ALGORITHMS["majority"] = _NativeMajorityVote
+    BANK_DEBOUNCER = _NativeBankDebouncer
+else:
+    BANK_DEBOUNCER = BankDebouncer
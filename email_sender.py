@@ -1,88 +1,206 @@
 """
 MicroPython Gmail SMTP Email Sender for ESP32
-Uses Gmail's SMTP server with App Password authentication
+Uses Gmail's SMTP server with App Password authentication, racing port 465
+against the STARTTLS port 587 (see transport.py). The message is
+streamed through a fixed-size buffer, so attachments produced chunk by
+chunk (e.g. from flash) never have to fit in memory.
 """
 
-import socket
-import ssl
-import time
+import os
 import gc
-from mybase64 import b64encode  # Use our custom base64 implementation
+import watchdog
+from mybase64 import b64encode, B64Encoder  # Use our custom base64 implementation
+from transport import connect, wrap, keep_session, send_all
+
+CHUNK = 512  # Bytes buffered before each send() of the message body
+SMTPS_PORT = 465  # TLS from the start; any other port upgrades with STARTTLS
+
+class DataWriter:
+    """Message body writer for the SMTP DATA phase
+
+    Buffers up to CHUNK bytes per send(), doubles a "." at the start of a
+    line (dot-stuffing, RFC 5321 4.5.2) even when the line starts in a later
+    chunk, and ends the message with CRLF "." CRLF.
+    """
+
+    def __init__(self, server, chunk=CHUNK):
+        self.server = server
+        self.buf = bytearray(chunk)
+        self.fill = 0
+        self.line_start = True
+        self.sent = 0
+
+    def _put(self, data):
+        n = len(data)
+        start = 0
+        while start < n:
+            take = min(len(self.buf) - self.fill, n - start)
+            self.buf[self.fill:self.fill + take] = data[start:start + take]
+            self.fill += take
+            start += take
+            if self.fill == len(self.buf):
+                self.flush()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if not data:
+            return
+        if self.line_start and data[0] == 46:  # "."
+            self._put(b".")
+        start = 0
+        while True:
+            i = data.find(b"\n.", start)
+            if i < 0:
+                break
+            self._put(data[start:i + 2])
+            self._put(b".")
+            start = i + 2
+        self._put(data[start:])
+        self.line_start = data[-1] == 10  # "\n"
+
+    def flush(self):
+        if self.fill:
+            send_all(self.server, memoryview(self.buf)[:self.fill])
+            self.sent += self.fill
+            self.fill = 0
+
+    def finish(self):
+        """End the message and send what is buffered"""
+        self._put(b".\r\n" if self.line_start else b"\r\n.\r\n")
+        self.flush()
+
+def _crlf(text):
+    """Text with bare LF line ends turned into the CRLF that SMTP expects"""
+    return text.replace("\r\n", "\n").replace("\n", "\r\n")
+
+def write_message(out, sender, recipients, subject, message, attachments=None):
+    """Write the headers and body to out (a DataWriter)
+
+    attachments: (filename, content_type, chunks) tuples, where chunks is
+    an iterable of bytes, read once and base64-encoded as it streams.
+    """
+    out.write(f"From: Sump Alarm <{sender}>\r\n"
+              f"To: {', '.join(recipients)}\r\n"
+              f"Subject: {subject}\r\n")
+    if not attachments:
+        out.write(f"Content-Type: text/plain; charset=utf-8\r\n\r\n{_crlf(message)}\r\n")
+        return
+    boundary = "=_sump_" + "".join(f"{b:02x}" for b in os.urandom(6))  # "=_" never occurs in base64
+    out.write(f"MIME-Version: 1.0\r\n"
+              f"Content-Type: multipart/mixed; boundary=\"{boundary}\"\r\n\r\n"
+              f"--{boundary}\r\n"
+              f"Content-Type: text/plain; charset=utf-8\r\n\r\n{_crlf(message)}\r\n")
+    for filename, content_type, chunks in attachments:
+        out.write(f"--{boundary}\r\n"
+                  f"Content-Type: {content_type}; name=\"{filename}\"\r\n"
+                  f"Content-Disposition: attachment; filename=\"{filename}\"\r\n"
+                  f"Content-Transfer-Encoding: base64\r\n\r\n")
+        encoder = B64Encoder(line_length=76)
+        for chunk in chunks:
+            out.write(encoder.update(chunk))
+        out.write(encoder.finish())
+    out.write(f"--{boundary}--\r\n")
 
 class GmailSender:
-    def __init__(self, gmail_user, app_password):
-        """Initialize with Gmail username and App Password"""
+    def __init__(self, gmail_user, app_password, ports=(465, 587)):
+        """Initialize with Gmail username and App Password
+
+        ports are raced in staggered parallel, the first preferred.
+        """
         self.gmail_user = gmail_user
         self.app_password = app_password
         self.smtp_server = "smtp.gmail.com"
-        self.smtp_port = 465  # SSL port
+        self.smtp_ports = ports
         
+    def _reply(self, server, step):
+        """Read one whole server reply, timed as a blocking call of the notifier task
+
+        A multi-line reply (EHLO) may arrive in several pieces; it ends with
+        the line that has a space after the code ("250 AUTH ..."). Reading
+        less would leave lines that look like the reply to the next command.
+        """
+        reply = b""
+        with watchdog.blocking("notifier", f"smtp {step}"):
+            while True:
+                chunk = server.recv(1024)
+                if not chunk:
+                    break
+                reply += chunk
+                if reply.endswith(b"\r\n") and reply.split(b"\r\n")[-2][3:4] != b"-":
+                    break
+        return reply.decode()
+    
     def _encode_base64(self, message):
         """Encode a string to base64"""
         return b64encode(message)
     
-    def send_email(self, to_emails, subject, message):
-        """Send email through Gmail SMTP"""
+    def send_email(self, to_emails, subject, message, attachments=None):
+        """Send email through Gmail SMTP
+
+        attachments: optional (filename, content_type, chunks) tuples, see
+        write_message(); the chunks are streamed, not collected first.
+        """
         # Convert single email address to list if needed
         if isinstance(to_emails, str):
             to_emails = [to_emails]
             
-        # Format recipient list for SMTP
-        recipients_str = ", ".join(to_emails)
-        
-        # Create socket and wrap with SSL
+        # Race the SMTP ports and addresses, then wrap with SSL
         print("Creating socket connection to Gmail...")
         server = None
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            routes = [(self.smtp_server, port) for port in self.smtp_ports]
+            sock, route = connect(routes)
+            server = sock
             sock.settimeout(15)
+            if route[1] == SMTPS_PORT:
+                print("Wrapping with SSL...")
+                server = wrap(sock, self.smtp_server)
             
-            # First resolve the hostname
-            print(f"Resolving {self.smtp_server}...")
-            addr_info = socket.getaddrinfo(self.smtp_server, self.smtp_port)[0]
-            addr = addr_info[-1]
-            print(f"Resolved to {addr}")
-            
-            # Connect the plain socket first
-            print(f"Connecting to {self.smtp_server}:{self.smtp_port}...")
-            sock.connect(addr)
-            
-            # Now wrap with SSL after connection
-            print("Wrapping with SSL...")
-            server = ssl.wrap_socket(sock, server_hostname=self.smtp_server)
-            
-            response = server.recv(1024).decode()
+            response = self._reply(server, "greeting")
             print("Server response:", response)
             
             if not response.startswith('220'):
                 raise Exception("SMTP Server not ready")
             
+            if route[1] != SMTPS_PORT:
+                # Submission port: plain until STARTTLS
+                send_all(server, b'EHLO ESP32-C3-Sump-Alarm\r\n')
+                response = self._reply(server, "EHLO")
+                send_all(server, b'STARTTLS\r\n')
+                response = self._reply(server, "STARTTLS")
+                print("Server response:", response)
+                if not response.startswith('220'):
+                    raise Exception("STARTTLS refused")
+                print("Wrapping with SSL...")
+                server = wrap(sock, self.smtp_server)
+            
             # Say HELLO
             print("Sending EHLO...")
-            server.send(b'EHLO ESP32-C3-Sump-Alarm\r\n')
-            response = server.recv(1024).decode()
+            send_all(server, b'EHLO ESP32-C3-Sump-Alarm\r\n')
+            response = self._reply(server, "EHLO")
             print("Server response:", response)
             
             # Login: Authentication
             print("Authenticating...")
-            server.send(b'AUTH LOGIN\r\n')
-            response = server.recv(1024).decode()
+            send_all(server, b'AUTH LOGIN\r\n')
+            response = self._reply(server, "AUTH")
             print("Server response:", response)
             
             # Free memory before encoding
             gc.collect()
             
             # Send username (base64 encoded)
-            server.send((self._encode_base64(self.gmail_user) + '\r\n').encode())
-            response = server.recv(1024).decode()
+            send_all(server, (self._encode_base64(self.gmail_user) + '\r\n').encode())
+            response = self._reply(server, "user")
             print("Server response:", response)
             
             # Free memory before encoding
             gc.collect()
             
             # Send password (base64 encoded)
-            server.send((self._encode_base64(self.app_password) + '\r\n').encode())
-            response = server.recv(1024).decode()
+            send_all(server, (self._encode_base64(self.app_password) + '\r\n').encode())
+            response = self._reply(server, "password")
             print("Server response:", response)
             
             if not response.startswith('235'):
@@ -90,15 +208,15 @@ class GmailSender:
             
             # Set sender
             print("Setting sender...")
-            server.send(f'MAIL FROM: <{self.gmail_user}>\r\n'.encode())
-            response = server.recv(1024).decode()
+            send_all(server, f'MAIL FROM: <{self.gmail_user}>\r\n'.encode())
+            response = self._reply(server, "MAIL FROM")
             print("Server response:", response)
             
             # Set recipients
             print("Setting recipients...")
             for email in to_emails:
-                server.send(f'RCPT TO: <{email}>\r\n'.encode())
-                response = server.recv(1024).decode()
+                send_all(server, f'RCPT TO: <{email}>\r\n'.encode())
+                response = self._reply(server, "RCPT TO")
                 print(f"Server response for {email}:", response)
                 
                 if not response.startswith('250'):
@@ -106,24 +224,16 @@ class GmailSender:
             
             # Start data transmission
             print("Starting data transmission...")
-            server.send(b'DATA\r\n')
-            response = server.recv(1024).decode()
+            send_all(server, b'DATA\r\n')
+            response = self._reply(server, "DATA")
             print("Server response:", response)
             
-            # Construct email headers and content
-            email_message = (
-                f"From: Sump Alarm <{self.gmail_user}>\r\n"
-                f"To: {recipients_str}\r\n"
-                f"Subject: {subject}\r\n"
-                f"Content-Type: text/plain; charset=utf-8\r\n"
-                f"\r\n"
-                f"{message}\r\n"
-                f".\r\n"  # End of message indicator
-            )
-            
-            # Send the email content
-            server.send(email_message.encode())
-            response = server.recv(1024).decode()
+            # Stream the headers, body and any attachments
+            out = DataWriter(server)
+            write_message(out, self.gmail_user, to_emails, subject, message, attachments)
+            out.finish()
+            print(f"Sent {out.sent} bytes")
+            response = self._reply(server, "message")
             print("Server response:", response)
             
             if not response.startswith('250'):
@@ -131,11 +241,12 @@ class GmailSender:
             
             # Quit the session
             print("Closing connection...")
-            server.send(b'QUIT\r\n')
-            response = server.recv(1024).decode()
+            send_all(server, b'QUIT\r\n')
+            response = self._reply(server, "QUIT")
             print("Server response:", response)
             
-            # Close socket
+            # Keep the TLS session to resume next time, close socket
+            keep_session(server, self.smtp_server)
             server.close()
             print("Email sent successfully!")
             return True
@@ -0,0 +1,58 @@
+"""
+Persistent event log for the Sump Alarm
+Appends one CSV line per event to a small file on flash, rotating it when it
+gets too big. Lines are "<ticks_ms>,<event>,<detail>"; once the time
+service has synced, the first field is "<ticks_ms>@<unix_ms>" so events can
+be lined up with the gateway's and phone's clocks.
+"""
+
+import os
+
+import timeservice
+from compat import ticks_ms
+
+LOG_FILE = "events.log"
+OLD_LOG_FILE = "events.1.log"
+MAX_BYTES = 32 * 1024
+
+def _size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return 0
+
+def log(event, detail=""):
+    """Append an event; never raises so logging cannot break the alarm"""
+    try:
+        if _size(LOG_FILE) > MAX_BYTES:
+            try:
+                os.remove(OLD_LOG_FILE)
+            except OSError:
+                pass
+            os.rename(LOG_FILE, OLD_LOG_FILE)
+        now = ticks_ms()
+        wall = timeservice.epoch_ms(now)
+        stamp = now if wall is None else f"{now}@{wall}"
+        with open(LOG_FILE, "a") as f:
+            f.write(f"{stamp},{event},{detail}\n")
+    except Exception as e:
+        print(f"Event log write failed: {e}")
+
+def read_records(paths=(OLD_LOG_FILE, LOG_FILE)):
+    """Yield (ticks_ms, unix_ms or None, event, detail) tuples, oldest first"""
+    for path in paths:
+        try:
+            f = open(path)
+        except OSError:
+            continue
+        with f:
+            for line in f:
+                parts = line.rstrip("\n").split(",", 2)
+                if len(parts) == 3:
+                    ticks, _, wall = parts[0].partition("@")
+                    yield int(ticks), int(wall) if wall else None, parts[1], parts[2]
+
+def read_events(paths=(OLD_LOG_FILE, LOG_FILE)):
+    """Yield (stamp, event, detail) tuples, oldest first"""
+    for ticks, _, event, detail in read_records(paths):
+        yield ticks, event, detail
@@ -0,0 +1,601 @@
+"""
+Fleet load simulator: many virtual alarm units alarming in one storm
+Host tool (CPython, not for the ESP32). Starts local stand-ins for the
+Telegram Bot API, Gmail SMTP and ntfy.sh that enforce rate limits like the
+real services, then makes hundreds or thousands of virtual units alarm
+within a few seconds of each other, spread across a process pool with
+asyncio inside each worker. Units send what notify.py sends (same URLs,
+headers and SMTP dialogue, text from notify.alarm_title, credentials encoded
+with mybase64) straight to the services, or one datagram each through
+gateway_server.py. Reports delivery throughput, tail latency and rate-limit
+rejections per channel for each retry/jitter strategy.
+
+Usage:
+    python fleet_sim.py --units 1000 --workers 4 --storm-s 20
+    python fleet_sim.py --units 500 --strategy device,full,decorrelated
+    python fleet_sim.py --units 500 --mode gateway
+
+Strategies for retrying a rejected (429/421) or failed send:
+    device        what the firmware does: one attempt per channel, and the
+                  whole round again after --retry-s only if every channel failed
+    none          retry at once
+    expo          exponential backoff, no jitter
+    full          exponential backoff with full jitter, honouring Retry-After
+    decorrelated  decorrelated jitter, honouring Retry-After
+--spread-s adds a random delay before each unit's first send.
+
+The stand-ins speak plain TCP (no TLS) so the host can open thousands of
+connections; latency added by the services is set with --service-ms.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote, urlsplit, parse_qs
+
+CHANNELS = ("telegram", "gmail", "ntfy")
+STRATEGIES = ("device", "none", "expo", "full", "decorrelated")
+UNIT_RE = re.compile(r"\((u\d+)\)")
+
+def use_config_template():
+    """Make "import config" work on a host without credentials"""
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        import config_template
+        sys.modules["config"] = config_template
+
+def raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+# --- Stand-in services ------------------------------------------------------------
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self):
+        """Take one token; returns 0 on success or seconds until one is free"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class StandIns:
+    """Telegram, SMTP and ntfy stand-ins with per-bot/chat/account/visitor limits"""
+
+    def __init__(self, args):
+        self.args = args
+        self.buckets = {}
+        self.accepted = {c: {} for c in CHANNELS}  # channel -> unit -> first accept time
+        self.rejected = {c: 0 for c in CHANNELS}
+        self.requests = {c: 0 for c in CHANNELS}
+        self.connections = 0
+        self.peak_connections = 0
+        self.servers = []
+        self.ports = {}
+
+    def bucket(self, name, rate, burst):
+        b = self.buckets.get(name)
+        if b is None:
+            b = self.buckets[name] = TokenBucket(rate, burst)
+        return b
+
+    def _accept(self, channel, text):
+        match = UNIT_RE.search(text)
+        if match:
+            self.accepted[channel].setdefault(match.group(1), time.time())
+
+    async def _service_delay(self):
+        ms = self.args.service_ms
+        await asyncio.sleep(random.uniform(0.5, 1.5) * ms / 1000)
+
+    def _opened(self):
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, self.connections)
+
+    async def _read_http(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = h.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = b""
+        if "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        return method, target, headers, body
+
+    @staticmethod
+    def _respond(writer, status, reason, body, extra=(), close=False):
+        head = [f"HTTP/1.1 {status} {reason}", f"Content-Length: {len(body)}",
+                "Content-Type: application/json"]
+        head.extend(extra)
+        if close:
+            head.append("Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+
+    async def _http(self, reader, writer, handler):
+        self._opened()
+        try:
+            while True:
+                req = await self._read_http(reader)
+                if req is None:
+                    break
+                close = req[2].get("connection", "").lower() == "close"
+                status, reason, body, extra = await handler(*req)
+                self._respond(writer, status, reason, body, extra, close)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def telegram(self, method, target, headers, body):
+        self.requests["telegram"] += 1
+        parts = urlsplit(target)
+        query = parse_qs(parts.query)
+        token = parts.path.split("/")[1][3:]
+        chat = query.get("chat_id", [""])[0]
+        a = self.args
+        wait = max(self.bucket(f"bot:{token}", a.telegram_bot_rate, a.telegram_bot_rate).take(),
+                   self.bucket(f"chat:{token}:{chat}", a.telegram_chat_rate, 3).take())
+        if wait:
+            self.rejected["telegram"] += 1
+            retry = math.ceil(wait)
+            body = json.dumps({"ok": False, "error_code": 429,
+                               "description": f"Too Many Requests: retry after {retry}",
+                               "parameters": {"retry_after": retry}}).encode()
+            return 429, "Too Many Requests", body, (f"Retry-After: {retry}",)
+        await self._service_delay()
+        self._accept("telegram", unquote(query.get("text", [""])[0]))
+        return 200, "OK", b'{"ok":true,"result":{}}', ()
+
+    async def ntfy(self, method, target, headers, body):
+        self.requests["ntfy"] += 1
+        visitor = headers.get("x-forwarded-for", "local")
+        a = self.args
+        wait = self.bucket(f"visitor:{visitor}", a.ntfy_rate, a.ntfy_burst).take()
+        if wait:
+            self.rejected["ntfy"] += 1
+            body = b'{"code":42901,"http":429,"error":"limit reached: too many requests"}'
+            return 429, "Too Many Requests", body, (f"Retry-After: {math.ceil(wait)}",)
+        await self._service_delay()
+        self._accept("ntfy", headers.get("title", ""))
+        return 200, "OK", b'{"event":"message"}', ()
+
+    async def smtp(self, reader, writer):
+        """Enough ESMTP for email_sender.py and smtplib (AUTH LOGIN/PLAIN)"""
+        import base64
+        self._opened()
+        account = "anonymous"
+
+        async def reply(text):
+            writer.write(text.encode() + b"\r\n")
+            await writer.drain()
+
+        try:
+            await reply("220 stand-in ESMTP ready")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                cmd = line.decode("latin-1").strip()
+                verb = cmd.split(" ", 1)[0].upper()
+                if verb in ("EHLO", "HELO"):
+                    await reply("250-stand-in\r\n250-AUTH LOGIN PLAIN\r\n250 8BITMIME")
+                elif verb == "AUTH":
+                    parts = cmd.split()
+                    if parts[1].upper() == "PLAIN":
+                        blob = parts[2] if len(parts) > 2 else None
+                        if blob is None:
+                            await reply("334 ")
+                            blob = (await reader.readline()).decode().strip()
+                        account = base64.b64decode(blob).split(b"\0")[1].decode()
+                    else:
+                        await reply("334 VXNlcm5hbWU6")
+                        account = base64.b64decode((await reader.readline()).strip()).decode()
+                        await reply("334 UGFzc3dvcmQ6")
+                        await reader.readline()
+                    await reply("235 2.7.0 Accepted")
+                elif verb == "MAIL":
+                    self.requests["gmail"] += 1
+                    a = self.args
+                    if self.bucket(f"account:{account}", a.smtp_rate, a.smtp_burst).take():
+                        self.rejected["gmail"] += 1
+                        await reply("421 4.7.28 Rate limited, try again later")
+                        break
+                    await reply("250 2.1.0 OK")
+                elif verb == "RCPT":
+                    await reply("250 2.1.5 OK")
+                elif verb == "DATA":
+                    await reply("354 Go ahead")
+                    subject = ""
+                    while True:
+                        data = await reader.readline()
+                        if data in (b".\r\n", b".\n", b""):
+                            break
+                        if data.lower().startswith(b"subject:"):
+                            subject = data.decode("utf-8", "replace")
+                    await self._service_delay()
+                    self._accept("gmail", subject)
+                    await reply("250 2.0.0 OK queued")
+                elif verb in ("NOOP", "RSET"):
+                    await reply("250 2.0.0 OK")
+                elif verb == "QUIT":
+                    await reply("221 2.0.0 Bye")
+                    break
+                else:
+                    await reply("502 5.5.1 Unrecognized command")
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def start(self, host="127.0.0.1"):
+        backlog = 4096
+        servers = (
+            ("telegram", lambda r, w: self._http(r, w, self.telegram)),
+            ("ntfy", lambda r, w: self._http(r, w, self.ntfy)),
+            ("gmail", self.smtp),
+        )
+        for name, handler in servers:
+            server = await asyncio.start_server(handler, host, 0, backlog=backlog)
+            self.servers.append(server)
+            self.ports[name] = server.sockets[0].getsockname()[1]
+
+    def reset(self):
+        self.buckets.clear()
+        self.accepted = {c: {} for c in CHANNELS}
+        self.rejected = {c: 0 for c in CHANNELS}
+        self.requests = {c: 0 for c in CHANNELS}
+        self.peak_connections = self.connections
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+# --- Virtual units (run inside the worker processes) ------------------------------
+
+class Unit:
+    """One alarm unit sending the way notify.py does, with a retry strategy"""
+
+    def __init__(self, index, cfg, rng):
+        self.name = f"u{index}"
+        self.cfg = cfg
+        self.rng = rng
+        self.ip = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+        self.bot = f"bot{index % cfg['bots']}"
+        self.chat = f"chat{index % cfg['chats']}"
+        self.account = f"unit{index % cfg['accounts']}@example.com"
+        self.attempts = {c: 0 for c in CHANNELS}
+        self.rejections = {c: 0 for c in CHANNELS}
+        self.errors = {c: 0 for c in CHANNELS}
+        self.delivered = {c: False for c in CHANNELS}
+        self.gateway_acked = False
+
+    # Each send opens a fresh connection and closes it, as the device does
+    async def send_telegram(self, notify):
+        message = f"🚨 {notify.alarm_title(self.name)} Water level is high! Check the sump pump immediately!"
+        encoded = message.replace(" ", "%20")
+        request = (f"GET /bot{self.bot}/sendMessage?chat_id={self.chat}&text={encoded} HTTP/1.1\r\n"
+                   "Host: api.telegram.org\r\nConnection: close\r\n\r\n")
+        status, headers = await self._http(self.cfg["ports"]["telegram"], request.encode())
+        return status == 200, status == 429, float(headers.get("retry-after", 0))
+
+    async def send_ntfy(self, notify):
+        body = b"Water level is high! Check the sump pump immediately!"
+        request = (f"POST /{self.cfg['topic']} HTTP/1.1\r\nHost: ntfy.sh\r\n"
+                   f"Title: {notify.alarm_title(self.name)}\r\nPriority: urgent\r\n"
+                   f"Tags: warning,rotating_light\r\nX-Forwarded-For: {self.ip}\r\n"
+                   f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body
+        status, headers = await self._http(self.cfg["ports"]["ntfy"], request)
+        return status == 200, status == 429, float(headers.get("retry-after", 0))
+
+    async def _http(self, port, request):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            writer.write(request)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            return status, headers
+        finally:
+            writer.close()
+
+    async def send_gmail(self, notify):
+        """The email_sender.py dialogue, one reply read per command"""
+        import mybase64
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.cfg["ports"]["gmail"])
+
+        async def command(data):
+            if data:
+                writer.write(data)
+                await writer.drain()
+            return (await reader.readline()).decode()
+
+        async def multiline():
+            while True:
+                line = (await reader.readline()).decode()
+                if len(line) < 4 or line[3] != "-":
+                    return line
+
+        try:
+            await command(None)
+            writer.write(b"EHLO ESP32-C3-Sump-Alarm\r\n")
+            await multiline()
+            await command(b"AUTH LOGIN\r\n")
+            await command((mybase64.b64encode(self.account) + "\r\n").encode())
+            if not (await command((mybase64.b64encode("app-password") + "\r\n").encode())).startswith("235"):
+                return False, False, 0
+            response = await command(f"MAIL FROM: <{self.account}>\r\n".encode())
+            if response.startswith("421"):
+                return False, True, 0
+            await command(f"RCPT TO: <{self.account}>\r\n".encode())
+            await command(b"DATA\r\n")
+            subject = f"URGENT: Sump Pump Alert ({self.name})!"
+            message = (f"From: Sump Alarm <{self.account}>\r\nTo: {self.account}\r\n"
+                       f"Subject: {subject}\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n"
+                       "The water level is high!\r\n.\r\n")
+            response = await command(message.encode())
+            await command(b"QUIT\r\n")
+            return response.startswith("250"), False, 0
+        finally:
+            writer.close()
+
+    async def send_channel(self, channel, notify):
+        """Send on one channel with the configured retry strategy"""
+        send = getattr(self, f"send_{channel}")
+        strategy = self.cfg["strategy"]
+        base = self.cfg["base_s"]
+        cap = self.cfg["cap_s"]
+        sleep = base
+        deadline = time.time() + self.cfg["give_up_s"]
+        while True:
+            self.attempts[channel] += 1
+            try:
+                ok, limited, retry_after = await asyncio.wait_for(send(notify), 30)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                ok, limited, retry_after = False, False, 0
+                self.errors[channel] += 1
+            if ok:
+                self.delivered[channel] = True
+                return True
+            if limited:
+                self.rejections[channel] += 1
+            if strategy == "device" or time.time() >= deadline:
+                return False
+            n = self.attempts[channel]
+            if strategy == "none":
+                wait = 0
+            elif strategy == "expo":
+                wait = min(cap, base * 2 ** (n - 1))
+            elif strategy == "full":
+                wait = max(retry_after, self.rng.uniform(0, min(cap, base * 2 ** (n - 1))))
+            else:  # decorrelated
+                sleep = min(cap, self.rng.uniform(base, sleep * 3))
+                wait = max(retry_after, sleep)
+            await asyncio.sleep(wait)
+
+    async def send_gateway(self):
+        """One signed datagram to the gateway, resent until acked (GatewayClient timing)"""
+        import gateway
+        loop = asyncio.get_running_loop()
+        acked = loop.create_future()
+        session = self.rng.getrandbits(32)
+        key = self.cfg["gateway_key"].encode()
+
+        class Proto(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                msg = gateway.unpack(data)
+                if (msg and msg["type"] == gateway.T_ACK and msg["session"] == session
+                        and gateway.verify(key, data, msg) and not acked.done()):
+                    acked.set_result(True)
+
+        transport, _ = await loop.create_datagram_endpoint(
+            Proto, remote_addr=("127.0.0.1", self.cfg["ports"]["gateway"]))
+        datagram = gateway.pack(key, gateway.T_ALERT, session, 1, gateway.EV_ALARM,
+                                gateway.CH_TELEGRAM | gateway.CH_GMAIL | gateway.CH_NTFY,
+                                self.name, "", "sump", self.name)
+        wait = 0.25
+        end = time.time() + self.cfg["gateway_deadline_s"]
+        try:
+            while time.time() < end:
+                transport.sendto(datagram)
+                try:
+                    await asyncio.wait_for(asyncio.shield(acked), min(wait, end - time.time()))
+                    return True
+                except asyncio.TimeoutError:
+                    wait *= 2
+            return False
+        finally:
+            transport.close()
+
+    async def run(self, alarm_at, notify):
+        """Wait for this unit's alarm, then notify like send_notifications()"""
+        await asyncio.sleep(max(0, alarm_at - time.time()))
+        detected = time.time()
+        if self.cfg["spread_s"]:
+            await asyncio.sleep(self.rng.uniform(0, self.cfg["spread_s"]))
+        if self.cfg["mode"] == "gateway":
+            self.gateway_acked = await self.send_gateway()
+            if self.gateway_acked:
+                return detected
+        while True:
+            success = False
+            for channel in CHANNELS:
+                if not self.delivered[channel]:
+                    success = await self.send_channel(channel, notify) or success
+            if success or self.cfg["strategy"] != "device" or \
+                    time.time() - detected + self.cfg["retry_s"] > self.cfg["give_up_s"]:
+                return detected
+            await asyncio.sleep(self.cfg["retry_s"])  # The firmware's NOTIFY_RETRY_SECONDS
+
+async def _run_units(indices, cfg):
+    use_config_template()
+    raise_fd_limit()
+    import notify
+    rng = random.Random(cfg["seed"] * 1000003 + indices[0])
+    units = [Unit(i, cfg, rng) for i in indices]
+    alarm_times = [cfg["storm_start"] + rng.uniform(0, cfg["storm_s"]) for _ in units]
+    detected = await asyncio.gather(*(u.run(t, notify) for u, t in zip(units, alarm_times)))
+    return [(u.name, d, u.attempts, u.rejections, u.errors, u.delivered, u.gateway_acked)
+            for u, d in zip(units, detected)]
+
+def run_worker(indices, cfg):
+    """Process pool entry point: run a slice of the fleet on its own event loop"""
+    return asyncio.run(_run_units(indices, cfg))
+
+# --- Driver ---------------------------------------------------------------------
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+def report(strategy, args, results, services, gw, elapsed):
+    detected = {r[0]: r[1] for r in results}
+    print(f"\n{args.mode} mode, strategy {strategy}: {args.units} units, "
+          f"storm {args.storm_s} s, spread {args.spread_s} s, {elapsed:.1f} s wall")
+    print(f"{'channel':<10}{'delivered':>11}{'requests':>10}{'rejected':>10}{'errors':>8}"
+          f"{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'max s':>8}{'msg/s':>8}")
+    for channel in CHANNELS:
+        accepted = services.accepted[channel]
+        latency = [t - detected[u] for u, t in accepted.items() if u in detected]
+        errors = sum(r[4][channel] for r in results)
+        span = (max(accepted.values()) - min(accepted.values())) if len(accepted) > 1 else 0
+        rate = len(accepted) / span if span else float(len(accepted))
+        print(f"{channel:<10}{len(accepted):>6}/{args.units:<4}{services.requests[channel]:>10}"
+              f"{services.rejected[channel]:>10}{errors:>8}{percentile(latency, 50):>8.2f}"
+              f"{percentile(latency, 95):>8.2f}{percentile(latency, 99):>8.2f}"
+              f"{max(latency, default=float('nan')):>8.2f}{rate:>8.1f}")
+    every = sum(1 for r in results if all(r[0] in services.accepted[c] for c in CHANNELS))
+    none = sum(1 for r in results if not any(r[0] in services.accepted[c] for c in CHANNELS))
+    print(f"Units reached on every channel: {every}, on no channel: {none}, "
+          f"peak service connections: {services.peak_connections}")
+    if gw is not None:
+        acked = sum(1 for r in results if r[6])
+        print(f"Gateway acked {acked}/{args.units}; {gw.summary()}")
+
+async def run_strategy(strategy, args, services, loop, pool):
+    services.reset()
+    gw = None
+    transport = tasks = None
+    ports = dict(services.ports)
+    if args.mode == "gateway":
+        import gateway_server
+        cfg = {"listen": "127.0.0.1:0", "keys": {"*": args.gateway_key},
+               "dedupe_window_s": 300, "queue_size": args.units * 2,
+               "telegram": {"bot_token": "bot0", "chat_id": "chat0",
+                            "api": f"http://127.0.0.1:{ports['telegram']}"},
+               "gmail": {"user": "gateway@example.com", "app_password": "app-password",
+                         "recipients": ["gateway@example.com"], "host": "127.0.0.1",
+                         "port": ports["gmail"], "tls": "none"},
+               "ntfy": {"topic": "sump", "server": f"http://127.0.0.1:{ports['ntfy']}"}}
+        gw, transport, tasks = await gateway_server.serve(cfg, workers=args.gateway_workers)
+        ports["gateway"] = transport.get_extra_info("sockname")[1]
+
+    start = time.time()
+    cfg = {"ports": ports, "strategy": strategy, "mode": args.mode, "seed": args.seed,
+           "storm_start": start + args.startup_s, "storm_s": args.storm_s,
+           "spread_s": args.spread_s, "retry_s": args.retry_s, "give_up_s": args.give_up_s,
+           "base_s": args.base_s, "cap_s": args.cap_s, "topic": "sump",
+           "bots": args.bots, "chats": args.chats, "accounts": args.accounts,
+           "gateway_key": args.gateway_key, "gateway_deadline_s": 10.0}
+    slices = [list(range(w, args.units, args.workers)) for w in range(args.workers)]
+    futures = [loop.run_in_executor(pool, run_worker, s, cfg) for s in slices if s]
+    results = [r for part in await asyncio.gather(*futures) for r in part]
+    if gw is not None:
+        await gw.queue.join()  # Let the gateway finish its fan-outs
+    report(strategy, args, results, services, gw, time.time() - start)
+    if gw is not None:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        transport.close()
+        gw.close()
+        await asyncio.sleep(0.5)  # Let the stand-ins see the pooled connections close
+
+async def main_async(args):
+    raise_fd_limit()
+    services = StandIns(args)
+    await services.start()
+    loop = asyncio.get_running_loop()
+    try:
+        with ProcessPoolExecutor(args.workers) as pool:
+            for strategy in args.strategy.split(","):
+                if strategy not in STRATEGIES:
+                    raise SystemExit(f"Unknown strategy {strategy}; choose from {', '.join(STRATEGIES)}")
+                await run_strategy(strategy, args, services, loop, pool)
+    finally:
+        services.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--units", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                        help="Worker processes running the units")
+    parser.add_argument("--mode", choices=("direct", "gateway"), default="direct")
+    parser.add_argument("--strategy", default="device,full",
+                        help=f"Comma-separated list from: {', '.join(STRATEGIES)}")
+    parser.add_argument("--storm-s", type=float, default=10, help="Alarms start within this window")
+    parser.add_argument("--spread-s", type=float, default=0, help="Random delay before the first send")
+    parser.add_argument("--retry-s", type=float, default=20,
+                        help="Round retry for the device strategy (NOTIFY_RETRY_SECONDS, shortened)")
+    parser.add_argument("--give-up-s", type=float, default=60, help="Stop retrying after this long")
+    parser.add_argument("--base-s", type=float, default=0.5, help="First backoff step")
+    parser.add_argument("--cap-s", type=float, default=20, help="Longest backoff step")
+    parser.add_argument("--bots", type=int, default=1, help="Telegram bots shared by the fleet")
+    parser.add_argument("--chats", type=int, default=100, help="Telegram chats shared by the fleet")
+    parser.add_argument("--accounts", type=int, default=50, help="Gmail accounts shared by the fleet")
+    parser.add_argument("--telegram-bot-rate", type=float, default=30, help="Messages/s per bot")
+    parser.add_argument("--telegram-chat-rate", type=float, default=1, help="Messages/s per chat")
+    parser.add_argument("--smtp-rate", type=float, default=1, help="Messages/s per account")
+    parser.add_argument("--smtp-burst", type=float, default=5)
+    parser.add_argument("--ntfy-rate", type=float, default=0.2, help="Requests/s per visitor IP")
+    parser.add_argument("--ntfy-burst", type=float, default=60)
+    parser.add_argument("--service-ms", type=float, default=80, help="Service processing time")
+    parser.add_argument("--gateway-workers", type=int, default=16)
+    parser.add_argument("--gateway-key", default="fleet-sim-key")
+    parser.add_argument("--startup-s", type=float, default=3,
+                        help="Head start for the worker processes before the storm")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
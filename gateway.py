@@ -0,0 +1,191 @@
+"""
+Notification gateway client and datagram format for the Sump Alarm
+Instead of three TLS handshakes per alarm, the device can send one small
+HMAC-signed UDP datagram to gateway_server.py on the LAN, which fans the
+alert out to Telegram, Gmail and Ntfy over pooled connections. The datagram
+is resent until the gateway acknowledges it or the deadline passes, after
+which the caller falls back to sending directly. The gateway acks only once
+the alert has gone out on at least one channel, so the deadline must leave
+it time for one send (a TLS handshake when its pool is cold).
+
+Datagram: "SA", version, type, event, channel mask, session (4 bytes),
+sequence (4 bytes), then length-prefixed unit, site, sensor and label
+strings, then the first 16 bytes of HMAC-SHA256 over everything before it.
+The same code packs and checks datagrams on the ESP32 and in the server.
+"""
+
+import struct
+
+try:
+    import hashlib
+except ImportError:
+    import uhashlib as hashlib
+
+from compat import ticks_ms, ticks_diff
+
+MAGIC = b"SA"
+VERSION = 1
+MAC_LEN = 16
+_HEADER = ">2sBBBBII"
+HEADER_LEN = struct.calcsize(_HEADER)
+
+# Datagram types
+T_ALERT = 1
+T_ACK = 2
+
+# Events
+EV_ALARM = 1
+EV_RETRY = 2
+EV_RESTORE = 3
+EV_TEST = 4
+EV_SILENT = 5  # heartbeat_monitor.py: a unit stopped sending heartbeats
+EV_BACK = 6    # ... and started again
+
+# Channel mask bits
+CH_TELEGRAM = 1
+CH_GMAIL = 2
+CH_NTFY = 4
+CHANNEL_BITS = (("telegram", CH_TELEGRAM), ("gmail", CH_GMAIL), ("ntfy", CH_NTFY))
+
+# Ack status
+ACK_ACCEPTED = 0   # Delivered on at least one channel
+ACK_DUPLICATE = 1  # Already delivered for this or another unit at the same site
+
+_pads = {}  # key -> (inner pad, outer pad)
+
+def hmac_sha256(key, msg):
+    """HMAC-SHA256 (MicroPython has hashlib.sha256 but no hmac module)"""
+    pads = _pads.get(key)
+    if pads is None:
+        k = key if len(key) <= 64 else hashlib.sha256(key).digest()
+        k = k + bytes(64 - len(k))
+        pads = (bytes(b ^ 0x36 for b in k), bytes(b ^ 0x5C for b in k))
+        _pads[key] = pads
+    inner = hashlib.sha256(pads[0])
+    inner.update(msg)
+    outer = hashlib.sha256(pads[1])
+    outer.update(inner.digest())
+    return outer.digest()
+
+def _same(a, b):
+    """Constant-time comparison of two byte strings"""
+    if len(a) != len(b):
+        return False
+    diff = 0
+    for x, y in zip(a, b):
+        diff |= x ^ y
+    return diff == 0
+
+def pack(key, msg_type, session, seq, event=0, mask=0, unit="", site="", sensor="", label=""):
+    """Build a signed datagram"""
+    parts = [struct.pack(_HEADER, MAGIC, VERSION, msg_type, event, mask, session, seq)]
+    for text in (unit, site, sensor, label):
+        data = text.encode()[:255]
+        parts.append(bytes((len(data),)))
+        parts.append(data)
+    body = b"".join(parts)
+    return body + hmac_sha256(key, body)[:MAC_LEN]
+
+def unpack(data):
+    """Parse a datagram without checking its MAC; returns a dict or None"""
+    if len(data) < HEADER_LEN + 4 + MAC_LEN:
+        return None
+    magic, version, msg_type, event, mask, session, seq = struct.unpack_from(_HEADER, data)
+    if magic != MAGIC or version != VERSION:
+        return None
+    pos = HEADER_LEN
+    end = len(data) - MAC_LEN
+    fields = []
+    for _ in range(4):
+        if pos >= end:
+            return None
+        n = data[pos]
+        if pos + 1 + n > end:
+            return None
+        fields.append(bytes(data[pos + 1:pos + 1 + n]).decode())
+        pos += 1 + n
+    return {"type": msg_type, "event": event, "mask": mask, "session": session,
+            "seq": seq, "unit": fields[0], "site": fields[1], "sensor": fields[2],
+            "label": fields[3], "body_len": end}
+
+def verify(key, data, msg=None):
+    """True if the datagram's MAC matches key"""
+    if msg is None:
+        msg = unpack(data)
+        if msg is None:
+            return False
+    end = msg["body_len"]
+    return _same(hmac_sha256(key, data[:end])[:MAC_LEN], data[end:end + MAC_LEN])
+
+def channel_mask(routes):
+    """Mask of the channels for which routes(name) is true"""
+    mask = 0
+    for name, bit in CHANNEL_BITS:
+        if routes(name):
+            mask |= bit
+    return mask
+
+class GatewayClient:
+    def __init__(self, host, key, unit, site="", port=5050, deadline_ms=10000,
+                 first_wait_ms=250):
+        """Send alerts to a gateway_server.py on the LAN
+
+        key: shared secret (bytes or str). Each client picks a random
+        session number so sequence numbers never repeat across reboots.
+        """
+        import os
+        self.host = host
+        self.port = port
+        self.key = key.encode() if isinstance(key, str) else key
+        self.unit = unit
+        self.site = site
+        self.deadline_ms = deadline_ms
+        self.first_wait_ms = first_wait_ms
+        self.session = struct.unpack(">I", os.urandom(4))[0]
+        self.seq = 0
+        self._addr = None
+        self.last_rtt_ms = None
+        self.last_attempts = 0
+
+    def send_alert(self, event, sensor="", label="", mask=CH_TELEGRAM | CH_GMAIL | CH_NTFY):
+        """Send one alert and wait for the ack; True once the gateway has delivered it
+
+        The datagram is resent with doubling waits until it is acknowledged
+        or deadline_ms has passed.
+        """
+        import socket
+        import watchdog
+        self.seq += 1
+        datagram = pack(self.key, T_ALERT, self.session, self.seq, event, mask,
+                        self.unit, self.site, sensor, label)
+        if self._addr is None:
+            with watchdog.blocking("notifier", "gateway resolve"):
+                self._addr = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_DGRAM)[0][-1]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        start = ticks_ms()
+        wait_ms = self.first_wait_ms
+        self.last_attempts = 0
+        try:
+            with watchdog.blocking("notifier", "gateway ack"):
+                while True:
+                    left = self.deadline_ms - ticks_diff(ticks_ms(), start)
+                    if left <= 0:
+                        return False
+                    sock.sendto(datagram, self._addr)
+                    self.last_attempts += 1
+                    sock.settimeout(min(wait_ms, left) / 1000)
+                    wait_ms *= 2
+                    try:
+                        while True:
+                            reply = sock.recv(128)
+                            msg = unpack(reply)
+                            if (msg and msg["type"] == T_ACK and msg["session"] == self.session
+                                    and msg["seq"] == self.seq and verify(self.key, reply, msg)):
+                                self.last_rtt_ms = ticks_diff(ticks_ms(), start)
+                                return True
+                            if ticks_diff(ticks_ms(), start) >= self.deadline_ms:
+                                return False
+                    except OSError:
+                        pass  # Timed out waiting: send again
+        finally:
+            sock.close()
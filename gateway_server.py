@@ -0,0 +1,471 @@
+"""
+LAN notification gateway for Sump Alarm units
+Host service (CPython asyncio, not for the ESP32). Units in gateway mode send
+one HMAC-signed UDP datagram per alert (see gateway.py). This service drops
+repeats from retries and from other units at the same site, fans the alert
+out to Telegram, Gmail SMTP and Ntfy, and acks it once the first channel has
+delivered it. If every channel fails there is no ack, and the unit sends
+directly. HTTPS
+connections are pooled and kept alive per host and the SMTP session stays
+logged in between alerts, so once the gateway is warm there is no TLS
+handshake on the alert path. One process serves hundreds of units.
+
+Usage:
+    python gateway_server.py --config gateway.json
+
+gateway.json (channels that are left out are disabled):
+    {
+      "listen": "0.0.0.0:5050",
+      "keys": {"*": "shared secret", "garage-unit": "its own secret"},
+      "dedupe_window_s": 300,
+      "telegram": {"bot_token": "...", "chat_id": "..."},  # optional api
+      "gmail": {"user": "you@gmail.com", "app_password": "...",
+                "recipients": ["you@gmail.com"]},  # optional host, port, tls
+      "ntfy": {"topic": "your_topic", "server": "https://ntfy.sh"}
+    }
+
+Units that watch the same pit should share a GATEWAY_SITE and sensor name;
+an alert for the same site, sensor and event within dedupe_window_s is
+not sent again, and is acknowledged once the first one has been delivered.
+"""
+
+import argparse
+import asyncio
+import json
+import ssl
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+import gateway
+
+# --- Pooled HTTPS ---------------------------------------------------------------
+
+class HttpPool:
+    """Keep-alive HTTP/1.1 connections, a few per host"""
+
+    def __init__(self, max_per_host=4, idle_s=50, ssl_context=None):
+        self.max_per_host = max_per_host
+        self.idle_s = idle_s
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self._idle = {}  # (scheme, host, port) -> [(reader, writer, last_used)]
+        self._limits = {}
+        self.connects = 0
+        self.reuses = 0
+
+    async def _get(self, key):
+        idle = self._idle.get(key, [])
+        now = time.monotonic()
+        while idle:
+            reader, writer, used = idle.pop()
+            if now - used < self.idle_s and not reader.at_eof():
+                self.reuses += 1
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=self.ssl_context if scheme == "https" else None)
+        self.connects += 1
+        return reader, writer, False
+
+    def _put(self, key, reader, writer):
+        self._idle.setdefault(key, []).append((reader, writer, time.monotonic()))
+
+    async def request(self, method, url, headers=None, body=b"", timeout=15):
+        """Send one request; returns (status, body bytes)"""
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {parts.hostname}",
+                 f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.max_per_host)
+        async with limit:
+            for attempt in (0, 1):
+                reader, writer, reused = await self._get(key)
+                try:
+                    status, data, keep = await asyncio.wait_for(
+                        self._exchange(reader, writer, request), timeout)
+                except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    writer.close()
+                    if reused and attempt == 0:
+                        continue  # The server closed an idle connection: redial once
+                    raise
+                if keep:
+                    self._put(key, reader, writer)
+                else:
+                    writer.close()
+                return status, data
+
+    @staticmethod
+    async def _exchange(reader, writer, request):
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise EOFError("connection closed")
+        status = int(status_line.split()[1])
+        length = None
+        chunked = False
+        keep = True
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            value = value.strip()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and "chunked" in value.lower():
+                chunked = True
+            elif name == "connection" and value.lower() == "close":
+                keep = False
+        if chunked:
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b"".join(chunks)
+        elif length is not None:
+            data = await reader.readexactly(length)
+        else:
+            data = await reader.read()
+            keep = False
+        return status, data, keep
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, writer, _ in idle:
+                writer.close()
+        self._idle.clear()
+
+# --- Pooled SMTP --------------------------------------------------------------
+
+class SmtpSession:
+    """One logged-in SMTP session reused between alerts (smtplib in a thread)"""
+
+    def __init__(self, user, password, host="smtp.gmail.com", port=465, tls="ssl", idle_s=240):
+        """tls: "ssl" (port 465), "starttls" (port 587) or "none" (test servers)"""
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.idle_s = idle_s
+        self._smtp = None
+        self._used = 0.0
+        self._lock = asyncio.Lock()
+        self.logins = 0
+
+    def _session(self):
+        import smtplib
+        if self._smtp is not None and time.monotonic() - self._used < self.idle_s:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+        self._close()
+        if self.tls == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=20)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=20)
+            if self.tls == "starttls":
+                smtp.starttls()
+        smtp.login(self.user, self.password)
+        self.logins += 1
+        self._smtp = smtp
+        return smtp
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _send(self, recipients, subject, text):
+        from email.message import EmailMessage
+        msg = EmailMessage()
+        msg["From"] = f"Sump Alarm <{self.user}>"
+        msg["To"] = ", ".join(recipients)
+        msg["Subject"] = subject
+        msg.set_content(text)
+        self._session().send_message(msg)
+        self._used = time.monotonic()
+
+    async def send(self, recipients, subject, text):
+        async with self._lock:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._send, recipients, subject, text)
+
+    def close(self):
+        self._close()
+
+# --- Gateway ------------------------------------------------------------------
+
+def alert_text(msg):
+    """Headline and body for an alert datagram"""
+    where = msg["label"] or msg["sensor"] or msg["unit"]
+    event = msg["event"]
+    if event == gateway.EV_RESTORE:
+        return f"Sump OK ({where})", f"The water level at {where} is back to normal."
+    if event == gateway.EV_TEST:
+        return f"Sump alarm test ({where})", f"Test notification from unit {msg['unit']}."
+    if event == gateway.EV_SILENT:
+        return (f"SUMP ALARM OFFLINE ({where})!",
+                f"{where} has stopped checking in. It cannot warn you of water "
+                "until it is back: check its power and WiFi.")
+    if event == gateway.EV_BACK:
+        return f"Sump alarm back online ({where})", f"{where} is checking in again."
+    return (f"SUMP ALARM ({where})!",
+            f"The water level at {where} is high! Check the sump pump immediately!")
+
+class Gateway(asyncio.DatagramProtocol):
+    def __init__(self, cfg, pool=None, smtp=None):
+        """Set up keys, dedupe state and the enabled channels from cfg"""
+        self.cfg = cfg
+        self.keys = {unit: key.encode() for unit, key in cfg["keys"].items()}
+        self.window_s = cfg.get("dedupe_window_s", 300)
+        self.retries = cfg.get("channel_retries", 3)
+        self.queue = asyncio.Queue(cfg.get("queue_size", 1000))
+        self.pool = pool or HttpPool()
+        self.smtp = smtp
+        if smtp is None and "gmail" in cfg:
+            gmail = cfg["gmail"]
+            self.smtp = SmtpSession(gmail["user"], gmail["app_password"],
+                                    gmail.get("host", "smtp.gmail.com"), gmail.get("port", 465),
+                                    gmail.get("tls", "ssl"))
+        self.channels = {}
+        if "telegram" in cfg:
+            self.channels[gateway.CH_TELEGRAM] = ("telegram", self.send_telegram)
+        if "gmail" in cfg:
+            self.channels[gateway.CH_GMAIL] = ("gmail", self.send_gmail)
+        if "ntfy" in cfg:
+            self.channels[gateway.CH_NTFY] = ("ntfy", self.send_ntfy)
+        self.seen = {}     # (unit, session, seq) -> (ack status or None while sending, time)
+        self.recent = {}   # (site, sensor, event) -> time of the last delivered fan-out
+        self.waiting = {}  # (site, sensor, event) -> [(key, msg, addr, status)] to ack on delivery
+        self.transport = None
+        self.stats = {"received": 0, "rejected": 0, "retransmits": 0, "duplicates": 0,
+                      "queue_full": 0, "fanouts": 0, "sent": 0, "failed": 0,
+                      "undelivered": 0}
+        self.fanout_ms = []  # Queue-to-delivered time of recent fan-outs
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.stats["received"] += 1
+        msg = gateway.unpack(data)
+        if msg is None or msg["type"] != gateway.T_ALERT:
+            self.stats["rejected"] += 1
+            return
+        key = self.keys.get(msg["unit"]) or self.keys.get("*")
+        if key is None or not gateway.verify(key, data, msg):
+            self.stats["rejected"] += 1
+            return
+
+        now = time.monotonic()
+        ident = (msg["unit"], msg["session"], msg["seq"])
+        group = (msg["site"] or msg["unit"], msg["sensor"], msg["event"])
+        if msg["event"] == gateway.EV_TEST:
+            group += ident  # Every test alert is sent and acked on its own
+        seen = self.seen.get(ident)
+        if seen is not None:
+            self.stats["retransmits"] += 1
+            if seen[0] is None:
+                self._wait(group, key, msg, addr, None)  # Still sending; ack when delivered
+                return
+            status = seen[0]  # Our ack was lost; ack again
+        elif group in self.waiting:
+            self.stats["duplicates"] += 1  # Another unit's alert is being sent
+            self.seen[ident] = (None, now)
+            self._wait(group, key, msg, addr, gateway.ACK_DUPLICATE)
+            return
+        else:
+            last = self.recent.get(group)
+            if last is not None and now - last < self.window_s:
+                self.stats["duplicates"] += 1
+                status = gateway.ACK_DUPLICATE
+                self.seen[ident] = (status, now)
+            else:
+                try:
+                    self.queue.put_nowait((msg, group, now))
+                except asyncio.QueueFull:
+                    self.stats["queue_full"] += 1
+                    return  # No ack: the unit falls back to sending directly
+                self.seen[ident] = (None, now)
+                self.waiting[group] = []
+                self._wait(group, key, msg, addr, gateway.ACK_ACCEPTED)
+                return
+        self._ack(key, msg, addr, status)
+
+    def _wait(self, group, key, msg, addr, status):
+        """Ack msg once the group's alert is delivered; retransmits update the address"""
+        waiters = self.waiting[group]
+        for i, waiter in enumerate(waiters):
+            if (waiter[1]["unit"], waiter[1]["session"], waiter[1]["seq"]) == \
+                    (msg["unit"], msg["session"], msg["seq"]):
+                waiters[i] = (key, msg, addr, waiter[3])
+                return
+        waiters.append((key, msg, addr, status))
+
+    def _ack(self, key, msg, addr, status):
+        self.transport.sendto(gateway.pack(key, gateway.T_ACK, msg["session"], msg["seq"],
+                                           status, 0, msg["unit"]), addr)
+
+    def _delivered(self, group):
+        """The first channel got the alert through: ack every unit waiting for it"""
+        waiters = self.waiting.pop(group, None)
+        if waiters is None:
+            return
+        now = time.monotonic()
+        self.recent[group] = now
+        for key, msg, addr, status in waiters:
+            self.seen[(msg["unit"], msg["session"], msg["seq"])] = (status, now)
+            self._ack(key, msg, addr, status)
+
+    def _undelivered(self, group):
+        """Every channel failed: no ack, so the units send directly"""
+        waiters = self.waiting.pop(group, None)
+        if waiters is None:
+            return
+        self.stats["undelivered"] += 1
+        for key, msg, addr, status in waiters:
+            self.seen.pop((msg["unit"], msg["session"], msg["seq"]), None)
+
+    async def send_telegram(self, msg):
+        cfg = self.cfg["telegram"]
+        title, body = alert_text(msg)
+        text = quote(f"🚨 {title} {body}")
+        api = cfg.get("api", "https://api.telegram.org").rstrip("/")
+        status, _ = await self.pool.request(
+            "GET", f"{api}/bot{cfg['bot_token']}/sendMessage"
+                   f"?chat_id={cfg['chat_id']}&text={text}")
+        return status == 200
+
+    async def send_ntfy(self, msg):
+        cfg = self.cfg["ntfy"]
+        title, body = alert_text(msg)
+        server = cfg.get("server", "https://ntfy.sh").rstrip("/")
+        urgent = msg["event"] in (gateway.EV_ALARM, gateway.EV_RETRY, gateway.EV_SILENT)
+        status, _ = await self.pool.request(
+            "POST", f"{server}/{cfg['topic']}",
+            headers={"Title": title.encode("utf-8").decode("latin-1"),
+                     "Priority": "urgent" if urgent else "default",
+                     "Tags": "warning,rotating_light" if urgent else "white_check_mark"},
+            body=body.encode())
+        return status == 200
+
+    async def send_gmail(self, msg):
+        title, body = alert_text(msg)
+        await self.smtp.send(self.cfg["gmail"]["recipients"], title,
+                             body + f"\n\nUnit: {msg['unit']}\nSensor: {msg['sensor']}\n")
+        return True
+
+    async def _send_channel(self, name, send, msg, group):
+        delay = 1
+        for attempt in range(self.retries):
+            try:
+                if await send(msg):
+                    self.stats["sent"] += 1
+                    self._delivered(group)
+                    return True
+            except Exception as e:
+                print(f"{name} send failed (attempt {attempt + 1}): {e}")
+            await asyncio.sleep(delay)
+            delay *= 2
+        self.stats["failed"] += 1
+        return False
+
+    async def worker(self):
+        """Take accepted alerts off the queue and send them on every channel"""
+        while True:
+            msg, group, queued = await self.queue.get()
+            sends = [self._send_channel(name, send, msg, group)
+                     for bit, (name, send) in self.channels.items() if msg["mask"] & bit]
+            if not any(await asyncio.gather(*sends)):
+                self._undelivered(group)
+            self.stats["fanouts"] += 1
+            self.fanout_ms.append((time.monotonic() - queued) * 1000)
+            del self.fanout_ms[:-1000]
+            self.queue.task_done()
+
+    async def prune(self, every_s=60):
+        """Forget alert ids and site groups older than the dedupe window"""
+        while True:
+            await asyncio.sleep(every_s)
+            cutoff = time.monotonic() - max(self.window_s, 600)
+            self.seen = {k: v for k, v in self.seen.items() if v[1] >= cutoff or v[0] is None}
+            self.recent = {k: v for k, v in self.recent.items() if v >= cutoff}
+
+    def summary(self):
+        s = self.stats
+        lat = sorted(self.fanout_ms)
+        p50 = f"{lat[len(lat) // 2]:.0f}" if lat else "-"
+        return (f"received {s['received']} rejected {s['rejected']} retransmits {s['retransmits']} "
+                f"duplicates {s['duplicates']} fan-outs {s['fanouts']} sent {s['sent']} "
+                f"failed {s['failed']} undelivered {s['undelivered']} queue-full {s['queue_full']} fan-out p50 {p50} ms "
+                f"https connects {self.pool.connects} reuses {self.pool.reuses}")
+
+    def close(self):
+        self.pool.close()
+        if self.smtp is not None:
+            self.smtp.close()
+
+async def serve(cfg, workers=8):
+    """Start the gateway; returns (gateway, transport, background tasks)"""
+    host, _, port = cfg.get("listen", "0.0.0.0:5050").rpartition(":")
+    loop = asyncio.get_running_loop()
+    transport, gw = await loop.create_datagram_endpoint(
+        lambda: Gateway(cfg), local_addr=(host or "0.0.0.0", int(port)))
+    tasks = [asyncio.ensure_future(gw.worker()) for _ in range(workers)]
+    tasks.append(asyncio.ensure_future(gw.prune()))
+    return gw, transport, tasks
+
+async def run(cfg, workers, stats_s):
+    gw, transport, tasks = await serve(cfg, workers)
+    print(f"Gateway listening on {transport.get_extra_info('sockname')}, "
+          f"channels: {', '.join(name for name, _ in gw.channels.values()) or 'none'}")
+    try:
+        while True:
+            await asyncio.sleep(stats_s)
+            print(gw.summary())
+    finally:
+        for task in tasks:
+            task.cancel()
+        transport.close()
+        gw.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--config", required=True, help="Gateway JSON config")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent fan-outs")
+    parser.add_argument("--stats-s", type=float, default=60, help="Print stats this often")
+    args = parser.parse_args()
+    with open(args.config) as f:
+        cfg = json.load(f)
+    try:
+        asyncio.run(run(cfg, args.workers, args.stats_s))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
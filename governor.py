@@ -0,0 +1,327 @@
+"""
+Alert governor for the Sump Alarm
+Sits between the alarm engines and the notifiers. Each channel has a token
+bucket so a float bobbing around the threshold cannot flood Telegram or the
+SMS gateways; repeated alarm/restore cycles within the flap window become
+one "flapping" digest instead of a message per cycle; and "water back to
+normal" messages are sent at once, batched, or not at all. The state is a
+fixed-size record in RTC memory, so it survives soft and watchdog resets.
+"""
+
+import struct
+
+import rtcstore
+from compat import ticks_ms, ticks_diff, ticks_add
+
+CHANNELS = ("telegram", "gmail", "ntfy")
+MAX_SLOTS = 8  # Sensors tracked (float switches plus the level sensor)
+
+# Message kinds returned by poll()
+MSG_FLAPPING = 1  # Digest while a sensor keeps alarming and restoring
+MSG_SETTLED = 2   # Flapping has stopped and the water is down
+MSG_RESTORE = 3   # One or more sensors back to normal
+
+# Slot flags
+_WET = 1
+_FLAPPING = 2
+_RESTORE = 4  # Restore message pending
+
+RETRY_MS = 60000  # Wait before retrying a digest or restore that failed
+
+_HEAD = "<I3H"      # CRC of the slot names, milli-tokens per channel
+_SLOT = "<BBBBiiii"  # flags, alarms, restores, spare, then ages/delays in s
+                    # (-1 = unset): window start, last alarm, next digest, restore due
+
+try:
+    from binascii import crc32
+except ImportError:
+    from ubinascii import crc32
+
+class AlertGovernor:
+    def __init__(self, names, limits=None, flap_window_s=1800, flap_alarms=3,
+                 digest_s=1800, restore="batch", restore_batch_s=300, persist=True, now=None):
+        """Track up to MAX_SLOTS sensors by name
+
+        limits: {channel: (burst, refill_s)}; a channel without an entry is
+        not limited. A sensor is flapping once it alarms flap_alarms times
+        within flap_window_s; its alarms are then reported in a digest every
+        digest_s until it has been quiet for flap_window_s.
+        restore: "each", "batch" (restores within restore_batch_s of the
+        first share one message) or "off".
+        """
+        if len(names) > MAX_SLOTS:
+            raise ValueError(f"At most {MAX_SLOTS} sensors, got {len(names)}")
+        if restore not in ("each", "batch", "off"):
+            raise ValueError(f"Unknown restore policy: {restore}")
+        self.names = list(names)
+        self.limits = limits or {}
+        self.flap_window_ms = flap_window_s * 1000
+        self.flap_alarms = flap_alarms
+        self.digest_ms = digest_s * 1000
+        self.restore = restore
+        self.restore_batch_ms = restore_batch_s * 1000
+        self.persist = persist
+        now = ticks_ms() if now is None else now
+        n = len(self.names)
+        self.tokens = [self._burst(c) * 1000 for c in CHANNELS]  # milli-tokens
+        self._refilled = [now] * len(CHANNELS)
+        self.flags = [0] * n
+        self.alarms = [0] * n     # Alarms since the window or last digest began
+        self.restores = [0] * n
+        self.window = [None] * n  # ticks_ms of the first alarm in the window
+        self.last_alarm = [None] * n  # None once older than the flap window
+        self.digest_due = [None] * n
+        self.restore_due = [None] * n
+        self.suppressed = 0
+        self.limited = 0
+        self.restored = False
+        if persist:
+            self.restored = self._load(now)
+
+    def configure(self, limits, flap_window_s, flap_alarms, digest_s, restore, restore_batch_s):
+        """Apply new settings (config hot reload), keeping the current state"""
+        if restore not in ("each", "batch", "off"):
+            raise ValueError(f"Unknown restore policy: {restore}")
+        was_limited = [channel in self.limits for channel in CHANNELS]
+        self.limits = limits or {}
+        self.flap_window_ms = flap_window_s * 1000
+        self.flap_alarms = flap_alarms
+        self.digest_ms = digest_s * 1000
+        self.restore = restore
+        self.restore_batch_ms = restore_batch_s * 1000
+        for i, channel in enumerate(CHANNELS):
+            full = self._burst(channel) * 1000
+            # A newly limited channel starts with a full bucket
+            self.tokens[i] = min(self.tokens[i], full) if was_limited[i] else full
+
+    def _burst(self, channel):
+        limit = self.limits.get(channel)
+        return limit[0] if limit else 0
+
+    def _names_crc(self):
+        return crc32(",".join(self.names).encode()) & 0xFFFFFFFF
+
+    # --- Token buckets ---------------------------------------------------
+
+    def take(self, channel, now=None):
+        """Spend a token for one message on channel; False if rate limited"""
+        limit = self.limits.get(channel)
+        if not limit:
+            return True
+        now = ticks_ms() if now is None else now
+        i = CHANNELS.index(channel)
+        self._refill(i, now)
+        if self.tokens[i] < 1000:
+            self.limited += 1
+            print(f"Rate limit: {channel} message held back")
+            return False
+        self.tokens[i] -= 1000
+        self._save(now)
+        return True
+
+    def _refill(self, i, now):
+        """Add the tokens earned since the last refill to channel i's bucket
+
+        A full bucket earns nothing, so its stamp moves up to now: that keeps
+        it inside ticks_diff()'s 2^29 ms range while the loop polls. A stamp
+        out of range (ticks_diff() gone negative) counts as a full refill.
+        """
+        limit = self.limits.get(CHANNELS[i])
+        if not limit:
+            return
+        burst, refill_s = limit
+        full = burst * 1000
+        elapsed = ticks_diff(now, self._refilled[i])
+        gained = full if elapsed < 0 else elapsed // refill_s  # milli-tokens: 1000 per refill_s seconds
+        if gained > 0:
+            self.tokens[i] = min(full, self.tokens[i] + gained)
+            self._refilled[i] = ticks_add(self._refilled[i], gained * refill_s)
+        if self.tokens[i] >= full:
+            self._refilled[i] = now
+
+    # --- Events from the alarm engines -------------------------------------
+
+    def on_alarm(self, name, now=None):
+        """Record an alarm; True to notify now, False if a digest covers it"""
+        now = ticks_ms() if now is None else now
+        i = self.names.index(name)
+        flags = self.flags[i] | _WET
+        flags &= ~_RESTORE  # Water came back before the all clear went out
+        self.restore_due[i] = None
+        if self.window[i] is None or ticks_diff(now, self.window[i]) > self.flap_window_ms:
+            self.window[i] = now
+            if not flags & _FLAPPING:
+                self.alarms[i] = 0
+                self.restores[i] = 0
+        self.alarms[i] += 1
+        self.last_alarm[i] = now
+        send = True
+        if flags & _FLAPPING:
+            send = False
+        elif self.alarms[i] >= self.flap_alarms:
+            flags |= _FLAPPING
+            self.digest_due[i] = now  # First digest right away
+            send = False
+        self.flags[i] = flags
+        if not send:
+            self.suppressed += 1
+        self._save(now)
+        return send
+
+    def on_restore(self, name, alarmed=True, now=None):
+        """Record the water going down; only restores after an alarm count"""
+        if not alarmed:
+            return
+        now = ticks_ms() if now is None else now
+        i = self.names.index(name)
+        self.flags[i] &= ~_WET
+        self.restores[i] += 1
+        if not self.flags[i] & _FLAPPING and self.restore != "off":
+            self.flags[i] |= _RESTORE
+            delay = self.restore_batch_ms if self.restore == "batch" else 0
+            self.restore_due[i] = ticks_add(now, delay)
+        self._save(now)
+
+    # --- Messages due ------------------------------------------------------
+
+    def poll(self, now=None):
+        """Return the next message due as (kind, slot indexes, alarms, restores), or None"""
+        now = ticks_ms() if now is None else now
+        self._expire(now)
+        restore_ready = False
+        for i in range(len(self.names)):
+            flags = self.flags[i]
+            if flags & _FLAPPING:
+                quiet = self.last_alarm[i] is None
+                if not flags & _WET and quiet:
+                    return (MSG_SETTLED, [i], self.alarms[i], self.restores[i])
+                if ticks_diff(now, self.digest_due[i]) >= 0:
+                    return (MSG_FLAPPING, [i], self.alarms[i], self.restores[i])
+            elif flags & _RESTORE and ticks_diff(now, self.restore_due[i]) >= 0:
+                restore_ready = True
+        if restore_ready:
+            # Every pending restore goes out in the same message
+            slots = [i for i in range(len(self.names)) if self.flags[i] & _RESTORE]
+            return (MSG_RESTORE, slots, 0, len(slots))
+        return None
+
+    def _expire(self, now):
+        """Drop window and last-alarm stamps older than the flap window
+
+        ticks_diff() is only meaningful for 2^29 ms (about 6.2 days) on the
+        device; a stamp kept longer would make a new alarm look recent. The
+        token buckets are topped up here too, for the same reason.
+        """
+        for i in range(len(CHANNELS)):
+            self._refill(i, now)
+        for i in range(len(self.names)):
+            if self.window[i] is not None and ticks_diff(now, self.window[i]) > self.flap_window_ms:
+                self.window[i] = None
+            if self.last_alarm[i] is not None and ticks_diff(now, self.last_alarm[i]) >= self.flap_window_ms:
+                self.last_alarm[i] = None
+
+    def done(self, msg, ok, now=None):
+        """Record whether a message from poll() was delivered"""
+        now = ticks_ms() if now is None else now
+        kind, slots = msg[0], msg[1]
+        for i in slots:
+            if not ok:
+                retry = ticks_add(now, RETRY_MS)
+                if kind == MSG_RESTORE:
+                    self.restore_due[i] = retry
+                elif kind == MSG_FLAPPING:
+                    self.digest_due[i] = retry
+                else:
+                    self.last_alarm[i] = ticks_add(now, RETRY_MS - self.flap_window_ms)
+            elif kind == MSG_RESTORE:
+                self.flags[i] &= ~_RESTORE
+                self.restore_due[i] = None
+            elif kind == MSG_FLAPPING:
+                self.alarms[i] = 0
+                self.restores[i] = 0
+                self.digest_due[i] = ticks_add(now, self.digest_ms)
+            else:
+                self.flags[i] &= ~_FLAPPING
+                self.alarms[i] = 0
+                self.restores[i] = 0
+                self.window[i] = None
+                self.digest_due[i] = None
+        self._save(now)
+
+    def describe(self, msg, labels=None):
+        """Title and body text for a message from poll()"""
+        kind, slots, alarms, restores = msg
+        where = ", ".join((labels or self.names)[i] for i in slots)
+        if kind == MSG_RESTORE:
+            return f"Sump OK ({where})", f"The water level is back to normal at {where}."
+        minutes = self.digest_ms // 60000
+        if kind == MSG_SETTLED:
+            return (f"Sump flapping stopped ({where})",
+                    f"No alarm at {where} for {self.flap_window_ms // 60000} min "
+                    f"({alarms} alarms since the last digest). The water level is normal.")
+        now = "HIGH now" if self.flags[slots[0]] & _WET else "normal now"
+        return (f"SUMP ALARM flapping ({where})!",
+                f"The float at {where} keeps crossing the alarm level: {alarms} alarms and "
+                f"{restores} restores since the last message. Water is {now}. "
+                f"Next digest in {minutes} min if it continues.")
+
+    def metrics(self):
+        return {
+            "tokens": {c: self.tokens[i] // 1000 for i, c in enumerate(CHANNELS)
+                       if c in self.limits},
+            "flapping": [self.names[i] for i in range(len(self.names)) if self.flags[i] & _FLAPPING],
+            "suppressed": self.suppressed,
+            "limited": self.limited,
+        }
+
+    # --- RTC memory record -------------------------------------------------
+
+    def _age_s(self, now, stamp):
+        return -1 if stamp is None else max(0, ticks_diff(now, stamp)) // 1000
+
+    def _due_s(self, now, stamp):
+        return -1 if stamp is None else max(0, ticks_diff(stamp, now)) // 1000
+
+    def _save(self, now):
+        """Write the state as ages relative to now (ticks restart after a reset)"""
+        if not self.persist:
+            return
+        parts = [struct.pack(_HEAD, self._names_crc(), *self.tokens)]
+        for i in range(len(self.names)):
+            parts.append(struct.pack(
+                _SLOT, self.flags[i], min(self.alarms[i], 255), min(self.restores[i], 255), 0,
+                self._age_s(now, self.window[i]), self._age_s(now, self.last_alarm[i]),
+                self._due_s(now, self.digest_due[i]), self._due_s(now, self.restore_due[i])))
+        rtcstore.write("governor", b"".join(parts))
+
+    def _load(self, now):
+        """Pick up the state from before a reset; time spent rebooting is not counted"""
+        data = rtcstore.read("governor")
+        n = len(self.names)
+        head = struct.calcsize(_HEAD)
+        slot = struct.calcsize(_SLOT)
+        if data is None or len(data) != head + n * slot:
+            return False
+        fields = struct.unpack_from(_HEAD, data)
+        if fields[0] != self._names_crc():
+            return False  # Sensors were reconfigured
+        self.tokens = [min(t, self._burst(c) * 1000) for c, t in zip(CHANNELS, fields[1:])]
+
+        def ago(s):
+            return None if s < 0 else ticks_add(now, -s * 1000)
+
+        def ahead(s):
+            return None if s < 0 else ticks_add(now, s * 1000)
+
+        for i in range(n):
+            flags, alarms, restores, _, window, last, digest, restore = \
+                struct.unpack_from(_SLOT, data, head + i * slot)
+            self.flags[i] = flags
+            self.alarms[i] = alarms
+            self.restores[i] = restores
+            self.window[i] = ago(window)
+            self.last_alarm[i] = ago(last)
+            self.digest_due[i] = ahead(digest)
+            self.restore_due[i] = ahead(restore)
+        print(f"Alert governor state restored from RTC memory ({n} sensors)")
+        return True
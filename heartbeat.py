@@ -0,0 +1,286 @@
+"""
+Heartbeat for the Sump Alarm (dead man's switch)
+Every HEARTBEAT_S seconds the unit reports that it is alive to a monitor,
+so a power cut, lost WiFi or a hang looks different from a dry pit. A beat
+is one signed UDP datagram with no reply (the least radio time), or one
+plain HTTP GET for healthchecks-style services. With HEARTBEAT_RADIO_OFF
+the radio is switched off between beats, and a beat that is nearly due
+goes out early when an alert or time sync has the radio up anyway.
+heartbeat_monitor.py receives the beats, measures jitter and missed beats,
+and raises an alert when they stop.
+
+Datagram: "HB", version, flags, session (4 bytes, random per boot),
+sequence, uptime s, status word (4 bytes each), free heap in 64-byte units,
+longest loop pass in ms, beat period in s (2 bytes each), length-prefixed
+unit name, then the first 8 bytes of HMAC-SHA256 (gateway.hmac_sha256).
+The same code packs the datagram on the ESP32 and checks it on the monitor.
+"""
+
+import struct
+
+from compat import ticks_ms, ticks_diff, ticks_add
+
+MAGIC = b"HB"
+VERSION = 1
+MAC_LEN = 8
+_HEADER = ">2sBBIIIIHHH"
+HEADER_LEN = struct.calcsize(_HEADER)
+HEAP_UNIT = 64
+HTTP_MS = 3000        # Give up on an HTTP beat after this long
+EARLY_FRACTION = 4    # Send up to period/4 early while the radio is up
+
+# Status word bits
+S_WET = 0             # Bits 0-7: sensors reading wet
+S_ALARM = 8           # Bits 8-15: sensors alarming
+S_SILENCED = 1 << 16  # Siren silenced from Telegram
+S_NOTIFY_FAILED = 1 << 17  # An alarm is waiting to retry its notification
+S_CLOCK = 1 << 18     # Wall clock synced
+S_OTA_TRIAL = 1 << 19  # Running an update on trial
+S_RESET_SHIFT = 24    # Bits 24-31: machine.reset_cause() at boot
+
+def status_word(wet=0, alarms=0, silenced=False, notify_failed=False, clock=False,
+                ota_trial=False, reset_cause=0):
+    """Pack the unit's state into 32 bits"""
+    word = (wet & 0xFF) << S_WET | (alarms & 0xFF) << S_ALARM
+    if silenced:
+        word |= S_SILENCED
+    if notify_failed:
+        word |= S_NOTIFY_FAILED
+    if clock:
+        word |= S_CLOCK
+    if ota_trial:
+        word |= S_OTA_TRIAL
+    return word | (reset_cause & 0xFF) << S_RESET_SHIFT
+
+def describe(word):
+    """Readable summary of a status word"""
+    parts = [f"wet={word >> S_WET & 0xFF:08b}", f"alarm={word >> S_ALARM & 0xFF:08b}"]
+    for bit, name in ((S_SILENCED, "silenced"), (S_NOTIFY_FAILED, "notify-failed"),
+                      (S_CLOCK, "clock"), (S_OTA_TRIAL, "ota-trial")):
+        if word & bit:
+            parts.append(name)
+    parts.append(f"reset={word >> S_RESET_SHIFT}")
+    return " ".join(parts)
+
+def pack(key, session, seq, uptime_s, word, heap_free, loop_ms, period_s, unit):
+    """Build a signed beat"""
+    from gateway import hmac_sha256
+    name = unit.encode()[:32]
+    body = struct.pack(_HEADER, MAGIC, VERSION, 0, session, seq, uptime_s, word,
+                       min(heap_free // HEAP_UNIT, 0xFFFF), min(loop_ms, 0xFFFF),
+                       min(period_s, 0xFFFF)) + bytes((len(name),)) + name
+    return body + hmac_sha256(key, body)[:MAC_LEN]
+
+def unpack(data):
+    """Parse a beat without checking its MAC; returns a dict or None"""
+    if len(data) < HEADER_LEN + 1 + MAC_LEN:
+        return None
+    magic, version, flags, session, seq, uptime_s, word, heap, loop_ms, period_s = \
+        struct.unpack_from(_HEADER, data)
+    if magic != MAGIC or version != VERSION:
+        return None
+    n = data[HEADER_LEN]
+    end = HEADER_LEN + 1 + n
+    if end + MAC_LEN != len(data):
+        return None
+    return {"session": session, "seq": seq, "uptime_s": uptime_s, "word": word,
+            "heap_free": heap * HEAP_UNIT, "loop_ms": loop_ms, "period_s": period_s,
+            "unit": bytes(data[HEADER_LEN + 1:end]).decode(), "body_len": end}
+
+def verify(key, data, msg=None):
+    """True if the beat's MAC matches key"""
+    from gateway import hmac_sha256, _same
+    msg = msg or unpack(data)
+    if msg is None:
+        return False
+    end = msg["body_len"]
+    return _same(hmac_sha256(key, data[:end])[:MAC_LEN], data[end:end + MAC_LEN])
+
+def _would_block(e):
+    import errno
+    return getattr(e, "errno", None) in (errno.EAGAIN, errno.EINPROGRESS)
+
+class Heartbeat:
+    def __init__(self, url, unit, key, status, period_s=300, radio_off=False, wifi=None):
+        """Beat to url every period_s seconds
+
+        url: "udp://host:port" for heartbeat_monitor.py, or
+        "http://host/path" for a healthchecks-style ping URL (plain HTTP;
+        TLS would cost more radio time than the beat itself).
+        status(): returns the status word, called only when a beat is sent.
+        radio_off: turn WiFi off again after a beat that had to bring it up
+        (for units with nothing else keeping it connected).
+        wifi: (ssid, password), or False to skip WiFi handling (host tests).
+        """
+        import os
+        from transport import Station
+        self.key = key.encode() if isinstance(key, str) else key
+        self.unit = unit
+        self.status = status
+        self.radio_off = radio_off
+        self.station = Station(wifi)
+        self.session = struct.unpack(">I", os.urandom(4))[0]
+        self.seq = 0
+        self.sock = None
+        self.state = 0  # 0 idle, 1 connecting, 2 waiting for the HTTP reply
+        self.max_loop_us = 0
+        self.uptime_ms = self._uptime_at = ticks_ms()  # Created early in boot: ms since reset
+        self.configure(url, period_s)
+        self.next_ms = ticks_ms()  # First beat as soon as the radio is up
+        # Counters
+        self.sent = 0
+        self.early = 0
+        self.failures = 0
+        self.last_error = None
+
+    def configure(self, url, period_s, key=None, radio_off=None):
+        """Apply new settings (config hot reload)"""
+        scheme, _, rest = url.partition("://")
+        if scheme not in ("udp", "http"):
+            raise ValueError(f"Heartbeat URL must be udp:// or http://, not {url}")
+        hostport, _, path = rest.partition("/")
+        host, _, port = hostport.partition(":")
+        new = (scheme, host, int(port or (80 if scheme == "http" else 5051)), "/" + path)
+        if getattr(self, "target", None) != new:
+            self.target = new
+            self.station.forget()
+        self.period_ms = period_s * 1000
+        if key is not None:
+            self.key = key.encode() if isinstance(key, str) else key
+        if radio_off is not None:
+            self.radio_off = radio_off
+
+    @property
+    def busy(self):
+        """True while an HTTP beat is in flight"""
+        return self.state != 0
+
+    def note_loop(self, busy_us):
+        """Record one main loop pass; the longest since the last beat is reported"""
+        if busy_us > self.max_loop_us:
+            self.max_loop_us = busy_us
+
+    def step(self, now=None):
+        """Send a beat when due, one non-blocking socket operation at most"""
+        now = ticks_ms() if now is None else now
+        try:
+            if self.state:
+                self._http_step(now)
+                return
+            left = ticks_diff(self.next_ms, now)
+            if left > 0 and (not self.radio_off or left > self.period_ms // EARLY_FRACTION):
+                return
+            up = self.station.up()
+            if left > 0:
+                if not up:
+                    return  # Not due, and not worth waking the radio for
+                self.early += 1  # Share the radio an alert or sync brought up
+            elif not up:
+                self.station.connect(now)
+                return
+            self._beat(now)
+        except Exception as e:
+            self._fail(now, e)
+
+    def _resolve(self):
+        import socket
+        kind = socket.SOCK_DGRAM if self.target[0] == "udp" else socket.SOCK_STREAM
+        return self.station.address(self.target[1], self.target[2], kind, "sensor")
+
+    def _payload(self, now):
+        from compat import mem_free
+        self.seq += 1
+        # Uptime is accumulated because ticks_ms wraps after about 12 days
+        self.uptime_ms += ticks_diff(now, self._uptime_at)
+        self._uptime_at = now
+        return self.seq, self.uptime_ms // 1000, self.status(), mem_free(), self.max_loop_us // 1000
+
+    def _beat(self, now):
+        import socket
+        seq, uptime_s, word, heap, loop_ms = self._payload(now)
+        self.next_ms = ticks_add(self.next_ms if ticks_diff(now, self.next_ms) < self.period_ms
+                                 else now, self.period_ms)
+        self.max_loop_us = 0
+        addr = self._resolve()
+        if self.target[0] == "udp":
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.sendto(pack(self.key, self.session, seq, uptime_s, word, heap, loop_ms,
+                                 self.period_ms // 1000, self.unit), addr)
+            finally:
+                sock.close()
+            self._done()
+            return
+        # HTTP: connect without blocking, send once writable, read the status line
+        self.request = (f"GET {self.target[3]}?unit={self.unit}&boot={self.session:08x}"
+                        f"&seq={seq}&up={uptime_s}&s={word:08x}&heap={heap}&loop={loop_ms}"
+                        f"&period={self.period_ms // 1000} HTTP/1.0\r\n"
+                        f"Host: {self.target[1]}\r\n\r\n").encode()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        self.sock = sock
+        self.deadline = ticks_add(now, HTTP_MS)
+        self.state = 1
+        try:
+            sock.connect(addr)
+        except OSError as e:
+            if not _would_block(e):
+                raise
+
+    def _http_step(self, now):
+        if ticks_diff(now, self.deadline) >= 0:
+            raise OSError("timed out")
+        if self.state == 1:
+            import select
+            poller = select.poll()
+            poller.register(self.sock, select.POLLOUT)
+            events = poller.poll(0)
+            if not events:
+                return
+            if events[0][1] & (select.POLLERR | select.POLLHUP):
+                raise OSError("connect failed")
+            self.sock.send(self.request)  # A few dozen bytes: one segment
+            self.state = 2
+            return
+        try:
+            data = self.sock.recv(16)
+        except OSError as e:
+            if _would_block(e):
+                return
+            raise
+        if data is None:
+            return
+        if not data.startswith(b"HTTP/1.") or data[9:10] != b"2":
+            raise OSError(f"HTTP {data[9:12].decode() or 'closed'}")
+        self._close()
+        self._done()
+
+    def _done(self):
+        self.sent += 1
+        if self.radio_off:
+            self.station.down()
+        self.station.raised = False
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        self.state = 0
+
+    def _fail(self, now, error):
+        self._close()
+        self.failures += 1
+        self.last_error = str(error)
+        self.station.forget()
+        print(f"Heartbeat failed: {error}")
+
+    def metrics(self):
+        return {
+            "sent": self.sent,
+            "early": self.early,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
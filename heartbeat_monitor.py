@@ -0,0 +1,235 @@
+"""
+Heartbeat monitor for Sump Alarm units (dead man's switch)
+Host service (CPython asyncio). Receives the signed UDP beats from
+heartbeat.py, and also answers the HTTP form of the ping, so it can stand in
+for a healthchecks-style service. For every unit it tracks the arrival
+jitter against the unit's own beat period, beats lost in transit (sequence
+gaps), reboots (a new session) and the reported status word. When a unit
+has been silent for --grace beat periods it raises an alert, and again when
+the unit comes back. Alerts are printed and, with --gateway, sent through
+gateway_server.py to Telegram, Gmail and Ntfy.
+
+Usage:
+    python heartbeat_monitor.py --key SECRET
+    python heartbeat_monitor.py --key SECRET --gateway 127.0.0.1:5050 --gateway-key SECRET
+"""
+
+import argparse
+import asyncio
+import time
+
+import heartbeat
+
+class Unit:
+    """What the monitor knows about one unit"""
+
+    def __init__(self, name):
+        self.name = name
+        self.session = None
+        self.seq = 0
+        self.last = None      # monotonic time of the last beat
+        self.period_s = None
+        self.status = None
+        self.beats = 0
+        self.lost = 0         # Beats missing from the sequence
+        self.reboots = 0
+        self.silent = False
+        self.outages = 0
+        self.deviation_ms = []  # Arrival time minus expected, recent beats
+
+    def beat(self, msg, now):
+        steady = msg["session"] == self.session and not self.silent
+        if msg["session"] != self.session:
+            if self.session is not None:
+                self.reboots += 1
+            self.session = msg["session"]
+        elif msg["seq"] > self.seq + 1:
+            self.lost += msg["seq"] - self.seq - 1
+        elif msg["seq"] <= self.seq:
+            return False  # Replayed or reordered
+        if steady and self.last is not None:
+            gap = now - self.last
+            periods = max(1, round(gap / self.period_s))
+            self.deviation_ms.append((gap - periods * self.period_s) * 1000)
+            del self.deviation_ms[:-1000]
+        self.seq = msg["seq"]
+        self.last = now
+        self.period_s = msg["period_s"]
+        self.status = msg
+        self.beats += 1
+        return True
+
+    def jitter(self):
+        """(mean absolute, p95 absolute, max absolute) deviation in ms"""
+        dev = sorted(abs(d) for d in self.deviation_ms)
+        if not dev:
+            return None
+        return sum(dev) / len(dev), dev[int(len(dev) * 0.95)], dev[-1]
+
+class Monitor(asyncio.DatagramProtocol):
+    def __init__(self, keys, grace=2.5, on_alert=None):
+        """keys: {unit or "*": secret}; on_alert(unit, silent, text) is called on changes"""
+        self.keys = {unit: key.encode() for unit, key in keys.items()}
+        self.grace = grace
+        self.on_alert = on_alert
+        self.units = {}
+        self.rejected = 0
+        self.alerts = []
+
+    def datagram_received(self, data, addr):
+        msg = heartbeat.unpack(data)
+        key = msg and (self.keys.get(msg["unit"]) or self.keys.get("*"))
+        if key is None or not heartbeat.verify(key, data, msg):
+            self.rejected += 1
+            return
+        self.receive(msg)
+
+    def receive(self, msg):
+        now = time.monotonic()
+        unit = self.units.get(msg["unit"])
+        if unit is None:
+            unit = self.units[msg["unit"]] = Unit(msg["unit"])
+            print(f"{unit.name}: first beat, every {msg['period_s']} s, "
+                  f"{heartbeat.describe(msg['word'])}")
+        was_silent = unit.silent
+        down_s = now - unit.last if unit.last is not None else 0
+        if not unit.beat(msg, now):
+            return
+        if was_silent:
+            unit.silent = False
+            rebooted = " after a reboot" if msg["uptime_s"] < down_s else ""
+            self._alert(unit, False, f"{unit.name} is back after {down_s:.0f} s{rebooted}")
+
+    def check(self):
+        """Raise the alert for units silent longer than grace periods"""
+        now = time.monotonic()
+        for unit in self.units.values():
+            if unit.silent or unit.last is None:
+                continue
+            silent_s = now - unit.last
+            if silent_s > self.grace * unit.period_s:
+                unit.silent = True
+                unit.outages += 1
+                self._alert(unit, True, f"{unit.name} silent for {silent_s:.0f} s "
+                                        f"(beats every {unit.period_s} s)")
+
+    def _alert(self, unit, silent, text):
+        print(("ALERT: " if silent else "RECOVERED: ") + text)
+        self.alerts.append((unit.name, silent, text))
+        if self.on_alert:
+            self.on_alert(unit.name, silent, text)
+
+    def http_ping(self, query):
+        """The HTTP form of a beat: GET /path?unit=..&boot=..&seq=..&up=..&s=..&heap=..&loop=..&period=..
+
+        Not signed (healthchecks-style URLs are the secret), so only accepted
+        from units that have no key of their own.
+        """
+        try:
+            msg = {"unit": query["unit"], "session": int(query["boot"], 16),
+                   "seq": int(query["seq"]), "uptime_s": int(query["up"]),
+                   "word": int(query["s"], 16), "heap_free": int(query["heap"]),
+                   "loop_ms": int(query["loop"]), "period_s": int(query["period"])}
+        except (KeyError, ValueError):
+            return False
+        if msg["unit"] in self.keys or msg["period_s"] <= 0:
+            self.rejected += 1
+            return False
+        self.receive(msg)
+        return True
+
+    def summary(self):
+        lines = []
+        for unit in self.units.values():
+            jitter = unit.jitter()
+            jitter = (f"jitter mean {jitter[0]:.1f} p95 {jitter[1]:.1f} max {jitter[2]:.1f} ms"
+                      if jitter else "jitter -")
+            status = unit.status
+            lines.append(
+                f"{unit.name}: {'SILENT' if unit.silent else 'ok'} beats {unit.beats} "
+                f"lost {unit.lost} reboots {unit.reboots} outages {unit.outages} {jitter}; "
+                f"up {status['uptime_s']} s heap {status['heap_free']} loop {status['loop_ms']} ms "
+                f"{heartbeat.describe(status['word'])}")
+        return "\n".join(lines) or "no units yet"
+
+async def _http(monitor, reader, writer):
+    try:
+        line = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        from urllib.parse import urlsplit, parse_qsl
+        parts = line.decode("latin-1").split()
+        ok = len(parts) >= 2 and monitor.http_ping(dict(parse_qsl(urlsplit(parts[1]).query)))
+        writer.write(b"HTTP/1.0 200 OK\r\n\r\nOK" if ok else b"HTTP/1.0 400 Bad Request\r\n\r\n")
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(monitor, udp="0.0.0.0:5051", http=None, check_s=1.0):
+    """Start listening; returns (transports and servers, background tasks)"""
+    loop = asyncio.get_running_loop()
+    host, _, port = udp.rpartition(":")
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: monitor, local_addr=(host or "0.0.0.0", int(port)))
+    endpoints = [transport]
+    if http:
+        host, _, port = http.rpartition(":")
+        endpoints.append(await asyncio.start_server(
+            lambda r, w: _http(monitor, r, w), host or "0.0.0.0", int(port)))
+
+    async def checker():
+        while True:
+            await asyncio.sleep(check_s)
+            monitor.check()
+
+    return endpoints, [asyncio.ensure_future(checker())]
+
+def gateway_alerter(address, key):
+    """on_alert that sends the alert through gateway_server.py"""
+    import gateway
+    host, _, port = address.rpartition(":")
+    client = gateway.GatewayClient(host, key, "heartbeat-monitor", port=int(port))
+    loop = asyncio.get_event_loop()
+
+    def send(unit, silent, text):
+        event = gateway.EV_SILENT if silent else gateway.EV_BACK
+        loop.run_in_executor(None, client.send_alert, event, "heartbeat", unit)
+
+    return send
+
+async def run(args):
+    keys = {"*": args.key}
+    on_alert = gateway_alerter(args.gateway, args.gateway_key or args.key) if args.gateway else None
+    monitor = Monitor(keys, args.grace, on_alert)
+    endpoints, tasks = await serve(monitor, args.listen, args.http)
+    print(f"Heartbeat monitor on udp {args.listen}" + (f", http {args.http}" if args.http else ""))
+    try:
+        while True:
+            await asyncio.sleep(args.stats_s)
+            print(monitor.summary())
+    finally:
+        for task in tasks:
+            task.cancel()
+        for endpoint in endpoints:
+            endpoint.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--key", required=True, help="HEARTBEAT_KEY of the units")
+    parser.add_argument("--listen", default="0.0.0.0:5051", help="UDP address for beats")
+    parser.add_argument("--http", help="Also accept HTTP pings on this address (host:port)")
+    parser.add_argument("--grace", type=float, default=2.5,
+                        help="Alert after this many beat periods without a beat")
+    parser.add_argument("--gateway", help="Send alerts through gateway_server.py at host:port")
+    parser.add_argument("--gateway-key", help="Gateway key if not the same as --key")
+    parser.add_argument("--stats-s", type=float, default=600, help="Print the unit table this often")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Lazy module loading registry for the Sump Alarm
+Networking and notifier modules are imported only when an alarm needs them
+and can be evicted from sys.modules afterwards, so their bytecode does not
+stay on the heap while the pit is dry. Import time and heap cost are
+recorded per module.
+"""
+
+import sys
+import gc
+
+from compat import ticks_us, ticks_diff, mem_free, mem_alloc
+
+# Eviction policy: "pressure" evicts only when free heap is below MIN_FREE,
+# "always" evicts after every use, "never" keeps modules loaded.
+POLICY = "pressure"
+MIN_FREE = 80000
+
+_stats = {}  # name -> [loads, hits, evictions, last_us, max_us, last_heap]
+_deps = {}   # name -> modules that appeared in sys.modules while loading it
+_kept = set()  # Modules that stay resident once loaded (they hold state)
+
+def configure(policy=None, min_free=None):
+    """Set the eviction policy and memory-pressure threshold"""
+    global POLICY, MIN_FREE
+    if policy is not None:
+        if policy not in ("pressure", "always", "never"):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        POLICY = policy
+    if min_free is not None:
+        MIN_FREE = min_free
+
+def keep(name):
+    """Never evict name, alone or as a dependency of another module
+
+    For small modules that hold state (sessions, timings) or that other
+    resident modules bound names from at import: evicting them would leave
+    two copies of the module, each with its own state.
+    """
+    _kept.add(name)
+
+def load(name):
+    """Import a module on demand and record its import cost"""
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = [0, 0, 0, 0, 0, 0]
+    module = sys.modules.get(name)
+    if module is not None:
+        stats[1] += 1
+        return module
+
+    gc.collect()
+    before_keys = set(sys.modules)
+    heap_before = mem_alloc()
+    start = ticks_us()
+    __import__(name)
+    module = sys.modules[name]  # __import__ returns the top package for dotted names
+    elapsed = ticks_diff(ticks_us(), start)
+    gc.collect()
+    heap = mem_alloc() - heap_before
+
+    _deps[name] = [k for k in sys.modules if k not in before_keys and k != name]
+    stats[0] += 1
+    stats[3] = elapsed
+    if elapsed > stats[4]:
+        stats[4] = elapsed
+    stats[5] = heap
+    print(f"Loaded {name} in {elapsed // 1000} ms, {heap} bytes")
+    return module
+
+def release(name, force=False):
+    """Drop a module (and what it pulled in) if the policy says so
+
+    Callers must not keep their own references to the module, otherwise
+    the memory cannot be reclaimed.
+    """
+    if name not in sys.modules or name in _kept:
+        return False
+    if not force:
+        if POLICY == "never":
+            return False
+        if POLICY == "pressure" and mem_free() >= MIN_FREE:
+            return False
+    for dep in list(_deps.pop(name, ())) + [name]:
+        if dep in sys.modules and dep not in _kept:
+            del sys.modules[dep]
+            if dep in _stats:
+                _stats[dep][2] += 1
+    gc.collect()
+    return True
+
+class using:
+    """Context manager: load a module for a block, release it afterwards"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        return load(self.name)
+
+    def __exit__(self, exc_type, exc, tb):
+        release(self.name)
+        return False
+
+def metrics():
+    """Per-module import statistics for the metrics registry"""
+    return {name: {"loads": s[0], "hits": s[1], "evictions": s[2],
+                   "last_ms": s[3] // 1000, "max_ms": s[4] // 1000, "heap": s[5],
+                   "resident": name in sys.modules}
+            for name, s in _stats.items()}
@@ -0,0 +1,196 @@
+"""
+Analog sump level sensing for a pressure transducer or resistive strip
+Samples the ADC in bursts into a preallocated array, reduces each burst with
+a streaming decimation filter and tracks the rate of rise with a sliding
+least-squares slope, so the alarm can fire on a fast rise before the high
+mark is reached. All per-sample work is fixed and allocation free.
+"""
+
+from array import array
+
+from alarm_engine import AlarmEngine
+
+class MovingAverage:
+    """Running mean of the last n samples (ring buffer and running sum)"""
+
+    def __init__(self, n):
+        self.n = n
+        self._ring = array("l", [0] * n)
+        self._pos = 0
+        self._count = 0
+        self._sum = 0
+
+    def update(self, x):
+        ring = self._ring
+        pos = self._pos
+        if self._count < self.n:
+            self._count += 1
+        else:
+            self._sum -= ring[pos]
+        ring[pos] = x
+        self._sum += x
+        self._pos = pos + 1 if pos + 1 < self.n else 0
+        return self._sum // self._count
+
+class MovingMedian:
+    """Median of the last n samples, kept as a sorted window"""
+
+    def __init__(self, n):
+        self.n = n
+        self._ring = array("l", [0] * n)
+        self._sorted = array("l", [0] * n)
+        self._pos = 0
+        self._count = 0
+
+    def update(self, x):
+        srt = self._sorted
+        count = self._count
+        if count == self.n:
+            # Remove the oldest sample from the sorted window
+            old = self._ring[self._pos]
+            i = 0
+            while srt[i] != old:
+                i += 1
+            while i < count - 1:
+                srt[i] = srt[i + 1]
+                i += 1
+            count -= 1
+        # Insert the new sample in order
+        i = count
+        while i > 0 and srt[i - 1] > x:
+            srt[i] = srt[i - 1]
+            i -= 1
+        srt[i] = x
+        count += 1
+        self._count = count
+        self._ring[self._pos] = x
+        self._pos = self._pos + 1 if self._pos + 1 < self.n else 0
+        mid = count // 2
+        if count & 1:
+            return srt[mid]
+        return (srt[mid - 1] + srt[mid]) // 2
+
+class SlopeEstimator:
+    """Least-squares slope over the last k evenly spaced points
+
+    Running sums are updated in O(1) per point. The slope is returned in
+    units per step, scaled by `scale` to stay in integer arithmetic.
+    """
+
+    def __init__(self, k, scale=1000):
+        if k < 2:
+            raise ValueError("need at least two points")
+        self.k = k
+        self.scale = scale
+        self._ring = array("l", [0] * k)
+        self._pos = 0
+        self._count = 0
+        self._sy = 0
+        self._sxy = 0
+
+    def update(self, y):
+        k = self.k
+        if self._count == k:
+            # Drop the oldest point; the others move one index down
+            old = self._ring[self._pos]
+            self._sy -= old
+            self._sxy -= self._sy
+            self._count -= 1
+        self._sxy += self._count * y
+        self._sy += y
+        self._ring[self._pos] = y
+        self._pos = self._pos + 1 if self._pos + 1 < k else 0
+        self._count += 1
+        return self.slope()
+
+    def slope(self):
+        n = self._count
+        if n < 2:
+            return 0
+        # slope = (n*Sxy - Sx*Sy) / (n*Sxx - Sx^2) with x = 0..n-1
+        sx = n * (n - 1) // 2
+        sxx = (n - 1) * n * (2 * n - 1) // 6
+        return (n * self._sxy - sx * self._sy) * self.scale // (n * sxx - sx * sx)
+
+FILTERS = {
+    "average": MovingAverage,
+    "median": MovingMedian,
+}
+
+class LevelSensor:
+    def __init__(self, name, adc_pin, label=None, burst=16, filter="median", filter_n=16,
+                 slope_points=12, period_ms=5000, empty_raw=0, full_raw=65535,
+                 high_permille=700, rise_permille_per_min=50, rise_floor_permille=300,
+                 debounce_s=10, retry_s=600, channels=None, email_recipients=None,
+                 ntfy_topic=None, reader=None):
+        """Configure the ADC, filters, calibration and alarm thresholds
+
+        Levels are in permille of the calibrated range (empty_raw..full_raw).
+        The alarm condition is level >= high_permille, or a rise faster than
+        rise_permille_per_min while the level is above rise_floor_permille.
+        reader: optional callable returning one raw 16-bit sample (host tests).
+        """
+        self.name = name
+        self.base_label = label or name
+        self.burst = burst
+        self.period_ms = period_ms
+        self.empty_raw = empty_raw
+        self.span = max(1, full_raw - empty_raw)
+        self.high = high_permille
+        self.rise = rise_permille_per_min
+        self.rise_floor = rise_floor_permille
+        self.channels = channels
+        self.email_recipients = email_recipients
+        self.ntfy_topic = ntfy_topic
+        self.engine = AlarmEngine(debounce_s, retry_s)
+
+        self._buf = array("H", [0] * burst)
+        self._filter = FILTERS[filter](filter_n)
+        self._slope = SlopeEstimator(slope_points)
+        self._read = reader or self._setup_adc(adc_pin)
+
+        self.raw = 0
+        self.level = 0        # permille
+        self.rate = 0         # permille per minute
+        self.readings = 0
+
+    def _setup_adc(self, adc_pin):
+        from machine import ADC, Pin
+        adc = ADC(Pin(adc_pin))
+        adc.atten(ADC.ATTN_11DB)  # Full 0-3.3 V range
+        return adc.read_u16
+
+    @property
+    def label(self):
+        return f"{self.base_label} {self.level // 10}% rising {self.rate / 10:.1f}%/min"
+
+    @property
+    def wet(self):
+        """Alarm condition: above the high mark, or rising fast"""
+        if self.level >= self.high:
+            return 1
+        return 1 if self.level >= self.rise_floor and self.rate >= self.rise else 0
+
+    def routes(self, channel):
+        return self.channels is None or channel in self.channels
+
+    def read(self):
+        """Take one burst, update level and rate of rise, return the level"""
+        buf = self._buf
+        read = self._read
+        for i in range(self.burst):
+            buf[i] = read()
+        filt = self._filter
+        for i in range(self.burst):
+            value = filt.update(buf[i])
+        self.raw = value
+        level = (value - self.empty_raw) * 1000 // self.span
+        self.level = 0 if level < 0 else 1000 if level > 1000 else level
+        # Slope is per reading (x1000); convert to permille per minute
+        self.rate = self._slope.update(self.level) * 60000 // (self.period_ms * 1000)
+        self.readings += 1
+        return self.level
+
+    def metrics(self):
+        return {"level_permille": self.level, "rate_permille_min": self.rate,
+                "raw": self.raw, "readings": self.readings}
@@ -4,28 +4,34 @@
 #
 # Rob Frohne, Updated March 2025
 
+# Only hardware and sensing modules are imported at the top so the sensor and
+# siren are armed before any networking code is loaded; network, socket, ssl
+# and the notifiers are imported on first use.
 from machine import Pin, Timer
+import os
+import sys
 import time
 import gc
-import network
-import socket
-import config  # Import configuration with credentials
+import settings
+config = settings.load()  # Validated settings, compiled from config.py to config.bin
+import metrics
+import eventlog
+import lazy
+import accel
+import watchdog
+import timeservice
+from governor import AlertGovernor
+from metrics import print_memory_status
+from sampler import AdaptiveSampler
+from sensors import SensorArray
+from level_sensor import LevelSensor
+from alarm_engine import ACT_ALARM, ACT_RETRY, ACT_RESTORE
+from checkpoint import EngineCheckpoint
 
 # Configure garbage collection
 gc.enable()
 gc.threshold(gc.mem_free() // 4)
 
-# Memory monitoring functions
-def get_free_memory():
-    """Return amount of free memory in bytes"""
-    gc.collect()
-    return gc.mem_free()
-
-def print_memory_status(label="Current"):
-    """Print memory status with a label"""
-    free_mem = get_free_memory()
-    print(f"=== {label} Memory: {free_mem} bytes free ===")
-
 # GPIO pin definitions for ESP32-C3 Super Mini
 LED_PIN = 8           # Built-in LED
 SENSOR_GND_PIN = 3    # Virtual GND for float switch (set LOW)
@@ -38,16 +44,31 @@ def toggle(p):
     """Toggle pin value"""
     p.value(not p.value())
 
+siren_ticks = 0  # Half-cycles driven; the watchdog checks the siren in when it moves
+
 def alarmSound(t):
     """This is to vibrate the speaker via H-bridge"""
     global in_a
     global in_b
+    global siren_ticks
+    siren_ticks += 1
     a = in_a.value()
     a = 0 if a else 1  # Toggle a
     b = 0 if a else 1  # b = not a
     in_a.value(a)
     in_b.value(b)
 
+if accel.ENABLED:
+    _SPEAKER_MASK_A = 1 << SPEAKER_IN_A
+    _SPEAKER_MASK_B = 1 << SPEAKER_IN_B
+    _speaker_phase = 0
+
+    def alarmSound(t):
+        """This is to vibrate the speaker via H-bridge (viper register writes)"""
+        global _speaker_phase, siren_ticks
+        siren_ticks += 1
+        _speaker_phase = accel.h_bridge_step(_speaker_phase, _SPEAKER_MASK_A, _SPEAKER_MASK_B)
+
 def blink_led(times=1):
     """Blink the LED a specified number of times"""
     for _ in range(times):
@@ -56,318 +77,57 @@ def blink_led(times=1):
         led.value(0)
         time.sleep(0.2)
 
-def connect_wifi(ssid, password, max_retries=3):
-    """Connect to WiFi with retries"""
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    
-    if wlan.isconnected():
-        print("Already connected to WiFi:", wlan.ifconfig()[0])
-        return True
-        
-    for attempt in range(max_retries):
-        print(f"WiFi connection attempt {attempt+1}/{max_retries}")
-        wlan.connect(ssid, password)
-        
-        # Wait with timeout
-        for _ in range(20):
-            if wlan.isconnected():
-                print("WiFi connected:", wlan.ifconfig()[0])
-                blink_led(2)  # Signal connection success
-                return True
-            time.sleep(0.5)
-            blink_led(1)  # Signal waiting
-    
-    print("WiFi connection failed after retries")
-    return False
-
-def make_http_request(url, method="GET", headers=None, data=None, timeout=30):
-    """General HTTP request function with optimized memory usage"""
-    import urequests  # Import only when needed to save memory
-    
-    gc.collect()  # Force garbage collection before request
-    print_memory_status("Before HTTP request")
-    
+def send_notifications(sensor=None):
+    """Load the notifier code, send the alarm, and let it be evicted again"""
+    multiple = len(sensors.sensors) > 1 or level is not None
+    label = sensor.label if sensor and multiple else None
+    # The loop is blocked while notifying, so the notifier's own deadlines
+    # stand in for the sensor task until it returns
+    watchdog.suspend("sensor")
+    watchdog.resume("notifier")
     try:
-        if method.upper() == "GET":
-            response = urequests.get(url, timeout=timeout)
-        else:  # POST
-            response = urequests.post(url, headers=headers, data=data, timeout=timeout)
-        
-        status = response.status_code
-        if status == 200:
-            print(f"HTTP {method} request successful")
-            result = True
-        else:
-            print(f"HTTP {method} request failed with status: {status}")
-            result = False
-            
-        response.close()
-        return result, status
-    except OSError as e:
-        print(f"Network error: {e}")
-        return False, -1
-    except Exception as e:
-        print(f"HTTP request failed: {e}")
-        return False, -1
+        return lazy.load("notify").send_notifications(sensor, label, blink=blink_led,
+                                                      allow=governor.take)
     finally:
-        # Clean up
-        gc.collect()
-        print_memory_status(f"After HTTP {method} request")
-
-def send_telegram_alert():
-    """Send alert through Telegram using urequests with fallback to direct socket"""
-    print("Preparing Telegram alert...")
-    bot_token = config.TELEGRAM_BOT_TOKEN
-    chat_id = config.TELEGRAM_CHAT_ID
-    message = "🚨 SUMP ALARM! Water level is high! Check the sump pump immediately!"
-    
-    # Simpler approach first - use urequests with simplified parameters
-    try:
-        import urequests
-        print("Trying urequests with simplified parameters...")
-        
-        # Encode message for URL
-        encoded_message = message.replace(" ", "%20")
-        
-        # Simple URL with minimum parameters
-        simple_url = f"https://api.telegram.org/bot{bot_token}/sendMessage?chat_id={chat_id}&text={encoded_message}"
-        
-        # Attempt the request with generous timeout
-        print("Sending request via urequests...")
-        response = urequests.get(simple_url, timeout=30)
-        
-        # Check response
-        if response.status_code == 200:
-            print("Telegram message sent successfully via urequests")
-            response.close()
-            return True
-        else:
-            print(f"urequests failed with status code: {response.status_code}")
-            response.close()
-    except Exception as e:
-        print(f"urequests approach failed: {e}")
-    
-    # Telegram Web API backup approach - no TLS, just HTTP
-    try:
-        print("Trying Telegram Bot API via HTTP (backup method)...")
-        
-        import socket
-        import json
-        
-        # Create a plain socket (no SSL)
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
-        sock.settimeout(5)  # Short timeout
-        
-        # Connect to the Telegram API server on port 80 (HTTP)
-        print("Connecting to api.telegram.org:80...")
-        sock.connect(("api.telegram.org", 80))
-        
-        # URL-encode the message for HTTP
-        encoded_message = message.replace(" ", "%20").replace("!", "%21")
-        
-        # Construct HTTP GET request
-        request = (
-            f"GET /bot{bot_token}/sendMessage?chat_id={chat_id}&text={encoded_message} HTTP/1.1\r\n"
-            "Host: api.telegram.org\r\n"
-            "Connection: close\r\n\r\n"
-        )
-        
-        # Send the request
-        print("Sending HTTP request...")
-        sock.send(request.encode())
-        
-        # Read the response
-        print("Reading response...")
-        response = b""
-        while True:
-            try:
-                data = sock.recv(1024)
-                if not data:
-                    break
-                response += data
-            except:
-                break
-        
-        # Close the socket
-        sock.close()
-        
-        # Process the response
-        response_str = response.decode()
-        
-        # Check if the response contains a success indicator
-        if "200 OK" in response_str and "true" in response_str:
-            print("Telegram alert sent successfully via HTTP")
-            return True
-        else:
-            print("HTTP method failed")
-            print(response_str[:200] + "...")
-            return False
-            
-    except Exception as e:
-        print(f"HTTP method failed: {e}")
-        return False
-        
-    # All methods failed
-    return False
+        watchdog.suspend("notifier")
+        watchdog.resume("sensor")
+        lazy.release("notify")
 
-def send_ntfy_alert():
-    """Send push notification via ntfy.sh (free service)"""
-    print("Preparing Ntfy alert...")
+def send_governor_message(msg):
+    """Send a flapping digest or all-clear message from the alert governor"""
+    slots = [all_sensors[i] for i in msg[1]]
+    title, text = governor.describe(msg, [s.label for s in all_sensors])
+    watchdog.suspend("sensor")
+    watchdog.resume("notifier")
     try:
-        import urequests
-        
-        # Your unique topic - subscribe to this in the Ntfy app
-        topic = config.NTFY_TOPIC
-        url = f"https://ntfy.sh/{topic}"
-        
-        headers = {
-            "Title": "SUMP ALARM!",
-            "Priority": "urgent",
-            "Tags": "warning,rotating_light"
-        }
-        
-        message = "Water level is high! Check the sump pump immediately!"
-        
-        response = urequests.post(url, headers=headers, data=message, timeout=15)
-        
-        if response.status_code == 200:
-            print("Ntfy alert sent successfully")
-            response.close()
-            return True
-        else:
-            print(f"Ntfy failed with status: {response.status_code}")
-            response.close()
-            return False
-            
-    except Exception as e:
-        print(f"Ntfy alert failed: {e}")
-        return False
-
-def send_gmail_alert(recipients):
-    """Send email alert using Gmail's SMTP server with App Password"""
-    print("Preparing Gmail alert...")
-    
-    try:
-        import email_sender
-        
-        # Force garbage collection before email send
-        gc.collect()
-        
-        # Gmail credentials - replace with your own
-        gmail_user = config.GMAIL_USER
-        # App password (NOT your regular Gmail password)
-        app_password = config.GMAIL_APP_PASSWORD  # No spaces
-        
-        # Create Gmail sender
-        gmail = email_sender.GmailSender(gmail_user, app_password)
-        
-        # Email content
-        subject = "URGENT: Sump Pump Alert!"
-        message = "The water level in your sump is high! Please check the sump immediately!\n\n"
-        message += f"Alert Time: {time.localtime()}\n"
-        message += "Do not flush the toilet or run the water downstairs!\n\n"
-        message += "This is an automated message from your Sump Pump Alarm system."
-        
-        print("Sending email via Gmail SMTP...")
-        success = gmail.send_email(recipients, subject, message)
-        
-        if success:
-            print(f"Email alert sent to {', '.join(recipients)}")
-            return True
-        else:
-            print("Email alert failed")
-            return False
-            
+        ok = lazy.load("notify").send_message(
+            title, text, lambda c: any(s.routes(c) for s in slots),
+            sensor=slots[0], blink=blink_led, allow=governor.take)
     except Exception as e:
-        print(f"Email alert error: {e}")
-        return False
-
-def send_notifications():
-    """Send notifications through all configured channels"""
-    success = False
-    
-    print_memory_status("Start of notifications")
-    
-    # Try to connect to WiFi first
-    print("Connecting to WiFi...")
-    if not connect_wifi(config.WIFI_SSID, config.WIFI_PASSWORD):
-        print("WiFi connection failed, cannot send notifications")
-        return False
-        
-    print("WiFi connected")
-    gc.collect()
-    
-    # Try Telegram first
-    try:
-        telegram_success = send_telegram_alert()
-        if telegram_success:
-            success = True
-            print("Telegram notification succeeded")
-    except Exception as e:
-        print(f"Telegram module failure: {e}")
-    
-    # Force garbage collection between notification methods
-    gc.collect()
-    
-    # Try Gmail next
-    try:
-        # List of email recipients (includes SMS via email gateway)
-        recipients = config.EMAIL_RECIPIENTS
-        email_success = send_gmail_alert(recipients)
-        if email_success:
-            success = True
-            print("Gmail notification succeeded")
-    except Exception as e:
-        print(f"Gmail module failure: {e}")
-    
-    # Force garbage collection between notification methods
-    gc.collect()
-    
-    # Try Ntfy (free push notification)
-    try:
-        ntfy_success = send_ntfy_alert()
-        if ntfy_success:
-            success = True
-            print("Ntfy notification succeeded")
-    except Exception as e:
-        print(f"Ntfy module failure: {e}")
-    
-    print_memory_status("End of notifications")
-    return success
+        print(f"Governor message error: {e}")
+        ok = False
+    finally:
+        watchdog.suspend("notifier")
+        watchdog.resume("sensor")
+        lazy.release("notify")
+    governor.done(msg, ok)
+    eventlog.log("notify", f"{','.join(s.name for s in slots)} kind={msg[0]} ok={ok}")
 
 # Debouncing configuration
-DEBOUNCE_SECONDS = 15      # Switch must be on for this many seconds before alarm
+DEBOUNCE_SECONDS = config.DEBOUNCE_SECONDS  # Switch must be on this many seconds before alarm
 SAMPLE_INTERVAL_MS = 100   # Sample interval in milliseconds for debouncing
 SAMPLES_REQUIRED = 10      # Number of consecutive samples required to confirm state
+NOTIFY_RETRY_SECONDS = config.NOTIFY_RETRY_SECONDS  # Retry failed notifications this often
 
 def read_sensor_debounced(samples=SAMPLES_REQUIRED, interval_ms=SAMPLE_INTERVAL_MS):
-    """Read sensor with debouncing - requires multiple consistent readings"""
-    consistent_count = 0
-    last_value = pin.value()
-    
+    """Stream a burst of bank-wide samples through the debounce filters"""
     for _ in range(samples):
         time.sleep_ms(interval_ms)
-        current_value = pin.value()
-        if current_value == last_value:
-            consistent_count += 1
-        else:
-            consistent_count = 0
-            last_value = current_value
-    
-    # Return the value only if we got consistent readings
-    if consistent_count >= samples - 1:
-        return last_value
-    else:
-        # Inconsistent readings - assume no water (fail-safe)
-        return 0
+        sensors.sample()
+    return sensors.state
 
 # Initialization
 print_memory_status("Startup")
-notificationSent = False
-notBuzzingYet = True
-secondsFlooded = 0
-alarmTriggered = False  # Track if we've already triggered the alarm
 
 # Initialize GPIO
 led = Pin(LED_PIN, Pin.OUT)
@@ -376,73 +136,684 @@ led = Pin(LED_PIN, Pin.OUT)
 # Switch is NORMALLY CLOSED (no water) and OPEN when water is HIGH
 # - No water: switch closed, GPIO4 pulled to GND via GPIO3 → reads 0
 # - Water HIGH: switch open, GPIO4 pulled HIGH by internal pull-up → reads 1
-sensor_gnd = Pin(SENSOR_GND_PIN, Pin.OUT)
-sensor_gnd.value(0)  # Set GPIO3 LOW to act as GND
-pin = Pin(WATER_SENSOR_PIN, Pin.IN, Pin.PULL_UP)  # Water sensor input
+# Sites with a high-high float or a second pit list every switch in
+# config.SENSORS; each gets its own debounce filter and alarm state machine.
+sensor_specs = config.SENSORS or [
+    {"name": "sump", "pin": WATER_SENSOR_PIN, "gnd_pin": SENSOR_GND_PIN},
+]
+sensors = SensorArray(
+    sensor_specs,
+    algorithm=config.DEBOUNCE_ALGORITHM,
+    params=config.DEBOUNCE_PARAMS,
+    gpio_in_reg=config.GPIO_IN_REG,
+    default_debounce_s=DEBOUNCE_SECONDS,
+    default_retry_s=NOTIFY_RETRY_SECONDS,
+)
+
+# Optional analog level sensor (pressure transducer or resistive strip)
+level_spec = config.LEVEL_SENSOR
+level = LevelSensor(**level_spec) if level_spec else None
+if level:
+    metrics.register("level", level.metrics)
+
+# Alert governor: per-channel rate limits, flapping digests and batched
+# all-clear messages; its state is kept in RTC memory across soft resets
+all_sensors = sensors.sensors + ([level] if level else [])
+governor = AlertGovernor(
+    [s.name for s in all_sensors],
+    limits=config.ALERT_RATE_LIMITS,
+    flap_window_s=config.FLAP_WINDOW_S,
+    flap_alarms=config.FLAP_ALARMS,
+    digest_s=config.FLAP_DIGEST_S,
+    restore=config.RESTORE_NOTIFY,
+    restore_batch_s=config.RESTORE_BATCH_S,
+)
+metrics.register("governor", governor.metrics)
+
+def alarm_active():
+    """True while any float switch or the level sensor is alarming"""
+    return sensors.alarm_active or (level is not None and level.engine.alarm_triggered)
 
 tim = Timer(0)  # Use timer 0
 in_a = Pin(SPEAKER_IN_A, Pin.OUT)  # To H-Bridge IN_A
 in_b = Pin(SPEAKER_IN_B, Pin.OUT)  # To H-Bridge IN_B
+silenced_until = None  # ticks_ms when a /silence from Telegram runs out
+
+def siren_on():
+    """Start the buzzer unless it has been silenced"""
+    if silenced_until is None:
+        tim.init(period=1, mode=Timer.PERIODIC, callback=alarmSound)
+        watchdog.resume("siren")
+
+def siren_off():
+    tim.deinit()
+    watchdog.suspend("siren")
+
+def build_mode():
+    """How the modules were loaded: frozen into firmware, .mpy or source"""
+    path = getattr(metrics, "__file__", "")
+    if not path or path.startswith(".frozen"):
+        return "frozen"
+    return "mpy" if path.endswith(".mpy") else "py"
+
+# Alarm state checkpointed in RTC memory on every engine transition. After a
+# reset in the middle of a flood the engines carry on where they were: no
+# second debounce window, the siren straight back on, and an alarm whose
+# notification had not gone out retried on the first loop pass.
+checkpoint = EngineCheckpoint(all_sensors)
+resumed = checkpoint.restore()
+checkpoint.attach()
+metrics.register("checkpoint", checkpoint.metrics)
+if resumed:
+    sensors.seed(resumed)
+    if alarm_active():
+        led.value(1)
+        siren_on()
+    print(f"Resumed {', '.join(s.name for s in resumed)} from RTC memory "
+          f"{checkpoint.resume_ms} ms after reset")
+    eventlog.log("resume", f"{','.join(s.name for s in resumed)} alarm={int(alarm_active())} "
+                           f"ms={checkpoint.resume_ms}")
+
+# Armed: take the first sample now and record how long boot took.
+# ticks_ms() counts from reset, so it is the boot-to-armed time.
+sensors.sample()
+BOOT_TO_ARMED_MS = time.ticks_ms()
+eventlog.log("armed", f"ms={BOOT_TO_ARMED_MS} build={build_mode()}")
+print(f"Armed {BOOT_TO_ARMED_MS} ms after reset ({build_mode()} build)")
+
+# Hardware watchdog, fed only while every task meets its deadline
+supervisor = None
+if config.WDT_ENABLED:
+    import machine
+    supervisor = watchdog.Supervisor(
+        config.WDT_DEADLINES_MS,
+        wdt_timeout_ms=config.WDT_TIMEOUT_MS,
+        timer_id=config.WDT_TIMER_ID,
+    )
+    if machine.reset_cause() == machine.WDT_RESET:
+        eventlog.log("wdt_reset", str(supervisor.state.get("pending")))
+    supervisor.record_boot(machine.reset_cause(), machine.WDT_RESET)
+    watchdog.install(supervisor)
+    # The siren is checked in by the supervising timer while its own timer
+    # fires, so a notifier call blocking the loop cannot starve it
+    supervisor.watch("siren", lambda: siren_ticks)
+    supervisor.resume("sensor")
+    if alarm_active() and silenced_until is None:
+        supervisor.resume("siren")  # Resumed from the checkpoint
+    supervisor.start()
+    metrics.register("watchdog", supervisor.metrics)
+
+# Over-the-air updates. boot.py counts trial boots of a new version; it is
+# kept once it passes the alarm self-test and runs the loop for OTA_CONFIRM_S.
+OTA_URL = config.OTA_URL
+OTA_CHECK_S = config.OTA_CHECK_S
+OTA_RETRY_S = 600  # After a failed or paused download
+
+def ota_in_trial():
+    try:
+        os.stat("ota_state.json")
+    except OSError:
+        return False
+    try:
+        return lazy.load("ota").in_trial()
+    finally:
+        lazy.release("ota")
+
+def self_test():
+    """Alarm self-test for a new version: sensors, siren timer, notifier code"""
+    try:
+        sensors.sample()
+        if level:
+            level.read()
+        # The siren timer must fire; count its ticks without driving the speaker
+        fired = [0]
+        def count(t):
+            fired[0] += 1
+        tim.init(period=1, mode=Timer.PERIODIC, callback=count)
+        time.sleep_ms(100)
+        tim.deinit()
+        if fired[0] < 50:
+            print(f"Self-test: siren timer fired {fired[0]} times in 100 ms")
+            return False
+        # The notifier code must at least import
+        for name in ("notify", "email_sender", "mybase64"):
+            lazy.load(name)
+            lazy.release(name, force=True)
+        return True
+    except Exception as e:
+        print(f"Self-test failed: {e}")
+        return False
+
+ota_trial = ota_in_trial()
+trial_wdt = None
+if ota_trial:
+    import machine
+    if not self_test():
+        eventlog.log("ota_selftest", "failed")
+        lazy.load("ota").rollback("self-test failed")
+        machine.reset()
+    print("Self-test passed, confirming the update after the loop has run a while")
+    if supervisor is None:
+        # boot.py armed the watchdog for the trial and it cannot be stopped,
+        # so without the supervisor the main loop feeds it from now on
+        trial_wdt = machine.WDT(timeout=config.OTA_TRIAL_WDT_MS)
+ota_trial_ms = time.ticks_ms()
+ota_next_ms = time.ticks_add(time.ticks_ms(), config.OTA_FIRST_CHECK_S * 1000)
+
+def ota_progress(have, size):
+    """Pause the download (it resumes later) as soon as a float reads wet"""
+    return not sensors.sample()
+
+def check_ota():
+    """Look for an update while the pit is dry; reset into it once installed
+
+    Returns seconds until the next check.
+    """
+    watchdog.suspend("sensor")
+    watchdog.resume("notifier")
+    installed = False
+    try:
+        if not lazy.load("notify").connect_wifi(config.WIFI_SSID, config.WIFI_PASSWORD):
+            return OTA_RETRY_S
+        installed = lazy.load("ota").check_and_update(
+            OTA_URL, config.OTA_KEY, progress=ota_progress)
+    except Exception as e:
+        print(f"OTA update failed: {e}")
+        eventlog.log("ota_error", str(e))
+        return OTA_RETRY_S
+    finally:
+        watchdog.suspend("notifier")
+        watchdog.resume("sensor")
+        lazy.release("notify")
+        lazy.release("ota")
+    if installed:
+        import machine
+        eventlog.log("ota_install", "reset")
+        machine.reset()
+    return OTA_CHECK_S
+
+# Periodic email report: pump cycles and alarms, with the event log attached
+# as a compressed CSV. Sent while the pit is dry, like the update check.
+# Counted down a minute at a time: a week is beyond what ticks_add can span.
+REPORT_RETRY_S = 3600
+report_left_s = config.REPORT_S
+report_tick_ms = time.ticks_ms()
+
+def send_report():
+    """Email the report now; True if it was sent"""
+    watchdog.suspend("sensor")
+    watchdog.resume("notifier")
+    stats = {}
+    try:
+        subject, message, attachments = lazy.load("report").report(
+            config.REPORT_DAYS, {s.name: s.label for s in all_sensors}, stats=stats)
+        notify = lazy.load("notify")
+        ok = notify.connect_wifi(config.WIFI_SSID, config.WIFI_PASSWORD) and \
+            notify.send_gmail_alert(config.REPORT_RECIPIENTS or config.EMAIL_RECIPIENTS,
+                                    subject=subject, message=message, attachments=attachments)
+    except Exception as e:
+        print(f"Report failed: {e}")
+        ok = False
+    finally:
+        watchdog.suspend("notifier")
+        watchdog.resume("sensor")
+        lazy.release("notify")
+        lazy.release("report")
+    eventlog.log("report", f"ok={int(bool(ok))} csv={stats.get('csv_bytes')} gz={stats.get('gzip_bytes')}")
+    return bool(ok)
+
+# Canary: a marked test alert through each channel with a test-only
+# destination, timed phase by phase against CANARY_SLO_MS. The first run is
+# ten minutes after boot; failures are checked again after an hour. The
+# history is only created on the first run with a test destination.
+CANARY_RETRY_S = 3600
+canary = None
+canary_left_s = min(600, config.CANARY_S)
+canary_tick_ms = time.ticks_ms()
+
+def run_canary():
+    """Probe every channel with a test destination now; True if all passed"""
+    global canary
+    canary_module = lazy.load("canary")
+    targets = canary_module.destinations(config)
+    if not targets:
+        if canary is None:
+            lazy.release("canary")
+        return True
+    if canary is None:
+        canary = canary_module.Canary(config.CANARY_SLO_MS)
+        metrics.register("canary", canary.metrics)
+    watchdog.suspend("sensor")
+    watchdog.resume("notifier")
+    changes = []
+    passed = True
+    try:
+        notify = lazy.load("notify")
+        wifi = lambda: notify.connect_wifi(config.WIFI_SSID, config.WIFI_PASSWORD)
+        for channel, destination in targets.items():
+            try:
+                ok, phases = canary_module.probe(notify, channel, destination, wifi, canary.runs + 1)
+            except Exception as e:
+                print(f"Canary {channel} error: {e}")
+                ok, phases = False, {}
+            passed = passed and ok
+            change = canary.record(channel, ok, phases)
+            eventlog.log("canary", f"{channel} ok={int(ok)} " +
+                         " ".join(f"{p}={ms}" for p, ms in phases.items()))
+            if change:
+                changes.append((channel, change))
+            gc.collect()
+        # Warn on the channels that still work (real destinations)
+        for channel, change in changes:
+            eventlog.log("canary_" + change, channel)
+            title = f"Sump alarm channel {change}: {channel}"
+            print(title)
+            try:
+                notify.send_message(title, canary.summary(channel), routes=lambda c: c != channel,
+                                    allow=governor.take)
+            except Exception as e:
+                print(f"Canary warning error: {e}")
+    except Exception as e:
+        print(f"Canary error: {e}")
+        passed = False
+    finally:
+        watchdog.suspend("notifier")
+        watchdog.resume("sensor")
+        lazy.release("notify")
+    return passed
+
+# Telegram commands: /status, /silence 30m, /test and /metrics from
+# TELEGRAM_CHAT_ID. The poller is stepped once per loop pass and never blocks.
+def format_duration(seconds):
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def telegram_command(command, arg):
+    """Run one command from the chat and return the reply"""
+    global silenced_until, chat_job
+    if command == "/status":
+        lines = []
+        for s in all_sensors:
+            e = s.engine
+            state = "ALARM" if e.alarm_triggered else f"wet {e.seconds_flooded}s" if e.flooded else "dry"
+            lines.append(f"{s.label}: {state}")
+        if level:
+            lines.append(f"Level: {level.level // 10}% ({level.rate / 10:+.1f}%/min)")
+        if silenced_until is not None:
+            left = time.ticks_diff(silenced_until, time.ticks_ms()) // 1000
+            lines.append(f"Siren silenced for {format_duration(max(left, 0))}")
+        if canary and canary.degraded:
+            lines.append(f"Degraded channels: {', '.join(canary.degraded)}")
+        lines.append(f"Up {format_duration(time.ticks_ms() // 1000)}, {gc.mem_free()} bytes free")
+        return "\n".join(lines)
+    if command == "/silence":
+        if arg.strip().lower() == "off":
+            silenced_until = None
+            if alarm_active():
+                siren_on()
+            return "Siren enabled"
+        seconds = lazy.load("telegram_bot").parse_duration(arg)
+        if seconds is None or seconds <= 0:
+            return "Usage: /silence 30m (or 2h, 90s, off)"
+        seconds = min(seconds, TELEGRAM_SILENCE_MAX_S)
+        silenced_until = time.ticks_add(time.ticks_ms(), seconds * 1000)
+        siren_off()
+        eventlog.log("silence", f"s={seconds}")
+        return f"Siren silenced for {format_duration(seconds)}; alerts still go out"
+    if command == "/test":
+        if alarm_active() or sensors.flooded:
+            return "Not testing while water is detected"
+        ok = self_test()
+        eventlog.log("selftest", f"ok={int(ok)}")
+        return "Self-test passed" if ok else "Self-test FAILED"
+    if command in ("/report", "/canary"):
+        if alarm_active() or sensors.flooded:
+            return f"Not running {command} while water is detected"
+        # Both block for seconds: the main loop runs them, not bot.step()
+        chat_job = command
+        return f"{command} queued, the result follows"
+    if command == "/set":
+        parts = arg.split(None, 1)
+        if len(parts) < 2:
+            return "Usage: /set DEBOUNCE_SECONDS 20"
+        name = parts[0].upper()
+        if name in settings.LOCAL_ONLY:
+            return f"{name} can only be changed in config.py"
+        try:
+            value = settings.parse(name, parts[1])
+        except settings.ConfigError as e:
+            return str(e)
+        return change_settings("set", {name: value})
+    if command == "/get":
+        name = arg.strip().upper()
+        if name not in settings.SCHEMA:
+            return f"Unknown setting {name}"
+        return f"{name} = {settings.show(name)}"
+    if command == "/reload":
+        return change_settings("reload")
+    if command == "/metrics":
+        return "\n".join(f"{k}: {v}" for k, v in metrics.collect().items())
+    return ("Commands: /status, /silence 30m, /silence off, /test, /report, /canary, /metrics, "
+            "/get NAME, /set NAME VALUE, /reload")
+
+def run_chat_job():
+    """Run the /report or /canary queued by telegram_command() and reply"""
+    global chat_job
+    job, chat_job = chat_job, None
+    if alarm_active() or sensors.flooded:
+        bot.reply(f"{job} skipped: water detected")
+    elif job == "/report":
+        bot.reply("Report sent" if send_report() else "Report FAILED")
+    else:
+        run_canary()
+        if canary is None:
+            bot.reply("No canary destinations in config (CANARY_EMAIL, ...)")
+        else:
+            bot.reply("\n".join(canary.summary(c) for c in canary.history))
+
+TELEGRAM_SILENCE_MAX_S = 12 * 3600
+chat_job = None  # /report or /canary waiting for the main loop
+
+# transport holds the TLS sessions and pins, and the Wi-Fi station the
+# poller, clock and heartbeat below share: once loaded it stays
+lazy.keep("transport")
+
+bot = None
+if config.TELEGRAM_COMMANDS:
+    bot = lazy.load("telegram_bot").TelegramPoller(
+        config.TELEGRAM_BOT_TOKEN, config.TELEGRAM_CHAT_ID, telegram_command,
+        period_s=config.TELEGRAM_POLL_S,
+        wifi=(config.WIFI_SSID, config.WIFI_PASSWORD))
+    metrics.register("telegram", bot.metrics)
+    # The poller carries the bot token too: its TLS connections are pinned
+    lazy.load("transport").configure(config.TLS_SESSIONS, config.TLS_PINS, config.TLS_PIN_MODE)
+
+# Wall clock for event, metric and alert timestamps
+clock = None
+if config.NTP_HOST:
+    clock = timeservice.TimeService(config.NTP_HOST, config.NTP_RESYNC_S,
+                                    wifi=(config.WIFI_SSID, config.WIFI_PASSWORD))
+    timeservice.install(clock)
+    metrics.register("clock", clock.metrics)
+
+# Heartbeat to an external monitor, so a dead or offline unit raises an alert
+beat = None
+if config.HEARTBEAT_URL:
+    import machine
+    BOOT_RESET_CAUSE = machine.reset_cause()
+
+    def heartbeat_status():
+        """Status word sent with each beat"""
+        hb = lazy.load("heartbeat")
+        wet = alarms = 0
+        notify_failed = False
+        for i, sensor in enumerate(all_sensors):
+            engine = sensor.engine
+            if engine.flooded:
+                wet |= 1 << i
+            if engine.alarm_triggered:
+                alarms |= 1 << i
+                notify_failed = notify_failed or not engine.notification_sent
+        return hb.status_word(wet, alarms, silenced_until is not None, notify_failed,
+                              clock is not None and clock.synced, ota_trial, BOOT_RESET_CAUSE)
+
+    beat = lazy.load("heartbeat").Heartbeat(
+        config.HEARTBEAT_URL, config.GATEWAY_UNIT, config.HEARTBEAT_KEY, heartbeat_status,
+        period_s=config.HEARTBEAT_S, radio_off=config.HEARTBEAT_RADIO_OFF,
+        wifi=(config.WIFI_SSID, config.WIFI_PASSWORD))
+    metrics.register("heartbeat", beat.metrics)
+
+# Configuration hot reload: a new config.py (noticed with one stat every
+# CONFIG_CHECK_S) or /set and /reload from Telegram. settings.apply() checks
+# everything first, then this pushes the values into the running tasks.
+CONFIG_CHECK_S = 5
+last_config_check_ms = time.ticks_ms()
+
+def apply_settings(changed):
+    """Push hot-reloaded settings into the sensor, sampler, governor and tasks"""
+    global DEBOUNCE_SECONDS, NOTIFY_RETRY_SECONDS, METRICS_PRINT_S, OTA_URL, OTA_CHECK_S
+    DEBOUNCE_SECONDS = config.DEBOUNCE_SECONDS
+    NOTIFY_RETRY_SECONDS = config.NOTIFY_RETRY_SECONDS
+    for sensor, spec in zip(sensors.sensors, sensor_specs):
+        # Sensors with their own debounce_s/retry_s in SENSORS keep them
+        if "debounce_s" not in spec:
+            sensor.engine.debounce_ms = DEBOUNCE_SECONDS * 1000
+        if "retry_s" not in spec:
+            sensor.engine.retry_ms = NOTIFY_RETRY_SECONDS * 1000
+    sampler.fast_ms = config.SAMPLER_FAST_MS
+    sampler.normal_ms = config.SAMPLER_NORMAL_MS
+    sampler.idle_ms = config.SAMPLER_IDLE_MS
+    sampler.idle_after_ms = config.SAMPLER_IDLE_AFTER_S * 1000
+    sampler.fast_hold_ms = config.SAMPLER_FAST_HOLD_S * 1000
+    governor.configure(config.ALERT_RATE_LIMITS, config.FLAP_WINDOW_S, config.FLAP_ALARMS,
+                       config.FLAP_DIGEST_S, config.RESTORE_NOTIFY, config.RESTORE_BATCH_S)
+    lazy.configure(config.LAZY_EVICT_POLICY, config.LAZY_MIN_FREE_BYTES)
+    if bot:
+        bot.token = config.TELEGRAM_BOT_TOKEN
+        bot.chat_id = str(config.TELEGRAM_CHAT_ID)
+        bot.period_ms = config.TELEGRAM_POLL_S * 1000
+        bot.station.wifi = (config.WIFI_SSID, config.WIFI_PASSWORD)
+    if "transport" in sys.modules:
+        sys.modules["transport"].configure(config.TLS_SESSIONS, config.TLS_PINS, config.TLS_PIN_MODE)
+    if clock:
+        clock.configure(config.NTP_HOST or clock.host, config.NTP_RESYNC_S,
+                        (config.WIFI_SSID, config.WIFI_PASSWORD))
+    if beat:
+        beat.configure(config.HEARTBEAT_URL, config.HEARTBEAT_S, config.HEARTBEAT_KEY,
+                       config.HEARTBEAT_RADIO_OFF)
+        beat.unit = config.GATEWAY_UNIT
+        beat.station.wifi = (config.WIFI_SSID, config.WIFI_PASSWORD)
+    if canary:
+        canary.slo_ms = dict(config.CANARY_SLO_MS)
+    METRICS_PRINT_S = config.METRICS_PRINT_S
+    OTA_URL = config.OTA_URL
+    OTA_CHECK_S = config.OTA_CHECK_S
+    # Credentials, recipients and topics are read by the notifiers at send time
+
+settings.on_change(apply_settings)
+metrics.register("config", settings.metrics)
+
+def change_settings(how, changes=None):
+    """Reload config.py or apply changes; return a one-line result"""
+    try:
+        if changes is None:
+            live, later = settings.reload()
+        else:
+            live, later = settings.apply(changes)
+    except settings.ConfigError as e:
+        print(f"Config {how} rejected: {e}")
+        eventlog.log("config", f"{how} rejected")
+        return f"Rejected, nothing changed: {e}"
+    print(f"Config {how}: applied {live}, after reset {later}")
+    eventlog.log("config", f"{how} live={len(live)} reset={len(later)}")
+    result = f"Applied: {', '.join(live) or 'no changes'}"
+    if later:
+        result += f"; after a reset: {', '.join(later)}"
+    return result
 
 print('ESP32-C3 Sump Alarm System Starting')
 print('Version 2.2 - November 2025 (with debouncing)')
 print(f'Debounce threshold: {DEBOUNCE_SECONDS} seconds')
+for sensor in sensors.sensors:
+    print(f"Sensor {sensor.name}: GPIO{sensor.pin} ({sensor.label}), alarm after {sensor.engine.debounce_ms // 1000}s")
 blink_led(3)  # Signal startup
 print_memory_status("After initialization")
 
+# Adaptive sampling: poll rarely while dry, burst-sample on any wet reading
+sampler = AdaptiveSampler(
+    fast_ms=config.SAMPLER_FAST_MS,
+    normal_ms=config.SAMPLER_NORMAL_MS,
+    idle_ms=config.SAMPLER_IDLE_MS,
+    idle_after_s=config.SAMPLER_IDLE_AFTER_S,
+    fast_hold_s=config.SAMPLER_FAST_HOLD_S,
+)
+metrics.register("sampler", sampler.metrics)
+
+# Networking/notifier modules are loaded on demand and evicted after use
+lazy.configure(config.LAZY_EVICT_POLICY, config.LAZY_MIN_FREE_BYTES)
+metrics.register("imports", lazy.metrics)
+
+def transport_metrics():
+    """Connection racing and TLS resumption counters while transport.py is loaded"""
+    transport = sys.modules.get("transport")
+    return dict(transport.stats) if transport else {"loaded": False}
+
+metrics.register("transport", transport_metrics)
+METRICS_PRINT_S = config.METRICS_PRINT_S
+next_sleep_ms = sampler.normal_ms
+last_metrics_ms = time.ticks_ms()
+last_level_ms = time.ticks_ms()
+
+def handle_action(sensor, action):
+    """React to an alarm engine action for one sensor"""
+    engine = sensor.engine
+    if action == ACT_ALARM:
+        print(f'ALERT: Water level is high at {sensor.label}! (confirmed after debounce)')
+        eventlog.log("alarm", sensor.name)
+        led.value(1)  # Solid LED to indicate alarm
+        siren_on()  # Start the buzzer
+        
+        # Try to send notifications, unless the sensor is flapping and the
+        # governor's digest covers this alarm
+        if not governor.on_alarm(sensor.name):
+            print(f"{sensor.label} is flapping, alarm goes in the digest")
+            engine.notified(True)
+            eventlog.log("notify", f"{sensor.name} flapping=1")
+            return
+        try:
+            engine.notified(send_notifications(sensor))
+        except Exception as e:
+            print("Notification error but alarm continues:", e)
+        eventlog.log("notify", f"{sensor.name} ok={engine.notification_sent}")
+    
+    elif action == ACT_RETRY:
+        # Retry notification every 10 minutes if it failed before
+        try:
+            gc.collect()
+            engine.notified(send_notifications(sensor))
+        except Exception as e:
+            print(f"Retry notification error: {e}")
+        eventlog.log("notify", f"{sensor.name} ok={engine.notification_sent} retry=1")
+    
+    elif action == ACT_RESTORE:
+        print(f"Water level restored at {sensor.label} (was high for {engine.last_flood_s}s, alarm triggered: {engine.last_alarm})")
+        eventlog.log("restore", f"{sensor.name} s={engine.last_flood_s} alarm={int(engine.last_alarm)}")
+        governor.on_restore(sensor.name, engine.last_alarm)
+        if not alarm_active():
+            siren_off()  # Stop alarm sound once no sensor is alarming
+
 # Forever loop
 while True:
-    time.sleep(1)
+    time.sleep_ms(next_sleep_ms)
+    wake_us = time.ticks_us()
+    slept_ms = 0
     
-    # Use debounced sensor reading to filter out noise
-    sensor_value = read_sensor_debounced()
+    # One cheap probe of every sensor decides how hard we need to look
+    raw_bits = sensors.sample()
+    next_sleep_ms = sampler.update(1 if raw_bits else 0, time.ticks_ms(),
+                                   alarm=sensors.flooded or (level is not None and level.engine.flooded))
     
-    if sensor_value == 1:  # Water detected (adjust based on your sensor logic)
-        secondsFlooded += 1
-        print(f"Water detected for {secondsFlooded} seconds (alarm at {DEBOUNCE_SECONDS}s)")
-        
-        # Start alarm after DEBOUNCE_SECONDS of continuous detection
-        if secondsFlooded == DEBOUNCE_SECONDS and not alarmTriggered:
-            print('ALERT: Water level is high! (confirmed after debounce)')
-            led.value(1)  # Solid LED to indicate alarm
-            alarmTriggered = True
-            
-            # Start the buzzer
-            notBuzzingYet = False
-            tim.init(period=1, mode=Timer.PERIODIC, callback=alarmSound)
-            
-            # Try to send notifications
-            try:
-                notificationSent = send_notifications()
-            except Exception as e:
-                print("Notification error but alarm continues:", e)
-        
-        # Keep alarm on and retry notification every 10 minutes if first attempt failed
-        elif secondsFlooded > DEBOUNCE_SECONDS:
-            print('ALERT: Water level is high!')
-            led.value(1)  # Solid LED for alarm
+    if sampler.fast:
+        # Use debounced sensor reading to filter out noise
+        read_sensor_debounced(interval_ms=sampler.fast_ms)
+        sampler.add_samples(SAMPLES_REQUIRED)
+        slept_ms = SAMPLES_REQUIRED * sampler.fast_ms
+    
+    sensors.step(time.ticks_ms(), handle_action)
     
-            # Ensure buzzer is on
-            if notBuzzingYet:
-                notBuzzingYet = False
-                tim.init(period=1, mode=Timer.PERIODIC, callback=alarmSound)
-                
-            # Retry notification every 10 minutes if it failed before
-            if not notificationSent and secondsFlooded % 600 == 0:
-                try:
-                    gc.collect()
-                    notificationSent = send_notifications()
-                except Exception as e:
-                    print(f"Retry notification error: {e}")
+    # Analog level runs on its own fixed cadence so the slope stays meaningful
+    if level and time.ticks_diff(time.ticks_ms(), last_level_ms) >= level.period_ms:
+        now = time.ticks_ms()
+        if time.ticks_diff(now, last_level_ms) >= 2 * level.period_ms:
+            # Missed periods (blocking notification, OTA step): resynchronise
+            # rather than catch up, as catch-up readings would be one loop
+            # pass apart and the slope would read them as period_ms apart
+            last_level_ms = now
+        else:
+            last_level_ms = time.ticks_add(last_level_ms, level.period_ms)
+        level.read()
+        action = level.engine.update(level.wet, time.ticks_ms())
+        if action:
+            handle_action(level, action)
+    
+    if alarm_active():
+        print('ALERT: Water level is high!')
+        led.value(1)  # Solid LED for alarm
+    elif sensors.flooded:
+        for sensor in sensors.sensors:
+            if sensor.engine.flooded:
+                print(f"Water detected at {sensor.name} for {sensor.engine.seconds_flooded} seconds (alarm at {sensor.engine.debounce_ms // 1000}s)")
     else:
         toggle(led)  # Blink LED in normal operation
-        if secondsFlooded > 0:
-            print(f"Water level restored (was high for {secondsFlooded}s, alarm triggered: {alarmTriggered})")
-        
-        secondsFlooded = 0
-        notificationSent = False
-        notBuzzingYet = True
-        alarmTriggered = False  # Reset alarm state when water level returns to normal
-        tim.deinit()  # Stop alarm sound
-
-
+    
+    if silenced_until is not None and time.ticks_diff(time.ticks_ms(), silenced_until) >= 0:
+        silenced_until = None
+        if alarm_active():
+            siren_on()  # Silence ran out with the water still high
+    
+    if time.ticks_diff(time.ticks_ms(), last_config_check_ms) >= CONFIG_CHECK_S * 1000:
+        last_config_check_ms = time.ticks_ms()
+        if settings.source_changed():
+            change_settings("file")
+    
+    # Time sync: one non-blocking UDP exchange now and then
+    if clock and config.NTP_HOST:
+        clock.step()
+        if clock.busy:
+            next_sleep_ms = min(next_sleep_ms, 50)
+    
+    # Commands from Telegram: a few non-blocking socket calls per pass, and
+    # short sleeps while an exchange is in flight
+    if bot:
+        bot.step()
+        if bot.busy:
+            next_sleep_ms = min(next_sleep_ms, 50)
+    
+    # Heartbeat: one datagram (or short HTTP GET) every HEARTBEAT_S
+    if beat:
+        beat.step()
+        if beat.busy:
+            next_sleep_ms = min(next_sleep_ms, 50)
+    
+    # Flapping digests and all-clear messages that have come due
+    governor_msg = governor.poll()
+    if governor_msg:
+        send_governor_message(governor_msg)
+    
+    watchdog.checkin("sensor")
+    if trial_wdt:
+        trial_wdt.feed()
+    
+    if ota_trial and time.ticks_diff(time.ticks_ms(), ota_trial_ms) >= config.OTA_CONFIRM_S * 1000:
+        ota_trial = False
+        lazy.load("ota").confirm()
+        lazy.release("ota")
+        eventlog.log("ota_confirm", "")
+    elif chat_job:
+        run_chat_job()
+    elif OTA_URL and not ota_trial and not alarm_active() and not sensors.flooded and \
+            time.ticks_diff(time.ticks_ms(), ota_next_ms) >= 0:
+        ota_next_ms = time.ticks_add(time.ticks_ms(), check_ota() * 1000)
+    elif config.REPORT_S and time.ticks_diff(time.ticks_ms(), report_tick_ms) >= 60000:
+        report_tick_ms = time.ticks_ms()
+        report_left_s = min(report_left_s - 60, config.REPORT_S)
+        if report_left_s <= 0 and not alarm_active() and not sensors.flooded:
+            report_left_s = config.REPORT_S if send_report() else REPORT_RETRY_S
+    elif config.CANARY_S and time.ticks_diff(time.ticks_ms(), canary_tick_ms) >= 60000:
+        canary_tick_ms = time.ticks_ms()
+        canary_left_s = min(canary_left_s - 60, config.CANARY_S)
+        if canary_left_s <= 0 and not alarm_active() and not sensors.flooded:
+            canary_left_s = config.CANARY_S if run_canary() else min(config.CANARY_S, CANARY_RETRY_S)
+    
+    # CPU time spent awake, excluding the sleeps inside the burst
+    busy_us = time.ticks_diff(time.ticks_us(), wake_us) - slept_ms * 1000
+    sampler.add_busy(busy_us)
+    if beat:
+        beat.note_loop(busy_us)
+    
+    if time.ticks_diff(time.ticks_ms(), last_metrics_ms) >= METRICS_PRINT_S * 1000:
+        last_metrics_ms = time.ticks_ms()
+        metrics.print_metrics()
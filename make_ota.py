@@ -0,0 +1,80 @@
+"""
+Build an over-the-air update bundle for the Sump Alarm
+Host tool (run on a PC). Packs the given files into one deflate-compressed
+bundle with a small window so the ESP32 can inflate it in about 1 KB, and
+writes manifest.json with the version, the bundle's size and SHA-256, the
+SHA-256 of every file and an HMAC over all of them made with --key, which
+the device checks against OTA_KEY. Serve the output directory over HTTP and point OTA_URL at
+manifest.json.
+
+Usage:
+    python make_ota.py --version 2.3 --key SECRET main.py config.py notify.py
+    python build_mpy.py && python make_ota.py --version 2.3 --key SECRET build/*
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import struct
+import zlib
+
+from ota import WINDOW_BITS, signed_text
+
+def pack_files(paths):
+    """The uncompressed bundle: name and size records followed by the data"""
+    parts = []
+    for path in paths:
+        name = os.path.basename(path).encode()
+        with open(path, "rb") as f:
+            data = f.read()
+        parts.append(struct.pack(">H", len(name)) + name + struct.pack(">I", len(data)) + data)
+    parts.append(struct.pack(">H", 0))
+    return b"".join(parts)
+
+def build_bundle(paths, version, out_dir, key, window_bits=WINDOW_BITS, level=9):
+    """Write the bundle and manifest.json to out_dir; return (manifest, raw size)"""
+    names = [os.path.basename(p) for p in paths]
+    if len(set(names)) != len(names):
+        raise SystemExit("Two files with the same name in one bundle")
+    raw = pack_files(paths)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, window_bits)
+    bundle = compressor.compress(raw) + compressor.flush()
+    os.makedirs(out_dir, exist_ok=True)
+    bundle_name = f"bundle-{version}.bin"
+    with open(os.path.join(out_dir, bundle_name), "wb") as f:
+        f.write(bundle)
+    files = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            files[os.path.basename(path)] = hashlib.sha256(f.read()).hexdigest()
+    manifest = {
+        "version": version,
+        "bundle": bundle_name,
+        "size": len(bundle),
+        "sha256": hashlib.sha256(bundle).hexdigest(),
+        "files": files,
+    }
+    manifest["mac"] = hmac.new(key.encode(), signed_text(manifest).encode(), hashlib.sha256).hexdigest()
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest, len(raw)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("files", nargs="+", help="Files to install on the device")
+    parser.add_argument("--version", required=True, help="Version name; the device installs any new one")
+    parser.add_argument("--out", default="ota_site", help="Directory to serve over HTTP")
+    parser.add_argument("--key", required=True, help="Sign the manifest with this OTA_KEY")
+    parser.add_argument("--window-bits", type=int, default=WINDOW_BITS,
+                        help="Deflate window (2**bits bytes of device RAM while inflating)")
+    args = parser.parse_args()
+    manifest, raw = build_bundle(args.files, args.version, args.out, args.key, args.window_bits)
+    print(f"{len(manifest['files'])} files, {raw} bytes -> {manifest['size']} bytes "
+          f"({100 * manifest['size'] // raw}%) in {args.out}/{manifest['bundle']}")
+    print("Serve it with a web server that supports Range requests (nginx, caddy) so "
+          "interrupted downloads resume, and set OTA_URL to .../manifest.json")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compute TLS public key pins for the Sump Alarm
+Host tool (run on a PC). Connects to each server, checks its certificate
+against the PC's CA store, and prints the pin the device checks
+(transport.spki_pin: base64 SHA-256 of the certificate's public key) as a
+TLS_PINS line for config.py. Backup pins come from PEM files given with
+--backup: a certificate or public key the server may switch to, such as
+the next key a service has announced or its issuing CA's key. Servers
+renew their keys now and then; run this again and update config.py when
+the canary or the "pin mismatch" log shows a new key.
+
+Usage:
+    python make_pins.py api.telegram.org smtp.gmail.com:465 ntfy.sh
+    python make_pins.py ntfy.sh --backup next-ntfy-key.pem
+"""
+
+import argparse
+import base64
+import hashlib
+import socket
+import ssl
+
+from transport import spki_pin
+
+def server_pin(host, port=443, verify=True, timeout=10):
+    """Pin of the certificate host presents on port"""
+    context = ssl.create_default_context()
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        with context.wrap_socket(sock, server_hostname=host) as tls:
+            return spki_pin(tls.getpeercert(True))
+
+def pem_pin(path):
+    """Pin of a PEM certificate or public key file"""
+    with open(path) as f:
+        text = f.read()
+    if "BEGIN CERTIFICATE" in text:
+        return spki_pin(ssl.PEM_cert_to_DER_cert(text))
+    if "BEGIN PUBLIC KEY" in text:
+        body = "".join(l for l in text.splitlines() if l and not l.startswith("-----"))
+        return base64.b64encode(hashlib.sha256(base64.b64decode(body)).digest()).decode()
+    raise SystemExit(f"{path}: not a PEM certificate or public key")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("servers", nargs="+", help="host or host:port (default port 443)")
+    parser.add_argument("--backup", action="append", default=[],
+                        help="PEM certificate or public key to add as a backup pin (repeatable)")
+    parser.add_argument("--insecure", action="store_true",
+                        help="Do not check the certificate against the PC's CA store")
+    args = parser.parse_args()
+    backups = [pem_pin(path) for path in args.backup]
+    pins = {}
+    for server in args.servers:
+        host, _, port = server.partition(":")
+        pin = server_pin(host, int(port or 443), not args.insecure)
+        print(f"{server}: {pin}")
+        pins.setdefault(host, [])
+        if pin not in pins[host]:
+            pins[host].append(pin)
+    for host in pins:
+        pins[host] += [b for b in backups if b not in pins[host]]
+    print("\nTLS_PINS = {")
+    for host, values in pins.items():
+        print(f"    {host!r}: {values!r},")
+    print("}")
+    short = [h for h, v in pins.items() if len(v) < 2]
+    if short:
+        print(f"\nNo backup pin for {', '.join(short)}: config.py needs one (--backup)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Lightweight metrics registry for the Sump Alarm
+Subsystems register a provider function returning a small dict of counters
+"""
+
+import gc
+
+import timeservice
+from compat import mem_free
+
+_providers = {}
+_counters = {}
+
+def register(name, provider):
+    """Register a callable returning a dict of metrics under a name"""
+    _providers[name] = provider
+
+def inc(name, n=1):
+    """Increment a free-standing counter"""
+    _counters[name] = _counters.get(name, 0) + n
+
+def set_value(name, value):
+    """Set a free-standing gauge"""
+    _counters[name] = value
+
+def collect():
+    """Return a dict of all registered metrics"""
+    result = {"counters": dict(_counters)}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
+
+def print_metrics(label="Metrics"):
+    """Print all metrics, one group per line"""
+    print(f"=== {label} at {timeservice.stamp()} ===")
+    for name, values in collect().items():
+        print(f"  {name}: {values}")
+
+# Memory monitoring functions
+def get_free_memory():
+    """Return amount of free memory in bytes"""
+    gc.collect()
+    return mem_free()
+
+def print_memory_status(label="Current"):
+    """Print memory status with a label"""
+    free_mem = get_free_memory()
+    print(f"=== {label} Memory: {free_mem} bytes free ===")
@@ -1,36 +1,229 @@
 """
-Simple Base64 encoder implementation for MicroPython when base64 module is not available
+Base64 encoder/decoder for MicroPython when the base64 module is not available
+Uses ubinascii/binascii when present; otherwise a table-driven pure Python
+implementation that writes straight into caller-supplied buffers. Includes
+an incremental encoder for streaming large payloads such as MIME parts.
 """
 
+import accel
+
+try:
+    import ubinascii as _binascii
+except ImportError:
+    try:
+        import binascii as _binascii
+    except ImportError:
+        _binascii = None
+
+# Set to False to force the pure Python code (tests and benchmarks)
+USE_BINASCII = _binascii is not None
+
 # Base64 encoding table
 _b64_alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+_ENC = _b64_alphabet.encode()
+_PAD = 61  # ord('=')
+
+# Decoding table: byte value -> 6-bit value, 0xFF for characters to skip
+_DEC = bytearray(b'\xff' * 256)
+for _i in range(64):
+    _DEC[_ENC[_i]] = _i
+del _i
+
+def encoded_length(n):
+    """Number of base64 characters needed for n input bytes"""
+    return (n + 2) // 3 * 4
+
+def _encode_into_py(data, start, end, out, pos):
+    """Pure Python encode of data[start:end] into out at pos; returns new pos"""
+    enc = _ENC
+    full = end - (end - start) % 3
+    i = start
+    while i < full:
+        b = (data[i] << 16) | (data[i + 1] << 8) | data[i + 2]
+        out[pos] = enc[b >> 18]
+        out[pos + 1] = enc[(b >> 12) & 0x3F]
+        out[pos + 2] = enc[(b >> 6) & 0x3F]
+        out[pos + 3] = enc[b & 0x3F]
+        i += 3
+        pos += 4
+    rem = end - full
+    if rem:
+        b1 = data[i]
+        b2 = data[i + 1] if rem == 2 else 0
+        out[pos] = enc[b1 >> 2]
+        out[pos + 1] = enc[((b1 & 0x03) << 4) | (b2 >> 4)]
+        out[pos + 2] = enc[(b2 & 0x0F) << 2] if rem == 2 else _PAD
+        out[pos + 3] = _PAD
+        pos += 4
+    return pos
+
+if accel.ENABLED:
+    import micropython
+
+    @micropython.viper
+    def _encode_blocks_viper(src, n: int, dst) -> int:
+        """Encode the whole 3-byte groups of src[:n] into dst; returns bytes read"""
+        s = ptr8(src)
+        d = ptr8(dst)
+        enc = ptr8(_ENC)
+        i = 0
+        o = 0
+        while i + 3 <= n:
+            b = (s[i] << 16) | (s[i + 1] << 8) | s[i + 2]
+            d[o] = enc[b >> 18]
+            d[o + 1] = enc[(b >> 12) & 0x3F]
+            d[o + 2] = enc[(b >> 6) & 0x3F]
+            d[o + 3] = enc[b & 0x3F]
+            i += 3
+            o += 4
+        return i
+
+    def _encode_into(data, start, end, out, pos):
+        """Viper encode of the full groups, Python for the padded tail"""
+        done = _encode_blocks_viper(memoryview(data)[start:end], end - start,
+                                    memoryview(out)[pos:])
+        return _encode_into_py(data, start + done, end, out, pos + done // 3 * 4)
+else:
+    _encode_into = _encode_into_py
+
+def b64encode_into(data, out, pos=0):
+    """Encode bytes-like data into the writable buffer out at pos
+
+    Returns the number of bytes written. out must have room for
+    encoded_length(len(data)) bytes.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    n = encoded_length(len(data))
+    if len(out) - pos < n:
+        raise ValueError("output buffer too small")
+    if USE_BINASCII and n:
+        out[pos:pos + n] = _binascii.b2a_base64(data)[:n]
+        return n
+    return _encode_into(data, 0, len(data), out, pos) - pos
 
 def b64encode(data):
     """Encode bytes or string to base64 string"""
     if isinstance(data, str):
         data = data.encode('utf-8')
-    
-    result = []
-    data_len = len(data)
-    
-    for i in range(0, data_len, 3):
-        # Get up to 3 bytes
-        b1 = data[i]
-        b2 = data[i + 1] if i + 1 < data_len else 0
-        b3 = data[i + 2] if i + 2 < data_len else 0
-        
-        # Convert to 4 base64 characters
-        result.append(_b64_alphabet[b1 >> 2])
-        result.append(_b64_alphabet[((b1 & 0x03) << 4) | (b2 >> 4)])
-        
-        if i + 1 < data_len:
-            result.append(_b64_alphabet[((b2 & 0x0F) << 2) | (b3 >> 6)])
-        else:
-            result.append('=')
-            
-        if i + 2 < data_len:
-            result.append(_b64_alphabet[b3 & 0x3F])
-        else:
-            result.append('=')
-    
-    return ''.join(result)
+    if USE_BINASCII:
+        return _binascii.b2a_base64(data)[:encoded_length(len(data))].decode()
+    out = bytearray(encoded_length(len(data)))
+    _encode_into(data, 0, len(data), out, 0)
+    return out.decode()
+
+def b64decode_into(data, out, pos=0):
+    """Decode base64 (bytes or str) into the writable buffer out at pos
+
+    Whitespace and other non-alphabet characters are skipped. Returns the
+    number of bytes written.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    dec = _DEC
+    start = pos
+    acc = 0
+    bits = 0
+    for c in data:
+        if c == _PAD:
+            break
+        v = dec[c]
+        if v == 0xFF:
+            continue
+        acc = ((acc << 6) | v) & 0xFFFFFF
+        bits += 6
+        if bits >= 8:
+            bits -= 8
+            out[pos] = (acc >> bits) & 0xFF
+            pos += 1
+    return pos - start
+
+def b64decode(data):
+    """Decode a base64 string or bytes to bytes"""
+    if USE_BINASCII:
+        try:
+            return _binascii.a2b_base64(data)
+        except ValueError:
+            pass  # Unusual padding or characters: fall back to the lenient decoder
+    if isinstance(data, str):
+        data = data.encode()
+    out = bytearray(len(data) * 3 // 4 + 3)
+    n = b64decode_into(data, out)
+    return bytes(memoryview(out)[:n])
+
+class B64Encoder:
+    """Incremental encoder for payloads too big to hold in memory
+
+    Feed chunks with update(); each call returns the base64 text that is
+    complete so far (optionally broken into CRLF-terminated lines of
+    line_length characters, as MIME requires), and finish() returns the
+    rest. Up to two leftover input bytes are carried between calls.
+    """
+
+    def __init__(self, line_length=0):
+        if line_length % 4:
+            raise ValueError("line_length must be a multiple of 4")
+        self.line_length = line_length
+        self._carry = bytearray(3)
+        self._carry_len = 0
+        self._column = 0
+
+    def _wrap(self, encoded):
+        """Insert CRLF line breaks into freshly encoded text"""
+        if not self.line_length:
+            return bytes(encoded)
+        parts = []
+        i = 0
+        n = len(encoded)
+        while i < n:
+            take = min(self.line_length - self._column, n - i)
+            parts.append(bytes(encoded[i:i + take]))
+            self._column += take
+            i += take
+            if self._column == self.line_length:
+                parts.append(b"\r\n")
+                self._column = 0
+        return b"".join(parts)
+
+    def update(self, data):
+        """Encode another chunk; returns the complete base64 bytes so far"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        data = memoryview(data)
+        start = 0
+        head = b""
+        if self._carry_len:
+            need = 3 - self._carry_len
+            take = min(need, len(data))
+            self._carry[self._carry_len:self._carry_len + take] = data[:take]
+            self._carry_len += take
+            start = take
+            if self._carry_len < 3:
+                return b""
+            block = bytearray(4)
+            _encode_into(self._carry, 0, 3, block, 0)
+            head = block
+            self._carry_len = 0
+        usable = (len(data) - start) // 3 * 3
+        body = bytearray(usable // 3 * 4)
+        if usable:
+            if USE_BINASCII:
+                body[:] = _binascii.b2a_base64(data[start:start + usable])[:len(body)]
+            else:
+                _encode_into(data, start, start + usable, body, 0)
+        rest = len(data) - start - usable
+        if rest:
+            self._carry[:rest] = data[start + usable:]
+            self._carry_len = rest
+        return self._wrap(head + body if head else body)
+
+    def finish(self):
+        """Flush the leftover bytes with padding and end the last line"""
+        out = bytearray(4)
+        n = _encode_into(self._carry, 0, self._carry_len, out, 0)
+        self._carry_len = 0
+        result = self._wrap(out[:n])
+        if self.line_length and self._column:
+            result += b"\r\n"
+            self._column = 0
+        return result
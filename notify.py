@@ -0,0 +1,329 @@
+"""
+Notification channels for the Sump Alarm (Telegram, Gmail, Ntfy)
+Loaded lazily by main.py when an alarm fires and evicted again afterwards
+under memory pressure, so none of this code is on the heap while dry.
+"""
+
+import time
+import gc
+
+import config
+import lazy
+import timeservice
+import watchdog
+from metrics import print_memory_status
+
+CHANNELS = ("telegram", "gmail", "ntfy")
+
+def connect_wifi(ssid, password, max_retries=3, blink=None):
+    """Connect to WiFi with retries, blinking the LED through blink(times)"""
+    import network  # Import only when needed to keep boot fast
+    wlan = network.WLAN(network.STA_IF)
+    wlan.active(True)
+    
+    if wlan.isconnected():
+        print("Already connected to WiFi:", wlan.ifconfig()[0])
+        return True
+    
+    watchdog.resume("wifi")  # Each poll of the association must check in
+    try:
+        for attempt in range(max_retries):
+            print(f"WiFi connection attempt {attempt+1}/{max_retries}")
+            wlan.connect(ssid, password)
+            
+            # Wait with timeout
+            for _ in range(20):
+                watchdog.checkin("wifi")
+                watchdog.checkin("notifier")
+                if wlan.isconnected():
+                    print("WiFi connected:", wlan.ifconfig()[0])
+                    if blink:
+                        blink(2)  # Signal connection success
+                    return True
+                time.sleep(0.5)
+                if blink:
+                    blink(1)  # Signal waiting
+    finally:
+        watchdog.suspend("wifi")
+    
+    print("WiFi connection failed after retries")
+    return False
+
+def _transport():
+    """The connection helper (transport.py), set up from config
+
+    Kept resident: it is small, holds the TLS sessions, pins and timings,
+    and email_sender binds its functions at import.
+    """
+    lazy.keep("transport")
+    transport = lazy.load("transport")
+    transport.configure(config.TLS_SESSIONS, config.TLS_PINS, config.TLS_PIN_MODE)
+    return transport
+
+def make_http_request(url, method="GET", headers=None, data=None, timeout=30):
+    """General HTTP request function with optimized memory usage"""
+    transport = _transport()
+    
+    gc.collect()  # Force garbage collection before request
+    print_memory_status("Before HTTP request")
+    
+    try:
+        status = transport.request(method.upper(), url, headers=headers, data=data, timeout_s=timeout)
+        if status == 200:
+            print(f"HTTP {method} request successful")
+            result = True
+        else:
+            print(f"HTTP {method} request failed with status: {status}")
+            result = False
+            
+        return result, status
+    except OSError as e:
+        print(f"Network error: {e}")
+        return False, -1
+    except Exception as e:
+        print(f"HTTP request failed: {e}")
+        return False, -1
+    finally:
+        # Clean up
+        gc.collect()
+        print_memory_status(f"After HTTP {method} request")
+
+def alarm_title(label=None):
+    """Alarm headline, naming the sensor when there is more than one"""
+    return f"SUMP ALARM ({label})!" if label else "SUMP ALARM!"
+
+def sent_at():
+    """" (sent <UTC time>)" once the clock is set, for end-to-end latency"""
+    ms = timeservice.epoch_ms()
+    return f" (sent {timeservice.iso(ms)})" if ms is not None else ""
+
+def send_telegram_alert(label=None, message=None, chat_id=None):
+    """Send alert through Telegram over HTTPS
+
+    There is no plain HTTP fallback: after a TLS or pin failure it would
+    hand the bot token to whoever is in the way.
+    """
+    print("Preparing Telegram alert...")
+    transport = _transport()
+    bot_token = config.TELEGRAM_BOT_TOKEN
+    chat_id = chat_id or config.TELEGRAM_CHAT_ID
+    if message is None:
+        message = f"🚨 {alarm_title(label)} Water level is high! Check the sump pump immediately!"
+    message += sent_at()
+    url = f"https://api.telegram.org/bot{bot_token}/sendMessage?chat_id={chat_id}&text={transport.quote(message)}"
+    
+    try:
+        print("Sending Telegram request...")
+        status = transport.request("GET", url, timeout_s=30)
+        if status == 200:
+            print("Telegram message sent successfully")
+            return True
+        print(f"Telegram failed with status code: {status}")
+    except Exception as e:
+        print(f"Telegram failed: {e}")
+    return False
+
+def send_ntfy_alert(label=None, topic=None, title=None, message=None):
+    """Send push notification via ntfy.sh (free service)"""
+    print("Preparing Ntfy alert...")
+    try:
+        transport = _transport()
+        
+        # Your unique topic - subscribe to this in the Ntfy app
+        topic = topic or config.NTFY_TOPIC
+        url = f"https://ntfy.sh/{topic}"
+        
+        urgent = title is None or title.startswith("SUMP ALARM")
+        headers = {
+            "Title": title or alarm_title(label),
+            "Priority": "urgent" if urgent else "default",
+            "Tags": "warning,rotating_light" if urgent else "white_check_mark"
+        }
+        
+        if message is None:
+            message = "Water level is high! Check the sump pump immediately!"
+        message += sent_at()
+        
+        status = transport.request("POST", url, headers=headers, data=message, timeout_s=15)
+        
+        if status == 200:
+            print("Ntfy alert sent successfully")
+            return True
+        else:
+            print(f"Ntfy failed with status: {status}")
+            return False
+            
+    except Exception as e:
+        print(f"Ntfy alert failed: {e}")
+        return False
+
+def send_gmail_alert(recipients, label=None, subject=None, message=None, attachments=None):
+    """Send email alert using Gmail's SMTP server with App Password
+
+    attachments are streamed, see email_sender.write_message().
+    """
+    print("Preparing Gmail alert...")
+    
+    try:
+        _transport()
+        email_sender = lazy.load("email_sender")
+        
+        # Force garbage collection before email send
+        gc.collect()
+        
+        # Gmail credentials - replace with your own
+        gmail_user = config.GMAIL_USER
+        # App password (NOT your regular Gmail password)
+        app_password = config.GMAIL_APP_PASSWORD  # No spaces
+        
+        # Create Gmail sender
+        gmail = email_sender.GmailSender(gmail_user, app_password, config.SMTP_PORTS)
+        
+        # Email content
+        if subject is None:
+            subject = f"URGENT: Sump Pump Alert ({label})!" if label else "URGENT: Sump Pump Alert!"
+            where = f"The water level at {label}" if label else "The water level in your sump"
+            message = f"{where} is high! Please check the sump immediately!\n\n"
+            message += f"Alert Time: {timeservice.stamp()}\n"
+            message += "Do not flush the toilet or run the water downstairs!\n\n"
+        else:
+            message += f"\n\nTime: {timeservice.stamp()}\n\n"
+        message += "This is an automated message from your Sump Pump Alarm system."
+        
+        print("Sending email via Gmail SMTP...")
+        success = gmail.send_email(recipients, subject, message, attachments)
+        
+        if success:
+            print(f"Email alert sent to {', '.join(recipients)}")
+            return True
+        else:
+            print("Email alert failed")
+            return False
+            
+    except Exception as e:
+        print(f"Email alert error: {e}")
+        return False
+
+def send_gateway_alert(sensor=None, label=None, routed=None):
+    """Hand the alert to the LAN gateway; True once it has delivered it"""
+    print("Sending alert to gateway...")
+    gateway = lazy.load("gateway")
+    try:
+        client = gateway.GatewayClient(
+            config.GATEWAY_HOST, config.GATEWAY_KEY,
+            config.GATEWAY_UNIT,
+            config.GATEWAY_SITE,
+            port=config.GATEWAY_PORT,
+            deadline_ms=config.GATEWAY_DEADLINE_MS,
+        )
+        mask = gateway.channel_mask(routed or (sensor.routes if sensor else lambda c: True))
+        ok = client.send_alert(gateway.EV_ALARM, sensor.name if sensor else "",
+                               label or (sensor.label if sensor else ""), mask)
+        if ok:
+            print(f"Gateway delivered in {client.last_rtt_ms} ms ({client.last_attempts} sends)")
+        return ok
+    except OSError as e:
+        print(f"Gateway send failed: {e}")
+        return False
+    finally:
+        del gateway
+        lazy.release("gateway")
+
+def _send_channels(channels, sensor=None, label=None, title=None, message=None):
+    """Send on each listed channel in turn; True if any succeeded"""
+    success = False
+    
+    # Try Telegram first
+    if "telegram" in channels:
+        try:
+            text = f"{title} {message}" if title else None
+            telegram_success = send_telegram_alert(label, text)
+            if telegram_success:
+                success = True
+                print("Telegram notification succeeded")
+        except Exception as e:
+            print(f"Telegram module failure: {e}")
+        gc.collect()
+    
+    # Try Gmail next
+    if "gmail" in channels:
+        try:
+            # List of email recipients (includes SMS via email gateway)
+            recipients = (sensor and sensor.email_recipients) or config.EMAIL_RECIPIENTS
+            email_success = send_gmail_alert(recipients, label, title, message)
+            if email_success:
+                success = True
+                print("Gmail notification succeeded")
+        except Exception as e:
+            print(f"Gmail module failure: {e}")
+        
+        # Drop the SMTP client (and ssl/base64 it pulled in) if memory is tight
+        lazy.release("email_sender")
+        gc.collect()
+    
+    # Try Ntfy (free push notification)
+    if "ntfy" in channels:
+        try:
+            ntfy_success = send_ntfy_alert(label, sensor and sensor.ntfy_topic, title, message)
+            if ntfy_success:
+                success = True
+                print("Ntfy notification succeeded")
+        except Exception as e:
+            print(f"Ntfy module failure: {e}")
+    
+    return success
+
+def _allowed_channels(routes, allow):
+    """Channels routed for this alert that the rate limits let through"""
+    channels = [c for c in CHANNELS if routes(c) and (allow is None or allow(c))]
+    if not channels:
+        print("Every channel is rate limited, nothing sent")
+    return channels
+
+def send_notifications(sensor=None, label=None, blink=None, allow=None):
+    """Send notifications through all configured channels (or the sensor's own)
+
+    allow(channel), if given, is asked once per channel after WiFi is up
+    (the alert governor's rate limits); refused channels are skipped.
+    """
+    print_memory_status("Start of notifications")
+    
+    # Try to connect to WiFi first
+    print("Connecting to WiFi...")
+    if not connect_wifi(config.WIFI_SSID, config.WIFI_PASSWORD, blink=blink):
+        print("WiFi connection failed, cannot send notifications")
+        return False
+        
+    print("WiFi connected")
+    gc.collect()
+    
+    channels = _allowed_channels(sensor.routes if sensor else lambda c: True, allow)
+    if not channels:
+        return False
+    
+    # Gateway mode: one signed datagram on the LAN instead of three TLS
+    # sessions; send directly unless the gateway acks delivery in time
+    if config.GATEWAY_HOST:
+        if send_gateway_alert(sensor, label, lambda c: c in channels):
+            return True
+        print("Gateway did not confirm delivery, sending directly")
+    
+    success = _send_channels(channels, sensor, label)
+    print_memory_status("End of notifications")
+    return success
+
+def send_message(title, message, routes=None, sensor=None, blink=None, allow=None):
+    """Send a governor message (flapping digest, all clear) on the routed channels
+
+    These go direct rather than through the gateway, whose datagrams only
+    carry the standard alarm texts.
+    """
+    print(f"Sending message: {title}")
+    if not connect_wifi(config.WIFI_SSID, config.WIFI_PASSWORD, blink=blink):
+        print("WiFi connection failed, cannot send message")
+        return False
+    gc.collect()
+    channels = _allowed_channels(routes or (lambda c: True), allow)
+    if not channels:
+        return False
+    return _send_channels(channels, sensor, title=title, message=message)
@@ -0,0 +1,441 @@
+"""
+Over-the-air updates for the Sump Alarm
+Fetches a small JSON manifest from OTA_URL and, when it names a new version,
+streams the deflate-compressed bundle to flash in fixed-size chunks (never
+whole in RAM), resuming an interrupted download with an HTTP Range request.
+The manifest must carry an HMAC made with OTA_KEY over the version, the
+bundle's SHA-256 and every file's SHA-256; the bundle is checked against
+it, unpacked to a staging directory with every file hashed, then
+swapped in with a journal so a power cut mid-swap is finished on the next
+boot. The new version runs on trial: boot.py rolls it back if it does not
+pass the alarm self-test and get confirmed within MAX_TRIAL_BOOTS boots.
+Bundles are built on a PC with make_ota.py.
+"""
+
+import os
+import struct
+import json
+
+try:
+    import hashlib
+except ImportError:
+    import uhashlib as hashlib
+
+import watchdog
+
+CHUNK = 1024
+STATE_FILE = "ota_state.json"
+PART_FILE = "ota.part"        # Bundle download in progress
+PART_META = "ota.part.json"   # Which bundle the part file belongs to
+NEW_DIR = "ota_new"           # Unpacked files waiting to be swapped in
+OLD_DIR = "ota_old"           # Previous files, kept until the update is confirmed
+MAX_TRIAL_BOOTS = 3
+WINDOW_BITS = 10  # 1 KB deflate window; make_ota.py compresses with the same
+
+# Bundle (after decompression): per file ">H" name length, name, ">I" size,
+# data; a zero name length ends it.
+
+class OTAError(Exception):
+    pass
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+def _size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return 0
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _mkdir(path):
+    try:
+        os.mkdir(path)
+    except OSError:
+        pass
+
+def _clear_dir(path):
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return
+    for name in names:
+        _remove(f"{path}/{name}")
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
+def _hex(digest):
+    return "".join("%02x" % b for b in digest)
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"state": "idle", "version": None}
+
+def _save_state(state):
+    """Write the journal atomically: a half-written state file is never read"""
+    with open(STATE_FILE + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.rename(STATE_FILE + ".tmp", STATE_FILE)
+
+def _valid_name(name):
+    """A plain file name that is not one of the updater's own"""
+    return (name and "/" not in name and name not in (".", "..") and
+            name not in (STATE_FILE, STATE_FILE + ".tmp", PART_FILE, PART_META, NEW_DIR, OLD_DIR))
+
+# --- HTTP ---------------------------------------------------------------------
+
+def _open(url, start=0, timeout=20):
+    """GET url from byte start; returns (sock, stream, status, headers)
+
+    Connects through transport like the notifiers, so an https server in
+    TLS_PINS is checked against its pins before the request goes out.
+    """
+    import transport
+    scheme, _, rest = url.partition("://")
+    host, _, path = rest.partition("/")
+    port = 443 if scheme == "https" else 80
+    if ":" in host:
+        host, port = host.split(":")
+        port = int(port)
+    sock, _ = transport.connect([(host, port)], timeout * 1000)
+    try:
+        sock.settimeout(timeout)
+        if scheme == "https":
+            sock = transport.wrap(sock, host)
+        # HTTP/1.0 so the body is never chunked
+        request = f"GET /{path} HTTP/1.0\r\nHost: {host}\r\n"
+        if start:
+            request += f"Range: bytes={start}-\r\n"
+        data = request.encode() + b"\r\n"
+        if hasattr(sock, "sendall"):
+            sock.sendall(data)
+        else:
+            sock.write(data)  # MicroPython TLS socket
+        stream = sock.makefile("rb") if hasattr(sock, "makefile") else sock
+        with watchdog.blocking("notifier", "ota response"):
+            status = int(stream.readline().split()[1])
+            headers = {}
+            while True:
+                line = stream.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+        return sock, stream, status, headers
+    except Exception:
+        sock.close()
+        raise
+
+def signed_text(manifest):
+    """What the manifest's HMAC covers: version, bundle and every file's hash"""
+    files = manifest["files"]
+    listed = ",".join(f"{name}={files[name]}" for name in sorted(files))
+    return f"{manifest['version']}:{manifest['bundle']}:{manifest['size']}:{manifest['sha256']}:{listed}"
+
+def fetch_manifest(url, key):
+    """Download and check the manifest; returns its dict
+
+    Raises OTAError without a key: an unsigned manifest would let anyone
+    on the network path name the code the unit installs.
+    """
+    if not key:
+        raise OTAError("No OTA_KEY: manifests are only trusted when signed")
+    sock, stream, status, _ = _open(url)
+    try:
+        if status != 200:
+            raise OTAError(f"Manifest fetch failed with status {status}")
+        manifest = json.loads(stream.read(4096))
+    finally:
+        sock.close()
+    for field in ("version", "bundle", "size", "sha256", "files"):
+        if field not in manifest:
+            raise OTAError(f"Manifest has no {field}")
+    from gateway import hmac_sha256
+    if _hex(hmac_sha256(key.encode(), signed_text(manifest).encode())) != manifest.get("mac"):
+        raise OTAError("Manifest signature does not match OTA_KEY")
+    return manifest
+
+def bundle_url(manifest_url, manifest):
+    """Bundle location: absolute, or relative to the manifest"""
+    bundle = manifest["bundle"]
+    if "://" in bundle:
+        return bundle
+    return manifest_url.rsplit("/", 1)[0] + "/" + bundle
+
+def download(url, manifest, progress=None):
+    """Stream the bundle into PART_FILE, resuming a previous partial download
+
+    progress(have, size) is called after each chunk and may return False to
+    pause. Returns the number of bytes fetched this time. Raises OTAError if
+    the download stopped short or does not match the manifest's SHA-256.
+    """
+    size = manifest["size"]
+    meta = {"sha256": manifest["sha256"], "size": size}
+    try:
+        with open(PART_META) as f:
+            same = json.load(f) == meta
+    except (OSError, ValueError):
+        same = False
+    if not same:
+        _remove(PART_FILE)
+        with open(PART_META, "w") as f:
+            json.dump(meta, f)
+
+    # Hash what is already on flash, then carry on from where it stopped
+    if _size(PART_FILE) > size:
+        _remove(PART_FILE)
+    have = _size(PART_FILE)
+    digest = hashlib.sha256()
+    buf = bytearray(CHUNK)
+    mv = memoryview(buf)
+    if have:
+        with open(PART_FILE, "rb") as f:
+            left = have
+            while left:
+                n = f.readinto(mv[:min(CHUNK, left)])
+                if not n:
+                    break
+                digest.update(mv[:n])
+                left -= n
+        print(f"Resuming OTA download at {have}/{size} bytes")
+
+    fetched = 0
+    if have < size:
+        sock, stream, status, headers = _open(url, have)
+        try:
+            if have and status == 206:
+                if not headers.get("content-range", "").startswith(f"bytes {have}-"):
+                    raise OTAError("Server resumed at the wrong offset")
+                mode = "ab"
+            elif status == 200:
+                if have:
+                    print("Server ignored the Range request, starting over")
+                    digest = hashlib.sha256()
+                have = 0
+                mode = "wb"
+            else:
+                raise OTAError(f"Bundle fetch failed with status {status}")
+            with open(PART_FILE, mode) as f:
+                while have < size:
+                    with watchdog.blocking("notifier", "ota chunk"):
+                        n = stream.readinto(mv[:min(CHUNK, size - have)])
+                    if not n:
+                        break  # Connection dropped: resume next time
+                    f.write(mv[:n])
+                    digest.update(mv[:n])
+                    have += n
+                    fetched += n
+                    if progress and progress(have, size) is False:
+                        break  # Paused by the caller: resume next time
+        finally:
+            sock.close()
+
+    if have < size:
+        raise OTAError(f"Download interrupted at {have}/{size} bytes")
+    if _hex(digest.digest()) != manifest["sha256"]:
+        _remove(PART_FILE)
+        _remove(PART_META)
+        raise OTAError("Bundle SHA-256 does not match the manifest")
+    return fetched
+
+# --- Unpack and swap ----------------------------------------------------------
+
+class _Inflater:
+    """zlib stream reader for CPython, where there is no deflate.DeflateIO"""
+
+    def __init__(self, f):
+        import zlib
+        self.f = f
+        self.z = zlib.decompressobj()
+        self.pending = b""
+
+    def readinto(self, buf):
+        z = self.z
+        while not self.pending:
+            data = z.unconsumed_tail or self.f.read(CHUNK)
+            if not data:
+                self.pending = z.flush()
+                if not self.pending:
+                    return 0
+                break
+            self.pending = z.decompress(data, len(buf))
+        n = min(len(buf), len(self.pending))
+        buf[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+def _inflater(f):
+    """Streaming zlib decompressor over an open file"""
+    try:
+        import deflate
+        return deflate.DeflateIO(f, deflate.ZLIB)  # Window size from the header
+    except ImportError:
+        pass
+    try:
+        import zlib
+        if hasattr(zlib, "DecompIO"):
+            return zlib.DecompIO(f, WINDOW_BITS)
+    except ImportError:
+        pass
+    return _Inflater(f)
+
+def _read_exact(stream, buf, n):
+    mv = memoryview(buf)
+    got = 0
+    while got < n:
+        k = stream.readinto(mv[got:n])
+        if not k:
+            raise OTAError("Bundle ends early")
+        got += k
+    return mv[:n]
+
+def unpack(manifest):
+    """Inflate PART_FILE into NEW_DIR, checking each file against the manifest"""
+    _clear_dir(NEW_DIR)
+    _mkdir(NEW_DIR)
+    expected = manifest["files"]
+    buf = bytearray(CHUNK)
+    names = []
+    with open(PART_FILE, "rb") as f:
+        stream = _inflater(f)
+        while True:
+            n = struct.unpack(">H", _read_exact(stream, buf, 2))[0]
+            if n == 0:
+                break
+            name = bytes(_read_exact(stream, buf, n)).decode()
+            size = struct.unpack(">I", _read_exact(stream, buf, 4))[0]
+            if not _valid_name(name) or name not in expected:
+                raise OTAError(f"Unexpected file in bundle: {name}")
+            digest = hashlib.sha256()
+            with open(f"{NEW_DIR}/{name}", "wb") as out:
+                left = size
+                while left:
+                    chunk = _read_exact(stream, buf, min(CHUNK, left))
+                    out.write(chunk)
+                    digest.update(chunk)
+                    left -= len(chunk)
+                    watchdog.checkin("notifier")
+            if _hex(digest.digest()) != expected[name]:
+                raise OTAError(f"{name} does not match its SHA-256")
+            names.append(name)
+    missing = [name for name in expected if name not in names]
+    if missing:
+        raise OTAError(f"Bundle is missing {', '.join(missing)}")
+    return names
+
+def _swap(state):
+    """Move staged files into place, keeping the old ones; safe to repeat"""
+    _mkdir(OLD_DIR)
+    for name in state["files"]:
+        new = f"{NEW_DIR}/{name}"
+        if not _exists(new):
+            continue  # Already swapped before a reset
+        if _exists(name) and not _exists(f"{OLD_DIR}/{name}"):
+            os.rename(name, f"{OLD_DIR}/{name}")
+        os.rename(new, name)
+    _clear_dir(NEW_DIR)
+    state["state"] = "trial"
+    state["boots"] = 0
+    _save_state(state)
+
+def install(manifest, names):
+    """Swap the staged files in; the new version is on trial from the next boot"""
+    state = load_state()
+    state.update({"state": "apply", "files": names, "previous": state.get("version"),
+                  "version": manifest["version"]})
+    _save_state(state)
+    _swap(state)
+    _remove(PART_FILE)
+    _remove(PART_META)
+
+def rollback(reason="self-test failed"):
+    """Put the previous files back and remember not to reinstall this version"""
+    state = load_state()
+    if state.get("state") not in ("apply", "trial"):
+        return False
+    for name in state["files"]:
+        old = f"{OLD_DIR}/{name}"
+        if _exists(old):
+            _remove(name)
+            os.rename(old, name)
+        elif not _exists(f"{NEW_DIR}/{name}"):
+            _remove(name)  # Added by the update
+    _clear_dir(OLD_DIR)
+    _clear_dir(NEW_DIR)
+    bad = state["version"]
+    _save_state({"state": "idle", "version": state.get("previous"), "rejected": bad})
+    print(f"OTA: rolled back {bad} ({reason})")
+    try:
+        import eventlog
+        eventlog.log("ota_rollback", f"{bad} {reason}")
+    except ImportError:
+        pass
+    return True
+
+def confirm():
+    """The new version passed its self-test: drop the old files"""
+    state = load_state()
+    if state.get("state") != "trial":
+        return False
+    _clear_dir(OLD_DIR)
+    _save_state({"state": "idle", "version": state["version"]})
+    print(f"OTA: version {state['version']} confirmed")
+    return True
+
+def in_trial():
+    return load_state().get("state") == "trial"
+
+def boot_check(max_boots=MAX_TRIAL_BOOTS):
+    """Run from boot.py: finish an interrupted swap, count trial boots
+
+    Returns True if this boot runs a version on trial. Rolls back once a
+    version has booted max_boots times without being confirmed.
+    """
+    state = load_state()
+    if state.get("state") == "apply":
+        print("OTA: finishing interrupted swap")
+        _swap(state)
+    if state.get("state") != "trial":
+        return False
+    state["boots"] = state.get("boots", 0) + 1
+    if state["boots"] > max_boots:
+        rollback(f"not confirmed after {max_boots} boots")
+        return False
+    _save_state(state)
+    print(f"OTA: version {state['version']} on trial, boot {state['boots']}/{max_boots}")
+    return True
+
+def check_and_update(url, key, progress=None):
+    """Install a new version if the manifest names one; True if installed
+
+    The caller resets the board afterwards so the new files are loaded.
+    """
+    manifest = fetch_manifest(url, key)
+    state = load_state()
+    version = manifest["version"]
+    if version in (state.get("version"), state.get("rejected")):
+        print(f"OTA: {version} is current or was rolled back")
+        return False
+    for name in manifest["files"]:
+        if not _valid_name(name):
+            raise OTAError(f"Refusing to install {name}")
+    print(f"OTA: downloading {version} ({manifest['size']} bytes)")
+    download(bundle_url(url, manifest), manifest, progress)
+    names = unpack(manifest)
+    install(manifest, names)
+    print(f"OTA: installed {version}, reset to start it")
+    return True
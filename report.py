@@ -0,0 +1,179 @@
+"""
+Periodic email report for the Sump Alarm
+Summarises the pump cycles (a float going wet and dry again) and alarms in
+events.log over the last REPORT_DAYS days, and attaches the events as a
+gzip-compressed CSV. Everything is generated from flash a line at a time
+while the email is being sent, so memory use does not grow with the
+history.
+"""
+
+import timeservice
+import eventlog
+
+CHUNK = 512        # Compressed bytes handed to the email sender at a time
+WINDOW_BITS = 9    # 512-byte deflate window on the device
+DAY_MS = 86400000
+
+def _compressor():
+    """(write(data), finish()) returning gzip bytes, or None without deflate"""
+    try:
+        import zlib
+        if hasattr(zlib, "compressobj"):
+            # gzip with the device's window and little buffer memory
+            z = zlib.compressobj(6, zlib.DEFLATED, 16 + WINDOW_BITS, 2)
+            return z.compress, z.flush
+    except ImportError:
+        pass
+    try:
+        import deflate
+        import io
+    except ImportError:
+        return None
+
+    class Sink(io.IOBase):
+        """Collects what DeflateIO writes"""
+
+        def __init__(self):
+            self.parts = []
+
+        def write(self, data):
+            self.parts.append(bytes(data))
+            return len(data)
+
+        def take(self):
+            data = b"".join(self.parts)
+            self.parts = []
+            return data
+
+    sink = Sink()
+    try:
+        stream = deflate.DeflateIO(sink, deflate.GZIP, WINDOW_BITS)
+        stream.write(b"")
+    except (AttributeError, ValueError, OSError):
+        return None  # Firmware built without deflate compression
+
+    def write(data):
+        stream.write(data)
+        return sink.take()
+
+    def finish():
+        stream.close()
+        return sink.take()
+
+    return write, finish
+
+def _selected(records, since_ms):
+    """Records newer than since_ms; those logged before the clock was set count too"""
+    for record in records:
+        if since_ms is None or record[1] is None or record[1] >= since_ms:
+            yield record
+
+def _quote(text):
+    if "," in text or '"' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+def csv_lines(records):
+    """CSV text for each record, header first"""
+    yield "time,uptime_s,event,sensor,detail\n"
+    for ticks, wall, event, detail in records:
+        sensor, rest = "", detail
+        if event in ("alarm", "restore", "notify"):
+            sensor, _, rest = detail.partition(" ")
+        yield (f"{timeservice.iso(wall) if wall is not None else ''},{ticks // 1000},"
+               f"{event},{_quote(sensor)},{_quote(rest)}\n")
+
+def compressed(lines, compressor, stats=None):
+    """Yield the gzip form of lines in chunks of at most CHUNK bytes"""
+    write, finish = compressor
+    pending = b""
+    raw = packed = 0
+    for line in lines:
+        data = line.encode()
+        raw += len(data)
+        pending += write(data)
+        while len(pending) >= CHUNK:
+            packed += CHUNK
+            yield pending[:CHUNK]
+            pending = pending[CHUNK:]
+    pending += finish()
+    packed += len(pending)
+    if stats is not None:
+        stats["csv_bytes"] = raw
+        stats["gzip_bytes"] = packed
+    for i in range(0, len(pending), CHUNK):
+        yield pending[i:i + CHUNK]
+
+def plain(lines, stats=None):
+    """Yield lines as bytes, for firmware that cannot compress"""
+    raw = 0
+    for line in lines:
+        data = line.encode()
+        raw += len(data)
+        yield data
+    if stats is not None:
+        stats["csv_bytes"] = raw
+        stats["gzip_bytes"] = None
+
+def summarise(records, labels=None):
+    """Count pump cycles, alarms and resets in one pass; returns a dict"""
+    labels = labels or {}
+    cycles = {}   # sensor -> [wet periods, total wet s, longest wet s, alarms]
+    summary = {"events": 0, "boots": 0, "wdt_resets": 0, "notify_failed": 0}
+    for ticks, wall, event, detail in records:
+        summary["events"] += 1
+        name = detail.split(" ", 1)[0]
+        if event == "restore":
+            c = cycles.setdefault(name, [0, 0, 0, 0])
+            seconds = 0
+            for field in detail.split(" ")[1:]:
+                if field.startswith("s="):
+                    seconds = int(field[2:])
+            c[0] += 1
+            c[1] += seconds
+            c[2] = max(c[2], seconds)
+        elif event == "alarm":
+            cycles.setdefault(name, [0, 0, 0, 0])[3] += 1
+        elif event == "armed":
+            summary["boots"] += 1
+        elif event == "wdt_reset":
+            summary["wdt_resets"] += 1
+        elif event == "notify" and "ok=False" in detail:
+            summary["notify_failed"] += 1
+    summary["sensors"] = {labels.get(name, name): c for name, c in cycles.items()}
+    return summary
+
+def report(days=7, labels=None, paths=(eventlog.OLD_LOG_FILE, eventlog.LOG_FILE), stats=None):
+    """(subject, message, attachments) for GmailSender.send_email
+
+    The attachment is a generator: it reads the log again while the email
+    is sent. stats, if given, receives the CSV and compressed sizes.
+    """
+    now = timeservice.epoch_ms()
+    since = now - days * DAY_MS if now is not None else None
+    s = summarise(_selected(eventlog.read_records(paths), since), labels)
+    lines = [f"Sump alarm report for the last {days} days"
+             + (f", to {timeservice.iso(now)[:16].replace('T', ' ')} UTC" if now else "") + ".", ""]
+    if s["sensors"]:
+        for label, (wet, wet_s, longest, alarms) in s["sensors"].items():
+            lines.append(f"{label}: {wet} pump cycles, wet {wet_s} s in total "
+                         f"(longest {longest} s), {alarms} alarms")
+    else:
+        lines.append("No water was detected.")
+    lines.append("")
+    lines.append(f"Boots: {s['boots']}, watchdog resets: {s['wdt_resets']}, "
+                 f"failed notifications: {s['notify_failed']}, events logged: {s['events']}")
+    lines.append("")
+    lines.append("The attached file lists every event.")
+
+    def rows():
+        return csv_lines(_selected(eventlog.read_records(paths), since))
+
+    compressor = _compressor()
+    if compressor is not None:
+        attachment = ("sump-events.csv.gz", "application/gzip", compressed(rows(), compressor, stats))
+    else:
+        attachment = ("sump-events.csv", "text/csv", plain(rows(), stats))
+    alarms = sum(c[3] for c in s["sensors"].values())
+    subject = f"Sump alarm report, last {days} days: {alarms} alarm{'' if alarms == 1 else 's'}"
+    return subject, "\n".join(lines), [attachment]
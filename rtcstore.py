@@ -0,0 +1,97 @@
+"""
+Fixed-size records in RTC memory for the Sump Alarm
+RTC user memory survives soft resets, machine.reset() and watchdog resets
+(not power loss) without wearing the flash. Each user owns a fixed region
+holding one record with a header and CRC-32, so a torn or stale record is
+ignored instead of trusted. On a PC the memory is a bytearray.
+"""
+
+import struct
+
+try:
+    from binascii import crc32
+except ImportError:
+    from ubinascii import crc32
+
+MAGIC = 0x5A
+_HEADER = "<BBHI"  # magic, tag, payload length, CRC-32 of the payload
+HEADER_LEN = struct.calcsize(_HEADER)
+
+# name -> (tag, offset, size including the header). Offsets are fixed so a
+# record is found in the same place after a reset; add new regions at the end.
+REGIONS = {
+    "governor": (1, 0, 192),
+    "telegram": (2, 192, 16),
+    "engine": (3, 208, 120),
+    "endpoints": (4, 328, 48),
+    "tls": (5, 376, 1024),
+}
+
+class _RamMemory:
+    """Stand-in for machine.RTC on a PC; survives for the life of the process"""
+
+    def __init__(self):
+        self.data = b""
+
+    def memory(self, data=None):
+        if data is None:
+            return self.data
+        self.data = bytes(data)
+
+_rtc = None
+
+def _memory():
+    global _rtc
+    if _rtc is None:
+        try:
+            from machine import RTC
+            _rtc = RTC()
+        except ImportError:
+            _rtc = _RamMemory()
+    return _rtc
+
+def _region(name):
+    try:
+        return REGIONS[name]
+    except KeyError:
+        raise ValueError(f"Unknown RTC region: {name}")
+
+def read(name):
+    """Return the payload stored in a region, or None if absent or corrupt"""
+    tag, offset, size = _region(name)
+    image = _memory().memory()
+    if len(image) < offset + HEADER_LEN:
+        return None
+    magic, stored_tag, length, crc = struct.unpack_from(_HEADER, image, offset)
+    start = offset + HEADER_LEN
+    if (magic != MAGIC or stored_tag != tag or length > size - HEADER_LEN
+            or len(image) < start + length):
+        return None
+    payload = bytes(image[start:start + length])
+    if crc32(payload) & 0xFFFFFFFF != crc:
+        return None
+    return payload
+
+def write(name, payload):
+    """Store a payload in a region (the rest of RTC memory is untouched)"""
+    tag, offset, size = _region(name)
+    if len(payload) > size - HEADER_LEN:
+        raise ValueError(f"{name} record is {len(payload)} bytes, region holds {size - HEADER_LEN}")
+    rtc = _memory()
+    image = bytearray(rtc.memory())
+    end = offset + HEADER_LEN + len(payload)
+    if len(image) < end:
+        image.extend(bytes(end - len(image)))
+    struct.pack_into(_HEADER, image, offset, MAGIC, tag, len(payload),
+                     crc32(payload) & 0xFFFFFFFF)
+    image[offset + HEADER_LEN:end] = payload
+    rtc.memory(image)
+
+def clear(name):
+    """Invalidate a region's record"""
+    tag, offset, size = _region(name)
+    rtc = _memory()
+    image = bytearray(rtc.memory())
+    if len(image) > offset:
+        image[offset] = 0
+        rtc.memory(image)
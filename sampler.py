@@ -0,0 +1,97 @@
+"""
+Adaptive sampling scheduler for the sump float switch
+Polls rarely while the pit has been dry for a long time and switches to
+high-rate sampling on the first wet reading and while an alarm is active
+"""
+
+from compat import ticks_diff
+
+MODE_FAST = 0    # Confirming a transition or alarm active
+MODE_NORMAL = 1  # Recently active, polling once per normal interval
+MODE_IDLE = 2    # Stable dry for a long time, polling rarely
+
+MODE_NAMES = ("fast", "normal", "idle")
+
+class AdaptiveSampler:
+    def __init__(self, fast_ms=100, normal_ms=1000, idle_ms=2000,
+                 idle_after_s=600, fast_hold_s=30):
+        """Configure the sample intervals and mode thresholds"""
+        self.fast_ms = fast_ms
+        self.normal_ms = normal_ms
+        self.idle_ms = idle_ms
+        self.idle_after_ms = idle_after_s * 1000
+        self.fast_hold_ms = fast_hold_s * 1000
+        self.mode = MODE_NORMAL
+        self._last_wet_ms = None
+        self._last_change_ms = None
+        self._last_raw = 0
+        self._last_update_ms = None
+        # Metrics
+        self.wakeups = 0
+        self.samples = 0
+        self.busy_us = 0
+        self.mode_changes = 0
+        self.mode_ms = [0, 0, 0]
+
+    @property
+    def fast(self):
+        return self.mode == MODE_FAST
+
+    @property
+    def interval_ms(self):
+        """Sleep time before the next wake-up in the current mode"""
+        if self.mode == MODE_FAST:
+            return self.fast_ms
+        if self.mode == MODE_IDLE:
+            return self.idle_ms
+        return self.normal_ms
+
+    def update(self, raw, now_ms, alarm=False):
+        """Feed one raw sensor sample and return the next sleep interval"""
+        self.wakeups += 1
+        self.samples += 1
+        if self._last_update_ms is not None:
+            self.mode_ms[self.mode] += ticks_diff(now_ms, self._last_update_ms)
+        self._last_update_ms = now_ms
+
+        if self._last_change_ms is None or raw != self._last_raw:
+            self._last_change_ms = now_ms
+            self._last_raw = raw
+        if raw:
+            self._last_wet_ms = now_ms
+
+        if raw or alarm:
+            mode = MODE_FAST
+        elif (self._last_wet_ms is not None and
+              ticks_diff(now_ms, self._last_wet_ms) < self.fast_hold_ms):
+            mode = MODE_FAST
+        elif ticks_diff(now_ms, self._last_change_ms) >= self.idle_after_ms:
+            mode = MODE_IDLE
+        else:
+            mode = MODE_NORMAL
+
+        if mode != self.mode:
+            self.mode = mode
+            self.mode_changes += 1
+        return self.interval_ms
+
+    def add_samples(self, n):
+        """Account for extra samples taken inside a confirmation burst"""
+        self.samples += n
+
+    def add_busy(self, us):
+        """Account for CPU time spent awake handling one wake-up"""
+        self.busy_us += us
+
+    def metrics(self):
+        """Return sampler counters for the metrics registry"""
+        return {
+            "mode": MODE_NAMES[self.mode],
+            "wakeups": self.wakeups,
+            "samples": self.samples,
+            "busy_ms": self.busy_us // 1000,
+            "mode_changes": self.mode_changes,
+            "fast_s": self.mode_ms[MODE_FAST] // 1000,
+            "normal_s": self.mode_ms[MODE_NORMAL] // 1000,
+            "idle_s": self.mode_ms[MODE_IDLE] // 1000,
+        }
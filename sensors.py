@@ -0,0 +1,181 @@
+"""
+Float switch sensor array for the Sump Alarm
+Reads every configured input with a single GPIO input-register read and
+gives each sensor its own debounce filter, alarm state machine and
+notification routing.
+"""
+
+import accel
+from alarm_engine import AlarmEngine, ACT_NONE
+from debounce import BANK_DEBOUNCER, make_debouncer
+
+if accel.ENABLED:
+    import micropython
+
+    @micropython.viper
+    def _read_reg_masked(addr: int, mask: int) -> int:
+        """Read a 32-bit peripheral register and mask it, without boxing"""
+        return int(ptr32(addr)[0] & mask)
+
+# ESP32-C3 GPIO_IN_REG (DR_REG_GPIO_BASE + 0x3C); one bit per GPIO
+GPIO_IN_REG_ESP32C3 = 0x6000403C
+
+class Sensor:
+    def __init__(self, index, name, pin, label=None, gnd_pin=None, active_high=True,
+                 debounce_s=15, retry_s=600, channels=None, email_recipients=None,
+                 ntfy_topic=None):
+        """Describe one float switch and where its alarms go"""
+        self.index = index
+        self.name = name
+        self.label = label or name
+        self.pin = pin
+        self.gnd_pin = gnd_pin
+        self.active_high = active_high
+        self.bit = 1 << pin
+        self.channels = channels
+        self.email_recipients = email_recipients
+        self.ntfy_topic = ntfy_topic
+        self.engine = AlarmEngine(debounce_s, retry_s)
+        self.filter = None  # Per-sensor filter, unused with the bank debouncer
+        self.wet = 0
+
+    def routes(self, channel):
+        """True if alarms from this sensor should go to the named channel"""
+        return self.channels is None or channel in self.channels
+
+class SensorArray:
+    def __init__(self, specs, algorithm="auto", params=None, gpio_in_reg=None,
+                 reader=None, default_debounce_s=15, default_retry_s=600):
+        """Create sensors from config dicts and set up the bank read
+
+        specs: list of dicts with name, pin and optional label, gnd_pin,
+        active_high, debounce_s, channels, email_recipients, ntfy_topic.
+        algorithm: a debounce.make_debouncer() name, "bank" to debounce
+        every sensor at once with bit-sliced counters, or "auto": the bank
+        for two or more sensors, so a sample costs the same however many
+        there are, and an integrator for one. With "auto" the bank takes
+        {"samples": N} as N rise and fall samples.
+        reader: optional callable returning the raw input word (host tests).
+        """
+        params = params or {}
+        self.sensors = []
+        for i, spec in enumerate(specs):
+            spec = dict(spec)
+            spec.setdefault("debounce_s", default_debounce_s)
+            spec.setdefault("retry_s", default_retry_s)
+            self.sensors.append(Sensor(i, **spec))
+
+        self.mask = 0
+        self.invert = 0  # Bits of active-low sensors, flipped after the read
+        for s in self.sensors:
+            if self.mask & s.bit:
+                raise ValueError(f"GPIO {s.pin} used by more than one sensor")
+            self.mask |= s.bit
+            if not s.active_high:
+                self.invert |= s.bit
+
+        if algorithm == "auto":
+            algorithm = "bank" if len(self.sensors) > 1 else "integrator"
+            if algorithm == "bank" and "samples" in params:
+                params = {"rise_samples": params["samples"], "fall_samples": params["samples"]}
+        self.algorithm = algorithm
+        if algorithm == "bank":
+            self.bank = BANK_DEBOUNCER(params.get("rise_samples", 10),
+                                       params.get("fall_samples", 10))
+        else:
+            self.bank = None
+            for s in self.sensors:
+                s.filter = make_debouncer(algorithm, **params)
+
+        self._pins = []
+        self._reader = reader or self._setup_hardware(gpio_in_reg)
+        self.state = 0
+        self.raw = 0
+
+    def _setup_hardware(self, gpio_in_reg):
+        """Configure the pins and pick the fastest available read method"""
+        from machine import Pin
+        for s in self.sensors:
+            if s.gnd_pin is not None:
+                # Virtual ground for the float switch
+                Pin(s.gnd_pin, Pin.OUT).value(0)
+            self._pins.append(Pin(s.pin, Pin.IN, Pin.PULL_UP))
+
+        if gpio_in_reg is not None:
+            try:
+                from machine import mem32
+                mem32[gpio_in_reg]  # Make sure the register is readable here
+                if accel.ENABLED:
+                    mask = self.mask
+                    return lambda: _read_reg_masked(gpio_in_reg, mask)
+                return lambda: mem32[gpio_in_reg]
+            except (ImportError, OSError, ValueError) as e:
+                print(f"GPIO register read unavailable ({e}), using Pin.value()")
+        return self._read_pins
+
+    def _read_pins(self):
+        """Fallback: assemble the input word from individual pin reads"""
+        word = 0
+        for s, p in zip(self.sensors, self._pins):
+            if p.value():
+                word |= s.bit
+        return word
+
+    def sample(self):
+        """Take one sample of every sensor and update the debounce state"""
+        raw = (self._reader() ^ self.invert) & self.mask
+        self.raw = raw
+        if self.bank is not None:
+            self.state = self.bank.update(raw)
+        else:
+            state = 0
+            for s in self.sensors:
+                if s.filter.update(raw & s.bit):
+                    state |= s.bit
+            self.state = state
+        return raw
+
+    def seed(self, wet_sensors):
+        """Start the debouncers of these sensors in the wet state
+
+        Used when alarm engines resume after a reset, so the water that was
+        there must be seen gone for a full fall window before a restore.
+        """
+        for s in wet_sensors:
+            if s in self.sensors:
+                self.state |= s.bit
+                if self.bank is None:
+                    s.filter.reset(1)
+        if self.bank is not None:
+            self.bank.reset(self.state)
+
+    @property
+    def flooded(self):
+        """True while any sensor has water or an active alarm"""
+        if self.state:
+            return True
+        for s in self.sensors:
+            if s.engine.flooded:
+                return True
+        return False
+
+    @property
+    def alarm_active(self):
+        for s in self.sensors:
+            if s.engine.alarm_triggered:
+                return True
+        return False
+
+    def step(self, now_ms, handler):
+        """Advance every active sensor's alarm engine
+
+        handler(sensor, action) is called for each action other than
+        ACT_NONE. Sensors that are dry with an idle engine are skipped.
+        """
+        state = self.state
+        for s in self.sensors:
+            s.wet = 1 if state & s.bit else 0
+            if s.wet or s.engine.flooded:
+                action = s.engine.update(s.wet, now_ms)
+                if action != ACT_NONE:
+                    handler(s, action)
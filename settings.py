@@ -0,0 +1,502 @@
+"""
+Validated, precompiled and hot-reloadable configuration for the Sump Alarm
+config.py is checked against SCHEMA once and compiled to config.bin, a
+compact tagged binary form that later boots decode without compiling
+Python. The values live on one namespace object installed as the "config"
+module, so `import config` and `config.X` keep working everywhere. apply()
+validates a whole set of changes before touching anything, then updates
+the namespace, rewrites config.bin atomically and tells the listeners
+(sensor, siren and notifier settings in main.py), so a new recipient or
+debounce time takes effect without a reset. Settings marked BOOT are stored
+but only take effect after the next reset.
+"""
+
+import os
+import struct
+import sys
+
+try:
+    from binascii import crc32
+except ImportError:
+    from ubinascii import crc32
+
+SOURCE = "config.py"
+COMPILED = "config.bin"
+_TMP = "config.bin.tmp"
+MAGIC = b"SCF1"
+_HEADER = "<4sIII"  # magic, schema CRC, config.py CRC, payload CRC
+HEADER_LEN = struct.calcsize(_HEADER)
+
+class ConfigError(ValueError):
+    """Invalid configuration; .errors lists every problem found"""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+# Value kinds
+STR = 0
+INT = 1
+BOOL = 2
+STR_LIST = 3
+DICT = 4
+LIST = 5
+ID = 6  # Telegram chat id: digits, maybe negative, as a string or int
+
+# When a change takes effect
+LIVE = True
+BOOT = False
+
+REQUIRED = object()
+
+# (name, kind, default, check, live), in the order config.bin stores them.
+# check is (lo, hi) for numbers, a tuple of allowed strings, or None.
+# A default of None means the setting may be None (feature off).
+_SPECS = (
+    ("WIFI_SSID", STR, REQUIRED, None, LIVE),
+    ("WIFI_PASSWORD", STR, REQUIRED, None, LIVE),
+    ("TELEGRAM_BOT_TOKEN", STR, REQUIRED, None, LIVE),
+    ("TELEGRAM_CHAT_ID", ID, REQUIRED, None, LIVE),
+    ("GMAIL_USER", STR, REQUIRED, None, LIVE),
+    ("GMAIL_APP_PASSWORD", STR, REQUIRED, None, LIVE),
+    ("NTFY_TOPIC", STR, REQUIRED, None, LIVE),
+    ("EMAIL_RECIPIENTS", STR_LIST, REQUIRED, None, LIVE),
+    ("DEBOUNCE_SECONDS", INT, 15, (1, 3600), LIVE),
+    ("NOTIFY_RETRY_SECONDS", INT, 600, (30, 86400), LIVE),
+    ("SAMPLER_FAST_MS", INT, 100, (10, 1000), LIVE),
+    ("SAMPLER_NORMAL_MS", INT, 1000, (50, 10000), LIVE),
+    ("SAMPLER_IDLE_MS", INT, 2000, (50, 10000), LIVE),
+    ("SAMPLER_IDLE_AFTER_S", INT, 600, (0, 86400), LIVE),
+    ("SAMPLER_FAST_HOLD_S", INT, 30, (0, 3600), LIVE),
+    ("DEBOUNCE_ALGORITHM", STR, "auto", ("auto", "integrator", "hysteresis", "majority", "bank"), BOOT),
+    ("DEBOUNCE_PARAMS", DICT, {"samples": 10}, None, BOOT),
+    ("SENSORS", LIST, None, None, BOOT),
+    ("GPIO_IN_REG", INT, None, None, BOOT),
+    ("LEVEL_SENSOR", DICT, None, None, BOOT),
+    ("LAZY_EVICT_POLICY", STR, "pressure", ("pressure", "always", "never"), LIVE),
+    ("LAZY_MIN_FREE_BYTES", INT, 80000, (0, 1 << 24), LIVE),
+    ("ALERT_RATE_LIMITS", DICT, {"telegram": (5, 120), "gmail": (3, 600), "ntfy": (5, 120)}, None, LIVE),
+    ("FLAP_WINDOW_S", INT, 1800, (60, 86400), LIVE),
+    ("FLAP_ALARMS", INT, 3, (2, 100), LIVE),
+    ("FLAP_DIGEST_S", INT, 1800, (60, 86400), LIVE),
+    ("RESTORE_NOTIFY", STR, "batch", ("batch", "each", "off"), LIVE),
+    ("RESTORE_BATCH_S", INT, 300, (0, 86400), LIVE),
+    ("GATEWAY_HOST", STR, None, None, LIVE),
+    ("GATEWAY_PORT", INT, 5050, (1, 65535), LIVE),
+    ("GATEWAY_KEY", STR, "change this shared secret", None, LIVE),
+    ("GATEWAY_UNIT", STR, "sump-alarm", None, LIVE),
+    ("GATEWAY_SITE", STR, "", None, LIVE),
+    ("GATEWAY_DEADLINE_MS", INT, 10000, (100, 60000), LIVE),
+    ("OTA_URL", STR, None, None, LIVE),
+    ("OTA_KEY", STR, None, None, LIVE),
+    ("OTA_CHECK_S", INT, 86400, (60, 30 * 86400), LIVE),
+    ("OTA_FIRST_CHECK_S", INT, 300, (0, 86400), BOOT),
+    ("OTA_CONFIRM_S", INT, 120, (10, 3600), BOOT),
+    ("OTA_TRIAL_WDT_MS", INT, 300000, (10000, 3600000), BOOT),
+    ("TELEGRAM_COMMANDS", BOOL, False, None, BOOT),
+    ("TELEGRAM_POLL_S", INT, 10, (2, 3600), LIVE),
+    ("ACCEL", BOOL, False, None, BOOT),
+    ("WDT_ENABLED", BOOL, False, None, BOOT),
+    ("WDT_TIMEOUT_MS", INT, 60000, (1000, 3600000), BOOT),
+    ("WDT_TIMER_ID", INT, 1, (0, 3), BOOT),
+    ("WDT_DEADLINES_MS", DICT, {"sensor": 20000, "siren": 10000, "notifier": 45000, "wifi": 15000}, None, BOOT),
+    ("METRICS_PRINT_S", INT, 3600, (10, 86400), LIVE),
+    ("NTP_HOST", STR, None, None, LIVE),
+    ("NTP_RESYNC_S", INT, 3600, (60, 86400), LIVE),
+    ("REPORT_S", INT, 0, (0, 90 * 86400), LIVE),
+    ("REPORT_DAYS", INT, 7, (1, 365), LIVE),
+    ("REPORT_RECIPIENTS", STR_LIST, None, None, LIVE),
+    ("HEARTBEAT_URL", STR, None, None, BOOT),
+    ("HEARTBEAT_S", INT, 300, (10, 65535), LIVE),
+    ("HEARTBEAT_KEY", STR, "change this shared secret", None, LIVE),
+    ("HEARTBEAT_RADIO_OFF", BOOL, False, None, LIVE),
+    ("SMTP_PORTS", LIST, [465, 587], None, LIVE),
+    ("TLS_SESSIONS", STR, "ram", ("off", "ram", "rtc"), LIVE),
+    ("TLS_PINS", DICT, {}, None, LIVE),
+    ("TLS_PIN_MODE", STR, "report", ("off", "report", "enforce"), LIVE),
+    ("CANARY_S", INT, 86400, (0, 30 * 86400), LIVE),
+    ("CANARY_TELEGRAM_CHAT_ID", ID, None, None, LIVE),
+    ("CANARY_EMAIL", STR_LIST, None, None, LIVE),
+    ("CANARY_NTFY_TOPIC", STR, None, None, LIVE),
+    ("CANARY_SLO_MS", DICT, {"wifi": 10000, "connect": 3000, "tls": 10000, "total": 30000}, None, LIVE),
+)
+NAMES = tuple(spec[0] for spec in _SPECS)
+SCHEMA = {spec[0]: spec[1:] for spec in _SPECS}
+
+# Never echoed back over Telegram
+SECRETS = ("WIFI_PASSWORD", "TELEGRAM_BOT_TOKEN", "GMAIL_APP_PASSWORD", "GATEWAY_KEY", "OTA_KEY",
+           "HEARTBEAT_KEY")
+
+# Never changed from Telegram: anyone in the chat could read them back into
+# their own hands, turn off pinning or point OTA at their own server. Edit
+# config.py for these.
+LOCAL_ONLY = SECRETS + ("TLS_PINS", "TLS_PIN_MODE", "OTA_URL")
+
+class Config:
+    """The "config" module: one attribute per setting"""
+
+config = Config()
+_listeners = []
+_source_stat = None
+reloads = 0
+rejected = 0
+
+def schema_crc():
+    """Changes whenever settings are added, removed or reordered"""
+    return crc32(",".join(NAMES).encode())
+
+# --- Validation ------------------------------------------------------------
+
+def _check_value(name, value, errors):
+    kind, default, check, live = SCHEMA[name]
+    if value is None:
+        if default is None:
+            return None
+        errors.append(f"{name} must be set")
+        return None
+    if kind == ID:
+        if isinstance(value, int) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str) or not value.lstrip("-").isdigit():
+            errors.append(f"{name} must be a number (your chat id)")
+        return value
+    if kind == STR_LIST:
+        if isinstance(value, tuple):
+            value = list(value)
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            errors.append(f"{name} must be a list of strings")
+        elif not value:
+            errors.append(f"{name} must not be empty")
+        elif any("@" not in v for v in value):
+            errors.append(f"{name}: not an address: {[v for v in value if '@' not in v][0]}")
+        return value
+    expected = {STR: str, INT: int, BOOL: bool, DICT: dict, LIST: list}[kind]
+    if kind == LIST and isinstance(value, tuple):
+        value = list(value)
+    if kind == INT and isinstance(value, bool) or not isinstance(value, expected):
+        errors.append(f"{name} must be {expected.__name__}, not {type(value).__name__}")
+        return value
+    if check is not None:
+        if kind == INT and not check[0] <= value <= check[1]:
+            errors.append(f"{name} must be between {check[0]} and {check[1]}")
+        elif kind == STR and value not in check:
+            errors.append(f"{name} must be one of {', '.join(check)}")
+    return value
+
+def validate(values, warn=None):
+    """Return a complete, checked settings dict or raise ConfigError
+
+    values: settings by name; missing ones take their defaults. Names not in
+    SCHEMA are passed to warn(name) and dropped.
+    """
+    errors = []
+    result = {}
+    for name in values:
+        if name not in SCHEMA and warn:
+            warn(name)
+    for name in NAMES:
+        value = values.get(name, SCHEMA[name][1])
+        if value is REQUIRED:
+            errors.append(f"{name} is missing")
+            continue
+        result[name] = _check_value(name, value, errors)
+    # Cross-field checks
+    if not errors:
+        if result["SAMPLER_FAST_MS"] > result["SAMPLER_NORMAL_MS"]:
+            errors.append("SAMPLER_FAST_MS must not exceed SAMPLER_NORMAL_MS")
+        for channel, limit in result["ALERT_RATE_LIMITS"].items():
+            if channel not in ("telegram", "gmail", "ntfy") or len(limit) != 2 or limit[0] < 1 or limit[1] < 1:
+                errors.append(f"ALERT_RATE_LIMITS[{channel!r}] must be (burst >= 1, refill_s >= 1)")
+        for i, spec in enumerate(result["SENSORS"] or ()):
+            if not isinstance(spec, dict) or "name" not in spec or "pin" not in spec:
+                errors.append(f"SENSORS[{i}] needs at least a name and a pin")
+        for phase, ms in result["CANARY_SLO_MS"].items():
+            if phase not in ("wifi", "resolve", "connect", "tls", "exchange", "total") \
+                    or not isinstance(ms, int) or ms < 1:
+                errors.append(f"CANARY_SLO_MS[{phase!r}] must be a phase with a limit in ms")
+        for host, pins in result["TLS_PINS"].items():
+            if not isinstance(pins, (list, tuple)) or not all(isinstance(p, str) and len(p) == 44 for p in pins):
+                errors.append(f"TLS_PINS[{host!r}] must be a list of base64 SHA-256 pins")
+            elif len(pins) < 2:
+                errors.append(f"TLS_PINS[{host!r}] needs a backup pin")
+        if result["OTA_URL"] and not result["OTA_KEY"]:
+            errors.append("OTA_KEY must be set with OTA_URL: unsigned updates are refused")
+        ports = result["SMTP_PORTS"]
+        if not ports or not all(isinstance(p, int) and 0 < p < 65536 for p in ports):
+            errors.append("SMTP_PORTS must be a list of port numbers")
+    if errors:
+        raise ConfigError(errors)
+    return result
+
+# --- Compact binary form ---------------------------------------------------
+# Tags: 0 None, 1 False, 2 True, 3 int32, 4 str, 5 list, 6 dict, 7 tuple,
+# 8 int64, 9 float. Lengths and counts are 16-bit. Top-level entries are
+# (schema index, value) so names are not stored.
+
+def _encode(value, out):
+    if value is None:
+        out.append(0)
+    elif value is True or value is False:
+        out.append(2 if value else 1)
+    elif isinstance(value, int):
+        if -0x80000000 <= value <= 0x7FFFFFFF:
+            out.append(3)
+            out.extend(struct.pack("<i", value))
+        else:
+            out.append(8)
+            out.extend(struct.pack("<q", value))
+    elif isinstance(value, float):
+        out.append(9)
+        out.extend(struct.pack("<f", value))
+    elif isinstance(value, str):
+        data = value.encode()
+        out.append(4)
+        out.extend(struct.pack("<H", len(data)))
+        out.extend(data)
+    elif isinstance(value, (list, tuple)):
+        out.append(5 if isinstance(value, list) else 7)
+        out.extend(struct.pack("<H", len(value)))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(6)
+        out.extend(struct.pack("<H", len(value)))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise ConfigError([f"cannot store a {type(value).__name__}"])
+
+def _decode(mv, pos):
+    tag = mv[pos]
+    pos += 1
+    if tag < 3:
+        return (None, False, True)[tag], pos
+    if tag == 3:
+        return struct.unpack_from("<i", mv, pos)[0], pos + 4
+    if tag == 8:
+        return struct.unpack_from("<q", mv, pos)[0], pos + 8
+    if tag == 9:
+        return struct.unpack_from("<f", mv, pos)[0], pos + 4
+    n = struct.unpack_from("<H", mv, pos)[0]
+    pos += 2
+    if tag == 4:
+        return bytes(mv[pos:pos + n]).decode(), pos + n
+    if tag == 6:
+        result = {}
+        for _ in range(n):
+            key, pos = _decode(mv, pos)
+            result[key], pos = _decode(mv, pos)
+        return result, pos
+    items = []
+    for _ in range(n):
+        item, pos = _decode(mv, pos)
+        items.append(item)
+    return (items if tag == 5 else tuple(items)), pos
+
+def encode(values, source_crc=0):
+    """Settings dict to the config.bin bytes"""
+    payload = bytearray()
+    for index, name in enumerate(NAMES):
+        if name in values:
+            payload.append(index)
+            _encode(values[name], payload)
+    header = struct.pack(_HEADER, MAGIC, schema_crc(), source_crc, crc32(payload))
+    return header + payload
+
+def decode(data):
+    """config.bin bytes to (settings dict, config.py CRC), or None if unusable"""
+    if len(data) < HEADER_LEN:
+        return None
+    magic, schema, source_crc, payload_crc = struct.unpack_from(_HEADER, data)
+    mv = memoryview(data)[HEADER_LEN:]
+    if magic != MAGIC or schema != schema_crc() or crc32(mv) != payload_crc:
+        return None
+    values = {}
+    pos = 0
+    while pos < len(mv):
+        index = mv[pos]
+        values[NAMES[index]], pos = _decode(mv, pos + 1)
+    return values, source_crc
+
+def save(values, source_crc, path=COMPILED):
+    """Write config.bin so a reset mid-write leaves the old file intact"""
+    with open(_TMP, "wb") as f:
+        f.write(encode(values, source_crc))
+    try:
+        os.remove(path)  # MicroPython's rename does not replace
+    except OSError:
+        pass
+    os.rename(_TMP, path)
+
+# --- Loading and hot reload ------------------------------------------------
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return st[6], st[8]  # size, mtime
+    except OSError:
+        return None
+
+def _run_source(source):
+    """Settings defined by config.py source, without importing it"""
+    namespace = {}
+    try:
+        exec(source, namespace)
+    except Exception as e:
+        raise ConfigError([f"{SOURCE}: {type(e).__name__}: {e}"])
+    return {k: v for k, v in namespace.items() if k.isupper() and not k.startswith("_")}
+
+def _warn_unknown(name):
+    print(f"Config: {name} is not a known setting (typo?), ignored")
+
+def _install(values):
+    for name, value in values.items():
+        setattr(config, name, value)
+    sys.modules["config"] = config
+
+def load():
+    """Boot: install the settings as the "config" module and return it
+
+    Uses config.bin when it was compiled from the current config.py (or
+    config.py has been removed). Otherwise compiles config.py; if that
+    fails validation the last good config.bin is kept (or, on a first boot,
+    config.py is used as it is) and the errors are printed, so a typo never
+    leaves the alarm unarmed.
+    """
+    global _source_stat
+    source = _read(SOURCE)
+    compiled = _read(COMPILED)
+    stored = decode(compiled) if compiled else None
+    source_crc = crc32(source) if source is not None else 0
+    _source_stat = _stat(SOURCE)
+    if stored and (source is None or stored[1] == source_crc):
+        _install(stored[0])
+        return config
+    if source is None:
+        raise ConfigError([f"no {SOURCE} and no usable {COMPILED}"])
+    try:
+        values = validate(_run_source(source), _warn_unknown)
+    except ConfigError as e:
+        if stored:
+            print(f"Config: {SOURCE} rejected, keeping {COMPILED}: {e}")
+            _install(stored[0])
+            return config
+        # Nothing good to fall back on: run with what there is (the siren
+        # needs no settings) and leave config.bin unwritten
+        print(f"Config: {SOURCE} has errors, fix them: {e}")
+        values = dict((n, s[1]) for n, s in SCHEMA.items() if s[1] is not REQUIRED)
+        try:
+            values.update(_run_source(source))
+        except ConfigError:
+            pass
+        _install(values)
+        return config
+    save(values, source_crc)
+    print(f"Config: compiled {SOURCE} to {COMPILED}")
+    _install(values)
+    return config
+
+def on_change(listener):
+    """Call listener(changed) after each applied change; changed is a list of names"""
+    _listeners.append(listener)
+
+def current():
+    return {name: getattr(config, name) for name in SCHEMA if hasattr(config, name)}
+
+def apply(changes, source_crc=None):
+    """Validate and apply changed settings as one unit
+
+    Returns (names applied now, names that need a reset). Raises
+    ConfigError with nothing changed if any value is invalid.
+    """
+    global reloads, rejected
+    merged = current()
+    merged.update(changes)
+    try:
+        values = validate(merged, _warn_unknown)
+    except ConfigError:
+        rejected += 1
+        raise
+    changed = [n for n in NAMES if getattr(config, n, REQUIRED) != values[n]]
+    stored = decode(_read(COMPILED) or b"")
+    stored_crc = stored[1] if stored else None
+    if source_crc is None:
+        source_crc = stored_crc or 0  # A remote change keeps the link to config.py
+    if changed or source_crc != stored_crc:
+        save(values, source_crc)
+    _install(values)
+    reloads += 1
+    live = [n for n in changed if SCHEMA[n][3]]
+    for listener in _listeners:
+        listener(live)
+    return live, [n for n in changed if not SCHEMA[n][3]]
+
+def reload():
+    """Re-read config.py and apply it (after uploading a new one)"""
+    global _source_stat, rejected
+    source = _read(SOURCE)
+    if source is None:
+        raise ConfigError([f"no {SOURCE}"])
+    _source_stat = _stat(SOURCE)
+    try:
+        values = _run_source(source)
+    except ConfigError:
+        rejected += 1
+        raise
+    # Settings left out of config.py go back to their defaults
+    for name, spec in SCHEMA.items():
+        if name not in values and spec[1] is not REQUIRED:
+            values[name] = spec[1]
+    return apply(values, crc32(source))
+
+def source_changed():
+    """Cheap check (one stat) for a newly uploaded config.py"""
+    st = _stat(SOURCE)
+    return st is not None and st != _source_stat
+
+def parse(name, text):
+    """A /set argument to a value of the setting's kind"""
+    if name not in SCHEMA:
+        raise ConfigError([f"unknown setting {name}"])
+    kind = SCHEMA[name][0]
+    text = text.strip()
+    if text.lower() == "none":
+        return None
+    if kind == INT:
+        try:
+            return int(text, 0)
+        except ValueError:
+            raise ConfigError([f"{name} must be a whole number"])
+    if kind == BOOL:
+        if text.lower() in ("1", "true", "on", "yes"):
+            return True
+        if text.lower() in ("0", "false", "off", "no"):
+            return False
+        raise ConfigError([f"{name} must be on or off"])
+    if kind == STR_LIST:
+        return [v.strip() for v in text.split(",") if v.strip()]
+    if kind in (DICT, LIST):
+        import json
+        try:
+            return json.loads(text)
+        except ValueError:
+            raise ConfigError([f"{name} must be JSON"])
+    return text
+
+def show(name):
+    """A setting's value for display, with secrets hidden"""
+    value = getattr(config, name, None)
+    if name in SECRETS and value:
+        return "(set)"
+    return repr(value)
+
+def metrics():
+    return {"reloads": reloads, "rejected": rejected}
@@ -0,0 +1,469 @@
+"""
+Accelerated soak test for the Sump Alarm logic
+Host tool (CPython, not for the ESP32). Drives the real sensor array,
+debounce filters, adaptive sampler, alarm engines, event log and lazy
+notifier loading through months of virtual time in minutes, with random
+floods, float chatter and network outages. Heap size and allocated block
+counts are sampled after every flood cycle; the run fails if the heap in the
+last quarter of the run is above the heap after warm-up by more than a few
+tens of bytes per cycle, or if alert latency or CPU cost per loop step gets
+worse over time.
+
+Usage:
+    python soak.py --days 90
+    python soak.py --days 365 --sensors 3 --seed 7 --csv soak.csv
+
+Exits with status 1 when a check fails. The notification channels are
+simulated (random failures and multi-hour outages); the notify module
+itself is imported and evicted through lazy.py on every alarm, using
+config_template.py when there is no config.py. The event log is written
+through os-level files (HostFile): each CPython io.FileIO leaves about 80
+traced bytes behind that are never reclaimed, which MicroPython's open()
+does not, and which would otherwise read as a 300 byte per cycle leak.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+CHANNELS = ("telegram", "gmail", "ntfy")
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+def use_config_template():
+    """Make "import config" work on a host without credentials"""
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        import config_template
+        sys.modules["config"] = config_template
+
+use_config_template()
+
+import eventlog
+import lazy
+import mybase64
+import watchdog  # noqa: F401 - resident from boot as in main.py, never a notifier dependency
+from alarm_engine import ACT_ALARM, ACT_RETRY, ACT_RESTORE
+from sampler import AdaptiveSampler
+from sensors import SensorArray
+
+SAMPLES_REQUIRED = 10  # Burst length in fast mode, as in main.py
+
+# --- Virtual world ----------------------------------------------------------
+
+class FloodSchedule:
+    """Random flood episodes for one float switch, generated as time advances
+
+    About a third of the episodes are short surges that should not raise an
+    alarm. The float chatters around both edges and drops out briefly while
+    flooded.
+    """
+
+    def __init__(self, rng, mean_gap_h=24, chatter_ms=3000, p_dropout=0.02):
+        self.rng = rng
+        self.mean_gap_ms = mean_gap_h * HOUR_MS
+        self.chatter_ms = chatter_ms
+        self.p_dropout = p_dropout
+        self.start, self.end = self._next(0)
+        self.episodes = 0
+
+    def _next(self, after_ms):
+        gap = int(self.rng.expovariate(1 / self.mean_gap_ms))
+        if self.rng.random() < 0.3:
+            seconds = self.rng.uniform(2, 10)
+        else:
+            seconds = math.exp(self.rng.uniform(math.log(60), math.log(6 * 3600)))
+        start = after_ms + self.chatter_ms + gap
+        return start, start + int(seconds * 1000)
+
+    def wet(self, now_ms):
+        """Raw switch reading (0 or 1) at now_ms"""
+        if now_ms >= self.end + self.chatter_ms:
+            self.start, self.end = self._next(self.end + self.chatter_ms)
+            self.episodes += 1
+        if now_ms < self.start - self.chatter_ms:
+            return 0
+        if abs(now_ms - self.start) < self.chatter_ms or abs(now_ms - self.end) < self.chatter_ms:
+            return self.rng.getrandbits(1)
+        if now_ms < self.end:
+            return 0 if self.rng.random() < self.p_dropout else 1
+        return 0
+
+class VirtualNetwork:
+    """Notification channels with random failures and multi-hour outages"""
+
+    def __init__(self, rng, fail_rate=0.1, outages_per_day=0.2, outage_h=(0.5, 12)):
+        self.rng = rng
+        self.fail_rate = fail_rate
+        self.outage_gap_ms = DAY_MS / outages_per_day
+        self.outage_h = outage_h
+        self.outage_start = 0
+        self.outage_end = 0
+        self._schedule(0)
+        self.sends = 0
+        self.failures = 0
+
+    def _schedule(self, after_ms):
+        self.outage_start = after_ms + int(self.rng.expovariate(1 / self.outage_gap_ms))
+        self.outage_end = self.outage_start + int(self.rng.uniform(*self.outage_h) * HOUR_MS)
+
+    def send(self, channel, now_ms):
+        """Return (success, virtual milliseconds the send blocked for)"""
+        while now_ms >= self.outage_end:
+            self._schedule(self.outage_end)
+        self.sends += 1
+        if self.outage_start <= now_ms:
+            self.failures += 1
+            return False, 15000 + self.rng.randint(0, 15000)  # Timeouts while WiFi is down
+        if self.rng.random() < self.fail_rate:
+            self.failures += 1
+            return False, self.rng.randint(1000, 30000)
+        return True, self.rng.randint(800, 6000)
+
+# --- Device model -------------------------------------------------------------
+
+class SoakDevice:
+    """The main.py loop, run against a virtual clock"""
+
+    def __init__(self, rng, net, n_sensors, algorithm, params, debounce_s, retry_s,
+                 mean_gap_h):
+        self.rng = rng
+        self.net = net
+        self.now = 0
+        self.floods = [FloodSchedule(rng, mean_gap_h) for _ in range(n_sensors)]
+        specs = [{"name": f"s{i}", "pin": 2 + i} for i in range(n_sensors)]
+        self.sensors = SensorArray(specs, algorithm=algorithm, params=params,
+                                   reader=self.read_word, default_debounce_s=debounce_s,
+                                   default_retry_s=retry_s)
+        self.sampler = AdaptiveSampler()
+        self.next_sleep_ms = self.sampler.normal_ms
+        self.steps = 0
+        self.dry_steps = 0
+        self.dry_ns = 0
+        self.cycles = []        # Finished episodes, filled by the soak loop
+        self.onset_ms = {}      # sensor index -> scheduled flood start
+        self.alarm_ms = {}      # sensor index -> time of ACT_ALARM
+        self.delivered_ms = {}  # sensor index -> first successful notification
+        self.violations = []
+        self.notify_s = 0.0     # Host time spent in notify(), kept out of the loop cost
+        self.notify_us = []     # Host microseconds per notify() call
+
+    def read_word(self):
+        word = 0
+        for s, floods in zip(self.sensors.sensors, self.floods):
+            if floods.wet(self.now):
+                word |= s.bit
+        return word
+
+    def notify(self, sensor):
+        """Time one notification round on the host"""
+        start = time.perf_counter()
+        try:
+            return self._notify(sensor)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.notify_s += elapsed
+            self.notify_us.append(elapsed * 1e6)
+
+    def _notify(self, sensor):
+        """Load notify lazily, "send" on every routed channel, then evict it"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            notify = lazy.load("notify")
+            try:
+                title = notify.alarm_title(sensor.label)
+                success = False
+                for channel in CHANNELS:
+                    if not sensor.routes(channel):
+                        continue
+                    if channel == "gmail":
+                        # Same allocations as the SMTP AUTH LOGIN exchange
+                        mybase64.b64encode(title)
+                        mybase64.b64encode(sensor.label)
+                    ok, blocked_ms = self.net.send(channel, self.now)
+                    self.now += blocked_ms  # The main loop is blocked while sending
+                    success = success or ok
+                return success
+            finally:
+                del notify
+                lazy.release("notify")
+
+    def handle_action(self, sensor, action):
+        engine = sensor.engine
+        i = sensor.index
+        if action == ACT_ALARM:
+            self.onset_ms[i] = self.floods[i].start
+            self.alarm_ms[i] = self.now
+            eventlog.log("alarm", sensor.name)
+            engine.notified(self.notify(sensor))
+            if engine.notification_sent:
+                self.delivered_ms[i] = self.now
+            eventlog.log("notify", f"{sensor.name} ok={engine.notification_sent}")
+        elif action == ACT_RETRY:
+            engine.notified(self.notify(sensor))
+            if engine.notification_sent:
+                self.delivered_ms[i] = self.now
+            eventlog.log("notify", f"{sensor.name} ok={engine.notification_sent} retry=1")
+        elif action == ACT_RESTORE:
+            eventlog.log("restore", f"{sensor.name} s={engine.last_flood_s} alarm={int(engine.last_alarm)}")
+            if engine.alarm_triggered or engine.notification_sent or engine.flooded:
+                self.violations.append(f"{sensor.name}: engine not reset after restore at {self.now} ms")
+            alarm = self.alarm_ms.pop(i, None)
+            onset = self.onset_ms.pop(i, None)
+            delivered = self.delivered_ms.pop(i, None)
+            self.cycles.append({
+                "sensor": i,
+                "end_ms": self.now,
+                "alarm": alarm is not None,
+                "alarm_latency_ms": alarm - onset if alarm is not None else None,
+                "delivery_latency_ms": delivered - onset if delivered is not None else None,
+            })
+
+    def run_until(self, end_ms):
+        """Run the main loop until the virtual clock reaches end_ms"""
+        sensors = self.sensors
+        sampler = self.sampler
+        perf_ns = time.perf_counter_ns
+        while self.now < end_ms:
+            start_ns = perf_ns()
+            self.now += self.next_sleep_ms
+            self.steps += 1
+            raw = sensors.sample()
+            self.next_sleep_ms = sampler.update(1 if raw else 0, self.now, alarm=sensors.flooded)
+            if sampler.fast:
+                for _ in range(SAMPLES_REQUIRED):
+                    self.now += sampler.fast_ms
+                    sensors.sample()
+                sampler.add_samples(SAMPLES_REQUIRED)
+                sensors.step(self.now, self.handle_action)
+            else:
+                # Dry poll: what the device does almost all of its life
+                sensors.step(self.now, self.handle_action)
+                self.dry_ns += perf_ns() - start_ns
+                self.dry_steps += 1
+
+class HostFile:
+    """open(path, "a") for the event log on plain file descriptors"""
+
+    def __init__(self, path, mode="r"):
+        if mode != "a":
+            raise ValueError("HostFile only appends")
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        os.close(self.fd)
+        return False
+
+    def write(self, text):
+        return os.write(self.fd, text.encode())
+
+# --- Measurements ---------------------------------------------------------------
+
+# CPython's import system and site hooks cache a little on every re-import
+# of the lazily loaded notifier, and this harness keeps per-cycle records;
+# neither says anything about the device heap.
+HOST_FILTERS = (
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "*/_distutils_hack/*"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+def heap_sample():
+    """Collect garbage and return (traced bytes, traced blocks, gc objects)
+
+    Traced bytes and blocks leave out host import machinery; without
+    tracemalloc they are None and only gc objects are counted.
+    """
+    gc.collect()
+    if not tracemalloc.is_tracing():
+        return None, None, len(gc.get_objects())
+    stats = tracemalloc.take_snapshot().filter_traces(HOST_FILTERS).statistics("filename")
+    return (sum(s.size for s in stats), sum(s.count for s in stats),
+            len(gc.get_objects()))
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+def quartiles(values):
+    """First and last quarter of a series (at least one item each)"""
+    q = max(1, len(values) // 4)
+    return values[:q], values[-q:]
+
+def check(samples, cycles, notify_us, args):
+    """Return a list of failure messages for the soak run"""
+    failures = []
+    # Host caches (file objects, interned strings) fill during the first cycles
+    warm = max(3, len(samples) // 4)
+    steady = samples[warm:]
+    if len(steady) < 8:
+        return [f"only {len(samples)} cycles; run more --days for a verdict"]
+
+    # Compare the last quarter of the run with the first quarter after
+    # warm-up, so a steady rise of a few tens of bytes per cycle fails
+    # while allocator noise averages out; gc-tracked objects are exact
+    q = max(2, len(steady) // 4)
+    span = len(steady) - q
+    limits = (("traced", 0, args.max_bytes_per_cycle, "bytes"),
+              ("blocks", 1, args.max_blocks_per_cycle, "blocks"),
+              ("objects", 2, args.max_objects_per_cycle, "objects"))
+    for name, col, limit, unit in limits:
+        series = [s[col] for s in steady]
+        if series[0] is None:
+            continue
+        early = sum(series[:q]) / q
+        late = sum(series[-q:]) / q
+        rate = (late - early) / span
+        print(f"  {name:<8} {early:>9.0f} -> {late:>8.0f} {unit}, {rate:>6.1f}/cycle (limit {limit}/cycle)")
+        if rate > limit:
+            failures.append(f"{name} grew {rate:.1f} {unit} per cycle "
+                            f"({early:.0f} -> {late:.0f} over {span} cycles)")
+
+    alarm_lat = [c["alarm_latency_ms"] for c in cycles if c["alarm_latency_ms"] is not None]
+    if len(alarm_lat) >= 8:
+        first, last = quartiles(alarm_lat)
+        p_first = percentile(first, 95)
+        p_last = percentile(last, 95)
+        print(f"  alarm latency p95 first/last quarter {p_first} / {p_last} ms")
+        if p_last > p_first * args.max_slowdown + 1000:
+            failures.append(f"alarm latency p95 rose from {p_first} to {p_last} ms")
+
+    cost = [s[3] for s in steady if s[3]]
+    first, last = quartiles(cost)
+    m_first = percentile(first, 50)
+    m_last = percentile(last, 50)
+    print(f"  CPU per dry loop step first/last quarter {m_first:.2f} / {m_last:.2f} us")
+    if m_last > m_first * args.max_slowdown:
+        failures.append(f"CPU per dry loop step rose from {m_first:.2f} to {m_last:.2f} us")
+
+    if len(notify_us) >= 8:
+        first, last = quartiles(notify_us)
+        m_first = percentile(first, 50)
+        m_last = percentile(last, 50)
+        print(f"  notify round first/last quarter {m_first:.0f} / {m_last:.0f} us")
+        if m_last > m_first * args.max_slowdown:
+            failures.append(f"notify round rose from {m_first:.0f} to {m_last:.0f} us")
+    return failures
+
+def run(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="soak_")
+    eventlog.LOG_FILE = os.path.join(workdir, "events.log")
+    eventlog.OLD_LOG_FILE = os.path.join(workdir, "events.1.log")
+    eventlog.MAX_BYTES = args.log_bytes
+    lazy.configure(args.lazy_policy, 0)
+
+    params = {"samples": SAMPLES_REQUIRED} if args.algorithm == "integrator" else \
+        {"rise_samples": SAMPLES_REQUIRED, "fall_samples": SAMPLES_REQUIRED}
+    net = VirtualNetwork(rng, fail_rate=args.fail_rate, outages_per_day=args.outages_per_day)
+    device = SoakDevice(rng, net, args.sensors, args.algorithm, params,
+                        args.debounce, args.retry, args.mean_gap_h)
+
+    eventlog.open = HostFile
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    samples = []  # (traced, blocks, objects, us per dry step) after each cycle
+    end_ms = args.days * DAY_MS
+    chunk_ms = HOUR_MS
+    wall_start = time.perf_counter()
+    last_cycles = 0
+    cycle_ns = 0
+    cycle_steps = 0
+    while device.now < end_ms:
+        device.run_until(min(end_ms, device.now + chunk_ms))
+        if len(device.cycles) != last_cycles:
+            last_cycles = len(device.cycles)
+            steps = device.dry_steps - cycle_steps
+            dry_us = (device.dry_ns - cycle_ns) / 1000 / steps if steps else 0
+            traced, blocks, objects = heap_sample()
+            samples.append((traced, blocks, objects, dry_us))
+            cycle_ns = device.dry_ns
+            cycle_steps = device.dry_steps
+    wall = time.perf_counter() - wall_start
+    snapshot = tracemalloc.take_snapshot() if args.tracemalloc else None
+    tracemalloc.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    alarms = [c for c in device.cycles if c["alarm"]]
+    delivered = [c["delivery_latency_ms"] for c in alarms if c["delivery_latency_ms"] is not None]
+    print(f"Simulated {args.days} days in {wall:.1f} s ({args.days * 86400 / wall:,.0f}x real time)")
+    print(f"Loop steps: {device.steps:,}  flood cycles: {len(device.cycles)}  alarms: {len(alarms)}")
+    print(f"Notification sends: {net.sends}  failed: {net.failures}")
+    print(f"Alerts delivered: {len(delivered)}/{len(alarms)}  "
+          f"latency p50 {percentile(delivered, 50)} ms  p99 {percentile(delivered, 99)} ms")
+    print(f"Notifier imports: {lazy.metrics().get('notify', {}).get('loads', 0)}")
+    if samples and args.tracemalloc:
+        print(f"Heap after first/last cycle: {samples[0][0]} / {samples[-1][0]} bytes, "
+              f"{samples[0][1]} / {samples[-1][1]} blocks")
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write("cycle,sensor,end_ms,alarm_latency_ms,delivery_latency_ms,traced,blocks,objects,us_per_dry_step\n")
+            for n, (c, s) in enumerate(zip(device.cycles, samples)):
+                traced = "" if s[0] is None else s[0]
+                blocks = "" if s[1] is None else s[1]
+                f.write(f"{n},{c['sensor']},{c['end_ms']},{c['alarm_latency_ms'] or ''},"
+                        f"{c['delivery_latency_ms'] or ''},{traced},{blocks},{s[2]},{s[3]:.3f}\n")
+        print(f"Wrote {args.csv}")
+
+    print("Checks:")
+    failures = device.violations[:5] + check(samples, device.cycles, device.notify_us, args)
+    if failures and snapshot is not None:
+        print("Largest allocation sites at the end of the run:")
+        for stat in snapshot.filter_traces(HOST_FILTERS).statistics("lineno")[:8]:
+            print(f"  {stat}")
+    for line in failures:
+        print(f"FAIL: {line}")
+    if not failures:
+        print("PASS")
+    return 1 if failures else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--days", type=int, default=90, help="Virtual days to simulate")
+    parser.add_argument("--sensors", type=int, default=2, help="Float switches on the board")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mean-gap-h", type=float, default=24,
+                        help="Mean hours between flood episodes per sensor")
+    parser.add_argument("--fail-rate", type=float, default=0.1,
+                        help="Chance that a single channel send fails")
+    parser.add_argument("--outages-per-day", type=float, default=0.2)
+    parser.add_argument("--algorithm", default="integrator",
+                        choices=("integrator", "hysteresis", "bank"))
+    parser.add_argument("--debounce", type=int, default=15, help="DEBOUNCE_SECONDS")
+    parser.add_argument("--retry", type=int, default=600, help="NOTIFY_RETRY_SECONDS")
+    parser.add_argument("--lazy-policy", default="always", choices=("always", "pressure", "never"))
+    parser.add_argument("--log-bytes", type=int, default=8 * 1024,
+                        help="Event log rotation size (small, to exercise rotation)")
+    parser.add_argument("--max-bytes-per-cycle", type=float, default=32,
+                        help="Allowed traced heap growth per flood cycle")
+    parser.add_argument("--max-blocks-per-cycle", type=float, default=0.5,
+                        help="Allowed allocated block growth per flood cycle")
+    parser.add_argument("--max-objects-per-cycle", type=float, default=0.5,
+                        help="Allowed gc-tracked object growth per flood cycle")
+    parser.add_argument("--max-slowdown", type=float, default=1.5,
+                        help="Allowed ratio of last to first quarter latency/CPU")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false",
+                        help="Skip byte-level heap tracing (faster)")
+    parser.add_argument("--csv", help="Write per-cycle measurements to this file")
+    sys.exit(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
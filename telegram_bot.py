@@ -0,0 +1,515 @@
+"""
+Telegram command channel for the Sump Alarm
+Polls getUpdates as a cooperative task: the main loop calls step() once per
+pass and each call does at most a few non-blocking socket operations, so
+sensing is never held up. Responses go through one fixed receive buffer and
+are scanned byte by byte for update_id, chat id and text without building
+the JSON object. Only messages from TELEGRAM_CHAT_ID are acted on. The
+update offset is kept in RTC memory so a reset does not replay commands.
+"""
+
+import struct
+
+import rtcstore
+from compat import ticks_ms, ticks_us, ticks_diff, ticks_add
+from transport import Station, check_pin, quote
+
+RECV_BUF = 512       # Bytes read per socket call
+TEXT_MAX = 64        # Longest command text kept
+REPLY_MAX = 700      # Longest reply sent
+MAX_UPDATES = 4      # Updates asked for per poll (and kept while scanning)
+MAX_REPLIES = 3      # Replies waiting to be sent
+READS_PER_STEP = 4   # Receive calls per step()
+EXCHANGE_MS = 20000  # Give up on one request after this long
+
+# Exchange states
+IDLE = 0
+CONNECTING = 1
+SENDING = 2
+RECEIVING = 3
+HANDSHAKING = 4
+
+# Keys the scanner cares about
+K_OTHER = 0
+K_OK = 1
+K_RESULT = 2
+K_UPDATE_ID = 3
+K_MESSAGE = 4
+K_CHAT = 5
+K_ID = 6
+K_TEXT = 7
+_KEYS = {b"ok": K_OK, b"result": K_RESULT, b"update_id": K_UPDATE_ID,
+         b"message": K_MESSAGE, b"chat": K_CHAT, b"id": K_ID, b"text": K_TEXT}
+_MAX_DEPTH = 8
+_ESCAPES = {0x6E: 0x20, 0x74: 0x20, 0x72: 0x20, 0x62: 0x20, 0x66: 0x20}  # \n \t \r \b \f -> space
+
+class UpdateScanner:
+    """Incremental scanner for a getUpdates response body
+
+    feed() takes any slice of the body; on_update(update_id, chat_id, text)
+    is called as each update object closes. Memory use is fixed: the key
+    and text buffers are preallocated and nothing else is kept per update.
+    """
+
+    def __init__(self, on_update, text_max=TEXT_MAX):
+        self.on_update = on_update
+        self.key = bytearray(16)
+        self.text = bytearray(text_max)
+        self.keys = [K_OTHER] * _MAX_DEPTH
+        self.objects = [False] * _MAX_DEPTH
+        self.reset()
+
+    def reset(self):
+        self.depth = 0
+        self.ok = False
+        self.in_str = False
+        self.esc = 0         # 1 after a backslash, 2..5 inside \uXXXX
+        self.str_key = False
+        self.str_text = False
+        self.slen = 0
+        self.want_key = False
+        self.scalar = False
+        self.first = 0
+        self.num = 0
+        self.neg = False
+        self._clear_update()
+
+    def _clear_update(self):
+        self.update_id = None
+        self.chat_id = None
+        self.text_len = -1
+
+    def _value_path(self):
+        """What the value about to start is: 1 update_id, 2 chat id, 3 text, 4 ok"""
+        d = self.depth
+        if d >= _MAX_DEPTH:
+            return 0
+        keys = self.keys
+        if d == 3 and keys[3] == K_UPDATE_ID:
+            return 1
+        if d == 5 and keys[5] == K_ID and keys[4] == K_CHAT and keys[3] == K_MESSAGE:
+            return 2
+        if d == 4 and keys[4] == K_TEXT and keys[3] == K_MESSAGE:
+            return 3
+        if d == 1 and keys[1] == K_OK:
+            return 4
+        return 0
+
+    def feed(self, data):
+        for c in data:
+            if self.in_str:
+                if self.esc:
+                    if self.esc == 1:
+                        if c == 0x75:  # \uXXXX: skip the digits, keep a placeholder
+                            self.esc = 2
+                            self._str_byte(0x3F)
+                            continue
+                        self._str_byte(_ESCAPES.get(c, c))
+                        self.esc = 0
+                    else:
+                        self.esc = 0 if self.esc == 5 else self.esc + 1
+                elif c == 0x5C:
+                    self.esc = 1
+                elif c == 0x22:
+                    self._end_string()
+                else:
+                    self._str_byte(c)
+                continue
+            if c == 0x22:
+                self.in_str = True
+                self.slen = 0
+                self.str_key = self.want_key
+                self.str_text = not self.want_key and self._value_path() == 3
+            elif c == 0x7B or c == 0x5B:  # { [
+                self._open(c == 0x7B)
+            elif c == 0x7D or c == 0x5D:  # } ]
+                self._end_scalar()
+                self._close()
+            elif c == 0x2C:  # ,
+                self._end_scalar()
+                d = self.depth
+                self.want_key = d < _MAX_DEPTH and self.objects[d]
+            elif c == 0x3A:  # :
+                self.want_key = False
+            elif c in (0x20, 0x0A, 0x0D, 0x09):
+                self._end_scalar()
+            else:
+                self._scalar_byte(c)
+
+    def _str_byte(self, c):
+        n = self.slen
+        if self.str_key:
+            if n < len(self.key):
+                self.key[n] = c
+            self.slen = n + 1
+        elif self.str_text and n < len(self.text):
+            self.text[n] = c
+            self.slen = n + 1
+
+    def _end_string(self):
+        self.in_str = False
+        if self.str_key:
+            d = self.depth
+            if d < _MAX_DEPTH:
+                n = self.slen
+                key = K_OTHER if n > len(self.key) else _KEYS.get(bytes(self.key[:n]), K_OTHER)
+                self.keys[d] = key
+        elif self.str_text:
+            self.text_len = self.slen
+
+    def _scalar_byte(self, c):
+        if not self.scalar:
+            self.scalar = True
+            self.first = c
+            self.num = 0
+            self.neg = c == 0x2D
+        if 0x30 <= c <= 0x39:
+            self.num = self.num * 10 + c - 0x30
+
+    def _end_scalar(self):
+        if not self.scalar:
+            return
+        self.scalar = False
+        path = self._value_path()
+        num = -self.num if self.neg else self.num
+        if path == 1:
+            self.update_id = num
+        elif path == 2:
+            self.chat_id = num
+        elif path == 4:
+            self.ok = self.first == 0x74  # true
+
+    def _open(self, is_object):
+        self.depth += 1
+        d = self.depth
+        if d < _MAX_DEPTH:
+            self.objects[d] = is_object
+            self.keys[d] = K_OTHER
+        self.want_key = is_object
+
+    def _close(self):
+        d = self.depth
+        if d == 3 and self.keys[1] == K_RESULT and self.objects[3]:
+            text = bytes(self.text[:self.text_len]) if self.text_len >= 0 else None
+            if self.update_id is not None:
+                self.on_update(self.update_id, self.chat_id, text)
+            self._clear_update()
+        self.depth = d - 1
+        self.want_key = False
+
+def parse_duration(arg, default_s=1800):
+    """"30m", "2h", "90s" or "45" (minutes) to seconds"""
+    arg = (arg or "").strip().lower()
+    if not arg:
+        return default_s
+    unit = arg[-1]
+    scale = {"s": 1, "m": 60, "h": 3600}.get(unit)
+    number = arg[:-1] if scale else arg
+    try:
+        return int(float(number) * (scale or 60))
+    except ValueError:
+        return None
+
+def _would_block(e):
+    import errno
+    if getattr(e, "errno", None) in (errno.EAGAIN, errno.EINPROGRESS):
+        return True
+    return type(e).__name__ in ("SSLWantReadError", "SSLWantWriteError")
+
+class TelegramPoller:
+    def __init__(self, token, chat_id, handler, period_s=10, host="api.telegram.org",
+                 port=443, tls=True, wifi=None):
+        """Poll for commands every period_s seconds
+
+        handler(command, argument) returns the reply text (or None). wifi is
+        (ssid, password) to keep the station connected, None to poll only
+        while something else keeps it connected, or False to skip the radio
+        (host tests); see transport.Station.
+        """
+        self.token = token
+        self.chat_id = str(chat_id)
+        self.handler = handler
+        self.period_ms = period_s * 1000
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.station = Station(wifi)
+        self.buf = bytearray(RECV_BUF)
+        self.mv = memoryview(self.buf)
+        self.updates = []  # (update_id, chat_id, text) from the current poll
+        self.replies = []
+        self.scanner = UpdateScanner(self._on_update)
+        self.state = IDLE
+        self.sock = None
+        self.request = None
+        self.sent = 0
+        self.polling = False
+        self.next_ms = ticks_ms()
+        self.offset = self._load_offset()
+        # Counters
+        self.polls = 0
+        self.commands = 0
+        self.ignored = 0
+        self.errors = 0
+        self.last_error = None
+        self.max_step_us = 0
+
+    @property
+    def busy(self):
+        """True while an exchange is in progress (the loop should step again soon)"""
+        return self.state != IDLE
+
+    def _load_offset(self):
+        data = rtcstore.read("telegram")
+        if data is None:
+            return None  # Unknown: the first poll only skips past old updates
+        return struct.unpack("<q", data)[0]
+
+    def _save_offset(self):
+        rtcstore.write("telegram", struct.pack("<q", self.offset))
+
+    def reply(self, text):
+        """Queue a message to the chat; the oldest is dropped if too many wait"""
+        if len(self.replies) >= MAX_REPLIES:
+            self.replies.pop(0)
+        self.replies.append(text[:REPLY_MAX])
+
+    def _on_update(self, update_id, chat_id, text):
+        if len(self.updates) < MAX_UPDATES:
+            self.updates.append((update_id, chat_id, text))
+
+    # --- The cooperative task ---------------------------------------------
+
+    def step(self, now=None):
+        """Advance the poller by a bounded amount of non-blocking work"""
+        start = ticks_us()
+        now = ticks_ms() if now is None else now
+        try:
+            if self.state == IDLE:
+                if self.replies:
+                    self._begin(now, False)
+                elif ticks_diff(now, self.next_ms) >= 0:
+                    self.next_ms = ticks_add(now, self.period_ms)
+                    self._begin(now, True)
+            elif ticks_diff(now, self.deadline) >= 0:
+                self._fail("timed out")
+            elif self.state == CONNECTING:
+                self._connecting()
+            elif self.state == HANDSHAKING:
+                self._handshaking()
+            elif self.state == SENDING:
+                self._sending()
+            elif self.state == RECEIVING:
+                self._receiving()
+        except Exception as e:
+            self._fail(e)
+        elapsed = ticks_diff(ticks_us(), start)
+        if elapsed > self.max_step_us:
+            self.max_step_us = elapsed
+
+    def _begin(self, now, polling):
+        if not self.station.ready(now):
+            return
+        import socket
+        if polling:
+            if self.offset is None:
+                offset = -1  # Only the newest update, to learn the offset without acting
+            else:
+                offset = self.offset
+            path = (f"/bot{self.token}/getUpdates?offset={offset}&limit={MAX_UPDATES}"
+                    "&timeout=0&allowed_updates=%5B%22message%22%5D")
+        else:
+            path = (f"/bot{self.token}/sendMessage?chat_id={self.chat_id}"
+                    f"&text={quote(self.replies[0])}")
+        self.request = (f"GET {path} HTTP/1.0\r\nHost: {self.host}\r\n\r\n").encode()
+        addr = self.station.address(self.host, self.port, socket.SOCK_STREAM, "sensor")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        self.sock = sock
+        self.polling = polling
+        self.sent = 0
+        self.deadline = ticks_add(now, EXCHANGE_MS)
+        self.updates = []
+        self.scanner.reset()
+        self._head = 0      # Position in the status line / header terminator match
+        self._status = 0
+        self._in_body = False
+        try:
+            sock.connect(addr)
+        except OSError as e:
+            if not _would_block(e):
+                raise
+        self.state = CONNECTING
+
+    def _connecting(self):
+        import select
+        poller = select.poll()
+        poller.register(self.sock, select.POLLOUT)
+        events = poller.poll(0)
+        if not events:
+            return
+        if events[0][1] & (select.POLLERR | select.POLLHUP):
+            raise OSError("connect failed")
+        if self.tls:
+            import ssl
+            if hasattr(ssl, "create_default_context"):
+                self.sock = ssl.create_default_context().wrap_socket(
+                    self.sock, server_hostname=self.host, do_handshake_on_connect=False)
+            else:
+                self.sock = ssl.wrap_socket(self.sock, server_hostname=self.host, do_handshake=False)
+            self.state = HANDSHAKING
+            self._handshaking()
+            return
+        self.state = SENDING
+        self._sending()
+
+    def _handshaking(self):
+        """Finish the TLS handshake and check the server's pin before the token goes out"""
+        sock = self.sock
+        try:
+            if hasattr(sock, "do_handshake"):
+                sock.do_handshake()
+            elif sock.write(b"") is None:
+                return  # MicroPython: still in progress
+        except OSError as e:
+            if _would_block(e):
+                return
+            raise
+        check_pin(sock, self.host)
+        self.state = SENDING
+        self._sending()
+
+    def _sending(self):
+        sock = self.sock
+        try:
+            # MicroPython's TLS socket only has write()
+            if hasattr(sock, "write"):
+                n = sock.write(self.request[self.sent:])
+            else:
+                n = sock.send(self.request[self.sent:])
+        except OSError as e:
+            if _would_block(e):
+                return
+            raise
+        if n is None:
+            return  # TLS handshake still in progress
+        self.sent += n
+        if self.sent >= len(self.request):
+            self.state = RECEIVING
+
+    def _receiving(self):
+        sock = self.sock
+        mv = self.mv
+        for _ in range(READS_PER_STEP):
+            try:
+                if hasattr(sock, "readinto"):
+                    n = sock.readinto(mv)
+                else:
+                    n = sock.recv_into(mv)
+            except OSError as e:
+                if _would_block(e):
+                    return
+                raise
+            if n is None:
+                return  # Nothing waiting
+            if n == 0:
+                self._finish()
+                return
+            self._consume(mv[:n])
+
+    def _consume(self, data):
+        """Split the response into status line, headers and body"""
+        if self._in_body:
+            if self.polling:
+                self.scanner.feed(data)
+            return
+        for i in range(len(data)):
+            c = data[i]
+            head = self._head
+            # Status code: the three digits after "HTTP/1.x "
+            if 9 <= head < 12 and self._status < 1000:
+                self._status = self._status * 10 + c - 0x30
+            if head >= 12:
+                # Match \r\n\r\n, counting in the high bits of _head
+                seen = head >> 12
+                if c == (0x0D if seen % 2 == 0 else 0x0A):
+                    seen += 1
+                else:
+                    seen = 1 if c == 0x0D else 0
+                if seen == 4:
+                    self._in_body = True
+                    if self.polling:
+                        self.scanner.feed(data[i + 1:])
+                    return
+                self._head = (seen << 12) | 12
+            else:
+                self._head = head + 1
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        self.state = IDLE
+
+    def _fail(self, error):
+        self.errors += 1
+        self.last_error = str(error)
+        print(f"Telegram poll error: {error}")
+        self._close()
+        self.station.forget()  # Resolve again next time, the address may have changed
+        self.next_ms = ticks_add(ticks_ms(), self.period_ms)
+
+    def _finish(self):
+        self._close()
+        if self._status != 200:
+            self._fail(f"HTTP {self._status}")
+            return
+        if not self.polling:
+            self.replies.pop(0)
+            return
+        self.polls += 1
+        if not self.scanner.ok:
+            return
+        updates = self.updates
+        self.updates = []
+        if not updates:
+            return
+        learning = self.offset is None
+        self.offset = max(u[0] for u in updates) + 1
+        self._save_offset()
+        if learning:
+            print(f"Telegram: skipped {len(updates)} update(s) from before this boot")
+            return
+        for update_id, chat_id, text in updates:
+            if str(chat_id) != self.chat_id or not text:
+                self.ignored += 1
+                continue
+            self._command(text.decode("utf-8", "ignore") if isinstance(text, bytes) else text)
+
+    def _command(self, text):
+        parts = text.strip().split(None, 1)
+        if not parts or not parts[0].startswith("/"):
+            return
+        command = parts[0].split("@")[0].lower()  # "/status@MyBot" in groups
+        arg = parts[1] if len(parts) > 1 else ""
+        self.commands += 1
+        print(f"Telegram command: {command} {arg}")
+        try:
+            answer = self.handler(command, arg)
+        except Exception as e:
+            answer = f"{command} failed: {e}"
+        if answer:
+            self.reply(answer)
+
+    def metrics(self):
+        return {
+            "polls": self.polls,
+            "commands": self.commands,
+            "ignored": self.ignored,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "max_step_ms": self.max_step_us // 1000,
+        }
@@ -0,0 +1,36 @@
+"""
+Simple test for the alarm_engine state machine
+"""
+
+from alarm_engine import AlarmEngine, ACT_NONE, ACT_ALARM, ACT_RETRY, ACT_RESTORE
+
+def test_alarm_engine():
+    print("Testing alarm engine...")
+    engine = AlarmEngine(debounce_s=15, retry_s=600)
+    actions = []
+
+    # 20 s of water at one reading per second, notifications fail
+    for second in range(20):
+        action = engine.update(1, second * 1000)
+        if action == ACT_ALARM:
+            engine.notified(False)
+        actions.append(action)
+    print(f"Alarm at second: {actions.index(ACT_ALARM)} (expected 15)")
+    print(f"Match: {actions.index(ACT_ALARM) == 15}\n")
+
+    # Failed notification is retried 600 s after the first attempt
+    action = engine.update(1, 615 * 1000)
+    print(f"Retry after 600 s: {action == ACT_RETRY}")
+    engine.notified(True)
+    action = engine.update(1, 1215 * 1000)
+    print(f"No retry once sent: {action == ACT_NONE}\n")
+
+    # Water goes away
+    action = engine.update(0, 1216 * 1000)
+    print(f"Restore: {action == ACT_RESTORE}, was high for {engine.last_flood_s}s")
+    print(f"Match: {action == ACT_RESTORE and not engine.alarm_triggered}\n")
+
+    print("Test completed")
+
+# Run test when imported
+test_alarm_engine()
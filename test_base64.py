@@ -1,35 +1,122 @@
 """
-Simple test for mybase64 module
+Correctness and throughput test for the mybase64 module
+Runs on the ESP32 and on a host; on a host the results are also checked
+against the standard library base64 module.
 """
 
-from mybase64 import b64encode
+import os
+
+import mybase64
+from mybase64 import b64encode, b64decode, b64encode_into, encoded_length, B64Encoder
+from compat import ticks_us, ticks_diff
+
+try:
+    import base64 as std_base64
+except ImportError:
+    std_base64 = None  # MicroPython: compare against known outputs only
 
 def test_base64():
     # Test cases
     print("Testing base64 encoding...")
-    
+
     test_strings = [
         "hello",
         "test123",
         "kl7na.pskmail@gmail.com",
         "vcwr reyq ckve oobye"
     ]
-    
+
     expected_outputs = [
         "aGVsbG8=",
         "dGVzdDEyMw==",
         "a2w3bmEucHNrbWFpbEBnbWFpbC5jb20=",
         "dmN3ciByZXlxIGNrdmUgb29ieWU="
     ]
-    
+
     for i, test_str in enumerate(test_strings):
         encoded = b64encode(test_str)
         print(f"Input: {test_str}")
         print(f"Output: {encoded}")
         print(f"Expected: {expected_outputs[i]}")
         print(f"Match: {encoded == expected_outputs[i]}\n")
-    
+
     print("Test completed")
 
+def check_round_trips():
+    """Pure and accelerated paths against each other and the stdlib"""
+    print("Testing encode/decode round trips...")
+    failures = 0
+    for use_binascii in (False, mybase64._binascii is not None):
+        mybase64.USE_BINASCII = use_binascii
+        for n in list(range(0, 70)) + [255, 1000, 4096]:
+            data = os.urandom(n)
+            encoded = b64encode(data)
+            if std_base64 and encoded != std_base64.b64encode(data).decode():
+                failures += 1
+            if b64decode(encoded) != data:
+                failures += 1
+            buf = bytearray(encoded_length(n) + 2)
+            written = b64encode_into(data, buf, 2)
+            if bytes(buf[2:2 + written]) != encoded.encode():
+                failures += 1
+    mybase64.USE_BINASCII = mybase64._binascii is not None
+    print(f"Round trip failures: {failures}")
+    print(f"Match: {failures == 0}\n")
+    return failures == 0
+
+def check_streaming():
+    """Incremental MIME-style encoding must match one-shot encoding"""
+    print("Testing streaming encoder...")
+    data = os.urandom(5000)
+    ok = True
+    for chunk in (1, 2, 3, 7, 57, 1000):
+        enc = B64Encoder(line_length=76)
+        parts = []
+        for i in range(0, len(data), chunk):
+            parts.append(enc.update(data[i:i + chunk]))
+        parts.append(enc.finish())
+        streamed = b"".join(parts)
+        lines = streamed.split(b"\r\n")
+        if lines[-1] != b"" or max(len(line) for line in lines) > 76:
+            ok = False
+        if b"".join(lines) != b64encode(data).encode():
+            ok = False
+        if std_base64 and streamed.replace(b"\r\n", b"\n") != std_base64.encodebytes(data):
+            ok = False
+    print(f"Match: {ok}\n")
+    return ok
+
+def benchmark(size=3000, rounds=20):
+    """Encode/decode throughput in KB/s for each available implementation"""
+    print(f"Throughput ({size} bytes x {rounds}):")
+    data = os.urandom(size)
+    out = bytearray(encoded_length(size))
+    encoded = b64encode(data)
+
+    def rate(fn):
+        start = ticks_us()
+        for _ in range(rounds):
+            fn()
+        us = max(1, ticks_diff(ticks_us(), start))
+        return size * rounds * 1000 // us  # bytes/ms == KB/s
+
+    candidates = [("pure", False)]
+    if mybase64._binascii is not None:
+        candidates.append(("binascii", True))
+    for name, use_binascii in candidates:
+        mybase64.USE_BINASCII = use_binascii
+        enc = rate(lambda: b64encode_into(data, out))
+        dec = rate(lambda: b64decode(encoded))
+        print(f"  mybase64 {name:<9} encode {enc:>7} KB/s  decode {dec:>7} KB/s")
+    mybase64.USE_BINASCII = mybase64._binascii is not None
+    if std_base64:
+        enc = rate(lambda: std_base64.b64encode(data))
+        dec = rate(lambda: std_base64.b64decode(encoded))
+        print(f"  stdlib base64      encode {enc:>7} KB/s  decode {dec:>7} KB/s")
+    print()
+
 # Run test when imported
 test_base64()
+check_round_trips()
+check_streaming()
+benchmark()
@@ -0,0 +1,78 @@
+"""
+Test for the canary alerts (run on a PC or the device)
+Drives the per-channel history with fast, slow and failed runs and checks
+when a channel is reported degraded and recovered, then probes a stand-in
+notifier to check the phase timings and the [CANARY] marking.
+"""
+
+import time
+
+import canary
+import transport
+
+class Config:
+    CANARY_TELEGRAM_CHAT_ID = None
+    CANARY_EMAIL = ["canary@example.com"]
+    CANARY_NTFY_TOPIC = "sump-canary-test"
+
+class FakeNotify:
+    """Records what would be sent; the "network" takes a few ms per phase"""
+
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.sent = []
+
+    def _send(self, channel, **kw):
+        transport.timings.update({"resolve": 5, "connect": 10, "tls": 20})
+        time.sleep(0.05)
+        self.sent.append((channel, kw))
+        return self.ok
+
+    def send_telegram_alert(self, label=None, message=None, chat_id=None):
+        return self._send("telegram", message=message, chat_id=chat_id)
+
+    def send_gmail_alert(self, recipients, label=None, subject=None, message=None):
+        return self._send("gmail", recipients=recipients, subject=subject)
+
+    def send_ntfy_alert(self, label=None, topic=None, title=None, message=None):
+        return self._send("ntfy", topic=topic, title=title)
+
+def test_history():
+    print("Testing canary history and degraded channels...")
+    c = canary.Canary({"tls": 3000, "total": 10000})
+    fast = {"wifi": 100, "tls": 1200, "total": 4000}
+    slow = {"wifi": 100, "tls": 4500, "total": 7000}
+    changes = [c.record("gmail", True, fast) for _ in range(3)]
+    print(f"Healthy runs change nothing: {changes == [None, None, None]}")
+    print(f"One slow run is tolerated: {c.record('gmail', True, slow) is None}")
+    print(f"A failure next makes it degraded: {c.record('gmail', False, {'wifi': 100, 'total': 15000}) == 'degraded'}")
+    print(f"Reported once: {c.record('gmail', False, {'total': 15000}) is None}")
+    print(f"Summary: {c.summary('gmail')}")
+    print(f"Still degraded after one good run: {c.record('gmail', True, fast) is None and c.degraded == ['gmail']}")
+    print(f"Recovered after two: {c.record('gmail', True, fast) == 'recovered' and c.degraded == []}")
+    for _ in range(20):
+        c.record("ntfy", True, fast)
+    print(f"History is bounded: {len(c.history['ntfy']) == canary.HISTORY}")
+    print(f"Other channels unaffected: {c.summary('ntfy')} / {c.summary('telegram')}")
+    print(f"Metrics: {c.metrics()}\n")
+
+def test_probe():
+    print("Testing canary probes...")
+    targets = canary.destinations(Config)
+    print(f"Only channels with a test destination: {sorted(targets) == ['gmail', 'ntfy']}")
+    notify = FakeNotify()
+    ok, phases = canary.probe(notify, "gmail", targets["gmail"], lambda: True, 7)
+    print(f"Sent to the test address, marked: "
+          f"{notify.sent[0][1]['recipients'] == ['canary@example.com'] and notify.sent[0][1]['subject'].startswith('[CANARY]')}")
+    print(f"Phases {phases}")
+    print(f"Exchange is the rest of the send: {ok and phases['tls'] == 20 and 10 <= phases['exchange'] <= 200}")
+    print(f"Total covers every phase: {phases['total'] >= sum(phases[p] for p in ('wifi', 'resolve', 'connect', 'tls', 'exchange'))}")
+    ok, phases = canary.probe(notify, "ntfy", targets["ntfy"], lambda: False)
+    print(f"No WiFi: failed with only the wifi phase: {not ok and sorted(phases) == ['total', 'wifi']}")
+    ok, phases = canary.probe(FakeNotify(ok=False), "ntfy", targets["ntfy"], lambda: True)
+    print(f"Rejected send fails: {not ok}")
+
+# Run test when imported
+test_history()
+test_probe()
+print("\nTest completed")
@@ -0,0 +1,95 @@
+"""
+Test for alarm state checkpoints in RTC memory (run on a PC or the device)
+Simulates resets at each point of a flood: while debouncing, after the
+alarm went out, and in the middle of a failed send, plus a crash loop, a
+corrupted record and a change of sensors.
+"""
+
+import checkpoint as checkpoint_module
+import rtcstore
+from alarm_engine import ACT_NONE, ACT_ALARM, ACT_RETRY, ACT_RESTORE
+from checkpoint import EngineCheckpoint
+from sensors import Sensor
+
+# Virtual clocks: the RTC keeps counting through a reset, ticks_ms restarts
+rtc_ms = [1000000]
+boot_at = [0]
+checkpoint_module.ticks_ms = lambda: rtc_ms[0] - boot_at[0]
+checkpoint_module._seconds = lambda: rtc_ms[0] // 1000
+
+def _at(engine, wet, ms):
+    """Update an engine ms after the last reset"""
+    rtc_ms[0] = boot_at[0] + ms
+    return engine.update(wet, ms)
+
+def _boot(names=("sump", "window_well")):
+    """What a reset does: new engines, resumed from RTC memory"""
+    sensors = [Sensor(i, name, pin=4 + i, debounce_s=15, retry_s=600) for i, name in enumerate(names)]
+    boot_at[0] = rtc_ms[0] + 500  # Half a second to reboot
+    rtc_ms[0] = boot_at[0]
+    checkpoint = EngineCheckpoint(sensors)
+    resumed = checkpoint.restore()
+    checkpoint.attach()
+    return sensors, checkpoint, resumed
+
+def test_checkpoint():
+    print("Testing alarm state checkpoints...")
+    rtcstore.clear("engine")
+    sensors, checkpoint, resumed = _boot()
+    print(f"Nothing to resume on a clean start: {resumed == []}")
+    sump = sensors[0].engine
+    for second in range(10):
+        _at(sump, 1, second * 1000)
+    print(f"Checkpointed once when the water came: {checkpoint.writes == 1}")
+
+    # Reset 10 s into the debounce window
+    sensors, checkpoint, resumed = _boot()
+    sump = sensors[0].engine
+    print(f"Resumed while debouncing: {[s.name for s in resumed] == ['sump']}, "
+          f"{sump.seconds_flooded} s flooded")
+    actions = [_at(sump, 1, ms) for ms in range(0, 7000, 500)]
+    alarm_ms = actions.index(ACT_ALARM) * 500
+    print(f"Alarm {alarm_ms} ms after the reset, the rest of the window: {4000 <= alarm_ms <= 6000}")
+    sump.notified(True)
+
+    # Reset after the alarm went out: siren state back, nothing resent
+    sensors, checkpoint, resumed = _boot()
+    sump = sensors[0].engine
+    print(f"Alarm and sent notification resumed: {sump.alarm_triggered and sump.notification_sent}")
+    print(f"No second alarm: {_at(sump, 1, 1000) == ACT_NONE}")
+
+    # Reset in the middle of a send that never finished
+    sump.notified(False)
+    sensors, checkpoint, resumed = _boot()
+    sump = sensors[0].engine
+    print(f"Unsent alarm retried on the first pass: {_at(sump, 1, 10) == ACT_RETRY}")
+
+    # The retry crashes the board again: back to the normal retry interval
+    sensors, checkpoint, resumed = _boot()
+    sump = sensors[0].engine
+    print(f"Crash loop falls back to the retry interval: {_at(sump, 1, 10) == ACT_NONE} "
+          f"(resumes {checkpoint.resumes})")
+
+    # Water gone while rebooting: the restore still happens
+    action = _at(sump, 0, 2000)
+    print(f"Restore after resume: {action == ACT_RESTORE and sump.last_alarm}")
+    sensors, checkpoint, resumed = _boot()
+    print(f"Dry state checkpointed: {resumed == []}")
+
+    # A torn record or different sensors are ignored
+    _at(sensors[1].engine, 1, 0)
+    image = bytearray(rtcstore._memory().memory())
+    image[rtcstore.REGIONS["engine"][1] + rtcstore.HEADER_LEN + 4] ^= 0xFF
+    rtcstore._memory().memory(image)
+    sensors, checkpoint, resumed = _boot()
+    print(f"Corrupted record ignored: {resumed == []}")
+    _at(sensors[1].engine, 1, 0)
+    sensors, checkpoint, resumed = _boot(("sump", "laundry"))
+    print(f"Other sensors ignore the record: {resumed == []}")
+    print(f"Metrics: {checkpoint.metrics()}\n")
+    rtcstore.clear("engine")
+
+    print("Test completed")
+
+# Run test when imported
+test_checkpoint()
@@ -77,32 +77,40 @@ def run_connection_tests():
         except Exception as e:
             print(f"Failed to connect to {host}:{port}: {e}")
     
-    # HTTPS connection test (port 443)
+    # HTTPS connection test (port 443), with the pins from config
     print("\n3. Testing HTTPS Connection")
     print("-------------------------")
+    import transport
+    transport.configure(pins=config.TLS_PINS, pin_mode="report")
     https_hosts = [
         ("google.com", 443),
         ("api.telegram.org", 443),
+        ("ntfy.sh", 443),
         ("smtp.gmail.com", 465)
     ]
     
     for host, port in https_hosts:
         try:
             print(f"Connecting to {host}:{port}...")
-            s = socket.socket()
+            s, route = transport.connect([(host, port)], timeout_ms=5000)
             s.settimeout(5)
             
-            # Try to establish SSL connection
+            # Establish the SSL connection and check the key against its pins
             print(f"Setting up SSL for {host}:{port}...")
-            import ssl
-            ss = ssl.wrap_socket(s, server_hostname=host)
-            
-            print(f"Connecting to {host}:{port}...")
-            ss.connect((host, port))
-            print(f"Connected to {host}:{port} successfully!")
+            failures = transport.stats["pin_failures"]
+            ss = transport.wrap(s, host)
+            pin = transport.spki_pin(ss.getpeercert(True))
+            if host not in config.TLS_PINS:
+                print(f"Connected to {host}:{port} successfully! (not pinned, key {pin})")
+            elif transport.stats["pin_failures"] == failures:
+                print(f"Connected to {host}:{port} successfully! Key matches its pin")
+            else:
+                print(f"Connected to {host}:{port}, but key {pin} is NOT pinned")
             ss.close()
         except Exception as e:
             print(f"Failed to connect to {host}:{port}: {e}")
+    print(f"Pin checks: {transport.stats['pin_checks']}, "
+          f"{transport.stats['pin_us'] // max(transport.stats['pin_checks'], 1)} us each")
     
     print("\nTest completed!")
     gc.collect()
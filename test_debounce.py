@@ -0,0 +1,61 @@
+"""
+Simple test for the debounce module
+"""
+
+from debounce import make_debouncer
+
+def test_debounce():
+    print("Testing debounce filters...")
+
+    # A single-sample glitch must never flip the state, a solid run must
+    glitch = [0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+    solid = [1] * 30
+    # Chattering float: two wet, one dry, repeated
+    chatter = [1, 1, 0] * 20
+
+    cases = [
+        ("integrator", {"samples": 10}),
+        ("hysteresis", {"rise_samples": 10, "fall_samples": 20}),
+        ("majority", {"window": 15}),
+    ]
+
+    for name, params in cases:
+        results = []
+        for trace, expected in ((glitch, 0), (solid, 1)):
+            filt = make_debouncer(name, **params)
+            for sample in trace:
+                state = filt.update(sample)
+            results.append(state == expected)
+
+        # Once wet, a chattering float must not drop the state
+        filt = make_debouncer(name, **params)
+        for sample in solid:
+            filt.update(sample)
+        drops = 0
+        for sample in chatter:
+            if not filt.update(sample):
+                drops += 1
+        print(f"{name}: glitch ignored {results[0]}, solid detected {results[1]}, "
+              f"chatter drops {drops}")
+        print(f"Match: {results[0] and results[1] and drops == 0}\n")
+
+def test_auto():
+    from sensors import SensorArray
+    print("Testing the automatic filter choice...")
+    word = [0]
+    one = SensorArray([{"name": "sump", "pin": 4}], params={"samples": 10}, reader=lambda: word[0])
+    specs = [{"name": f"s{i}", "pin": i} for i in range(6)]
+    many = SensorArray(specs, params={"samples": 10}, reader=lambda: word[0])
+    print(f"One switch gets an integrator, several share the bank: "
+          f"{one.algorithm == 'integrator' and many.algorithm == 'bank'}")
+    word[0] = 0b101
+    states = []
+    for _ in range(10):
+        many.sample()
+        states.append(many.state)
+    print(f"Bank flips after {{'samples': 10}}: {states[8] == 0 and states[9] == 0b101}\n")
+
+# Run test when imported
+test_debounce()
+test_auto()
+print("Test completed")
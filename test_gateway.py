@@ -0,0 +1,91 @@
+"""
+Simple test for the gateway datagram format (and a loopback run on a PC)
+"""
+
+import sys
+import gateway
+
+KEY = b"test key"
+
+def test_datagrams():
+    print("Testing gateway datagrams...")
+    data = gateway.pack(KEY, gateway.T_ALERT, 0x12345678, 7, gateway.EV_ALARM,
+                        gateway.CH_TELEGRAM | gateway.CH_NTFY, "unit-1", "home", "sump", "Main sump")
+    msg = gateway.unpack(data)
+    print(f"Datagram size: {len(data)} bytes")
+    print(f"Round trip: {msg['unit'] == 'unit-1' and msg['seq'] == 7 and msg['label'] == 'Main sump'}")
+    print(f"MAC verifies: {gateway.verify(KEY, data)}")
+    print(f"Wrong key rejected: {not gateway.verify(b'other key', data)}")
+    tampered = bytearray(data)
+    tampered[gateway.HEADER_LEN + 2] ^= 1
+    print(f"Tampered datagram rejected: {not gateway.verify(KEY, bytes(tampered))}")
+    print(f"Truncated datagram rejected: {gateway.unpack(data[:10]) is None}")
+
+    try:
+        import hmac
+        import hashlib
+        expected = hmac.new(KEY, b"message", hashlib.sha256).digest()
+        print(f"HMAC matches stdlib: {gateway.hmac_sha256(KEY, b'message') == expected}\n")
+    except ImportError:
+        print()
+
+def test_loopback():
+    """Run gateway_server in a thread and talk to it with GatewayClient"""
+    import asyncio
+    import threading
+    import gateway_server
+
+    cfg = {"listen": "127.0.0.1:0", "keys": {"*": KEY.decode()}, "dedupe_window_s": 300}
+    ready = threading.Event()
+    state = {"sent": []}
+
+    async def fake_ntfy(msg):
+        """Takes 300 ms; alerts for the "broken" sensor never get through"""
+        await asyncio.sleep(0.3)
+        state["sent"].append(msg["sensor"])
+        return msg["sensor"] != "broken"
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        state["loop"] = loop
+        gw, transport, tasks = loop.run_until_complete(gateway_server.serve(cfg, workers=2))
+        gw.channels = {gateway.CH_NTFY: ("ntfy", fake_ntfy)}
+        gw.retries = 1
+        state["gw"] = gw
+        state["port"] = transport.get_extra_info("sockname")[1]
+        ready.set()
+        loop.run_forever()
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        transport.close()
+        loop.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    ready.wait(5)
+    port = state["port"]
+
+    print("Testing gateway loopback...")
+    unit1 = gateway.GatewayClient("127.0.0.1", KEY, "unit-1", "home", port=port)
+    unit2 = gateway.GatewayClient("127.0.0.1", KEY, "unit-2", "home", port=port)
+    print(f"Alert acknowledged: {unit1.send_alert(gateway.EV_ALARM, 'sump', 'Main sump')}"
+          f" in {unit1.last_rtt_ms} ms ({unit1.last_attempts} sends)")
+    print(f"Acked only after delivery: {unit1.last_rtt_ms >= 300 and state['sent'] == ['sump']}")
+    print(f"Second unit, same site acknowledged: {unit2.send_alert(gateway.EV_ALARM, 'sump')}")
+    broken = gateway.GatewayClient("127.0.0.1", KEY, "unit-1", "home", port=port, deadline_ms=2500)
+    print(f"No ack when every channel fails: {not broken.send_alert(gateway.EV_ALARM, 'broken')}")
+    bad = gateway.GatewayClient("127.0.0.1", b"wrong key", "unit-3", port=port, deadline_ms=300)
+    print(f"Wrong key gets no ack: {not bad.send_alert(gateway.EV_ALARM, 'sump')}")
+
+    stats = state["gw"].stats
+    print(f"Sump fanned out once, one site duplicate, one undelivered, bad key rejected: "
+          f"{state['sent'].count('sump') == 1 and stats['duplicates'] == 1 and stats['undelivered'] >= 1 and stats['rejected'] >= 1}")
+    state["loop"].call_soon_threadsafe(state["loop"].stop)
+    thread.join(5)
+    print()
+
+test_datagrams()
+if sys.implementation.name == "cpython":
+    test_loopback()
+print("Test completed")
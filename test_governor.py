@@ -0,0 +1,123 @@
+"""
+Simple test for the alert governor (rate limits, flapping, restores, RTC state)
+"""
+
+import rtcstore
+from governor import AlertGovernor, MSG_FLAPPING, MSG_SETTLED, MSG_RESTORE
+
+LIMITS = {"telegram": (2, 60), "gmail": (1, 600)}
+
+def make(now):
+    return AlertGovernor(["sump", "pit2"], limits=LIMITS, flap_window_s=600, flap_alarms=3,
+                         digest_s=300, restore="batch", restore_batch_s=60, now=now)
+
+def test_governor():
+    print("Testing alert governor...")
+    rtcstore.clear("governor")
+    t = 1000000
+    gov = make(t)
+
+    # Token buckets: burst of 2, then one token per minute
+    sent = [gov.take("telegram", t) for _ in range(3)]
+    print(f"Telegram burst then limited: {sent == [True, True, False]}")
+    print(f"Refilled after a minute: {gov.take('telegram', t + 60000)}")
+    print(f"Unlimited channel always allowed: {gov.take('ntfy', t)}\n")
+
+    # Restores within the batch window share one message
+    print(f"First alarm sent: {gov.on_alarm('sump', t)}")
+    gov.on_restore("sump", True, t + 20000)
+    gov.on_alarm("pit2", t + 25000)
+    gov.on_restore("pit2", True, t + 40000)
+    print(f"Restore held for the batch: {gov.poll(t + 50000) is None}")
+    msg = gov.poll(t + 80000)
+    print(f"One message for both restores: {msg is not None and msg[0] == MSG_RESTORE and msg[1] == [0, 1]}")
+    print(f"  {gov.describe(msg)[0]}")
+    gov.done(msg, True, t + 80000)
+    print(f"Nothing left to send: {gov.poll(t + 90000) is None}\n")
+
+    # Third alarm inside the window starts a digest instead of a message
+    t += 100000
+    print(f"Second alarm in window sent: {gov.on_alarm('sump', t)}")
+    gov.on_restore("sump", True, t + 10000)
+    print(f"Restore cancelled by the next alarm: {not gov.on_alarm('sump', t + 20000)}")
+    msg = gov.poll(t + 20000)
+    print(f"Flapping digest due: {msg is not None and msg[0] == MSG_FLAPPING}")
+    gov.done(msg, True, t + 20000)
+    for k in range(4):
+        gov.on_restore("sump", True, t + 30000 + k * 20000)
+        print(f"Alarm {k + 4} suppressed: {not gov.on_alarm('sump', t + 40000 + k * 20000)}")
+    gov.on_restore("sump", True, t + 120000)
+    print(f"No restore message while flapping: {gov.poll(t + 200000) is None}")
+    msg = gov.poll(t + 20000 + 300000)
+    print(f"Next digest after digest_s: {msg[0] == MSG_FLAPPING}, alarms {msg[2]}, restores {msg[3]}")
+    print(f"  {gov.describe(msg)[1]}")
+    gov.done(msg, True, t + 320000)
+
+    # State survives a soft reset (a new governor reading RTC memory)
+    booted = make(t + 330000)
+    print(f"State restored after reset: {booted.restored and booted.metrics()['flapping'] == ['sump']}")
+    print(f"Tokens restored: {booted.tokens == gov.tokens}")
+    msg = None
+    last = booted.last_alarm[0]
+    for minute in range(1, 30):
+        now = last + minute * 60000
+        msg = booted.poll(now)
+        if msg and msg[0] == MSG_SETTLED:
+            break
+    print(f"Settled once quiet for the flap window: {msg is not None and msg[0] == MSG_SETTLED}")
+    booted.done(msg, True, now)
+    print(f"Flapping cleared: {booted.metrics()['flapping'] == []}")
+
+    other = AlertGovernor(["sump"], limits=LIMITS, now=t)
+    print(f"Reconfigured sensors ignore old state: {not other.restored}\n")
+    rtcstore.clear("governor")
+
+def test_wrap():
+    """MicroPython ticks wrap after 2^30 ms; ticks_diff holds for half of that"""
+    import governor
+    period = 1 << 30
+
+    def ticks_diff(a, b):
+        return ((a - b + period // 2) & (period - 1)) - period // 2
+
+    def ticks_add(a, b):
+        return (a + b) & (period - 1)
+
+    print("Testing the governor across a ticks wrap...")
+    host = governor.ticks_diff, governor.ticks_add
+    governor.ticks_diff, governor.ticks_add = ticks_diff, ticks_add
+    try:
+        t = 5000
+        gov = AlertGovernor(["sump"], flap_window_s=1800, flap_alarms=3, persist=False, now=t)
+        gov.on_alarm("sump", t)
+        gov.on_alarm("sump", ticks_add(t, 600000))
+        for minute in range(7 * 24 * 60):  # The main loop polls every pass
+            gov.poll(ticks_add(t, minute * 60000))
+        later = ticks_add(t, 7 * 86400 * 1000)
+        print(f"Stamps dropped after the flap window: {gov.window[0] is None and gov.last_alarm[0] is None}")
+        print(f"Alarm 7 days later is sent, not flapping: "
+              f"{gov.on_alarm('sump', later) and gov.metrics()['flapping'] == []}")
+
+        # A bucket drained by one flood refills, however long the quiet spell
+        gov = AlertGovernor(["sump"], limits={"gmail": (3, 600)}, persist=False, now=t)
+        drained = [gov.take("gmail", t) for _ in range(4)]
+        sent = []
+        for minute in range(1, 13 * 24 * 60):
+            now = ticks_add(t, minute * 60000)
+            gov.poll(now)
+            if minute in (7 * 1440, 9 * 1440, 11 * 1440):  # Days 7, 9 and 11
+                sent.append(gov.take("gmail", now))
+        print(f"Drained gmail bucket refills past the ticks range: "
+              f"{drained == [True, True, True, False] and sent == [True, True, True]}")
+        gov = AlertGovernor(["sump"], limits={"gmail": (3, 600)}, persist=False, now=t)
+        for _ in range(3):
+            gov.take("gmail", t)
+        print(f"Out-of-range stamp counts as a full refill: "
+              f"{all(gov.take('gmail', ticks_add(t, days * 86400000)) for days in (7, 9, 11))}\n")
+    finally:
+        governor.ticks_diff, governor.ticks_add = host
+
+# Run test when imported
+test_governor()
+test_wrap()
+print("Test completed")
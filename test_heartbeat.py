@@ -0,0 +1,114 @@
+"""
+Test for the heartbeat (dead man's switch)
+Checks the beat datagram and status word and, on a PC, runs
+heartbeat_monitor.py in a thread: beats at a 1 s period, a lost beat, a
+unit that goes silent and comes back, a reboot, a forged beat and an HTTP
+ping. Prints the jitter the monitor measured.
+"""
+
+import sys
+import time
+
+import heartbeat
+
+KEY = b"test key"
+
+def test_datagram():
+    print("Testing heartbeat datagrams...")
+    word = heartbeat.status_word(wet=0b01, alarms=0b01, silenced=True, clock=True, reset_cause=3)
+    data = heartbeat.pack(KEY, 0xCAFEF00D, 42, 86400, word, 123456, 17, 300, "unit-1")
+    msg = heartbeat.unpack(data)
+    print(f"Datagram size: {len(data)} bytes")
+    print(f"Round trip: {msg['seq'] == 42 and msg['unit'] == 'unit-1' and msg['word'] == word}")
+    print(f"Heap rounded to {heartbeat.HEAP_UNIT} bytes: {msg['heap_free'] == 123456 // 64 * 64}")
+    print(f"Status: {heartbeat.describe(word)}")
+    print(f"MAC verifies: {heartbeat.verify(KEY, data)}")
+    print(f"Wrong key rejected: {not heartbeat.verify(b'other key', data)}")
+    tampered = bytearray(data)
+    tampered[10] ^= 1
+    print(f"Tampered beat rejected: {not heartbeat.verify(KEY, bytes(tampered))}")
+    print(f"Truncated beat rejected: {heartbeat.unpack(data[:12]) is None}\n")
+
+def test_monitor():
+    import asyncio
+    import socket
+    import threading
+    import heartbeat_monitor
+
+    alerts = []
+    monitor = heartbeat_monitor.Monitor({"unit-1": KEY.decode()}, grace=2.5,
+                                        on_alert=lambda unit, silent, text: alerts.append((unit, silent)))
+    ready = threading.Event()
+    state = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        state["loop"] = loop
+        endpoints, tasks = loop.run_until_complete(heartbeat_monitor.serve(
+            monitor, "127.0.0.1:0", "127.0.0.1:0", check_s=0.1))
+        state["udp"] = endpoints[0].get_extra_info("sockname")[1]
+        state["http"] = endpoints[1].sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        for endpoint in endpoints:
+            endpoint.close()
+        loop.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    ready.wait(5)
+
+    def run(beat, seconds):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            beat.step()
+            time.sleep(0.001 if beat.busy else 0.01)
+
+    print("Testing the monitor with 1 s beats...")
+    url = f"udp://127.0.0.1:{state['udp']}"
+    status = lambda: heartbeat.status_word(clock=True)
+    beat = heartbeat.Heartbeat(url, "unit-1", KEY, status, period_s=1, wifi=False)
+    run(beat, 3.5)
+    beat.seq += 1  # As if the next datagram were lost on the way
+    run(beat, 2.2)
+    unit = monitor.units["unit-1"]
+    print(f"Beats received {unit.beats}, sent {beat.sent}: {unit.beats == beat.sent}")
+    print(f"Lost beat counted: {unit.lost == 1}")
+    mean, p95, worst = unit.jitter()
+    print(f"Jitter mean {mean:.1f} ms, p95 {p95:.1f} ms, max {worst:.1f} ms: {p95 < 100}")
+    print(f"No alert while beating: {not alerts}")
+
+    time.sleep(3)  # The unit goes quiet
+    print(f"Silent unit alerted: {alerts == [('unit-1', True)]}")
+    run(beat, 0.2)
+    time.sleep(0.2)
+    print(f"Recovery reported: {alerts[-1] == ('unit-1', False)}")
+
+    rebooted = heartbeat.Heartbeat(url, "unit-1", KEY, status, period_s=1, wifi=False)
+    run(rebooted, 0.2)
+    time.sleep(0.1)
+    print(f"Reboot noticed from the new session: {unit.reboots == 1}")
+
+    forged = heartbeat.pack(b"wrong key", 1, 1, 1, 0, 0, 0, 1, "unit-1")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.sendto(forged, ("127.0.0.1", state["udp"]))
+    sock.close()
+    time.sleep(0.1)
+    print(f"Forged beat rejected: {monitor.rejected == 1}")
+
+    http = heartbeat.Heartbeat(f"http://127.0.0.1:{state['http']}/ping", "unit-2", KEY,
+                               status, period_s=60, wifi=False)
+    run(http, 0.5)
+    print(f"HTTP ping accepted: {http.sent == 1 and 'unit-2' in monitor.units}")
+    print(monitor.summary())
+    print(f"Metrics: {beat.metrics()}\n")
+    state["loop"].call_soon_threadsafe(state["loop"].stop)
+    thread.join(5)
+
+test_datagram()
+if sys.implementation.name == "cpython":
+    test_monitor()
+print("Test completed")
@@ -0,0 +1,190 @@
+"""
+Test for over-the-air updates against a local HTTP server (run on a PC)
+Covers an interrupted and resumed download, the trial boot, rollback on a
+failed self-test or too many unconfirmed boots, and confirmation. Reports
+download throughput and the peak Python heap while updating.
+"""
+
+import sys
+
+def test_ota():
+    import http.server
+    import json
+    import os
+    import shutil
+    import tempfile
+    import threading
+    import time
+    import tracemalloc
+
+    import ota
+    from build_mpy import DEVICE_MODULES
+    from make_ota import build_bundle
+
+    print("Testing OTA updates...")
+    here = os.path.dirname(os.path.abspath(__file__))
+    site = tempfile.mkdtemp(prefix="ota_site_")
+    device = tempfile.mkdtemp(prefix="ota_device_")
+    drop_after = {}  # bundle name -> bytes to send before dropping the connection
+    served = {"bytes": 0, "ranges": 0}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """Static files with Range support and a simulated dropped connection"""
+
+        def do_GET(self):
+            path = os.path.join(site, self.path.lstrip("/"))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            size = os.path.getsize(path)
+            start = 0
+            rng = self.headers.get("Range")
+            if rng:
+                start = int(rng.split("=")[1].split("-")[0])
+                served["ranges"] += 1
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(size - start))
+            self.end_headers()
+            # Stream in chunks so the server adds little to the measured heap
+            left = drop_after.pop(os.path.basename(path), size - start)
+            with open(path, "rb") as f:
+                f.seek(start)
+                while left:
+                    chunk = f.read(min(4096, left))
+                    self.wfile.write(chunk)
+                    left -= len(chunk)
+                    if path.endswith(".bin"):
+                        served["bytes"] += len(chunk)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/manifest.json"
+    cwd = os.getcwd()
+
+    def make_version(version, body, extra_bytes=0):
+        """Bundle every device module plus a main.py marked with the version"""
+        src = os.path.join(site, "src")
+        os.makedirs(src, exist_ok=True)
+        paths = [os.path.join(here, m) for m in DEVICE_MODULES]
+        main = os.path.join(src, "main.py")
+        with open(main, "w") as f:
+            f.write(f"# {body}\nVERSION = {version!r}\n")
+        if extra_bytes:
+            # Incompressible payload to show the heap does not grow with the bundle
+            paths.append(os.path.join(src, "extra.bin"))
+            with open(paths[-1], "wb") as f:
+                f.write(os.urandom(extra_bytes))
+        manifest, raw = build_bundle(paths + [main], version, site, key="ota test key")
+        return manifest, raw
+
+    def device_main():
+        with open("main.py") as f:
+            return f.readline().strip()
+
+    try:
+        os.chdir(device)
+        with open("main.py", "w") as f:
+            f.write("# factory\n")
+
+        # Interrupted download, then resumed with a Range request
+        manifest, raw = make_version("2.0", "version 2.0")
+        print(f"Bundle: {len(manifest['files'])} files, {raw} -> {manifest['size']} bytes")
+        drop_after[manifest["bundle"]] = manifest["size"] // 3
+        try:
+            ota.check_and_update(url, "ota test key")
+            print("Interrupted download detected: False")
+        except ota.OTAError as e:
+            print(f"Interrupted download detected: True ({e})")
+        part = os.path.getsize(ota.PART_FILE)
+        served["bytes"] = 0
+        installed = ota.check_and_update(url, "ota test key")
+        resumed = served["ranges"] == 1 and served["bytes"] == manifest["size"] - part
+        print(f"Resumed from byte {part}, fetched only the rest: {resumed}")
+        print(f"Installed: {installed}, main.py is new: {device_main() == '# version 2.0'}")
+
+        # Trial boot, then the self-test fails
+        print(f"Trial boot: {ota.boot_check()}")
+        ota.rollback("self-test failed")
+        print(f"Rolled back to factory: {device_main() == '# factory'}")
+        print(f"Rejected version not reinstalled: {not ota.check_and_update(url, 'ota test key')}")
+
+        # Wrong key refused
+        try:
+            ota.fetch_manifest(url, "wrong key")
+            print("Bad signature refused: False")
+        except ota.OTAError:
+            print("Bad signature refused: True")
+
+        # No key, or a file hash changed after signing, is refused too
+        try:
+            ota.fetch_manifest(url, None)
+            print("Unsigned update refused without OTA_KEY: False")
+        except ota.OTAError:
+            print("Unsigned update refused without OTA_KEY: True")
+        with open(os.path.join(site, "manifest.json")) as f:
+            tampered = json.load(f)
+        tampered["files"]["main.py"] = "0" * 64
+        with open(os.path.join(site, "manifest.json"), "w") as f:
+            json.dump(tampered, f)
+        try:
+            ota.fetch_manifest(url, "ota test key")
+            print("Changed file hash breaks the signature: False")
+        except ota.OTAError:
+            print("Changed file hash breaks the signature: True")
+
+        # A version that never gets confirmed is rolled back by boot.py
+        make_version("2.1", "version 2.1")
+        ota.check_and_update(url, "ota test key")
+        trials = [ota.boot_check() for _ in range(ota.MAX_TRIAL_BOOTS + 1)]
+        print(f"Unconfirmed version rolled back after {ota.MAX_TRIAL_BOOTS} boots: "
+              f"{trials[-1] is False and device_main() == '# factory'}")
+
+        # Power cut right after the journal was written: finished on the next boot
+        manifest, raw = make_version("2.2", "version 2.2")
+        ota.download(ota.bundle_url(url, manifest), manifest)
+        names = ota.unpack(manifest)
+        state = ota.load_state()
+        state.update({"state": "apply", "files": names, "previous": state.get("version"),
+                      "version": "2.2"})
+        ota._save_state(state)
+        print(f"Interrupted swap finished at boot: {ota.boot_check() and device_main() == '# version 2.2'}")
+        print(f"Confirmed: {ota.confirm()}, old files dropped: {not os.path.exists(ota.OLD_DIR)}")
+
+        # Throughput and peak heap for a full update, small and large bundle.
+        # The heap is the host's (including the server thread), so the check
+        # is that it stays flat as the bundle grows.
+        peaks = []
+        for version, extra in (("2.3", 0), ("2.4", 512 * 1024)):
+            manifest, raw = make_version(version, f"version {version}", extra)
+            tracemalloc.start()
+            start = time.perf_counter()
+            ota.check_and_update(url, "ota test key")
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            ota.confirm()
+            peaks.append(peak)
+            print(f"Update {version}: {manifest['size']} bytes ({raw} unpacked) in {elapsed * 1000:.0f} ms, "
+                  f"{manifest['size'] / elapsed / 1024:.0f} KB/s; peak Python heap {peak} bytes")
+        print(f"Heap flat while the bundle grew {512 * 1024 // 1024} KB: "
+              f"{peaks[1] - peaks[0] < 16 * 1024}, bundle never held in RAM: {peaks[1] < manifest['size']}\n")
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(site, ignore_errors=True)
+        shutil.rmtree(device, ignore_errors=True)
+
+    print("Test completed")
+
+# Run test when imported (needs a PC: it starts an HTTP server)
+if sys.implementation.name == "cpython":
+    test_ota()
+else:
+    print("test_ota runs on a PC: python test_ota.py")
@@ -0,0 +1,128 @@
+"""
+Test for the streamed email report (run on a PC or the device)
+Sends a report with its compressed event log through a fake socket that
+accepts only a few bytes per send(), then checks the dot-stuffing and,
+on a PC, parses the MIME message, unpacks the attachment and checks that
+peak memory does not grow with the length of the log.
+"""
+
+import os
+import sys
+
+import report
+from email_sender import DataWriter, write_message
+
+class ShortSocket:
+    """Takes at most a few bytes per send(), like a full TCP window"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.sends = 0
+        self.largest = 0
+
+    def send(self, data):
+        self.sends += 1
+        self.largest = max(self.largest, len(data))
+        n = min(len(data), 1 + self.sends % 97)
+        self.data += bytes(data[:n])
+        return n
+
+def _write_log(path, events):
+    with open(path, "w") as f:
+        for i in range(events):
+            wall = 1761941002500 + i * 60000
+            name = ("sump", "window_well")[i % 2]
+            if i % 3 == 0:
+                f.write(f"{i * 60000}@{wall},alarm,{name}\n")
+            else:
+                f.write(f"{i * 60000}@{wall},restore,{name} s={i % 50} alarm={i % 3 // 2}\n")
+
+class NullSocket:
+    """Counts what is sent and keeps none of it"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, data):
+        self.sent += len(data)
+        return len(data)
+
+def _send(paths, stats, sock=None):
+    sock = sock or ShortSocket()
+    out = DataWriter(sock)
+    subject, message, attachments = report.report(
+        3650, {"sump": "Main sump"}, paths=paths, stats=stats)
+    write_message(out, "alarm@example.com", ["you@example.com"], subject,
+                  message + "\n.\n..leading dots are stuffed", attachments)
+    out.finish()
+    return sock, out, subject, message
+
+def test_stuffing():
+    print("Testing dot-stuffing across chunks...")
+    sock = ShortSocket()
+    out = DataWriter(sock, chunk=16)
+    for piece in (b"line one\r\n", b".", b"starts with a dot\r\nx\r\n.", b"\r\n", b"end"):
+        out.write(piece)
+    out.finish()
+    expected = b"line one\r\n..starts with a dot\r\nx\r\n..\r\nend\r\n.\r\n"
+    print(f"Stuffed and terminated: {bytes(sock.data) == expected}")
+    print(f"Partial sends retried ({sock.sends} sends), never more than the "
+          f"buffer at once: {sock.largest <= 16}\n")
+
+def test_report():
+    print("Testing the weekly report...")
+    path = "report_test.log"
+    _write_log(path, 300)
+    stats = {}
+    try:
+        sock, out, subject, message = _send((path,), stats)
+    finally:
+        os.remove(path)
+    data = bytes(sock.data)
+    print(f"Subject: {subject}")
+    print(message)
+    print(f"Message {len(data)} bytes in {sock.sends} partial sends, "
+          f"CSV {stats['csv_bytes']} bytes compressed to {stats['gzip_bytes']}")
+    ends = data.endswith(b"\r\n.\r\n")
+    print(f"Ends with the terminator: {ends}")
+    lines = data[:-5].split(b"\r\n")
+    print(f"Every dot line stuffed: {all(not l.startswith(b'.') or l.startswith(b'..') for l in lines)}")
+
+    if sys.implementation.name != "cpython":
+        return
+    import email
+    import gzip
+    body = b"\r\n".join(l[1:] if l.startswith(b".") else l for l in lines)
+    msg = email.message_from_bytes(body)
+    parts = msg.get_payload()
+    text = parts[0].get_payload()
+    csv = gzip.decompress(parts[1].get_payload(decode=True)).decode()
+    rows = csv.splitlines()
+    print(f"Multipart with the text and {parts[1].get_filename()}: {msg.is_multipart()}")
+    restored = "\r\n.\r\n..leading" in text
+    print(f"Dots restored in the text: {restored}")
+    print(f"Attachment has every event: {len(rows) == 301 and rows[2].startswith('2025-10-31T20:04:22.500Z,60,restore,window_well,s=1')}")
+
+def test_flat_memory():
+    import tracemalloc
+    print("\nTesting peak memory against the length of the log...")
+    peaks = []
+    for events in (500, 5000):
+        path = "report_test.log"
+        _write_log(path, events)
+        try:
+            tracemalloc.start()
+            _send((path,), {}, NullSocket())
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        finally:
+            os.remove(path)
+    print(f"Peak {peaks[0]} bytes for 500 events, {peaks[1]} for 5000: "
+          f"{peaks[1] < peaks[0] * 1.5}")
+
+# Run test when imported
+test_stuffing()
+test_report()
+if sys.implementation.name == "cpython":
+    test_flat_memory()
+print("\nTest completed")
@@ -0,0 +1,39 @@
+"""
+Simple test for the adaptive sampler (mode changes, intervals, metrics)
+"""
+
+from sampler import AdaptiveSampler
+
+def test_sampler():
+    print("Testing adaptive sampler...")
+    s = AdaptiveSampler(fast_ms=100, normal_ms=1000, idle_ms=2000, idle_after_s=600, fast_hold_s=30)
+    t = 1000000
+
+    # Dry pit polls at the normal rate until it has been stable for a while
+    print(f"Starts at the normal interval: {s.update(0, t) == 1000}")
+    print(f"Still normal before idle_after: {s.update(0, t + 599000) == 1000}")
+    print(f"Idle after a long dry spell: {s.update(0, t + 600000) == 2000}\n")
+
+    # First wet reading switches straight to fast sampling
+    t += 600000
+    print(f"Fast on the first wet reading: {s.update(1, t + 1000) == 100 and s.fast}")
+    print(f"Fast held after going dry: {s.update(0, t + 2000) == 100}")
+    print(f"Still fast inside fast_hold: {s.update(0, t + 30000) == 100}")
+    print(f"Normal once fast_hold expires: {s.update(0, t + 31001) == 1000}")
+    print(f"Active alarm keeps it fast: {s.update(0, t + 32000, alarm=True) == 100}\n")
+
+    # Metrics count wake-ups, burst samples, busy time and time per mode
+    s.add_samples(10)
+    s.add_busy(2500)
+    m = s.metrics()
+    print(f"Mode reported: {m['mode'] == 'fast'}")
+    print(f"Wake-ups counted: {m['wakeups'] == 8}")
+    print(f"Burst samples counted: {m['samples'] == 18}")
+    print(f"Busy time in ms: {m['busy_ms'] == 2}")
+    print(f"Mode changes counted: {m['mode_changes'] == 4}")
+    print(f"Time per mode recorded: {(m['fast_s'], m['normal_s']) == (30, 600)}")
+    print(f"Idle time recorded: {m['idle_s'] == 1}")
+
+# Run test when imported
+test_sampler()
+print("Test completed")
@@ -0,0 +1,125 @@
+"""
+Test for the configuration subsystem (run on a PC or the device)
+Compiles config_template.py, reloads from config.bin, rejects bad values
+without changing anything, and hot-applies edits and remote /set changes.
+Reports how long each form takes to load.
+"""
+
+import os
+import sys
+
+import settings
+from compat import ticks_us, ticks_diff
+
+def _write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+def _boot():
+    """What a reset does: forget the namespace, then load again"""
+    settings.config = settings.Config()
+    settings._listeners.clear()
+    return settings.load()
+
+def test_settings():
+    print("Testing settings...")
+    here = os.path.dirname(os.path.abspath(__file__)) if hasattr(os, "path") else "."
+    with open(here + "/config_template.py") as f:
+        template = f.read().replace('"YOUR_CHAT_ID"', '"123456789"')
+    previous = sys.modules.get("config")
+    cwd = os.getcwd()
+    work = "settings_test"
+    try:
+        os.mkdir(work)
+    except OSError:
+        pass
+    os.chdir(work)
+    try:
+        _write("config.py", template)
+        config = _boot()
+        print(f"Compiled: {os.stat('config.bin')[6]} bytes for {len(settings.NAMES)} settings "
+              f"(config.py is {len(template)} bytes)")
+        print(f"Installed as the config module: {sys.modules['config'] is config}")
+        print(f"Defaults filled in: {config.DEBOUNCE_SECONDS == 15 and config.OTA_URL is None}")
+
+        # Load time: exec of config.py versus decoding config.bin
+        with open("config.bin", "rb") as f:
+            data = f.read()
+        start = ticks_us()
+        settings.validate(settings._run_source(template.encode()))
+        source_us = ticks_diff(ticks_us(), start)
+        start = ticks_us()
+        values, _ = settings.decode(data)
+        binary_us = ticks_diff(ticks_us(), start)
+        print(f"Load config.py {source_us} us, config.bin {binary_us} us")
+        print(f"Round trip exact: {values == settings.current()}")
+        config = _boot()
+        print(f"Next boot uses config.bin: {config.ALERT_RATE_LIMITS == values['ALERT_RATE_LIMITS']}")
+
+        # Everything wrong is reported at once and nothing changes
+        changes = []
+        settings.on_change(changes.append)
+        try:
+            settings.apply({"DEBOUNCE_SECONDS": 0, "RESTORE_NOTIFY": "never", "EMAIL_RECIPIENTS": ["bob"]})
+            print("Bad values rejected: False")
+        except settings.ConfigError as e:
+            print(f"Bad values rejected: {len(e.errors) == 3} ({e})")
+        try:
+            settings.apply({"OTA_URL": "http://192.168.1.10:8000/manifest.json"})
+            print("OTA_URL without OTA_KEY rejected: False")
+        except settings.ConfigError as e:
+            print(f"OTA_URL without OTA_KEY rejected: True ({e})")
+        with open("config.bin", "rb") as f:
+            unchanged = f.read() == data
+        print(f"Nothing changed: {config.DEBOUNCE_SECONDS == 15 and not changes and unchanged}")
+
+        # A remote change is applied live and survives a reset
+        live, later = settings.apply({"DEBOUNCE_SECONDS": 20, "ACCEL": True})
+        print(f"Applied live {live}, after reset {later}: "
+              f"{live == ['DEBOUNCE_SECONDS'] and later == ['ACCEL'] and changes == [live]}")
+        config = _boot()
+        print(f"Kept across a reset: {config.DEBOUNCE_SECONDS == 20}")
+
+        # A new config.py is noticed with one stat and wins over remote changes
+        print(f"Unchanged config.py not reloaded: {not settings.source_changed()}")
+        _write("config.py", template.replace('NTFY_TOPIC = "your_unique_topic"', 'NTFY_TOPIC = "new_topic"'))
+        noticed = settings.source_changed()
+        live, later = settings.reload()
+        print(f"Edited config.py noticed: {noticed}, applied {live}, after reset {later}")
+        print(f"New topic live: {config.NTFY_TOPIC == 'new_topic' and config.DEBOUNCE_SECONDS == 15}")
+
+        # A typo in config.py never leaves the unit without a configuration
+        _write("config.py", template + "\nSAMPLER_FAST_MS = 'fast'\n")
+        config = _boot()
+        print(f"Bad config.py at boot keeps the last good settings: {config.SAMPLER_FAST_MS == 100}")
+        os.remove("config.bin")
+        config = _boot()
+        print(f"First boot with a bad config.py still runs: "
+              f"{config.WIFI_SSID == 'YOUR_WIFI_SSID' and config.DEBOUNCE_SECONDS == 15}")
+        _write("config.py", template + "\nDEBOUNCE_SECONDS = (\n")
+        try:
+            settings.reload()
+            print("Syntax error rejected: False")
+        except settings.ConfigError as e:
+            print(f"Syntax error rejected: True ({e})")
+
+        print(f"Secrets hidden: {settings.show('GMAIL_APP_PASSWORD') == '(set)'}")
+        print(f"Parsed from /set: {[settings.parse(n, t) for n, t in (('DEBOUNCE_SECONDS', '25'), ('ACCEL', 'on'), ('EMAIL_RECIPIENTS', 'a@b.c, d@e.f'))]}")
+        print(f"Metrics: {settings.metrics()}\n")
+    finally:
+        for name in ("config.py", "config.bin", "config.bin.tmp"):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+        os.chdir(cwd)
+        os.rmdir(work)
+        if previous is not None:
+            sys.modules["config"] = previous
+        else:
+            sys.modules.pop("config", None)
+
+    print("Test completed")
+
+# Run test when imported
+test_settings()
@@ -0,0 +1,159 @@
+"""
+Test for the Telegram command poller
+Feeds a getUpdates response to the scanner split at every byte boundary,
+then (on a PC) runs the poller against a local stand-in for the Bot API:
+old updates skipped at boot, commands answered, other chats ignored, the
+offset kept across a restart, and no step() call blocking.
+"""
+
+import sys
+
+import rtcstore
+from telegram_bot import UpdateScanner, TelegramPoller, parse_duration
+
+RESPONSE = (b'{"ok":true,"result":[{"update_id":901,"message":{"message_id":5,'
+            b'"from":{"id":42,"is_bot":false,"first_name":"Rob","text":"not this"},'
+            b'"chat":{"id":42,"type":"private"},"date":1700000000,"text":"/silence 30m"}},'
+            b'{"update_id":902,"message":{"chat":{"id":-7,"title":"x"},"text":"say \\"hi\\"\\n\\u00e9",'
+            b'"entities":[{"offset":0,"length":5,"type":"bot_command"}]}},'
+            b'{"update_id":903,"edited_message":{"chat":{"id":42},"text":"/old"}}]}')
+EXPECTED = [(901, 42, b"/silence 30m"), (902, -7, b'say "hi" ?'), (903, None, None)]
+
+def test_scanner():
+    print("Testing the update scanner...")
+    got = []
+    scanner = UpdateScanner(lambda *u: got.append(u))
+    scanner.feed(RESPONSE)
+    print(f"Whole response: {got == EXPECTED} {got}")
+    print(f"ok flag: {scanner.ok}")
+    splits_ok = True
+    for cut in range(1, len(RESPONSE)):
+        got = []
+        scanner.reset()
+        scanner.feed(RESPONSE[:cut])
+        scanner.feed(RESPONSE[cut:])
+        splits_ok = splits_ok and got == EXPECTED
+    print(f"Same result at all {len(RESPONSE) - 1} split points: {splits_ok}")
+    got = []
+    scanner.reset()
+    scanner.feed(b'{"ok":true,"result":[{"update_id":1,"message":{"chat":{"id":1},"text":"'
+                 + b"x" * 500 + b'"}}]}')
+    print(f"Long text truncated to {len(got[0][2])} bytes: {len(got[0][2]) == len(scanner.text)}")
+    got = []
+    scanner.reset()
+    scanner.feed(b'{"ok":false,"error_code":401,"description":"Unauthorized"}')
+    print(f"Error response: ok={scanner.ok}, updates={got}")
+    print(f"Durations: {[parse_duration(a) for a in ('30m', '2h', '90s', '45', '', 'soon')]}\n")
+
+def test_poller():
+    import http.server
+    import json
+    import socket
+    import threading
+    import time
+    import urllib.parse
+
+    print("Testing the poller against a local stand-in...")
+    pending = []  # Updates the stand-in will hand out
+    sent = []     # Messages the bot sent
+    offsets = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            if url.path.endswith("/getUpdates"):
+                offset = int(query["offset"])
+                offsets.append(offset)
+                if offset == -1:
+                    result = pending[-1:]
+                else:
+                    result = [u for u in pending if u["update_id"] >= offset]
+                result = result[:int(query["limit"])]
+                body = json.dumps({"ok": True, "result": result}).encode()
+            elif url.path.endswith("/sendMessage"):
+                sent.append((query["chat_id"], query["text"]))
+                body = b'{"ok":true,"result":{"message_id":1}}'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            # Dribble the body out so the poller sees many partial reads
+            for i in range(0, len(body), 100):
+                self.wfile.write(body[i:i + 100])
+                self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    def update(update_id, chat_id, text):
+        return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    commands = []
+
+    def handler(command, arg):
+        commands.append((command, arg))
+        return f"done {command} {arg}"
+
+    def run(poller, seconds):
+        """Step like the main loop does: often while busy, else every 100 ms"""
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            poller.step()
+            time.sleep(0.001 if poller.busy else 0.1)
+
+    try:
+        rtcstore.clear("telegram")
+        pending.append(update(10, 42, "/silence 5m"))  # Sent before the unit booted
+        bot = TelegramPoller("TOKEN", 42, handler, period_s=1, host="127.0.0.1",
+                             port=port, tls=False, wifi=False)
+        run(bot, 0.5)
+        print(f"Boot: learned offset {bot.offset} without running old commands: "
+              f"{bot.offset == 11 and not commands}")
+
+        pending.extend([update(11, 42, "/status"), update(12, 99, "/silence 12h"),
+                        update(13, 42, "/silence@SumpBot 30m"), update(14, 42, "hello")])
+        run(bot, 1.5)
+        print(f"Commands run: {commands}")
+        print(f"Only our chat obeyed: {commands == [('/status', ''), ('/silence', '30m')]}, "
+              f"ignored {bot.ignored}")
+        print(f"Replies sent: {sent == [('42', 'done /status '), ('42', 'done /silence 30m')]}")
+
+        restarted = TelegramPoller("TOKEN", 42, handler, period_s=1, host="127.0.0.1",
+                                   port=port, tls=False, wifi=False)
+        run(restarted, 0.5)
+        print(f"Offset kept across a restart: {offsets[-1] == 15 and len(commands) == 2}")
+        m = bot.metrics()
+        print(f"Metrics: {m}")
+        print(f"Longest step {m['max_step_ms']} ms, never blocked: {m['max_step_ms'] < 20}")
+
+        # A server that moved is looked up again after a failed poll
+        gone = socket.socket()
+        gone.bind(("127.0.0.1", 0))
+        answers = [gone.getsockname(), ("127.0.0.1", port)]
+        gone.close()
+        real_getaddrinfo = socket.getaddrinfo
+        socket.getaddrinfo = lambda host, p, *args: [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", answers.pop(0) if len(answers) > 1 else answers[0])]
+        try:
+            moved = TelegramPoller("TOKEN", 42, handler, period_s=1, host="telegram.test",
+                                   port=port, tls=False, wifi=False)
+            run(moved, 2.5)
+        finally:
+            socket.getaddrinfo = real_getaddrinfo
+        print(f"Moved server found again after a failure: {moved.errors >= 1 and moved.polls >= 1}\n")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print("Test completed")
+
+# Run test when imported; the stand-in server needs a PC
+test_scanner()
+if sys.implementation.name == "cpython":
+    test_poller()
@@ -0,0 +1,129 @@
+"""
+Test for the wall-clock time service
+Checks the date conversion, the drift estimate against a simulated slow
+crystal and, on a PC, a sync with a local SNTP stand-in whose clock is
+5 s ahead, a lost reply, and the stamps in events.log.
+"""
+
+import sys
+
+import timeservice
+from timeservice import TimeService, civil, iso
+
+def test_dates():
+    print("Testing date conversion...")
+    # (Unix ms, expected ISO): epoch, leap day, end of a century, far future
+    cases = [(0, "1970-01-01T00:00:00.000Z"),
+             (951782400123, "2000-02-29T00:00:00.123Z"),
+             (978307199999, "2000-12-31T23:59:59.999Z"),
+             (1761941002500, "2025-10-31T20:03:22.500Z"),
+             (4102444800000, "2100-01-01T00:00:00.000Z")]
+    print(f"ISO dates: {all(iso(ms) == text for ms, text in cases)}")
+    print(f"Weekday (2025-10-31 was a Friday): {civil(1761941002500)[7] == 4}\n")
+
+def test_drift():
+    print("Testing drift estimation...")
+    base = 1761941002500
+    ppm = 50  # The board's ticks run 50 ppm slow against real time
+    hour = 3600000
+    clock = TimeService()
+    jitter = [3, -4, 2, -1, 4, -3, 0, 2, -2, 1, 3, -4]  # ms of network noise per sync
+    for i, noise in enumerate(jitter):
+        ticks = 1000 + i * hour
+        clock.observe(ticks, base + ticks + ticks * ppm // 1000000 + noise)
+    m = clock.metrics()
+    print(f"Drift estimate {m['drift_ppm']} ppm (true {ppm}): {abs(m['drift_ppm'] - ppm) < 5}")
+    ticks = 1000 + len(jitter) * hour
+    truth = base + ticks + ticks * ppm // 1000000
+    error = clock.epoch_ms(ticks) - truth
+    print(f"Error an hour after the last sync {error} ms, "
+          f"{ppm * hour // 1000000} ms without the drift: {abs(error) < 10}")
+
+    # Days without a sync: the anchor moves forward without a jump
+    later = ticks + 3 * 86400000
+    expected = clock.epoch_ms(later)
+    clock.next_ms = later + hour  # Not due, so step() only rebases
+    clock.step(ticks + 2 * 86400000)
+    moved = clock.anchor_ticks == ticks + 2 * 86400000
+    print(f"Anchor moved after a day: {moved}, mapping continuous: "
+          f"{abs(clock.epoch_ms(later) - expected) <= 1}\n")
+
+def test_sync():
+    import os
+    import socket
+    import struct
+    import threading
+    import time
+
+    import eventlog
+
+    print("Testing SNTP sync against a local stand-in...")
+    ahead_ms = 5000
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    state = {"drop": 0, "served": 0}
+
+    def serve():
+        while True:
+            try:
+                data, addr = server.recvfrom(48)
+            except OSError:
+                return
+            if state["drop"]:
+                state["drop"] -= 1
+                continue
+            now = time.time() + ahead_ms / 1000 + timeservice.NTP_TO_UNIX_S
+            secs = int(now)
+            frac = int((now - secs) * (1 << 32))
+            reply = bytearray(48)
+            reply[0] = 0x24  # Version 4, server
+            reply[1] = 2     # Stratum
+            reply[24:32] = data[40:48]
+            reply[32:48] = struct.pack(">IIII", secs, frac, secs, frac)
+            time.sleep(0.003)  # Network delay on the way back
+            server.sendto(reply, addr)
+            state["served"] += 1
+
+    threading.Thread(target=serve, daemon=True).start()
+    clock = TimeService("127.0.0.1", resync_s=1, port=server.getsockname()[1], wifi=False,
+                        set_rtc=False)
+    timeservice.install(clock)
+
+    def run(seconds):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            clock.step()
+            time.sleep(0.001 if clock.busy else 0.05)
+
+    try:
+        print(f"Unsynced stamp: {timeservice.stamp()}")
+        run(0.3)
+        error = clock.epoch_ms() - (time.time() * 1000 + ahead_ms)
+        print(f"Synced: {clock.synced}, error {error:.1f} ms, rtt {clock.rtt_ms} ms: {abs(error) < 20}")
+
+        state["drop"] = 1
+        clock.next_ms = 0
+        run(timeservice.REPLY_MS / 1000 + 0.3)
+        print(f"Lost reply counted and retried later: {clock.failures == 1}")
+        m = clock.metrics()
+        print(f"Longest step {m['max_step_ms']} ms, never blocked: {m['max_step_ms'] < 20}")
+
+        eventlog.LOG_FILE = "timeservice_test.log"
+        eventlog.log("alarm", "sump")
+        records = list(eventlog.read_records(("timeservice_test.log",)))
+        _, wall, event, detail = records[-1]
+        print(f"Event stamped {iso(wall)}: {abs(wall - (time.time() * 1000 + ahead_ms)) < 50}")
+        print(f"Old readers unchanged: {list(eventlog.read_events(('timeservice_test.log',)))[-1][1:] == ('alarm', 'sump')}")
+        os.remove("timeservice_test.log")
+        print(f"Metrics: {clock.metrics()}\n")
+    finally:
+        timeservice.install(None)
+        server.close()
+
+    print("Test completed")
+
+# Run test when imported; the stand-in server needs a PC
+test_dates()
+test_drift()
+if sys.implementation.name == "cpython":
+    test_sync()
@@ -0,0 +1,329 @@
+"""
+Test for connection racing, TLS sessions and pinning (run on a PC)
+Local listeners stand in for the servers: one whose accept queue is full
+(SYNs go unanswered, like an unreachable front end), one that refuses, and
+one that answers. A patched resolver hands out several addresses for one
+name, as a real DNS server would.
+"""
+
+import socket
+import time
+
+import rtcstore
+import transport
+
+_real_getaddrinfo = socket.getaddrinfo
+_names = {}  # name -> [(ip, port)] by the port asked for
+
+def _getaddrinfo(host, port, *args):
+    if host in _names:
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", addr)
+                for addr in _names[host] if addr[1] == port]
+    return _real_getaddrinfo(host, port, *args)
+
+def _listener(backlog=8):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(backlog)
+    return sock, sock.getsockname()[1]
+
+def _blackhole():
+    """A port whose full accept queue drops new SYNs"""
+    sock, port = _listener(0)
+    fill = []
+    for _ in range(3):
+        s = socket.socket()
+        s.setblocking(False)
+        try:
+            s.connect(("127.0.0.1", port))
+        except BlockingIOError:
+            pass
+        fill.append(s)
+    time.sleep(0.1)
+    return [sock] + fill, port
+
+def _closed_port():
+    sock, port = _listener()
+    sock.close()
+    return port
+
+def _race(routes, **kw):
+    start = time.monotonic()
+    sock, route = transport.connect(routes, **kw)
+    elapsed = (time.monotonic() - start) * 1000
+    peer = sock.getpeername()
+    sock.close()
+    return route, peer, elapsed
+
+def test_transport():
+    print("Testing connection racing...")
+    socket.getaddrinfo = _getaddrinfo
+    rtcstore.clear("endpoints")
+    transport.forget()
+    held, dead = _blackhole()
+    live, live_port = _listener()
+    held.append(live)
+    refused = _closed_port()
+    try:
+        # 465 never answers, the STARTTLS alternate does
+        _names["smtp.test"] = [("127.0.0.1", dead), ("127.0.0.1", live_port)]
+        route, peer, elapsed = _race([("smtp.test", dead), ("smtp.test", live_port)])
+        print(f"Alternate won after one stagger ({elapsed:.0f} ms): "
+              f"{route[1] == live_port and 200 <= elapsed < 1000}")
+        print(f"Winner remembered: {transport.preferred('smtp.test') == ('127.0.0.1', live_port)}")
+
+        # Next time the winner goes first and connects at once
+        route, peer, elapsed = _race([("smtp.test", dead), ("smtp.test", live_port)])
+        print(f"Winner tried first next time ({elapsed:.0f} ms): {route[1] == live_port and elapsed < 200}")
+
+        # Survives the module being evicted: read back from RTC memory
+        transport._winners = None
+        print(f"Winner kept in RTC memory: {transport.preferred('smtp.test') == ('127.0.0.1', live_port)}")
+
+        # A refused address does not wait for its stagger
+        _names["api.test"] = [("127.0.0.1", refused)]
+        transport.forget("api.test")
+        route, peer, elapsed = _race([("api.test", refused), ("127.0.0.1", live_port)])
+        print(f"Refused address skipped at once ({elapsed:.0f} ms): {elapsed < 200}")
+
+        # Nothing answers: an error before the deadline, nothing left open
+        _names["down.test"] = [("127.0.0.1", dead), ("127.0.0.1", refused)]
+        before = transport.stats["failed"]
+        start = time.monotonic()
+        try:
+            transport.connect([("down.test", dead), ("down.test", refused)], timeout_ms=600)
+            print("Race with no server fails: False")
+        except OSError as e:
+            elapsed = (time.monotonic() - start) * 1000
+            print(f"Race with no server fails ({e}, {elapsed:.0f} ms): "
+                  f"{transport.stats['failed'] == before + 1 and elapsed < 1000}")
+        print(f"Stats: {transport.stats}\n")
+    finally:
+        socket.getaddrinfo = _real_getaddrinfo
+        for sock in held:
+            sock.close()
+        transport.forget()
+
+def test_request():
+    import threading
+    print("Testing HTTP requests over a raced connection...")
+    server, port = _listener()
+    seen = []
+
+    def serve():
+        conn, _ = server.accept()
+        data = b""
+        while b"hello" not in data:
+            data += conn.recv(1024)
+        seen.append(data)
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        conn.close()
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    status = transport.request("POST", f"http://127.0.0.1:{port}/topic",
+                               headers={"Title": "SUMP ALARM!"}, data="hello")
+    thread.join()
+    server.close()
+    print(f"Status 200: {status == 200}")
+    print(f"Headers and body sent: {seen and seen[0].startswith(b'POST /topic HTTP/1.0') and b'Content-Length: 5' in seen[0]}")
+    print(f"Query text quoted: {transport.quote('SUMP ALARM! 🚨') == 'SUMP%20ALARM%21%20%F0%9F%9A%A8'}")
+
+def test_tls_sessions():
+    import tempfile
+    from bench_notify import StandIn, make_cert, send_once
+    print("\nTesting TLS session resumption against a local stand-in...")
+    with tempfile.TemporaryDirectory() as directory:
+        files = make_cert(directory)
+        if files is None:
+            print("openssl not found, skipped")
+            return
+        stand_in = StandIn(*files)
+    try:
+        transport.configure("ram")
+        transport.forget_sessions()
+        before = dict(transport.stats)
+        results = [send_once(stand_in)[1] for _ in range(3)]
+        full = transport.stats["tls_full"] - before["tls_full"]
+        resumed = transport.stats["tls_resumed"] - before["tls_resumed"]
+        print(f"Alerts and emails accepted: {all(results)}")
+        print(f"One full handshake, then resumed ({full} full, {resumed} resumed): "
+              f"{full == 1 and resumed == 5 and stand_in.resumed == 5}")
+        transport.forget_sessions()
+        send_once(stand_in)
+        print(f"Full handshake again once forgotten: {transport.stats['tls_full'] == before['tls_full'] + 2}")
+        stand_in.split_replies = True
+        print(f"Email accepted with the EHLO reply arriving line by line: {send_once(stand_in)[1]}")
+        stand_in.split_replies = False
+
+        transport.configure("off")
+        before = dict(transport.stats)
+        send_once(stand_in)
+        print(f"No resumption when off: {transport.stats['tls_resumed'] == before['tls_resumed']}")
+
+        # Sessions that cannot be serialised (CPython) stay in RAM only
+        transport.configure("rtc")
+        transport.forget_sessions()
+        send_once(stand_in)
+        print(f"RTC record only where sessions serialise: {rtcstore.read('tls') is None}")
+        print(f"Stats: {transport.stats}")
+    finally:
+        transport.configure("ram")
+        transport.forget_sessions()
+        stand_in.close()
+
+def _openssl_pin(cert):
+    """Independent pin: openssl's DER public key, hashed"""
+    import base64
+    import hashlib
+    import shutil
+    import subprocess
+    exe = shutil.which("openssl")
+    key = subprocess.run([exe, "x509", "-in", cert, "-pubkey", "-noout"],
+                         check=True, capture_output=True).stdout
+    der = subprocess.run([exe, "pkey", "-pubin", "-outform", "der"], input=key,
+                         check=True, capture_output=True).stdout
+    return base64.b64encode(hashlib.sha256(der).digest()).decode()
+
+def test_pins():
+    import tempfile
+    from bench_notify import StandIn, make_cert, send_once
+    from email_sender import GmailSender
+    print("\nTesting certificate pinning against a local stand-in...")
+    with tempfile.TemporaryDirectory() as directory:
+        files = make_cert(directory)
+        if files is None:
+            print("openssl not found, skipped")
+            return
+        stand_in = StandIn(*files)
+        print(f"Pin matches openssl's public key hash: {stand_in.pin == _openssl_pin(files[0])}")
+    backup = "A" * 43 + "="
+    url = f"https://localhost:{stand_in.https_port}/sump-test"
+    try:
+        transport.configure("ram", {"localhost": [backup, stand_in.pin]}, "enforce")
+        before = dict(transport.stats)
+        ok = send_once(stand_in)[1] and send_once(stand_in)[1]
+        checks = transport.stats["pin_checks"] - before["pin_checks"]
+        print(f"Pinned key accepted, resumed sessions checked too ({checks} checks): "
+              f"{ok and checks == 4 and transport.stats['pin_failures'] == before['pin_failures']}")
+
+        transport.configure(pins={"localhost": [backup, backup]})
+        transport.forget_sessions()
+        try:
+            transport.request("GET", url)
+            print("Unpinned key refused: False")
+        except OSError as e:
+            print(f"Unpinned key refused ({e}): True")
+        gmail = GmailSender("alarm@example.com", "app password", ports=(stand_in.smtp_port,))
+        gmail.smtp_server = "localhost"
+        print(f"Email refused too: {not gmail.send_email(['test@example.com'], 'SUMP ALARM TEST', 'Pin test')}")
+
+        transport.configure(pin_mode="report")
+        failures = transport.stats["pin_failures"]
+        print(f"Report mode sends anyway and counts it: "
+              f"{transport.request('GET', url) == 200 and transport.stats['pin_failures'] == failures + 1}")
+
+        transport.configure(pins={"ntfy.sh": [backup, backup]}, pin_mode="enforce")
+        checks = transport.stats["pin_checks"]
+        print(f"Hosts without pins are not checked: "
+              f"{transport.request('GET', url) == 200 and transport.stats['pin_checks'] == checks}")
+        print(f"{transport.stats['pin_us'] // transport.stats['pin_checks']} us per check")
+    finally:
+        transport.configure("ram", {}, "report")
+        transport.forget_sessions()
+        stand_in.close()
+
+def test_no_downgrade():
+    import ssl
+    import sys
+    import tempfile
+    import config_template
+    from bench_notify import StandIn, make_cert
+    from telegram_bot import TelegramPoller
+    print("\nTesting that a pin mismatch never reaches the bot token...")
+    with tempfile.TemporaryDirectory() as directory:
+        files = make_cert(directory)
+        if files is None:
+            print("openssl not found, skipped")
+            return
+        stand_in = StandIn(*files)
+    backup = "A" * 43 + "="
+    sys.modules.setdefault("config", config_template)
+    saved = config_template.TLS_PINS, config_template.TLS_PIN_MODE
+    real_request = transport.request
+    real_context = getattr(ssl, "create_default_context")
+    urls = []
+
+    def spy(method, url, *args, **kwargs):
+        urls.append(url)
+        return real_request(method, url, *args, **kwargs)
+
+    def device_context():
+        # Like the device: no CA store, the pin is the only check
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+    try:
+        import notify
+        _names["api.telegram.org"] = [("127.0.0.1", stand_in.https_port)]
+        _names["pinned.test"] = [("127.0.0.1", stand_in.https_port)]
+        socket.getaddrinfo = lambda host, port, *args: _getaddrinfo(
+            host, stand_in.https_port if host == "api.telegram.org" else port, *args)
+        config_template.TLS_PINS = {"api.telegram.org": [backup, backup]}
+        config_template.TLS_PIN_MODE = "enforce"
+        transport.request = spy
+        transport.forget_sessions()
+        requests = stand_in.requests
+        failures = transport.stats["pin_failures"]
+        sent = notify.send_telegram_alert(message="Pin test", chat_id="1")
+        https_only = urls != [] and all(u.startswith("https://") for u in urls)
+        print(f"Alert refused, no plain HTTP retry, nothing reached the server: "
+              f"{not sent and https_only and stand_in.requests == requests and transport.stats['pin_failures'] > failures}")
+
+        ssl.create_default_context = device_context
+
+        def poll(pins):
+            transport.configure(pins={"pinned.test": pins}, pin_mode="enforce")
+            bot = TelegramPoller("123:token", 1, lambda command, argument: None,
+                                 host="pinned.test", port=stand_in.https_port, wifi=False)
+            requests = stand_in.requests
+            deadline = time.time() + 5
+            bot.step()
+            while bot.busy and time.time() < deadline:
+                time.sleep(0.01)
+                bot.step()
+            return bot, stand_in.requests - requests
+
+        bot, served = poll([backup, backup])
+        print(f"Command poller stops at the pin check ({bot.last_error}): "
+              f"{bot.errors == 1 and served == 0 and 'pin' in str(bot.last_error)}")
+        bot, served = poll([backup, stand_in.pin])
+        print(f"Command poller goes through with the right pin: {bot.errors == 0 and served == 1}")
+
+        import ota
+        transport.configure(pins={"pinned.test": [backup, backup]}, pin_mode="enforce")
+        requests = stand_in.requests
+        try:
+            ota.fetch_manifest(f"https://pinned.test:{stand_in.https_port}/manifest.json", "key")
+            refused = False
+        except OSError:
+            refused = True
+        print(f"OTA fetch stops at the pin check: {refused and stand_in.requests == requests}")
+    finally:
+        ssl.create_default_context = real_context
+        transport.request = real_request
+        socket.getaddrinfo = _getaddrinfo
+        config_template.TLS_PINS, config_template.TLS_PIN_MODE = saved
+        transport.configure("ram", {}, "report")
+        transport.forget_sessions()
+        stand_in.close()
+
+# Run test when imported
+test_transport()
+test_request()
+test_tls_sessions()
+test_pins()
+test_no_downgrade()
+print("\nTest completed")
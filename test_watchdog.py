@@ -0,0 +1,76 @@
+"""
+Simple test for the watchdog supervisor deadlines (no hardware WDT)
+"""
+
+import os
+from watchdog import Supervisor
+
+STATE_FILE = "test_watchdog.json"
+
+def test_watchdog():
+    print("Testing watchdog supervisor...")
+    try:
+        os.remove(STATE_FILE)
+    except OSError:
+        pass
+    sup = Supervisor({"sensor": 1000, "notifier": 5000}, hardware=False,
+                     state_file=STATE_FILE)
+    sup.resume("sensor")
+    start = sup._last[0]
+
+    # The suspended notifier is never late; the sensor is late after 1 s
+    print(f"Fed while on time: {sup.poll(start + 900)}")
+    print(f"Stops feeding on a missed check-in: {sup.poll(start + 1100) is False}\n")
+    sup = Supervisor({"sensor": 1000, "notifier": 5000}, hardware=False,
+                     state_file=STATE_FILE)
+    sup.resume("notifier")
+    with sup.blocking("notifier", "smtp DATA"):
+        t0 = sup._last[1]
+        print(f"Fed during short block: {sup.poll(t0 + 4000)}")
+        fed = sup.poll(t0 + 6000)
+    print(f"Stops feeding when overdue: {fed is False}, culprit: {sup.overdue}")
+    print(f"Feeding stays off: {sup.poll(t0 + 6000) is False}\n")
+
+    # Next boot turns the pending record into a reset record
+    booted = Supervisor({"sensor": 1000}, hardware=False, state_file=STATE_FILE)
+    booted.record_boot(reset_cause=3, wdt_cause=3)
+    last = booted.state["resets"][-1]
+    print(f"Reset recorded: {last['task'] == 'notifier' and last['reason'] == 'smtp DATA'}")
+    print(f"Longest block kept: {'notifier' in booted.state['longest']}\n")
+    os.remove(STATE_FILE)
+
+
+def test_alarm_notify():
+    """An alarm sounds the siren, then the loop blocks in a slow notifier"""
+    print("Testing a slow alarm notification while the siren sounds...")
+    deadlines = {"sensor": 20000, "siren": 10000, "notifier": 45000, "wifi": 15000}
+    for siren_running in (True, False):
+        sup = Supervisor(deadlines, hardware=False, state_file=STATE_FILE)
+        ticks = [0]
+        sup.watch("siren", lambda: ticks[0])
+        sup.resume("sensor")
+        start = sup._last[0]
+        sup.resume("siren")          # siren_on()
+        sup.suspend("sensor")        # send_notifications()
+        sup.resume("notifier")
+        fed = True
+        with sup.blocking("notifier", "wifi connect + TLS handshake"):
+            # 30 s of WiFi and TLS; the supervising timer polls twice a second
+            for t in range(500, 30001, 500):
+                if siren_running:
+                    ticks[0] += 1000  # The 1 ms siren timer keeps firing
+                fed = sup.poll(start + t) and fed
+        if siren_running:
+            print(f"Fed through a 30 s notification: {fed} ({sup.feeds} feeds)")
+        else:
+            print(f"A stopped siren is still caught: {not fed and sup.overdue[0] == 'siren'}")
+        try:
+            os.remove(STATE_FILE)
+        except OSError:
+            pass
+    print()
+
+# Run test when imported
+test_watchdog()
+test_alarm_notify()
+print("Test completed")
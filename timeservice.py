@@ -0,0 +1,239 @@
+"""
+Wall-clock time service for the Sump Alarm
+Maps ticks_ms to Unix time in milliseconds with a non-blocking SNTP client
+stepped from the main loop. Each sync measures the round trip and anchors
+the mapping at the reply; comparing successive syncs estimates how fast the
+board's crystal runs, so the mapping stays accurate between resyncs. Log
+lines, metrics and notifications are stamped through the module functions,
+which work (unstamped) before the first sync or without a service.
+"""
+
+import struct
+
+from compat import ticks_ms, ticks_us, ticks_diff, ticks_add
+
+NTP_PORT = 123
+NTP_TO_UNIX_S = 2208988800  # 1900-01-01 to 1970-01-01
+REPLY_MS = 2000             # Wait this long for an answer
+RETRY_S = 60                # After a failed sync
+MIN_DRIFT_SPAN_MS = 600000  # Syncs closer than this do not update the drift
+MAX_DRIFT_PPB = 500000      # Ignore drift estimates beyond 500 ppm
+REBASE_MS = 86400000        # Move the anchor forward before ticks_diff overflows
+
+_service = None
+
+def install(service):
+    """Make service the clock behind epoch_ms() and stamp()"""
+    global _service
+    _service = service
+
+def epoch_ms(ticks=None):
+    """Unix time in ms at ticks (default: now), or None before the first sync"""
+    if _service is None:
+        return None
+    return _service.epoch_ms(ticks)
+
+def civil(ms):
+    """Unix ms to (year, month, day, hour, minute, second, ms, weekday 0=Monday)"""
+    days, rem = divmod(ms, 86400000)
+    weekday = (days + 3) % 7  # 1970-01-01 was a Thursday
+    # Days to civil date (proleptic Gregorian), after Howard Hinnant
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    year = yoe + era * 400 + (1 if month <= 2 else 0)
+    second, milli = divmod(rem, 1000)
+    minute, second = divmod(second, 60)
+    hour, minute = divmod(minute, 60)
+    return year, month, day, hour, minute, second, milli, weekday
+
+def iso(ms):
+    """Unix ms as "2025-11-02T14:03:22.123Z" """
+    y, mo, d, h, mi, s, milli, _ = civil(ms)
+    return f"{y:04d}-{mo:02d}-{d:02d}T{h:02d}:{mi:02d}:{s:02d}.{milli:03d}Z"
+
+def stamp(ticks=None):
+    """Readable time for messages; says so when the clock is not set yet"""
+    ticks = ticks_ms() if ticks is None else ticks
+    ms = epoch_ms(ticks)
+    if ms is None:
+        return f"unknown (clock not set, up {ticks // 1000} s)"
+    return iso(ms)
+
+class TimeService:
+    def __init__(self, host="pool.ntp.org", resync_s=3600, port=NTP_PORT, wifi=None,
+                 set_rtc=True):
+        """Sync with host every resync_s seconds
+
+        wifi is (ssid, password) to bring the station up for a sync, None
+        to sync only while something else keeps it connected, or False to
+        skip the check (host tests).
+        set_rtc also sets machine.RTC so time.localtime() is right.
+        """
+        self.host = host
+        self.port = port
+        self.resync_ms = resync_s * 1000
+        from transport import Station
+        self.station = Station(wifi)
+        self.set_rtc = set_rtc
+        self.sock = None
+        self.next_ms = ticks_ms()
+        self.request = bytearray(48)
+        self.request[0] = 0x23  # LI 0, version 4, client
+        # The mapping: epoch = anchor_epoch + d + d * drift_ppb / 1e9
+        self.anchor_ticks = None
+        self.anchor_epoch = None
+        self.drift_ppb = 0
+        self.drift_known = False
+        # Counters
+        self.syncs = 0
+        self.failures = 0
+        self.last_error = None
+        self.rtt_ms = None
+        self.last_step_ms = None  # Correction applied at the last sync
+        self.max_step_us = 0
+
+    def configure(self, host, resync_s, wifi=None):
+        """Apply new settings (config hot reload), keeping the mapping"""
+        if host != self.host:
+            self.host = host
+            self.station.forget()
+        self.resync_ms = resync_s * 1000
+        self.station.wifi = wifi
+
+    @property
+    def synced(self):
+        return self.anchor_ticks is not None
+
+    @property
+    def busy(self):
+        """True while waiting for a reply (the loop should step again soon)"""
+        return self.sock is not None
+
+    def epoch_ms(self, ticks=None):
+        if self.anchor_ticks is None:
+            return None
+        ticks = ticks_ms() if ticks is None else ticks
+        d = ticks_diff(ticks, self.anchor_ticks)
+        return self.anchor_epoch + d + d * self.drift_ppb // 1000000000
+
+    def observe(self, ticks, epoch):
+        """Anchor the mapping at a measured (ticks_ms, Unix ms) pair"""
+        if self.anchor_ticks is not None:
+            span = ticks_diff(ticks, self.anchor_ticks)
+            predicted = self.epoch_ms(ticks)
+            self.last_step_ms = epoch - predicted
+            if span >= MIN_DRIFT_SPAN_MS:
+                # The error over the span is what the current drift missed
+                sample = self.drift_ppb + self.last_step_ms * 1000000000 // span
+                if -MAX_DRIFT_PPB <= sample <= MAX_DRIFT_PPB:
+                    if self.drift_known:
+                        self.drift_ppb += (sample - self.drift_ppb) // 4
+                    else:
+                        self.drift_ppb = sample
+                        self.drift_known = True
+        self.anchor_ticks = ticks
+        self.anchor_epoch = epoch
+        self.syncs += 1
+
+    # --- The cooperative task ---------------------------------------------
+
+    def step(self, now=None):
+        """Advance the sync by one non-blocking socket operation at most"""
+        start = ticks_us()
+        now = ticks_ms() if now is None else now
+        try:
+            if self.anchor_ticks is not None and ticks_diff(now, self.anchor_ticks) > REBASE_MS:
+                epoch = self.epoch_ms(now)
+                self.anchor_ticks, self.anchor_epoch = now, epoch
+            if self.sock is not None:
+                self._receive(now)
+            elif ticks_diff(now, self.next_ms) >= 0:
+                self._send(now)
+        except Exception as e:
+            self._fail(now, e)
+        elapsed = ticks_diff(ticks_us(), start)
+        if elapsed > self.max_step_us:
+            self.max_step_us = elapsed
+
+    def _send(self, now):
+        import socket
+        if not self.station.ready(now):
+            return
+        addr = self.station.address(self.host, self.port, socket.SOCK_DGRAM, "sensor")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        self.sock = sock
+        self.deadline = ticks_add(now, REPLY_MS)
+        self.sent_us = ticks_us()
+        sock.sendto(self.request, addr)
+
+    def _receive(self, now):
+        try:
+            data = self.sock.recv(48)
+        except OSError as e:
+            if ticks_diff(now, self.deadline) >= 0:
+                raise OSError("no reply")
+            import errno
+            if getattr(e, "errno", None) == errno.EAGAIN:
+                return
+            raise
+        if data is None:  # Some ports return None instead of raising EAGAIN
+            return
+        back_us = ticks_us()
+        back_ms = ticks_ms()
+        self._close()
+        if len(data) < 48 or data[0] & 0x07 != 4 or data[1] == 0:
+            raise OSError("bad reply")  # Not a server reply, or kiss-of-death
+        # Server receive (T2) and transmit (T3) timestamps
+        rs, rf, ts, tf = struct.unpack_from(">IIII", data, 32)
+        t2 = (rs - NTP_TO_UNIX_S) * 1000 + (rf * 1000 >> 32)
+        t3 = (ts - NTP_TO_UNIX_S) * 1000 + (tf * 1000 >> 32)
+        rtt = ticks_diff(back_us, self.sent_us) // 1000 - (t3 - t2)
+        self.rtt_ms = max(rtt, 0)
+        self.observe(back_ms, t3 + self.rtt_ms // 2)
+        self.next_ms = ticks_add(now, self.resync_ms)
+        if self.set_rtc:
+            self._set_rtc(back_ms)
+
+    def _set_rtc(self, ticks):
+        try:
+            from machine import RTC
+        except ImportError:
+            return  # Host
+        y, mo, d, h, mi, s, milli, wd = civil(self.epoch_ms(ticks))
+        RTC().datetime((y, mo, d, wd, h, mi, s, milli * 1000))
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _fail(self, now, error):
+        self._close()
+        self.failures += 1
+        self.last_error = str(error)
+        self.station.forget()  # Resolve again next time, the server may have moved
+        self.next_ms = ticks_add(now, RETRY_S * 1000)
+        print(f"Time sync failed: {error}")
+
+    def metrics(self):
+        return {
+            "synced": self.synced,
+            "now": iso(self.epoch_ms()) if self.synced else None,
+            "syncs": self.syncs,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "rtt_ms": self.rtt_ms,
+            "last_step_ms": self.last_step_ms,
+            "drift_ppm": self.drift_ppb / 1000 if self.drift_known else None,
+            "max_step_ms": self.max_step_us // 1000,
+        }
@@ -0,0 +1,253 @@
+"""
+Trace replay and parameter sweep for the alarm debounce settings
+Host tool (CPython + NumPy, not for the ESP32). Replays recorded or synthetic
+float-switch traces through the integrator debounce filter and AlarmEngine
+far faster than real time, and sweeps DEBOUNCE_SECONDS, SAMPLE_INTERVAL_MS
+and SAMPLES_REQUIRED to report detection latency and false-alarm rate.
+
+Usage:
+    python trace_sweep.py --debounce 5:30:5 --interval 50,100,200 --samples 3:20
+    python trace_sweep.py --trace-dir recordings/ --verify 20
+
+Recorded traces are CSV files of state changes, one "t_ms,value" row each.
+A "# onset_ms=<t>" comment line marks a real flood; files without it are
+treated as dry recordings.
+"""
+
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from alarm_engine import AlarmEngine, ACT_ALARM
+from debounce import Integrator
+
+BASE_MS = 10  # Resolution of the stored traces
+
+def parse_values(text):
+    """Parse "5,10,15" or "start:stop[:step]" (inclusive) into a list of ints"""
+    if ":" in text:
+        parts = [int(p) for p in text.split(":")]
+        step = parts[2] if len(parts) > 2 else 1
+        return list(range(parts[0], parts[1] + 1, step))
+    return [int(p) for p in text.split(",")]
+
+# --- Traces ---------------------------------------------------------------
+
+def synthetic_dry(rng, count, seconds, spike_rate=0.002, max_spike_ms=800):
+    """Dry pit with short wet spikes from waves and vibration"""
+    n = seconds * 1000 // BASE_MS
+    traces = np.zeros((count, n), dtype=np.uint8)
+    starts = rng.random((count, n)) < spike_rate
+    lengths = rng.integers(1, max_spike_ms // BASE_MS + 1, size=(count, n))
+    for row, col in zip(*np.nonzero(starts)):
+        traces[row, col:col + lengths[row, col]] = 1
+    return traces
+
+def synthetic_flood(rng, count, seconds, onset_range=(20, 60), p_drop=0.02, p_recover=0.2):
+    """Dry until onset, then wet with Markov dropouts from a bobbing float"""
+    n = seconds * 1000 // BASE_MS
+    traces = np.zeros((count, n), dtype=np.uint8)
+    onsets = rng.integers(onset_range[0] * 1000, onset_range[1] * 1000, size=count) // BASE_MS
+    # Per-trace chatter severity, from a steady float to a badly bobbing one
+    drop = p_drop * rng.random(count)
+    state = np.ones(count, dtype=np.uint8)
+    draws = rng.random((n, count))
+    for i in range(n):
+        flip = np.where(state == 1, draws[i] < drop, draws[i] < p_recover)
+        state = np.where(flip, 1 - state, state).astype(np.uint8)
+        traces[:, i] = np.where(i >= onsets, state, 0)
+    return traces, onsets * BASE_MS
+
+def load_csv_trace(path, seconds):
+    """Load a recorded trace of "t_ms,value" state changes onto the base grid"""
+    n = seconds * 1000 // BASE_MS
+    trace = np.zeros(n, dtype=np.uint8)
+    onset_ms = None
+    last_idx, last_val = 0, 0
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                if "onset_ms=" in line:
+                    onset_ms = int(line.split("onset_ms=")[1].split()[0])
+                continue
+            t_ms, value = line.split(",")[:2]
+            idx = min(n, int(t_ms) // BASE_MS)
+            trace[last_idx:idx] = last_val
+            last_idx, last_val = idx, int(value)
+    trace[last_idx:] = last_val
+    return trace, onset_ms
+
+# --- Replay ---------------------------------------------------------------
+
+def replay_scalar(trace, sample_ms, samples, debounce_s):
+    """Reference replay through the real filter and AlarmEngine
+
+    Returns the alarm time in ms from the start of the trace, or None.
+    """
+    step = sample_ms // BASE_MS
+    filt = Integrator(samples)
+    engine = AlarmEngine(debounce_s)
+    for k, raw in enumerate(trace[::step]):
+        now = k * sample_ms
+        if engine.update(filt.update(int(raw)), now) == ACT_ALARM:
+            return now
+    return None
+
+def replay_vector(traces, sample_ms, samples_list, debounce_list):
+    """Vectorised replay of many traces for many parameter combinations
+
+    Returns an int array of shape (len(debounce_list), len(samples_list),
+    len(traces)) holding the alarm time in ms, or -1 where no alarm fired.
+    """
+    sub = traces[:, ::sample_ms // BASE_MS]
+    limit = np.asarray(samples_list, dtype=np.int32)[:, None]
+    # AlarmEngine fires on the first tick where (run - 1) * sample_ms >= debounce
+    need = np.asarray([-(-d * 1000 // sample_ms) + 1 for d in debounce_list],
+                      dtype=np.int32)[:, None, None]
+    shape = (len(samples_list), traces.shape[0])
+    count = np.zeros(shape, dtype=np.int32)
+    state = np.zeros(shape, dtype=bool)
+    run = np.zeros(shape, dtype=np.int32)
+    alarm = np.full((len(debounce_list),) + shape, -1, dtype=np.int64)
+
+    for k in range(sub.shape[1]):
+        wet = sub[:, k][None, :].astype(bool)
+        count = np.where(wet, np.minimum(count + 1, limit), np.maximum(count - 1, 0))
+        state = (state | (count == limit)) & (count != 0)
+        run = np.where(state, run + 1, 0)
+        fire = (run[None] == need) & (alarm < 0)
+        alarm[fire] = k * sample_ms
+    return alarm
+
+def _sweep_job(args):
+    traces, sample_ms, samples_list, debounce_list = args
+    return sample_ms, replay_vector(traces, sample_ms, samples_list, debounce_list)
+
+def sweep(dry, floods, onsets_ms, intervals, samples_list, debounce_list, workers=None):
+    """Evaluate every combination and return a list of result dicts"""
+    jobs = []
+    for sample_ms in intervals:
+        jobs.append(("dry", (dry, sample_ms, samples_list, debounce_list)))
+        jobs.append(("flood", (floods, sample_ms, samples_list, debounce_list)))
+
+    outputs = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (kind, _), (sample_ms, alarm) in zip(jobs, pool.map(_sweep_job, [j[1] for j in jobs])):
+            outputs[(kind, sample_ms)] = alarm
+
+    results = []
+    for sample_ms in intervals:
+        dry_alarm = outputs[("dry", sample_ms)]
+        flood_alarm = outputs[("flood", sample_ms)]
+        for d_i, debounce_s in enumerate(debounce_list):
+            for s_i, samples in enumerate(samples_list):
+                fired = flood_alarm[d_i, s_i]
+                latency = (fired - onsets_ms)[fired >= 0] / 1000.0
+                # An alarm before the onset is a false alarm on a flood trace
+                early = int(np.count_nonzero((fired >= 0) & (fired < onsets_ms)))
+                latency = latency[latency >= 0]
+                false_alarms = int(np.count_nonzero(dry_alarm[d_i, s_i] >= 0)) + early
+                results.append({
+                    "debounce_s": debounce_s,
+                    "interval_ms": sample_ms,
+                    "samples": samples,
+                    "p50_s": float(np.median(latency)) if latency.size else float("nan"),
+                    "p95_s": float(np.percentile(latency, 95)) if latency.size else float("nan"),
+                    "missed": int(np.count_nonzero(fired < 0)),
+                    "false_alarm_rate": false_alarms / (len(dry) + len(floods)),
+                })
+    return results
+
+def verify(dry, floods, intervals, samples_list, debounce_list, count, rng):
+    """Cross-check the vectorised replay against the scalar engine"""
+    traces = np.concatenate([dry, floods])
+    mismatches = 0
+    for _ in range(count):
+        t = int(rng.integers(len(traces)))
+        sample_ms = int(rng.choice(intervals))
+        s_i = int(rng.integers(len(samples_list)))
+        d_i = int(rng.integers(len(debounce_list)))
+        vec = replay_vector(traces[t:t + 1], sample_ms, [samples_list[s_i]], [debounce_list[d_i]])
+        vec = int(vec[0, 0, 0])
+        ref = replay_scalar(traces[t], sample_ms, samples_list[s_i], debounce_list[d_i])
+        if (ref if ref is not None else -1) != vec:
+            mismatches += 1
+            print(f"Mismatch trace {t} interval {sample_ms} samples {samples_list[s_i]} "
+                  f"debounce {debounce_list[d_i]}: scalar {ref}, vector {vec}")
+    print(f"Verified {count} random replays, {mismatches} mismatches")
+    return mismatches == 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep debounce settings over float-switch traces")
+    parser.add_argument("--debounce", default="5:30:5", help="DEBOUNCE_SECONDS values")
+    parser.add_argument("--interval", default="50,100,200,500", help="SAMPLE_INTERVAL_MS values")
+    parser.add_argument("--samples", default="2:20:2", help="SAMPLES_REQUIRED values")
+    parser.add_argument("--dry", type=int, default=200, help="Synthetic dry traces")
+    parser.add_argument("--floods", type=int, default=200, help="Synthetic flood traces")
+    parser.add_argument("--seconds", type=int, default=300, help="Trace length")
+    parser.add_argument("--trace-dir", help="Directory of recorded CSV traces to add")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verify", type=int, default=0, help="Scalar cross-checks to run")
+    parser.add_argument("--top", type=int, default=20, help="Rows to print")
+    parser.add_argument("--csv", help="Write all results to this CSV file")
+    args = parser.parse_args()
+
+    intervals = parse_values(args.interval)
+    for sample_ms in intervals:
+        if sample_ms % BASE_MS:
+            parser.error(f"intervals must be multiples of {BASE_MS} ms")
+    samples_list = parse_values(args.samples)
+    debounce_list = parse_values(args.debounce)
+
+    rng = np.random.default_rng(args.seed)
+    dry = synthetic_dry(rng, args.dry, args.seconds)
+    floods, onsets = synthetic_flood(rng, args.floods, args.seconds)
+
+    if args.trace_dir:
+        rec_dry, rec_flood, rec_onsets = [], [], []
+        for path in sorted(glob.glob(os.path.join(args.trace_dir, "*.csv"))):
+            trace, onset = load_csv_trace(path, args.seconds)
+            if onset is None:
+                rec_dry.append(trace)
+            else:
+                rec_flood.append(trace)
+                rec_onsets.append(onset)
+        if rec_dry:
+            dry = np.concatenate([dry, np.stack(rec_dry)])
+        if rec_flood:
+            floods = np.concatenate([floods, np.stack(rec_flood)])
+            onsets = np.concatenate([onsets, np.asarray(rec_onsets)])
+        print(f"Loaded {len(rec_dry)} dry and {len(rec_flood)} flood recordings")
+
+    if args.verify and not verify(dry, floods, intervals, samples_list, debounce_list,
+                                  args.verify, rng):
+        raise SystemExit(1)
+
+    combos = len(intervals) * len(samples_list) * len(debounce_list)
+    print(f"Sweeping {combos} combinations over {len(dry)} dry and {len(floods)} flood traces...")
+    results = sweep(dry, floods, onsets, intervals, samples_list, debounce_list, args.workers)
+
+    # Best first: fewest false alarms, then fewest missed floods, then fastest
+    results.sort(key=lambda r: (r["false_alarm_rate"], r["missed"], r["p95_s"]))
+    print(f"{'debounce_s':>10}{'interval_ms':>12}{'samples':>8}{'p50_s':>8}{'p95_s':>8}"
+          f"{'missed':>8}{'false_rate':>11}")
+    for r in results[:args.top]:
+        print(f"{r['debounce_s']:>10}{r['interval_ms']:>12}{r['samples']:>8}{r['p50_s']:>8.1f}"
+              f"{r['p95_s']:>8.1f}{r['missed']:>8}{r['false_alarm_rate']:>11.3f}")
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write(",".join(results[0].keys()) + "\n")
+            for r in results:
+                f.write(",".join(str(v) for v in r.values()) + "\n")
+        print(f"Wrote {len(results)} rows to {args.csv}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,554 @@
+"""
+Connection racing for the Sump Alarm notifiers
+connect() tries every resolved address of a host, and alternates such as
+Gmail's STARTTLS port 587 next to 465, in staggered parallel ("happy
+eyeballs", RFC 8305): each attempt gets STAGGER_MS of head start before the
+next one starts, a failure starts the next one at once, and the first
+socket to connect wins while the rest are closed. The winning address is
+remembered in RTC memory and tried first next time, even if DNS does not
+return it again (lwIP resolves only one address per name).
+
+wrap() resumes TLS sessions (session IDs or tickets) kept per host from the
+last exchange, in RAM or also in RTC memory, where the port supports it:
+a resumed handshake skips the key exchange and certificate, which on the
+C3 is most of the seconds and heap a notification costs. The handshake
+time saved is counted in stats.
+
+Instead of CA chain validation, which would cost the C3 more handshake
+time and RAM, servers can be pinned: the SHA-256 of the public key in the
+certificate they present is checked against a few pins per host in
+config (one hash over a few hundred bytes per handshake).
+
+Station is the Wi-Fi and address handling shared by the cooperative tasks
+(Telegram poller, time service, heartbeat), which must never wait on the
+radio.
+"""
+
+import socket
+import struct
+
+import rtcstore
+import watchdog
+from compat import ticks_ms, ticks_us, ticks_diff, ticks_add
+
+try:
+    import hashlib
+except ImportError:
+    import uhashlib as hashlib
+
+try:
+    import binascii
+except ImportError:
+    import ubinascii as binascii
+
+try:
+    import select
+except ImportError:
+    import uselect as select
+
+crc32 = binascii.crc32
+
+STAGGER_MS = 250     # Head start of each attempt over the next
+TIMEOUT_MS = 15000   # For the whole race
+MAX_WINNERS = 4      # Hosts remembered in RTC memory
+WIFI_RETRY_MS = 30000  # Between a Station's connect attempts
+_WINNER = "<I4sH"    # CRC of the host name, IPv4 address, port
+_SESSION = "<IHH"    # CRC of the host name, full handshake ms, session length
+SESSIONS = "ram"     # Where TLS sessions are kept, see configure()
+PINS = {}            # host -> public key pins, see configure()
+PIN_MODE = "report"
+
+stats = {"races": 0, "attempts": 0, "failed": 0, "fallbacks": 0, "last": None, "last_ms": None,
+         "tls_full": 0, "tls_resumed": 0, "tls_saved_ms": 0, "tls_last_ms": None,
+         "pin_checks": 0, "pin_failures": 0, "pin_us": 0}
+timings = {}         # ms per phase of the last connection: resolve, connect, tls
+_winners = None      # [(host CRC, ip, port)], most recent first
+_context = None
+_sessions = {}       # host -> TLS session
+_full_ms = {}        # host -> last full handshake ms, to tell what resuming saves
+
+def _would_block(e):
+    import errno
+    return getattr(e, "errno", None) in (errno.EAGAIN, errno.EINPROGRESS)
+
+def _key(host):
+    return crc32(host.encode()) & 0xFFFFFFFF
+
+def _load():
+    global _winners
+    if _winners is None:
+        _winners = []
+        data = rtcstore.read("endpoints") or b""
+        size = struct.calcsize(_WINNER)
+        for i in range(0, len(data) - size + 1, size):
+            key, packed, port = struct.unpack_from(_WINNER, data, i)
+            _winners.append((key, ".".join(str(b) for b in packed), port))
+    return _winners
+
+def preferred(host):
+    """(ip, port) that last won a race to host, or None"""
+    key = _key(host)
+    for k, ip, port in _load():
+        if k == key:
+            return ip, port
+    return None
+
+def _remember(host, addr):
+    global _winners
+    ip, port = addr[0], addr[1]
+    if preferred(host) == (ip, port):
+        return
+    try:
+        packed = bytes(int(part) for part in ip.split("."))
+    except ValueError:
+        return  # Not IPv4
+    if len(packed) != 4:
+        return
+    key = _key(host)
+    _winners = [(key, ip, port)] + [w for w in _load() if w[0] != key][:MAX_WINNERS - 1]
+    _save()
+
+def _save():
+    rtcstore.write("endpoints", b"".join(
+        struct.pack(_WINNER, k, bytes(int(part) for part in ip.split(".")), port)
+        for k, ip, port in _winners))
+
+def forget(host=None):
+    """Drop the remembered winner for host (all hosts if None)"""
+    global _winners
+    if host is None:
+        _winners = []
+        rtcstore.clear("endpoints")
+    elif preferred(host) is not None:
+        key = _key(host)
+        _winners = [w for w in _load() if w[0] != key]
+        _save()
+
+def _candidates(routes):
+    """[(addr, route)] in the order to try them
+
+    The last winner first, then the first address of each route, then the
+    second address of each route and so on, so an alternate is tried before
+    more addresses of a port that may be blocked.
+    """
+    resolved = []
+    for route in routes:
+        host, port = route[0], route[1]
+        try:
+            with watchdog.blocking("notifier", f"resolve {host}"):
+                infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except OSError as e:
+            print(f"Cannot resolve {host}: {e}")
+            infos = []
+        addrs = []
+        for info in infos:
+            if info[0] == socket.AF_INET and info[-1] not in addrs:
+                addrs.append(info[-1])
+        resolved.append(addrs)
+    order = []
+    depth = max(len(addrs) for addrs in resolved)
+    for i in range(depth):
+        for route, addrs in zip(routes, resolved):
+            if i < len(addrs):
+                order.append((addrs[i], route))
+    best = preferred(routes[0][0])
+    if best is not None:
+        for route in routes:
+            if route[1] == best[1]:
+                order = [(best, route)] + [c for c in order if tuple(c[0][:2]) != best]
+                break
+    return order
+
+def _index(pending, obj):
+    """Entry of pending polled as obj (the socket, or its fd on a PC)"""
+    for i, entry in enumerate(pending):
+        if obj is entry[0] or (isinstance(obj, int) and obj == entry[0].fileno()):
+            return i
+    return None
+
+def _failed(sock):
+    """Connect error the poll flags do not show (not available on every port)"""
+    if not hasattr(socket, "SO_ERROR"):
+        return False
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0
+
+def connect(routes, timeout_ms=TIMEOUT_MS, stagger_ms=STAGGER_MS):
+    """Race TCP connections to routes, (host, port, ...) in order of preference
+
+    Returns (socket, route) for the first connection made, in blocking mode,
+    and closes every other attempt. The first route's host names the race
+    for the winner remembered next time. Raises OSError if none connects.
+    """
+    start = ticks_ms()
+    host = routes[0][0]
+    stats["races"] += 1
+    timings.clear()
+    queue = _candidates(routes)
+    timings["resolve"] = ticks_diff(ticks_ms(), start)
+    if not queue:
+        stats["failed"] += 1
+        raise OSError(f"cannot resolve {host}")
+    first = queue[0][0]
+    deadline = ticks_add(start, timeout_ms)
+    poller = select.poll()
+    pending = []  # (socket, addr, route)
+    next_ms = start
+    error = None
+    try:
+        while True:
+            now = ticks_ms()
+            if queue and (not pending or ticks_diff(now, next_ms) >= 0):
+                addr, route = queue.pop(0)
+                stats["attempts"] += 1
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                try:
+                    sock.connect(addr)
+                except OSError as e:
+                    if not _would_block(e):
+                        sock.close()
+                        error = e
+                        continue
+                poller.register(sock, select.POLLOUT)
+                pending.append((sock, addr, route))
+                next_ms = ticks_add(now, stagger_ms)
+            if not pending:
+                raise error or OSError(f"cannot connect to {host}")
+            left = ticks_diff(deadline, now)
+            if left <= 0:
+                raise OSError(f"timed out connecting to {host}")
+            wait = min(left, max(0, ticks_diff(next_ms, now))) if queue else left
+            with watchdog.blocking("notifier", f"connect {host}"):
+                events = poller.poll(wait)
+            for obj, event in events:
+                i = _index(pending, obj)
+                if i is None:
+                    continue
+                sock, addr, route = pending.pop(i)
+                poller.unregister(sock)
+                if event & (select.POLLERR | select.POLLHUP) or _failed(sock):
+                    sock.close()
+                    error = OSError(f"cannot connect to {addr[0]}:{addr[1]}")
+                    next_ms = ticks_ms()  # Start the next attempt now
+                    continue
+                sock.setblocking(True)
+                elapsed = ticks_diff(ticks_ms(), start)
+                if tuple(addr[:2]) != tuple(first[:2]):
+                    stats["fallbacks"] += 1
+                stats["last"] = f"{host} via {addr[0]}:{addr[1]}"
+                stats["last_ms"] = elapsed
+                timings["connect"] = elapsed - timings["resolve"]
+                print(f"Connected to {addr[0]}:{addr[1]} for {host} in {elapsed} ms")
+                _remember(host, addr)
+                return sock, route
+    except OSError:
+        stats["failed"] += 1
+        raise
+    finally:
+        for sock, addr, route in pending:
+            sock.close()
+
+def configure(sessions=None, pins=None, pin_mode=None):
+    """Set where TLS sessions are kept: "off", "ram" or "rtc" (RAM and RTC memory)
+
+    pins: {host: [base64 SHA-256 of the server's public key, backup, ...]}.
+    pin_mode: "enforce" refuses a server whose key is not pinned, "report"
+    only logs it, "off" skips the check.
+    """
+    global SESSIONS, PINS, PIN_MODE
+    if sessions is not None:
+        if sessions not in ("off", "ram", "rtc"):
+            raise ValueError(f"Unknown TLS session store: {sessions}")
+        SESSIONS = sessions
+    if pins is not None:
+        PINS = pins
+    if pin_mode is not None:
+        if pin_mode not in ("off", "report", "enforce"):
+            raise ValueError(f"Unknown pin mode: {pin_mode}")
+        PIN_MODE = pin_mode
+
+def _tlv(der, i):
+    """(tag, content start, end) of the DER element at i"""
+    tag = der[i]
+    n = der[i + 1]
+    i += 2
+    if n & 0x80:
+        count = n & 0x7F
+        n = 0
+        for b in der[i:i + count]:
+            n = (n << 8) | b
+        i += count
+    return tag, i, i + n
+
+def spki_pin(der):
+    """Pin of a DER certificate: base64 SHA-256 of its SubjectPublicKeyInfo
+
+    The same value as HPKP pins and curl's --pinnedpubkey sha256//...
+    """
+    _, i, _ = _tlv(der, 0)       # Certificate
+    _, i, _ = _tlv(der, i)       # TBSCertificate
+    if der[i] == 0xA0:           # [0] version
+        i = _tlv(der, i)[2]
+    for _ in range(5):           # serial, signature, issuer, validity, subject
+        i = _tlv(der, i)[2]
+    end = _tlv(der, i)[2]        # SubjectPublicKeyInfo
+    digest = hashlib.sha256(der[i:end]).digest()
+    return binascii.b2a_base64(digest).strip().decode()
+
+def check_pin(tls, host):
+    """Raise OSError in enforce mode if the server's key is not pinned for host
+
+    Call once the handshake is done and before anything is sent. A socket
+    that cannot show its certificate counts as a mismatch.
+    """
+    pins = PINS.get(host)
+    if not pins or PIN_MODE == "off":
+        return
+    start = ticks_us()
+    der = tls.getpeercert(True) if hasattr(tls, "getpeercert") else None
+    pin = spki_pin(der) if der else None
+    stats["pin_us"] += ticks_diff(ticks_us(), start)
+    stats["pin_checks"] += 1
+    if pin in pins:
+        return
+    stats["pin_failures"] += 1
+    print(f"Certificate of {host} does not match its pins (key {pin})")
+    if PIN_MODE == "enforce":
+        tls.close()
+        raise OSError(f"certificate pin mismatch for {host}")
+
+def _tls_context(ssl):
+    """One client context for every connection: sessions are tied to it"""
+    global _context
+    if _context is None:
+        _context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        if hasattr(_context, "check_hostname"):
+            _context.check_hostname = False
+        _context.verify_mode = ssl.CERT_NONE
+    return _context
+
+def _stored():
+    """[(host CRC, full handshake ms, session bytes)] from RTC memory"""
+    data = rtcstore.read("tls") or b""
+    head = struct.calcsize(_SESSION)
+    entries = []
+    i = 0
+    while i + head <= len(data):
+        key, full_ms, length = struct.unpack_from(_SESSION, data, i)
+        entries.append((key, full_ms, data[i + head:i + head + length]))
+        i += head + length
+    return entries
+
+def _store(host, session):
+    """Keep session in RTC memory, newest first, as many hosts as fit"""
+    try:
+        data = bytes(session)
+    except TypeError:
+        return  # This port cannot serialise sessions
+    key = _key(host)
+    room = rtcstore.REGIONS["tls"][2] - rtcstore.HEADER_LEN
+    out = b""
+    for k, full_ms, d in [(key, _full_ms.get(host, 0), data)] + [e for e in _stored() if e[0] != key]:
+        part = struct.pack(_SESSION, k, min(full_ms, 0xFFFF), len(d)) + d
+        if len(out) + len(part) <= room:
+            out += part
+    rtcstore.write("tls", out)
+
+def _session(ssl, host):
+    """Cached session for host, from RAM or else RTC memory, or None"""
+    session = _sessions.get(host)
+    if session is None and SESSIONS == "rtc" and hasattr(ssl, "SSLSession"):
+        key = _key(host)
+        for k, full_ms, data in _stored():
+            if k == key:
+                try:
+                    session = ssl.SSLSession(data)
+                except (TypeError, ValueError):
+                    break
+                _full_ms.setdefault(host, full_ms)
+                break
+    return session
+
+def wrap(sock, host):
+    """TLS client socket over a connected socket
+
+    Resumes the session kept by keep_session() when the server allows it,
+    which skips the key exchange and the certificate chain. The server is
+    not verified against CA certificates; hosts in PINS are checked
+    against their pinned public keys instead.
+    """
+    import ssl
+    start = ticks_ms()
+    with watchdog.blocking("notifier", f"TLS handshake {host}"):
+        if not hasattr(ssl, "SSLContext"):
+            tls = ssl.wrap_socket(sock, server_hostname=host)
+            check_pin(tls, host)
+            return tls
+        context = _tls_context(ssl)
+        session = _session(ssl, host) if SESSIONS != "off" else None
+        if session is None:
+            tls = context.wrap_socket(sock, server_hostname=host)
+        else:
+            try:
+                tls = context.wrap_socket(sock, server_hostname=host, session=session)
+            except Exception:
+                _sessions.pop(host, None)  # Do not offer it again
+                raise
+    elapsed = ticks_diff(ticks_ms(), start)
+    stats["tls_last_ms"] = elapsed
+    timings["tls"] = elapsed
+    if getattr(tls, "session_reused", False):
+        saved = max(0, _full_ms.get(host, elapsed) - elapsed)
+        stats["tls_resumed"] += 1
+        stats["tls_saved_ms"] += saved
+        print(f"TLS session with {host} resumed in {elapsed} ms, {saved} ms saved")
+    else:
+        stats["tls_full"] += 1
+        _full_ms[host] = elapsed
+        print(f"TLS handshake with {host} in {elapsed} ms")
+    check_pin(tls, host)
+    return tls
+
+def keep_session(tls, host):
+    """Keep the session of a finished exchange for the next wrap() to host
+
+    Call before close(): TLS 1.3 servers send their session tickets after
+    the handshake, so the session is only complete once a reply was read.
+    """
+    if SESSIONS == "off":
+        return
+    session = getattr(tls, "session", None)
+    if session is None:
+        return  # Port without session support
+    _sessions[host] = session
+    if SESSIONS == "rtc":
+        _store(host, session)
+
+def forget_sessions():
+    """Drop every cached TLS session"""
+    _sessions.clear()
+    rtcstore.clear("tls")
+
+def send_all(sock, data):
+    """Send every byte of data; send() may take only part of it"""
+    view = memoryview(data)
+    while len(view):
+        with watchdog.blocking("notifier", "send"):
+            n = sock.send(view)
+        if not n:
+            raise OSError("connection closed while sending")
+        view = view[n:]
+
+def quote(text):
+    """Percent-encode text for a URL query"""
+    out = []
+    for b in text.encode():
+        if (0x30 <= b <= 0x39) or (0x41 <= b <= 0x5A) or (0x61 <= b <= 0x7A) or b in b"-_.~":
+            out.append(chr(b))
+        else:
+            out.append("%%%02X" % b)
+    return "".join(out)
+
+def request(method, url, headers=None, data=None, timeout_s=15):
+    """HTTP/1.0 request over a raced connection; returns the status code
+
+    Only the status line is read: the notifiers need nothing else, and the
+    server has acted on the request by the time it answers.
+    """
+    scheme, _, rest = url.partition("://")
+    hostport, _, path = rest.partition("/")
+    host, _, port = hostport.partition(":")
+    tls = scheme == "https"
+    port = int(port) if port else (443 if tls else 80)
+    sock, route = connect([(host, port)])
+    try:
+        sock.settimeout(timeout_s)
+        if tls:
+            sock = wrap(sock, host)
+        if isinstance(data, str):
+            data = data.encode()
+        head = f"{method} /{path} HTTP/1.0\r\nHost: {host}\r\n"
+        for name, value in (headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        if data is not None:
+            head += f"Content-Length: {len(data)}\r\n"
+        send_all(sock, (head + "\r\n").encode())
+        if data:
+            send_all(sock, data)
+        line = b""
+        while b"\r\n" not in line and len(line) < 256:
+            with watchdog.blocking("notifier", f"HTTP {method} {host}"):
+                chunk = sock.recv(128)
+            if not chunk:
+                break
+            line += chunk
+        parts = line.split(b" ", 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+            raise OSError(f"bad HTTP response from {host}")
+        if tls:
+            keep_session(sock, host)
+        return int(parts[1])
+    finally:
+        sock.close()
+
+class Station:
+    """Wi-Fi and one cached server address for a cooperative task
+
+    connect() returns at once and is retried every WIFI_RETRY_MS until the
+    station is up. The address is resolved once (the one blocking call) and
+    forget() drops it after a failure, so a server that moved is looked up
+    again. wifi is (ssid, password) to bring the station up, None to use it
+    only while something else keeps it connected, or False to skip the
+    radio (host tests).
+    """
+
+    def __init__(self, wifi=None):
+        self.wifi = wifi
+        self.raised = False  # This task brought the radio up
+        self._wlan = None
+        self._try_ms = None
+        self._addr = None
+
+    def up(self):
+        """True while connected; never starts a connection"""
+        if self.wifi is False:
+            return True
+        if self._wlan is None:
+            import network
+            self._wlan = network.WLAN(network.STA_IF)
+        return self._wlan.active() and self._wlan.isconnected()
+
+    def connect(self, now):
+        """Start connecting, unless there are no credentials or the last try is recent"""
+        if not self.wifi or self._try_ms is not None and ticks_diff(now, self._try_ms) < WIFI_RETRY_MS:
+            return
+        self.up()
+        self._try_ms = now
+        self.raised = True
+        self._wlan.active(True)
+        self._wlan.connect(*self.wifi)  # Returns at once; checked on later steps
+
+    def ready(self, now):
+        """True once connected; otherwise start or retry a connection"""
+        if self.up():
+            return True
+        self.connect(now)
+        return False
+
+    def down(self):
+        """Switch the radio off if this task brought it up"""
+        if self.raised and self._wlan is not None:
+            self._wlan.disconnect()
+            self._wlan.active(False)
+        self.raised = False
+
+    def address(self, host, port, kind, task):
+        """host:port for kind (socket.SOCK_STREAM or SOCK_DGRAM), resolved once"""
+        if self._addr is None:
+            with watchdog.blocking(task, f"resolve {host}"):
+                self._addr = socket.getaddrinfo(host, port, 0, kind)[0][-1]
+        return self._addr
+
+    def forget(self):
+        """Resolve again next time (after a failure, or a new server)"""
+        self._addr = None
@@ -0,0 +1,217 @@
+"""
+Hardware watchdog supervisor for the Sump Alarm
+Each logical task (sensor loop, siren, notifier, WiFi) checks in against its
+own deadline. A periodic timer feeds machine.WDT only while every active
+task is on time, so a hung socket call ends in a clean reset instead of a
+frozen device. The longest blocking call per task and the reason for any
+watchdog reset are kept in a small JSON file on flash.
+"""
+
+import gc
+
+from compat import ticks_ms, ticks_diff
+
+STATE_FILE = "watchdog.json"
+MAX_RESETS = 8  # Reset records kept in the state file
+
+class _Blocking:
+    """Context manager timing one blocking call for a task"""
+
+    def __init__(self, sup, task, reason):
+        self.sup = sup
+        self.task = task
+        self.reason = reason
+
+    def __enter__(self):
+        self.sup.checkin(self.task)
+        self.sup._current[self.task] = self.reason
+        self.start = ticks_ms()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = ticks_diff(ticks_ms(), self.start)
+        self.sup._current.pop(self.task, None)
+        self.sup.checkin(self.task)
+        self.sup._record_blocking(self.task, self.reason, elapsed)
+        return False
+
+class _NoBlocking:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_BLOCKING = _NoBlocking()
+
+class Supervisor:
+    def __init__(self, deadlines, wdt_timeout_ms=30000, period_ms=1000,
+                 timer_id=1, hardware=True, state_file=STATE_FILE):
+        """Set up per-task deadlines (ms) and, on the device, the WDT and timer
+
+        Tasks start suspended; call resume() when a task begins running.
+        """
+        self.names = list(deadlines)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._deadline = [deadlines[name] for name in self.names]
+        now = ticks_ms()
+        self._last = [now] * len(self.names)
+        self._active = [False] * len(self.names)
+        self._current = {}  # task -> reason of the blocking call in progress
+        self._watched = []  # (task index, counter, [last value]) checked in by poll()
+        self.state_file = state_file
+        self.state = self._load()
+        self.feeds = 0
+        self.overdue = None  # (task, late_ms, reason) once feeding stops
+        self._wdt = None
+        self._timer = None
+        self.period_ms = period_ms
+        self.wdt_timeout_ms = wdt_timeout_ms
+        self.timer_id = timer_id
+        self.hardware = hardware
+
+    def _load(self):
+        try:
+            import json
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("resets", [])
+        state.setdefault("longest", {})
+        state.setdefault("pending", None)
+        return state
+
+    def _save(self):
+        try:
+            import json
+            with open(self.state_file, "w") as f:
+                json.dump(self.state, f)
+        except OSError as e:
+            print(f"Watchdog state write failed: {e}")
+
+    def record_boot(self, reset_cause=None, wdt_cause=None):
+        """Turn the pending overdue record into a reset record after a reboot"""
+        pending = self.state.get("pending")
+        if reset_cause is not None and reset_cause == wdt_cause:
+            record = pending or {"task": "unknown", "reason": "watchdog reset"}
+            self.state["resets"] = (self.state["resets"] + [record])[-MAX_RESETS:]
+            print(f"Last reset was the watchdog: {record}")
+        if pending is not None or (reset_cause is not None and reset_cause == wdt_cause):
+            self.state["pending"] = None
+            self._save()
+
+    def start(self):
+        """Start the hardware watchdog and the supervising timer"""
+        if not self.hardware:
+            return
+        from machine import WDT, Timer
+        self._wdt = WDT(timeout=self.wdt_timeout_ms)
+        self._timer = Timer(self.timer_id)
+        self._timer.init(period=self.period_ms, mode=Timer.PERIODIC,
+                         callback=lambda t: self.poll())
+
+    def checkin(self, name):
+        """Mark a task as alive; cheap enough for an ISR"""
+        self._last[self._index[name]] = ticks_ms()
+
+    def watch(self, name, counter):
+        """Check a task in from poll() whenever counter() has moved
+
+        For work driven by its own timer (the siren), which keeps running
+        while the main loop is blocked in a WiFi connect or TLS handshake.
+        """
+        self._watched.append((self._index[name], counter, [counter()]))
+
+    def resume(self, name):
+        i = self._index[name]
+        self._last[i] = ticks_ms()
+        self._active[i] = True
+
+    def suspend(self, name):
+        self._active[self._index[name]] = False
+
+    def blocking(self, task, reason):
+        """Context manager around a blocking call made by a task"""
+        return _Blocking(self, task, reason)
+
+    def _record_blocking(self, task, reason, elapsed):
+        longest = self.state["longest"].get(task)
+        if longest is None or elapsed > longest[0]:
+            self.state["longest"][task] = [elapsed, reason]
+            self._save()
+
+    def late_task(self, now=None):
+        """Return (task, late_ms) for the first overdue active task, or None"""
+        now = ticks_ms() if now is None else now
+        for i, name in enumerate(self.names):
+            if self._active[i]:
+                late = ticks_diff(now, self._last[i]) - self._deadline[i]
+                if late > 0:
+                    return name, late
+        return None
+
+    def poll(self, now=None):
+        """Feed the watchdog if every active task is on time
+
+        Runs from the supervising timer. Once a task is overdue, feeding
+        stops for good and the culprit is written to flash so the next
+        boot can report why the watchdog fired.
+        """
+        if self.overdue is not None:
+            return False
+        now = ticks_ms() if now is None else now
+        for i, counter, seen in self._watched:
+            value = counter()
+            if value != seen[0]:
+                seen[0] = value
+                self._last[i] = now
+        late = self.late_task(now)
+        if late is None:
+            if self._wdt is not None:
+                self._wdt.feed()
+            self.feeds += 1
+            return True
+        task, late_ms = late
+        reason = self._current.get(task, "no check-in")
+        self.overdue = (task, late_ms, reason)
+        print(f"Watchdog: task {task} overdue by {late_ms} ms ({reason}), allowing reset")
+        self.state["pending"] = {"task": task, "late_ms": late_ms, "reason": reason}
+        self._save()
+        gc.collect()
+        return False
+
+    def metrics(self):
+        now = ticks_ms()
+        return {
+            "feeds": self.feeds,
+            "ages_ms": {name: ticks_diff(now, self._last[i])
+                        for i, name in enumerate(self.names) if self._active[i]},
+            "longest": self.state["longest"],
+            "resets": len(self.state["resets"]),
+        }
+
+# Module-level supervisor so notifier code can check in without plumbing
+_supervisor = None
+
+def install(supervisor):
+    global _supervisor
+    _supervisor = supervisor
+
+def checkin(name):
+    if _supervisor is not None:
+        _supervisor.checkin(name)
+
+def resume(name):
+    if _supervisor is not None:
+        _supervisor.resume(name)
+
+def suspend(name):
+    if _supervisor is not None:
+        _supervisor.suspend(name)
+
+def blocking(task, reason):
+    """Time a blocking call; a no-op when no supervisor is installed"""
+    if _supervisor is None:
+        return _NO_BLOCKING
+    return _supervisor.blocking(task, reason)